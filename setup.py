@@ -49,9 +49,42 @@ xxh_mod = Extension("%s._xxhash" % PACKAGENAME,
                      '-Wstrict-aliasing=1', '-Wswitch-enum', '-Wdeclaration-after-statement',
                      '-Wstrict-prototypes', '-Wundef'])
 
+xxh3_mod = Extension("%s._xxh3" % PACKAGENAME,
+                     sources=["src/_xxh3.c"],
+                     depends=["src/xxhash.h", "src/xxh3.h", "src/xxhash.c"],
+                     include_dirs=["src",],
+                     language="c",
+                     extra_compile_args = extra_compile_args + \
+                     ['-O3',
+                      '-std=c99',
+                      '-Wall', '-Wextra', '-Wcast-qual', '-Wcast-align', '-Wshadow',
+                      '-Wstrict-aliasing=1', '-Wswitch-enum', '-Wdeclaration-after-statement',
+                      '-Wstrict-prototypes', '-Wundef'])
+
+nthash_mod = Extension("%s._nthash" % PACKAGENAME,
+                       sources=["src/_nthash.c"],
+                       language="c",
+                       extra_compile_args = extra_compile_args + \
+                       ['-O3',
+                        '-std=c99',
+                        '-Wall', '-Wextra', '-Wcast-qual', '-Wcast-align', '-Wshadow',
+                        '-Wstrict-aliasing=1', '-Wswitch-enum', '-Wdeclaration-after-statement',
+                        '-Wstrict-prototypes', '-Wundef'])
+
+sketchcore_mod = Extension("%s._sketchcore" % PACKAGENAME,
+                           sources=["src/_sketchcore.c"],
+                           language="c",
+                           extra_compile_args = extra_compile_args + \
+                           ['-O3',
+                            '-std=c99',
+                            '-Wall', '-Wextra', '-Wcast-qual', '-Wcast-align', '-Wshadow',
+                            '-Wstrict-aliasing=1', '-Wswitch-enum', '-Wdeclaration-after-statement',
+                            '-Wstrict-prototypes', '-Wundef'])
+
 setup(
     packages = [PACKAGENAME,
                 PACKAGENAME + '.tests'],
     package_dir = {PACKAGENAME: 'src'},
-    ext_modules = [mmh_mod, mmhmash_mod, xxh_mod],
+    ext_modules = [mmh_mod, mmhmash_mod, xxh_mod, xxh3_mod, nthash_mod,
+                   sketchcore_mod],
 )
@@ -6,9 +6,15 @@ uint32_t MINHASH_DEFAULT_SEED = 42;
 #include <stdio.h>
 
 PyDoc_STRVAR(hasharray_doc,
-             "hasharray(input, width, buffer [, seed]) -> int\n\n"
+             "hasharray(input, width, buffer [, seed [, threshold, direction, offsets]]) -> int or (int, int)\n\n"
              "Compute a hash values for a sliding array of bytes over a bytes-like object 'input', "
-	     "optionally using a seed (an integer).");
+	     "optionally using a seed (an integer).\n\n"
+	     "When 'threshold' (an integer), 'direction' (1 or -1), and 'offsets' (a buffer of format "
+	     "type Q) are given, only the hash values greater (direction 1) or lower (direction -1) than or "
+	     "equal to the threshold are written, contiguously, to 'buffer' and the positions of the "
+	     "corresponding windows in 'input' to 'offsets'. The return value is then a tuple with the "
+	     "number of windows hashed and the number of hash values written.\n\n"
+	     "The GIL is released while hashing.");
 
 static PyObject *
 hasharray(PyObject * self, PyObject * args)
@@ -17,8 +23,24 @@ hasharray(PyObject * self, PyObject * args)
   Py_buffer inputbuf;
   Py_buffer arraybuf;
   uint32_t seed = MINHASH_DEFAULT_SEED;
+  unsigned long long threshold = 0;
+  int direction = 0;
+  Py_buffer offsetbuf;
+  offsetbuf.obj = NULL;
 
-  if (!PyArg_ParseTuple(args, "s*ny*|I", &inputbuf, &width, &arraybuf, &seed)) {
+  if (!PyArg_ParseTuple(args, "s*ny*|IKiw*", &inputbuf, &width, &arraybuf, &seed,
+			&threshold, &direction, &offsetbuf)) {
+    return NULL;
+  }
+
+  if ((direction != 0 || offsetbuf.obj != NULL) &&
+      (offsetbuf.obj == NULL || (direction != 1 && direction != -1))) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
+    PyErr_SetString(PyExc_ValueError, "Filtering requires a threshold, a direction (1 or -1), and a buffer for offsets.");
     return NULL;
   }
 
@@ -28,6 +50,9 @@ hasharray(PyObject * self, PyObject * args)
   if (width > length) {
     PyBuffer_Release(&inputbuf);
     PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
     PyErr_SetString(PyExc_ValueError, "The width of the window cannot be longer than the input string.");
     return NULL;
   }
@@ -37,24 +62,65 @@ hasharray(PyObject * self, PyObject * args)
   if (arraybuf.itemsize != sizeof(unsigned long long)) {
     PyBuffer_Release(&inputbuf);
     PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
     PyErr_SetString(PyExc_ValueError, "The buffer must be of format type Q.");
     return NULL;
   }
 
   unsigned long long * hasharray = (unsigned long long *) arraybuf.buf;
   const Py_ssize_t maxi = olength < (length-width+1) ? olength : (length-width+1); 
-  
+
+  if (offsetbuf.obj != NULL &&
+      (offsetbuf.itemsize != sizeof(unsigned long long) ||
+       (offsetbuf.len / offsetbuf.itemsize) < maxi)) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    PyBuffer_Release(&offsetbuf);
+    PyErr_SetString(PyExc_ValueError, "The buffer for offsets must be of format type Q and as long as the buffer.");
+    return NULL;
+  }
+
   uint64_t outh[2] = {0, 0};
+  if (direction == 0) {
+    /* The buffers are held: the hashing loop does not need the GIL. */
+    Py_BEGIN_ALLOW_THREADS
+    for (Py_ssize_t i=0; i < maxi; i++) {
+      MurmurHash3_x64_128((void *)(input + i),
+			  (uint32_t)width,
+			  seed,
+			  &outh);
+      hasharray[i] = (unsigned long long)outh[0];
+    }
+    Py_END_ALLOW_THREADS
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
+    return PyLong_FromSsize_t(maxi);
+  }
+
+  unsigned long long * offsetarray = (unsigned long long *) offsetbuf.buf;
+  Py_ssize_t nkept = 0;
+  Py_BEGIN_ALLOW_THREADS
   for (Py_ssize_t i=0; i < maxi; i++) {
     MurmurHash3_x64_128((void *)(input + i),
 			(uint32_t)width,
 			seed,
 			&outh);
-    hasharray[i] = (unsigned long long)outh[0];
+    if (direction > 0 ? outh[0] >= threshold : outh[0] <= threshold) {
+      hasharray[nkept] = (unsigned long long)outh[0];
+      offsetarray[nkept] = (unsigned long long)i;
+      nkept++;
+    }
   }
+  Py_END_ALLOW_THREADS
   PyBuffer_Release(&inputbuf);
   PyBuffer_Release(&arraybuf);
-  return PyLong_FromSsize_t(maxi);
+  PyBuffer_Release(&offsetbuf);
+  return Py_BuildValue("nn", maxi, nkept);
 }
 
 
@@ -4,11 +4,169 @@
 uint32_t MINHASH_DEFAULT_SEED = 42;
 
 #include <stdio.h>
+#include <string.h>
+
+/* Complement of each byte (A <-> T and C <-> G, lowercase letters to lowercase
+   letters, other bytes unchanged). Filled when the module is initialized. */
+static unsigned char COMPLEMENT[256];
+
+/* Number of windows for which the reverse complement is computed at a time
+   (the scratch buffer stays in cache). */
+#define RC_BLOCKSIZE 4096
+
+/* Write the reverse complement of the 'length' bytes at 'input' to 'out'. */
+static inline void
+reverse_complement(const unsigned char * input, const Py_ssize_t length,
+		   unsigned char * out)
+{
+  for (Py_ssize_t t = 0; t < length; t++) {
+    out[t] = COMPLEMENT[input[length - 1 - t]];
+  }
+}
+
+PyDoc_STRVAR(hasharray_doc,
+             "hasharray(input, width, buffer [, seed [, threshold, direction, offsets]]) -> int or (int, int)\n\n"
+             "Compute MurmurHash3 hash values for canonical kmers in a sliding array of bytes over a "
+	     "bytes-like object 'input' (a DNA sequence), optionally using a seed (an integer). As in MASH, "
+	     "the canonical kmer is the lowest (lexicographically) of the kmer and of its reverse "
+	     "complement, and the hash value is the first 64 bits of MurmurHash3_x64_128. The reverse "
+	     "complement is computed block by block in a small buffer (no copy of the input is needed).\n\n"
+	     "When 'threshold' (an integer), 'direction' (1 or -1), and 'offsets' (a buffer of format "
+	     "type Q) are given, only the hash values greater (direction 1) or lower (direction -1) than or "
+	     "equal to the threshold are written, contiguously, to 'buffer' and the positions of the "
+	     "corresponding windows in 'input' to 'offsets'. The return value is then a tuple with the "
+	     "number of windows hashed and the number of hash values written.\n\n"
+	     "The GIL is released while hashing.");
+
+static PyObject *
+hasharray(PyObject * self, PyObject * args)
+{
+  Py_ssize_t width ;
+  Py_buffer inputbuf;
+  Py_buffer arraybuf;
+  uint32_t seed = MINHASH_DEFAULT_SEED;
+  unsigned long long threshold = 0;
+  int direction = 0;
+  Py_buffer offsetbuf;
+  offsetbuf.obj = NULL;
+
+  if (!PyArg_ParseTuple(args, "s*ny*|IKiw*", &inputbuf, &width, &arraybuf, &seed,
+			&threshold, &direction, &offsetbuf)) {
+    return NULL;
+  }
+
+  if ((direction != 0 || offsetbuf.obj != NULL) &&
+      (offsetbuf.obj == NULL || (direction != 1 && direction != -1))) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
+    PyErr_SetString(PyExc_ValueError, "Filtering requires a threshold, a direction (1 or -1), and a buffer for offsets.");
+    return NULL;
+  }
+
+  const unsigned char * input = (const unsigned char *)inputbuf.buf;
+  const Py_ssize_t length = inputbuf.len;
+
+  if (width < 1 || width > length) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
+    PyErr_SetString(PyExc_ValueError, "The width of the window must be positive and cannot be longer than the input string.");
+    return NULL;
+  }
+
+  const Py_ssize_t olength = arraybuf.len / arraybuf.itemsize;
+
+  if (arraybuf.itemsize != sizeof(unsigned long long)) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
+    PyErr_SetString(PyExc_ValueError, "The buffer must be of format type Q.");
+    return NULL;
+  }
+
+  unsigned long long * hasharray = (unsigned long long *) arraybuf.buf;
+  const Py_ssize_t maxi = olength < (length-width+1) ? olength : (length-width+1);
+
+  if (offsetbuf.obj != NULL &&
+      (offsetbuf.itemsize != sizeof(unsigned long long) ||
+       (offsetbuf.len / offsetbuf.itemsize) < maxi)) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    PyBuffer_Release(&offsetbuf);
+    PyErr_SetString(PyExc_ValueError, "The buffer for offsets must be of format type Q and as long as the buffer.");
+    return NULL;
+  }
+  unsigned long long * offsetarray = (unsigned long long *) offsetbuf.buf;
+
+  /* reverse complement of a block of windows */
+  unsigned char * block_rc = (unsigned char *) PyMem_Malloc((size_t)(RC_BLOCKSIZE + width - 1));
+  if (block_rc == NULL) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
+    return PyErr_NoMemory();
+  }
+
+  uint64_t outh[2] = {0, 0};
+  Py_ssize_t nkept = 0;
+  /* The buffers are held: the hashing loop does not need the GIL. */
+  Py_BEGIN_ALLOW_THREADS
+  for (Py_ssize_t blockbeg=0; blockbeg < maxi; blockbeg += RC_BLOCKSIZE) {
+    const Py_ssize_t nblock = (maxi - blockbeg) < RC_BLOCKSIZE ? (maxi - blockbeg) : RC_BLOCKSIZE;
+    const Py_ssize_t lblock = nblock + width - 1;
+    reverse_complement(input + blockbeg, lblock, block_rc);
+    for (Py_ssize_t r=0; r < nblock; r++) {
+      const unsigned char * window = input + blockbeg + r;
+      const unsigned char * window_rc = block_rc + (lblock - width - r);
+      /* canonical strand: the lesser of the k-mer and its reverse
+	 complement. This comparison is a data-dependent branch (the
+	 strand is as good as random). */
+      window = memcmp(window, window_rc, (size_t)width) <= 0 ? window : window_rc;
+      MurmurHash3_x64_128((const void *)window,
+			  (uint32_t)width,
+			  seed,
+			  &outh);
+      if (direction == 0) {
+	hasharray[blockbeg + r] = (unsigned long long)outh[0];
+      } else if (direction > 0 ? outh[0] >= threshold : outh[0] <= threshold) {
+	hasharray[nkept] = (unsigned long long)outh[0];
+	offsetarray[nkept] = (unsigned long long)(blockbeg + r);
+	nkept++;
+      }
+    }
+  }
+  Py_END_ALLOW_THREADS
+  PyMem_Free(block_rc);
+  PyBuffer_Release(&inputbuf);
+  PyBuffer_Release(&arraybuf);
+  if (offsetbuf.obj != NULL) {
+    PyBuffer_Release(&offsetbuf);
+    return Py_BuildValue("nn", maxi, nkept);
+  }
+  return PyLong_FromSsize_t(maxi);
+}
 
 PyDoc_STRVAR(hasharray_withrc_doc,
-             "hasharray_withrc(input, input_rc, width, buffer [, seed]) -> int\n\n"
+             "hasharray_withrc(input, input_rc, width, buffer [, seed [, threshold, direction, offsets]]) -> int or (int, int)\n\n"
              "Compute a hash values for a sliding array of bytes over a bytes-like object 'input', "
-	     "optionally using a seed (an integer).");
+	     "optionally using a seed (an integer). Each window is hashed from 'input' or from "
+	     "'input_rc' (the reverse complement of 'input'), whichever is the lowest "
+	     "(lexicographically). See also 'hasharray', that does not need 'input_rc'.\n\n"
+	     "When 'threshold' (an integer), 'direction' (1 or -1), and 'offsets' (a buffer of format "
+	     "type Q) are given, only the hash values greater (direction 1) or lower (direction -1) than or "
+	     "equal to the threshold are written, contiguously, to 'buffer' and the positions of the "
+	     "corresponding windows in 'input' to 'offsets'. The return value is then a tuple with the "
+	     "number of windows hashed and the number of hash values written.\n\n"
+	     "The GIL is released while hashing.");
 
 static PyObject *
 hasharray_withrc(PyObject * self, PyObject * args)
@@ -18,8 +176,25 @@ hasharray_withrc(PyObject * self, PyObject * args)
   Py_buffer inputbuf_rc;
   Py_buffer arraybuf;
   uint32_t seed = MINHASH_DEFAULT_SEED;
+  unsigned long long threshold = 0;
+  int direction = 0;
+  Py_buffer offsetbuf;
+  offsetbuf.obj = NULL;
+
+  if (!PyArg_ParseTuple(args, "s*s*ny*|IKiw*", &inputbuf, &inputbuf_rc, &width, &arraybuf, &seed,
+			&threshold, &direction, &offsetbuf)) {
+    return NULL;
+  }
 
-  if (!PyArg_ParseTuple(args, "s*s*ny*|I", &inputbuf, &inputbuf_rc, &width, &arraybuf, &seed)) {
+  if ((direction != 0 || offsetbuf.obj != NULL) &&
+      (offsetbuf.obj == NULL || (direction != 1 && direction != -1))) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&inputbuf_rc);
+    PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
+    PyErr_SetString(PyExc_ValueError, "Filtering requires a threshold, a direction (1 or -1), and a buffer for offsets.");
     return NULL;
   }
 
@@ -33,6 +208,9 @@ hasharray_withrc(PyObject * self, PyObject * args)
     PyBuffer_Release(&inputbuf);
     PyBuffer_Release(&inputbuf_rc);
     PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
     PyErr_SetString(PyExc_ValueError, "The width of the window cannot be longer than the input string.");
     return NULL;
   }
@@ -40,6 +218,9 @@ hasharray_withrc(PyObject * self, PyObject * args)
     PyBuffer_Release(&inputbuf);
     PyBuffer_Release(&inputbuf_rc);
     PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
     PyErr_SetString(PyExc_ValueError, "The length of the input and its reverse-complement must be identical.");
     return NULL;
   }
@@ -50,18 +231,36 @@ hasharray_withrc(PyObject * self, PyObject * args)
     PyBuffer_Release(&inputbuf);
     PyBuffer_Release(&inputbuf_rc);
     PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
     PyErr_SetString(PyExc_ValueError, "The buffer must be of format type Q.");
     return NULL;
   }
 
   unsigned long long * hasharray = (unsigned long long *) arraybuf.buf;
   const Py_ssize_t maxi = olength < (length-width+1) ? olength : (length-width+1); 
-  
+
+  if (offsetbuf.obj != NULL &&
+      (offsetbuf.itemsize != sizeof(unsigned long long) ||
+       (offsetbuf.len / offsetbuf.itemsize) < maxi)) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&inputbuf_rc);
+    PyBuffer_Release(&arraybuf);
+    PyBuffer_Release(&offsetbuf);
+    PyErr_SetString(PyExc_ValueError, "The buffer for offsets must be of format type Q and as long as the buffer.");
+    return NULL;
+  }
+  unsigned long long * offsetarray = (unsigned long long *) offsetbuf.buf;
+
   uint64_t outh[2] = {0, 0};
   Py_ssize_t j;
+  Py_ssize_t nkept = 0;
+  /* The buffers are held: the hashing loop does not need the GIL. */
+  Py_BEGIN_ALLOW_THREADS
   for (Py_ssize_t i=0; i < maxi; i++) {
     j = length_rc - width -i;
-    if (strcmp(input+i, input_rc+j) < 0) {
+    if (memcmp(input+i, input_rc+j, (size_t)width) <= 0) {
       MurmurHash3_x64_128((void *)(input + i),
 			  (uint32_t)width,
 			  seed,
@@ -72,16 +271,31 @@ hasharray_withrc(PyObject * self, PyObject * args)
 			  seed,
 			  &outh);
     }
-    hasharray[i] = (unsigned long long)outh[0];
+    if (direction == 0) {
+      hasharray[i] = (unsigned long long)outh[0];
+    } else if (direction > 0 ? outh[0] >= threshold : outh[0] <= threshold) {
+      hasharray[nkept] = (unsigned long long)outh[0];
+      offsetarray[nkept] = (unsigned long long)i;
+      nkept++;
+    }
   }
+  Py_END_ALLOW_THREADS
   PyBuffer_Release(&inputbuf);
   PyBuffer_Release(&inputbuf_rc);
   PyBuffer_Release(&arraybuf);
+  if (offsetbuf.obj != NULL) {
+    PyBuffer_Release(&offsetbuf);
+    return Py_BuildValue("nn", maxi, nkept);
+  }
   return PyLong_FromSsize_t(maxi);
 }
 
 
 static PyMethodDef murmurhash3_mashModuleMethods[] = {
+    {
+      "hasharray", (PyCFunction)hasharray,
+        METH_VARARGS, hasharray_doc,
+    },
     {
       "hasharray_withrc", (PyCFunction)hasharray_withrc,
         METH_VARARGS, hasharray_withrc_doc,
@@ -101,6 +315,18 @@ PyInit__murmurhash3_mash(void)
 {
     PyObject *m;
 
+    for (int c = 0; c < 256; c++) {
+      COMPLEMENT[c] = (unsigned char)c;
+    }
+    COMPLEMENT['A'] = 'T';
+    COMPLEMENT['T'] = 'A';
+    COMPLEMENT['C'] = 'G';
+    COMPLEMENT['G'] = 'C';
+    COMPLEMENT['a'] = 't';
+    COMPLEMENT['t'] = 'a';
+    COMPLEMENT['c'] = 'g';
+    COMPLEMENT['g'] = 'c';
+
     m = PyModule_Create(&moduledef);
     
     if (m == NULL) {
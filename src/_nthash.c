@@ -0,0 +1,217 @@
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <stdint.h>
+
+/* Rolling hash for DNA sequences in the style of ntHash (Mohamadi H, Chu J,
+   Vandervalk BP, Birol I. ntHash: recursive nucleotide hashing. Bioinformatics
+   2016). The hash value of a window is the XOR of the 64-bit values for its
+   letters, each rotated by its distance to the end of the window. Moving the
+   window by one letter is then a rotation and two XORs, whatever its width. */
+
+#define NTHASH_DEFAULT_SEED 0
+
+/* 64-bit values for the letters (lowercase letters like uppercase ones, 0 for
+   any other byte). Filled when the module is initialized. */
+static uint64_t LETTERS[256];
+
+static const uint64_t LETTER_A = 0x3c8bfbb395c60474ULL;
+static const uint64_t LETTER_C = 0x3193c18562a02b4cULL;
+static const uint64_t LETTER_G = 0x20323ed082572324ULL;
+static const uint64_t LETTER_T = 0x295549f54be24456ULL;
+
+static inline uint64_t
+rol64(const uint64_t x, const unsigned int r)
+{
+  return (x << r) | (x >> ((64 - r) & 63));
+}
+
+/* Finalization step of MurmurHash3 (a bijection): it spreads the linear
+   structure of the rolling value across all bits, and mixes in the seed. */
+static inline uint64_t
+fmix64(uint64_t k)
+{
+  k ^= k >> 33;
+  k *= 0xff51afd7ed558ccdULL;
+  k ^= k >> 33;
+  k *= 0xc4ceb9fe1a85ec53ULL;
+  k ^= k >> 33;
+  return k;
+}
+
+/* Hash the 'maxi' windows of 'width' letters in 'input'. Without filtering
+   (direction 0) all hash values are written to 'hasharray'. Otherwise only
+   the ones greater (direction 1) or lower (direction -1) than or equal to
+   'threshold' are, with their positions in 'offsetarray'. Return the number
+   of hash values written. */
+static Py_ssize_t
+nthash_windows(const unsigned char * input, const Py_ssize_t width,
+               const Py_ssize_t maxi, const uint64_t seed,
+               const unsigned long long threshold, const int direction,
+               unsigned long long * hasharray,
+               unsigned long long * offsetarray)
+{
+  const unsigned int rwidth = (unsigned int)(width % 64);
+  uint64_t fh = 0;
+  uint64_t out;
+  Py_ssize_t nkept = 0;
+  Py_ssize_t i;
+  for (i = 0; i < width; i++) {
+    fh = rol64(fh, 1) ^ LETTERS[input[i]];
+  }
+  for (i = 0; i < maxi; i++) {
+    if (i > 0) {
+      fh = rol64(fh, 1) ^ rol64(LETTERS[input[i-1]], rwidth) ^
+        LETTERS[input[i+width-1]];
+    }
+    out = fmix64(fh ^ seed);
+    if (direction == 0) {
+      hasharray[i] = out;
+    } else if (direction > 0 ? out >= threshold : out <= threshold) {
+      hasharray[nkept] = out;
+      offsetarray[nkept] = (unsigned long long)i;
+      nkept++;
+    }
+  }
+  return direction == 0 ? maxi : nkept;
+}
+
+PyDoc_STRVAR(hasharray_doc,
+             "hasharray(input, width, buffer [, seed [, threshold, direction, offsets]]) -> int or (int, int)\n\n"
+             "Compute a hash values for a sliding array of bytes over a bytes-like object 'input' "
+	     "with a rolling hash (ntHash-style, for DNA sequences), optionally using a seed (an integer). "
+	     "The cost per window does not depend on its width.\n\n"
+	     "The letters A, C, G, and T (or a, c, g, and t) have distinct values, and all other bytes "
+	     "share one value. The hash values are for the forward strand.\n\n"
+	     "When 'threshold' (an integer), 'direction' (1 or -1), and 'offsets' (a buffer of format "
+	     "type Q) are given, only the hash values greater (direction 1) or lower (direction -1) than or "
+	     "equal to the threshold are written, contiguously, to 'buffer' and the positions of the "
+	     "corresponding windows in 'input' to 'offsets'. The return value is then a tuple with the "
+	     "number of windows hashed and the number of hash values written.\n\n"
+	     "The GIL is released while hashing.");
+
+static PyObject *
+hasharray(PyObject * self, PyObject * args)
+{
+  Py_ssize_t width ;
+  Py_buffer inputbuf;
+  Py_buffer arraybuf;
+  unsigned long long seed = NTHASH_DEFAULT_SEED;
+  unsigned long long threshold = 0;
+  int direction = 0;
+  Py_buffer offsetbuf;
+  const unsigned char * input;
+  Py_ssize_t length, olength, maxi, nkept;
+  unsigned long long * hasharray;
+  unsigned long long * offsetarray = NULL;
+  offsetbuf.obj = NULL;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "s*ny*|KKiw*", &inputbuf, &width, &arraybuf, &seed,
+			&threshold, &direction, &offsetbuf)) {
+    return NULL;
+  }
+
+  if ((direction != 0 || offsetbuf.obj != NULL) &&
+      (offsetbuf.obj == NULL || (direction != 1 && direction != -1))) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
+    PyErr_SetString(PyExc_ValueError, "Filtering requires a threshold, a direction (1 or -1), and a buffer for offsets.");
+    return NULL;
+  }
+
+  input = (const unsigned char *)inputbuf.buf;
+  length = inputbuf.len;
+
+  if (width < 1 || width > length) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
+    PyErr_SetString(PyExc_ValueError, "The width of the window must be positive and cannot be longer than the input string.");
+    return NULL;
+  }
+
+  olength = arraybuf.len / arraybuf.itemsize;
+
+  if (arraybuf.itemsize != sizeof(unsigned long long)) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
+    PyErr_SetString(PyExc_ValueError, "The buffer must be of format type Q.");
+    return NULL;
+  }
+
+  hasharray = (unsigned long long *) arraybuf.buf;
+  maxi = olength < (length-width+1) ? olength : (length-width+1);
+
+  if (offsetbuf.obj != NULL &&
+      (offsetbuf.itemsize != sizeof(unsigned long long) ||
+       (offsetbuf.len / offsetbuf.itemsize) < maxi)) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    PyBuffer_Release(&offsetbuf);
+    PyErr_SetString(PyExc_ValueError, "The buffer for offsets must be of format type Q and as long as the buffer.");
+    return NULL;
+  }
+
+  if (offsetbuf.obj != NULL) {
+    offsetarray = (unsigned long long *) offsetbuf.buf;
+  }
+  /* The buffers are held: the hashing loop does not need the GIL. */
+  Py_BEGIN_ALLOW_THREADS
+  nkept = nthash_windows(input, width, maxi, (uint64_t)seed,
+			 threshold, direction, hasharray, offsetarray);
+  Py_END_ALLOW_THREADS
+  PyBuffer_Release(&inputbuf);
+  PyBuffer_Release(&arraybuf);
+  if (offsetbuf.obj != NULL) {
+    PyBuffer_Release(&offsetbuf);
+  }
+  if (direction == 0) {
+    return PyLong_FromSsize_t(maxi);
+  }
+  return Py_BuildValue("nn", maxi, nkept);
+}
+
+static PyMethodDef nthashModuleMethods[] = {
+    {
+      "hasharray", (PyCFunction)hasharray,
+        METH_VARARGS, hasharray_doc,
+    },
+    { NULL, NULL, 0, NULL} // sentinel
+};
+
+static struct PyModuleDef moduledef = {
+  PyModuleDef_HEAD_INIT,
+  "_nthash",
+  "Rolling hash for DNA sequences (ntHash-style).",
+  -1,
+  nthashModuleMethods,
+  NULL, NULL, NULL, NULL};
+
+PyMODINIT_FUNC
+PyInit__nthash(void)
+{
+    PyObject *m;
+
+    LETTERS['A'] = LETTERS['a'] = LETTER_A;
+    LETTERS['C'] = LETTERS['c'] = LETTER_C;
+    LETTERS['G'] = LETTERS['g'] = LETTER_G;
+    LETTERS['T'] = LETTERS['t'] = LETTER_T;
+
+    m = PyModule_Create(&moduledef);
+
+    if (m == NULL) {
+        return NULL;
+    }
+
+    PyModule_AddIntConstant(m, "DEFAULT_SEED", NTHASH_DEFAULT_SEED);
+
+    return m;
+}
@@ -0,0 +1,2682 @@
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <math.h>
+#include <stdint.h>
+#include <string.h>
+
+/*
+ * Heap primitives operating on a Python list, with the same invariant as the
+ * functions in the module `heapq` (heap[k] <= heap[2*k+1] and
+ * heap[k] <= heap[2*k+2]). Items are swapped in place in the list, which
+ * leaves reference counts unchanged.
+ */
+
+static int
+heap_siftdown(PyListObject *heap, Py_ssize_t startpos, Py_ssize_t pos)
+{
+  const Py_ssize_t size = PyList_GET_SIZE(heap);
+  PyObject *newitem, *parent;
+  PyObject **arr;
+  Py_ssize_t parentpos;
+  int cmp;
+
+  newitem = PyList_GET_ITEM(heap, pos);
+  while (pos > startpos) {
+    parentpos = (pos - 1) >> 1;
+    parent = PyList_GET_ITEM(heap, parentpos);
+    Py_INCREF(newitem);
+    Py_INCREF(parent);
+    cmp = PyObject_RichCompareBool(newitem, parent, Py_LT);
+    Py_DECREF(parent);
+    Py_DECREF(newitem);
+    if (cmp < 0) {
+      return -1;
+    }
+    if (size != PyList_GET_SIZE(heap)) {
+      PyErr_SetString(PyExc_RuntimeError, "List changed size during iteration.");
+      return -1;
+    }
+    if (cmp == 0) {
+      break;
+    }
+    arr = heap->ob_item;
+    parent = arr[parentpos];
+    newitem = arr[pos];
+    arr[parentpos] = newitem;
+    arr[pos] = parent;
+    pos = parentpos;
+  }
+  return 0;
+}
+
+static int
+heap_siftup(PyListObject *heap, Py_ssize_t pos)
+{
+  const Py_ssize_t endpos = PyList_GET_SIZE(heap);
+  const Py_ssize_t startpos = pos;
+  const Py_ssize_t limit = endpos >> 1;
+  PyObject **arr;
+  PyObject *tmp1, *tmp2;
+  Py_ssize_t childpos;
+  int cmp;
+
+  /* Bubble up the smaller child until hitting a leaf. */
+  while (pos < limit) {
+    childpos = 2 * pos + 1;
+    if (childpos + 1 < endpos) {
+      PyObject *a = PyList_GET_ITEM(heap, childpos);
+      PyObject *b = PyList_GET_ITEM(heap, childpos + 1);
+      Py_INCREF(a);
+      Py_INCREF(b);
+      cmp = PyObject_RichCompareBool(a, b, Py_LT);
+      Py_DECREF(a);
+      Py_DECREF(b);
+      if (cmp < 0) {
+        return -1;
+      }
+      childpos += ((unsigned)cmp ^ 1);
+      if (endpos != PyList_GET_SIZE(heap)) {
+        PyErr_SetString(PyExc_RuntimeError, "List changed size during iteration.");
+        return -1;
+      }
+    }
+    arr = heap->ob_item;
+    tmp1 = arr[childpos];
+    tmp2 = arr[pos];
+    arr[childpos] = tmp2;
+    arr[pos] = tmp1;
+    pos = childpos;
+  }
+  /* The leaf at pos is empty now. Put newitem there, and bubble it up. */
+  return heap_siftdown(heap, startpos, pos);
+}
+
+static int
+heap_push(PyListObject *heap, PyObject *item)
+{
+  if (PyList_Append((PyObject *)heap, item) < 0) {
+    return -1;
+  }
+  return heap_siftdown(heap, 0, PyList_GET_SIZE(heap) - 1);
+}
+
+/* Return a new reference to the smallest item, replaced with `item`. */
+static PyObject *
+heap_replace(PyListObject *heap, PyObject *item)
+{
+  PyObject *returnitem;
+
+  if (PyList_GET_SIZE(heap) == 0) {
+    PyErr_SetString(PyExc_IndexError, "index out of range");
+    return NULL;
+  }
+  returnitem = PyList_GET_ITEM(heap, 0);
+  Py_INCREF(item);
+  PyList_SET_ITEM(heap, 0, item);
+  if (heap_siftup(heap, 0) < 0) {
+    Py_DECREF(returnitem);
+    return NULL;
+  }
+  return returnitem;
+}
+
+/* Hash value for the first item of `elt`, multiplied by `sign`. */
+static int
+signed_hash(PyObject *elt, int sign, unsigned long long *h)
+{
+  PyObject *first, *value;
+
+  first = PySequence_GetItem(elt, 0);
+  if (first == NULL) {
+    return -1;
+  }
+  if (sign < 0) {
+    value = PyNumber_Negative(first);
+    Py_DECREF(first);
+    if (value == NULL) {
+      return -1;
+    }
+  } else {
+    value = first;
+  }
+  *h = PyLong_AsUnsignedLongLong(value);
+  Py_DECREF(value);
+  if (*h == (unsigned long long)-1 && PyErr_Occurred()) {
+    return -1;
+  }
+  return 0;
+}
+
+static int
+call_anynew(PyObject *anynew, PyObject *key)
+{
+  PyObject *res;
+
+  if (anynew == Py_None) {
+    return 0;
+  }
+  res = PyObject_CallFunctionObjArgs(anynew, key, NULL);
+  if (res == NULL) {
+    return -1;
+  }
+  Py_DECREF(res);
+  return 0;
+}
+
+static PyObject *
+call_make_elt(PyObject *make_elt, PyObject *key, int sign,
+              PyObject *subs, Py_ssize_t j, Py_ssize_t nsize)
+{
+  PyObject *signedkey, *elt;
+
+  if (sign < 0) {
+    signedkey = PyNumber_Negative(key);
+    if (signedkey == NULL) {
+      return NULL;
+    }
+  } else {
+    Py_INCREF(key);
+    signedkey = key;
+  }
+  elt = PyObject_CallFunction(make_elt, "OOnn", signedkey, subs, j, nsize);
+  Py_DECREF(signedkey);
+  return elt;
+}
+
+PyDoc_STRVAR(add_ngrams_doc,
+             "add_ngrams(heap, heapmap, maxsize, nsize, subs, nsubs, hashbuffer, heaptop,\n"
+             "           extracthash, make_elt, update_elt, replace, anynew, minmax_op\n"
+             "           [, offsets]) -> int\n\n"
+             "Process/add the hash values in 'hashbuffer' to a sketch and return the new\n"
+             "hash value for the top of the heap.\n\n"
+             "This is a compiled equivalent of the Python function\n"
+             "mashingpumpkins.minhashsketch._minmaxhash_add_ngrams(), with the same\n"
+             "arguments. Threshold filtering, lookups in 'heapmap', and the maintenance\n"
+             "of 'heap' are performed without returning to Python, and the callbacks\n"
+             "'make_elt', 'extracthash', and 'anynew' are only called for hash values\n"
+             "entering the sketch. As with the Python function, 'replace' is not used\n"
+             "and the hash values in 'hashbuffer' must be of format type Q.\n\n"
+             "If 'offsets' (a buffer of format type Q, or None) is given, the i-th hash value in\n"
+             "'hashbuffer' is for the window starting at position offsets[i] in 'subs'\n"
+             "(rather than at position i) as reported by hashing functions filtering\n"
+             "with a threshold.");
+
+static PyObject *
+add_ngrams(PyObject *self, PyObject *args)
+{
+  PyObject *heapobj, *heapmap, *subs, *heaptopobj;
+  PyObject *extracthash, *make_elt, *update_elt, *replace, *anynew;
+  PyObject *comparator, *offsetobj = Py_None;
+  PyListObject *heap;
+  Py_ssize_t maxsize, nsize, nsubs, lheap, j;
+  Py_buffer hashbuf;
+  Py_buffer offsetbuf;
+  int sign;
+  const unsigned long long *hashes;
+  const unsigned long long *offsets = NULL;
+  unsigned long long h, heaptop;
+  PyObject *key = NULL, *elt, *out, *res;
+
+  (void)self;
+  offsetbuf.obj = NULL;
+  if (!PyArg_ParseTuple(args, "O!O!nnOny*OOOOOO(iO)|O",
+                        &PyList_Type, &heapobj, &PyDict_Type, &heapmap,
+                        &maxsize, &nsize, &subs, &nsubs, &hashbuf,
+                        &heaptopobj, &extracthash, &make_elt, &update_elt,
+                        &replace, &anynew, &sign, &comparator, &offsetobj)) {
+    return NULL;
+  }
+  if (offsetobj != Py_None &&
+      PyObject_GetBuffer(offsetobj, &offsetbuf, PyBUF_SIMPLE) < 0) {
+    PyBuffer_Release(&hashbuf);
+    return NULL;
+  }
+  heap = (PyListObject *)heapobj;
+
+  if (hashbuf.itemsize != sizeof(unsigned long long)) {
+    PyErr_SetString(PyExc_ValueError, "The buffer must be of format type Q.");
+    goto fail;
+  }
+  if (nsubs < 0 || nsubs > (hashbuf.len / hashbuf.itemsize)) {
+    PyErr_SetString(PyExc_ValueError, "The number of hash values cannot be larger than the buffer.");
+    goto fail;
+  }
+  if (offsetbuf.obj != NULL) {
+    if (offsetbuf.itemsize != sizeof(unsigned long long) ||
+        nsubs > (offsetbuf.len / offsetbuf.itemsize)) {
+      PyErr_SetString(PyExc_ValueError, "The buffer for offsets must be of format type Q and as long as the number of hash values.");
+      goto fail;
+    }
+    offsets = (const unsigned long long *)offsetbuf.buf;
+  }
+  if (sign != 1 && sign != -1) {
+    PyErr_SetString(PyExc_ValueError, "The sign in 'minmax_op' must be either 1 or -1.");
+    goto fail;
+  }
+
+  heaptop = PyLong_AsUnsignedLongLong(heaptopobj);
+  if (heaptop == (unsigned long long)-1 && PyErr_Occurred()) {
+    goto fail;
+  }
+
+  hashes = (const unsigned long long *)hashbuf.buf;
+  lheap = PyList_GET_SIZE(heap);
+
+  for (j = 0; j < nsubs; j++) {
+    h = hashes[j];
+    if (lheap >= maxsize && update_elt == Py_None &&
+        !(sign > 0 ? h >= heaptop : h <= heaptop)) {
+      /* Hopeless hash value: it cannot enter the sketch and, if already
+         present, there is nothing to update. */
+      continue;
+    }
+    key = PyLong_FromUnsignedLongLong(h);
+    if (key == NULL) {
+      goto fail;
+    }
+    elt = PyDict_GetItemWithError(heapmap, key);
+    if (elt != NULL) {
+      if (update_elt != Py_None) {
+        res = PyObject_CallFunctionObjArgs(update_elt, elt, NULL);
+        if (res == NULL) {
+          goto fail;
+        }
+        Py_DECREF(res);
+      }
+    } else if (PyErr_Occurred()) {
+      goto fail;
+    } else if (lheap < maxsize) {
+      elt = call_make_elt(make_elt, key, sign, subs,
+                          offsets == NULL ? j : (Py_ssize_t)offsets[j], nsize);
+      if (elt == NULL) {
+        goto fail;
+      }
+      /* Add element to set and heap. */
+      if (PyDict_SetItem(heapmap, key, elt) < 0 || heap_push(heap, elt) < 0) {
+        Py_DECREF(elt);
+        goto fail;
+      }
+      Py_DECREF(elt);
+      res = PyObject_CallFunctionObjArgs(extracthash, PyList_GET_ITEM(heap, 0), NULL);
+      if (res == NULL) {
+        goto fail;
+      }
+      heaptop = PyLong_AsUnsignedLongLong(res);
+      Py_DECREF(res);
+      if (heaptop == (unsigned long long)-1 && PyErr_Occurred()) {
+        goto fail;
+      }
+      lheap++;
+      if (call_anynew(anynew, key) < 0) {
+        goto fail;
+      }
+    } else if (sign > 0 ? h >= heaptop : h <= heaptop) {
+      unsigned long long hout;
+      PyObject *outkey;
+
+      elt = call_make_elt(make_elt, key, sign, subs,
+                          offsets == NULL ? j : (Py_ssize_t)offsets[j], nsize);
+      if (elt == NULL) {
+        goto fail;
+      }
+      /* Replace the top value in the heap. */
+      if (PyDict_SetItem(heapmap, key, elt) < 0) {
+        Py_DECREF(elt);
+        goto fail;
+      }
+      out = heap_replace(heap, elt);
+      Py_DECREF(elt);
+      if (out == NULL) {
+        goto fail;
+      }
+      if (signed_hash(out, sign, &hout) < 0) {
+        Py_DECREF(out);
+        goto fail;
+      }
+      Py_DECREF(out);
+      outkey = PyLong_FromUnsignedLongLong(hout);
+      if (outkey == NULL) {
+        goto fail;
+      }
+      if (PyDict_DelItem(heapmap, outkey) < 0) {
+        Py_DECREF(outkey);
+        goto fail;
+      }
+      Py_DECREF(outkey);
+      /* The negative of the hash is needed for MinHash. */
+      if (signed_hash(PyList_GET_ITEM(heap, 0), sign, &heaptop) < 0) {
+        goto fail;
+      }
+      if (call_anynew(anynew, key) < 0) {
+        goto fail;
+      }
+    }
+    Py_DECREF(key);
+    key = NULL;
+  }
+  PyBuffer_Release(&hashbuf);
+  if (offsetbuf.obj != NULL) {
+    PyBuffer_Release(&offsetbuf);
+  }
+  return PyLong_FromUnsignedLongLong(heaptop);
+
+ fail:
+  Py_XDECREF(key);
+  PyBuffer_Release(&hashbuf);
+  if (offsetbuf.obj != NULL) {
+    PyBuffer_Release(&offsetbuf);
+  }
+  return NULL;
+}
+
+/*
+ * Heaps of hash values (uint64) in a flat array. The item at the top of the
+ * heap (position 0) is the one that would be evicted first: the largest hash
+ * value for bottom sketches (sign -1) and the smallest for top sketches
+ * (sign +1).
+ */
+
+#define HASHHEAP_ABOVE(a, b, sign) ((sign) < 0 ? (a) > (b) : (a) < (b))
+
+static void
+hashheap_siftdown(unsigned long long *heap, Py_ssize_t pos, int sign)
+{
+  const unsigned long long newitem = heap[pos];
+  Py_ssize_t parentpos;
+
+  while (pos > 0) {
+    parentpos = (pos - 1) >> 1;
+    if (!HASHHEAP_ABOVE(newitem, heap[parentpos], sign)) {
+      break;
+    }
+    heap[pos] = heap[parentpos];
+    pos = parentpos;
+  }
+  heap[pos] = newitem;
+}
+
+static void
+hashheap_siftup(unsigned long long *heap, Py_ssize_t size, Py_ssize_t pos, int sign)
+{
+  const unsigned long long newitem = heap[pos];
+  Py_ssize_t childpos;
+
+  while ((childpos = 2 * pos + 1) < size) {
+    if (childpos + 1 < size &&
+        HASHHEAP_ABOVE(heap[childpos + 1], heap[childpos], sign)) {
+      childpos++;
+    }
+    if (!HASHHEAP_ABOVE(heap[childpos], newitem, sign)) {
+      break;
+    }
+    heap[pos] = heap[childpos];
+    pos = childpos;
+  }
+  heap[pos] = newitem;
+}
+
+/* Number of hash values common to two sorted arrays of unique hash values. */
+static Py_ssize_t
+sorted_intersection_count(const unsigned long long *a, Py_ssize_t na,
+                          const unsigned long long *b, Py_ssize_t nb)
+{
+  Py_ssize_t i = 0, j = 0, n = 0;
+  unsigned long long x, y;
+
+  /* Branchless merge (the outcome of comparisons is not predictable). */
+  while (i < na && j < nb) {
+    x = a[i];
+    y = b[j];
+    n += (x == y);
+    i += (x <= y);
+    j += (y <= x);
+  }
+  return n;
+}
+
+PyDoc_STRVAR(intersection_size_doc,
+             "intersection_size(a, b) -> int\n\n"
+             "Return the number of hash values common to the buffers 'a' and 'b', computed\n"
+             "with one linear merge. The buffers must be of format type Q, and contain\n"
+             "unique hash values sorted in increasing order.");
+
+static PyObject *
+intersection_size(PyObject *self, PyObject *args)
+{
+  Py_buffer abuf;
+  Py_buffer bbuf;
+  Py_ssize_t n;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "y*y*", &abuf, &bbuf)) {
+    return NULL;
+  }
+  if (abuf.itemsize != sizeof(unsigned long long) ||
+      bbuf.itemsize != sizeof(unsigned long long)) {
+    PyBuffer_Release(&abuf);
+    PyBuffer_Release(&bbuf);
+    PyErr_SetString(PyExc_ValueError, "The buffers must be of format type Q.");
+    return NULL;
+  }
+  n = sorted_intersection_count((const unsigned long long *)abuf.buf,
+                                abuf.len / abuf.itemsize,
+                                (const unsigned long long *)bbuf.buf,
+                                bbuf.len / bbuf.itemsize);
+  PyBuffer_Release(&abuf);
+  PyBuffer_Release(&bbuf);
+  return PyLong_FromSsize_t(n);
+}
+
+/* Sort n hash values in increasing order with a least-significant-digit radix
+   sort (8 passes of 8 bits), using tmp (n values) as scratch space. */
+static void
+radixsort_hashes(unsigned long long *values, unsigned long long *tmp,
+                 Py_ssize_t n)
+{
+  Py_ssize_t counts[256];
+  Py_ssize_t i, c, total;
+  unsigned long long *src = values, *dst = tmp, *swap;
+  int shift, skip;
+
+  for (shift = 0; shift < 64; shift += 8) {
+    memset(counts, 0, sizeof(counts));
+    for (i = 0; i < n; i++) {
+      counts[(src[i] >> shift) & 0xff]++;
+    }
+    /* nothing to do if all values have the same digit */
+    skip = 0;
+    for (c = 0; c < 256; c++) {
+      if (counts[c] == n) {
+        skip = 1;
+      }
+    }
+    if (skip) {
+      continue;
+    }
+    total = 0;
+    for (c = 0; c < 256; c++) {
+      i = counts[c];
+      counts[c] = total;
+      total += i;
+    }
+    for (i = 0; i < n; i++) {
+      dst[counts[(src[i] >> shift) & 0xff]++] = src[i];
+    }
+    swap = src;
+    src = dst;
+    dst = swap;
+  }
+  if (src != values) {
+    memcpy(values, src, (size_t)n * sizeof(unsigned long long));
+  }
+}
+
+PyDoc_STRVAR(sort_unique_doc,
+             "sort_unique(hashbuffer) -> int\n\n"
+             "Sort the hash values in the buffer 'hashbuffer' (format type Q) in increasing\n"
+             "order and move the unique ones to the beginning of the buffer. Return the\n"
+             "number of unique hash values. The GIL is released during the sort.");
+
+static PyObject *
+sort_unique(PyObject *self, PyObject *args)
+{
+  Py_buffer hashbuf;
+  Py_ssize_t n, i, nunique = 0;
+  unsigned long long *hashes, *tmp;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "w*", &hashbuf)) {
+    return NULL;
+  }
+  if (hashbuf.itemsize != sizeof(unsigned long long)) {
+    PyBuffer_Release(&hashbuf);
+    PyErr_SetString(PyExc_ValueError, "The buffer must be of format type Q.");
+    return NULL;
+  }
+  n = hashbuf.len / hashbuf.itemsize;
+  hashes = (unsigned long long *)hashbuf.buf;
+  if (n < 2) {
+    PyBuffer_Release(&hashbuf);
+    return PyLong_FromSsize_t(n);
+  }
+  tmp = PyMem_Malloc((size_t)n * sizeof(unsigned long long));
+  if (tmp == NULL) {
+    PyBuffer_Release(&hashbuf);
+    return PyErr_NoMemory();
+  }
+  Py_BEGIN_ALLOW_THREADS
+  radixsort_hashes(hashes, tmp, n);
+  for (i = 0; i < n; i++) {
+    if (nunique == 0 || hashes[i] != hashes[nunique - 1]) {
+      hashes[nunique++] = hashes[i];
+    }
+  }
+  Py_END_ALLOW_THREADS
+  PyMem_Free(tmp);
+  PyBuffer_Release(&hashbuf);
+  return PyLong_FromSsize_t(nunique);
+}
+
+PyDoc_STRVAR(sorted_union_doc,
+             "sorted_union(a, b, out) -> int\n\n"
+             "Write the union of the buffers 'a' and 'b' (unique hash values sorted in\n"
+             "increasing order) to the buffer 'out', sorted and without duplicates, with\n"
+             "one linear merge. 'out' must have room for len(a) + len(b) hash values.\n"
+             "Return the number of hash values written. Buffers must be of format type Q.");
+
+static PyObject *
+sorted_union(PyObject *self, PyObject *args)
+{
+  Py_buffer abuf;
+  Py_buffer bbuf;
+  Py_buffer outbuf;
+  Py_ssize_t na, nb, i = 0, j = 0, n = 0;
+  const unsigned long long *a, *b;
+  unsigned long long *out;
+  unsigned long long x, y;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "y*y*w*", &abuf, &bbuf, &outbuf)) {
+    return NULL;
+  }
+  if (abuf.itemsize != sizeof(unsigned long long) ||
+      bbuf.itemsize != sizeof(unsigned long long) ||
+      outbuf.itemsize != sizeof(unsigned long long)) {
+    PyErr_SetString(PyExc_ValueError, "The buffers must be of format type Q.");
+    goto fail;
+  }
+  na = abuf.len / abuf.itemsize;
+  nb = bbuf.len / bbuf.itemsize;
+  if (outbuf.len / outbuf.itemsize < na + nb) {
+    PyErr_SetString(PyExc_ValueError, "The buffer 'out' is too small.");
+    goto fail;
+  }
+  a = (const unsigned long long *)abuf.buf;
+  b = (const unsigned long long *)bbuf.buf;
+  out = (unsigned long long *)outbuf.buf;
+  Py_BEGIN_ALLOW_THREADS
+  while (i < na && j < nb) {
+    x = a[i];
+    y = b[j];
+    out[n++] = x <= y ? x : y;
+    i += (x <= y);
+    j += (y <= x);
+  }
+  while (i < na) {
+    out[n++] = a[i++];
+  }
+  while (j < nb) {
+    out[n++] = b[j++];
+  }
+  Py_END_ALLOW_THREADS
+  PyBuffer_Release(&abuf);
+  PyBuffer_Release(&bbuf);
+  PyBuffer_Release(&outbuf);
+  return PyLong_FromSsize_t(n);
+
+ fail:
+  PyBuffer_Release(&abuf);
+  PyBuffer_Release(&bbuf);
+  PyBuffer_Release(&outbuf);
+  return NULL;
+}
+
+PyDoc_STRVAR(postings_count_doc,
+             "postings_count(hashes, offsets, ids, query, counts) -> int\n\n"
+             "Count the hash values in 'query' (sorted in increasing order) shared with each\n"
+             "sketch in an inverted index. The index is the buffer 'hashes' (unique hash values\n"
+             "sorted in increasing order), the buffer 'offsets' (one more than 'hashes'), and the\n"
+             "buffer 'ids' (format type I) such as the identifiers of the sketches with hashes[i]\n"
+             "are ids[offsets[i]:offsets[i+1]]. counts[id] is incremented for each hash value\n"
+             "in 'query' in the sketch 'id'. Return the number of hash values in 'query' found\n"
+             "in the index. Buffers other than 'ids' must be of format type Q.");
+
+static PyObject *
+postings_count(PyObject *self, PyObject *args)
+{
+  Py_buffer hashbuf;
+  Py_buffer offsetbuf;
+  Py_buffer idbuf;
+  Py_buffer querybuf;
+  Py_buffer countbuf;
+  Py_ssize_t nhashes, nids, nquery, ncounts, i, lo, hi, mid;
+  Py_ssize_t nfound = 0;
+  unsigned long long h, j, start, end;
+  const unsigned long long *hashes, *offsets, *query;
+  const unsigned int *ids;
+  unsigned long long *counts;
+  int invalid = 0;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "y*y*y*y*w*", &hashbuf, &offsetbuf, &idbuf,
+                        &querybuf, &countbuf)) {
+    return NULL;
+  }
+  if (hashbuf.itemsize != sizeof(unsigned long long) ||
+      offsetbuf.itemsize != sizeof(unsigned long long) ||
+      querybuf.itemsize != sizeof(unsigned long long) ||
+      countbuf.itemsize != sizeof(unsigned long long) ||
+      idbuf.itemsize != sizeof(unsigned int)) {
+    PyErr_SetString(PyExc_ValueError, "The buffers must be of format type Q ('ids' of format type I).");
+    goto fail;
+  }
+  nhashes = hashbuf.len / hashbuf.itemsize;
+  nids = idbuf.len / idbuf.itemsize;
+  nquery = querybuf.len / querybuf.itemsize;
+  ncounts = countbuf.len / countbuf.itemsize;
+  if (offsetbuf.len / offsetbuf.itemsize != nhashes + 1) {
+    PyErr_SetString(PyExc_ValueError, "The buffer 'offsets' must have one more element than 'hashes'.");
+    goto fail;
+  }
+  hashes = (const unsigned long long *)hashbuf.buf;
+  offsets = (const unsigned long long *)offsetbuf.buf;
+  ids = (const unsigned int *)idbuf.buf;
+  query = (const unsigned long long *)querybuf.buf;
+  counts = (unsigned long long *)countbuf.buf;
+  Py_BEGIN_ALLOW_THREADS
+  /* The query is sorted: the lower bound of the binary search only moves
+     forward. */
+  lo = 0;
+  for (i = 0; i < nquery && lo < nhashes; i++) {
+    h = query[i];
+    hi = nhashes;
+    while (lo < hi) {
+      mid = lo + (hi - lo) / 2;
+      if (hashes[mid] < h) {
+        lo = mid + 1;
+      } else {
+        hi = mid;
+      }
+    }
+    if (lo == nhashes || hashes[lo] != h) {
+      continue;
+    }
+    nfound++;
+    start = offsets[lo];
+    end = offsets[lo + 1];
+    if (start > end || end > (unsigned long long)nids) {
+      invalid = 1;
+      break;
+    }
+    for (j = start; j < end; j++) {
+      if (ids[j] >= (unsigned long long)ncounts) {
+        invalid = 1;
+        break;
+      }
+      counts[ids[j]]++;
+    }
+    if (invalid) {
+      break;
+    }
+    lo++;
+  }
+  Py_END_ALLOW_THREADS
+  if (invalid) {
+    PyErr_SetString(PyExc_ValueError, "Invalid index (offset or identifier out of range).");
+    goto fail;
+  }
+  PyBuffer_Release(&hashbuf);
+  PyBuffer_Release(&offsetbuf);
+  PyBuffer_Release(&idbuf);
+  PyBuffer_Release(&querybuf);
+  PyBuffer_Release(&countbuf);
+  return PyLong_FromSsize_t(nfound);
+
+ fail:
+  PyBuffer_Release(&hashbuf);
+  PyBuffer_Release(&offsetbuf);
+  PyBuffer_Release(&idbuf);
+  PyBuffer_Release(&querybuf);
+  PyBuffer_Release(&countbuf);
+  return NULL;
+}
+
+/* Sort n hash values and the identifiers next to them (ids[i] goes with
+   values[i]) by hash value, with a stable least-significant-digit radix sort
+   (8 passes of 8 bits), using tmp and tmpids (n values) as scratch space. */
+static void
+radixsort_pairs(unsigned long long *values, unsigned int *ids,
+                unsigned long long *tmp, unsigned int *tmpids,
+                Py_ssize_t n)
+{
+  Py_ssize_t counts[256];
+  Py_ssize_t i, c, total, j;
+  unsigned long long *src = values, *dst = tmp, *swap;
+  unsigned int *srcids = ids, *dstids = tmpids, *swapids;
+  int shift, skip;
+
+  for (shift = 0; shift < 64; shift += 8) {
+    memset(counts, 0, sizeof(counts));
+    for (i = 0; i < n; i++) {
+      counts[(src[i] >> shift) & 0xff]++;
+    }
+    /* nothing to do if all values have the same digit */
+    skip = 0;
+    for (c = 0; c < 256; c++) {
+      if (counts[c] == n) {
+        skip = 1;
+      }
+    }
+    if (skip) {
+      continue;
+    }
+    total = 0;
+    for (c = 0; c < 256; c++) {
+      i = counts[c];
+      counts[c] = total;
+      total += i;
+    }
+    for (i = 0; i < n; i++) {
+      j = counts[(src[i] >> shift) & 0xff]++;
+      dst[j] = src[i];
+      dstids[j] = srcids[i];
+    }
+    swap = src;
+    src = dst;
+    dst = swap;
+    swapids = srcids;
+    srcids = dstids;
+    dstids = swapids;
+  }
+  if (src != values) {
+    memcpy(values, src, (size_t)n * sizeof(unsigned long long));
+    memcpy(ids, srcids, (size_t)n * sizeof(unsigned int));
+  }
+}
+
+PyDoc_STRVAR(postings_index_doc,
+             "postings_index(hashes, ids, offsets) -> int\n\n"
+             "Make an inverted index (see postings_count) in place from pairs of a hash value in\n"
+             "the buffer 'hashes' and the identifier of a sketch in the buffer 'ids' (format\n"
+             "type I, as long as 'hashes'). The pairs are sorted by hash value (the order of\n"
+             "the identifiers for a hash value is kept), the unique hash values are moved to\n"
+             "the beginning of 'hashes', and the offsets of their identifiers in 'ids' are\n"
+             "written to 'offsets' (one more than the pairs). Return the number of unique hash\n"
+             "values. Buffers other than 'ids' must be of format type Q. The GIL is released\n"
+             "during the sort.");
+
+static PyObject *
+postings_index(PyObject *self, PyObject *args)
+{
+  Py_buffer hashbuf;
+  Py_buffer idbuf;
+  Py_buffer offsetbuf;
+  Py_ssize_t n, i, nunique = 0;
+  unsigned long long *hashes, *offsets;
+  unsigned int *ids;
+  unsigned long long *tmp = NULL;
+  unsigned int *tmpids = NULL;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "w*w*w*", &hashbuf, &idbuf, &offsetbuf)) {
+    return NULL;
+  }
+  if (hashbuf.itemsize != sizeof(unsigned long long) ||
+      offsetbuf.itemsize != sizeof(unsigned long long) ||
+      idbuf.itemsize != sizeof(unsigned int)) {
+    PyErr_SetString(PyExc_ValueError, "The buffers must be of format type Q ('ids' of format type I).");
+    goto fail;
+  }
+  n = hashbuf.len / hashbuf.itemsize;
+  if (idbuf.len / idbuf.itemsize != n) {
+    PyErr_SetString(PyExc_ValueError, "The buffers 'hashes' and 'ids' must have the same length.");
+    goto fail;
+  }
+  if (offsetbuf.len / offsetbuf.itemsize < n + 1) {
+    PyErr_SetString(PyExc_ValueError, "The buffer 'offsets' is too small.");
+    goto fail;
+  }
+  hashes = (unsigned long long *)hashbuf.buf;
+  ids = (unsigned int *)idbuf.buf;
+  offsets = (unsigned long long *)offsetbuf.buf;
+  tmp = PyMem_Malloc((size_t)(n > 0 ? n : 1) * sizeof(unsigned long long));
+  tmpids = PyMem_Malloc((size_t)(n > 0 ? n : 1) * sizeof(unsigned int));
+  if (tmp == NULL || tmpids == NULL) {
+    PyErr_NoMemory();
+    goto fail;
+  }
+  Py_BEGIN_ALLOW_THREADS
+  radixsort_pairs(hashes, ids, tmp, tmpids, n);
+  offsets[0] = 0;
+  for (i = 0; i < n; i++) {
+    if (nunique == 0 || hashes[i] != hashes[nunique - 1]) {
+      hashes[nunique++] = hashes[i];
+    }
+    offsets[nunique] = (unsigned long long)(i + 1);
+  }
+  Py_END_ALLOW_THREADS
+  PyMem_Free(tmp);
+  PyMem_Free(tmpids);
+  PyBuffer_Release(&hashbuf);
+  PyBuffer_Release(&idbuf);
+  PyBuffer_Release(&offsetbuf);
+  return PyLong_FromSsize_t(nunique);
+
+ fail:
+  PyMem_Free(tmp);
+  PyMem_Free(tmpids);
+  PyBuffer_Release(&hashbuf);
+  PyBuffer_Release(&idbuf);
+  PyBuffer_Release(&offsetbuf);
+  return NULL;
+}
+
+/* Append the identifiers for the hash value at position i in an inverted
+   index to out (at position *nout). Return -1 if the offsets are not
+   valid, 0 otherwise. */
+static int
+append_postings(const unsigned long long *offsets, Py_ssize_t i,
+                const unsigned int *ids, Py_ssize_t nids,
+                unsigned int *out, unsigned long long *nout)
+{
+  unsigned long long start = offsets[i], end = offsets[i + 1];
+  if (start > end || end > (unsigned long long)nids) {
+    return -1;
+  }
+  memcpy(out + *nout, ids + start, (size_t)(end - start) * sizeof(unsigned int));
+  *nout += end - start;
+  return 0;
+}
+
+PyDoc_STRVAR(postings_merge_doc,
+             "postings_merge(ahashes, aoffsets, aids, bhashes, boffsets, bids, hashes, offsets, ids) -> int\n\n"
+             "Merge two inverted indexes (see postings_count) 'a' and 'b' into 'hashes', 'offsets',\n"
+             "and 'ids', with one linear merge. For a hash value in both, the identifiers from\n"
+             "'a' come first. The output buffers must have room for all hash values (plus one\n"
+             "offset) and identifiers in 'a' and 'b'. Return the number of unique hash values\n"
+             "written. Buffers for identifiers must be of format type I, the others of format\n"
+             "type Q.");
+
+static PyObject *
+postings_merge(PyObject *self, PyObject *args)
+{
+  Py_buffer bufs[9];
+  Py_ssize_t lengths[9];
+  const unsigned long long *ah, *ao, *bh, *bo;
+  const unsigned int *ai, *bi;
+  unsigned long long *oh, *oo;
+  unsigned int *oi;
+  Py_ssize_t na, nb, i = 0, j = 0, n = 0, k;
+  unsigned long long nids = 0;
+  int invalid = 0;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "y*y*y*y*y*y*w*w*w*", &bufs[0], &bufs[1],
+                        &bufs[2], &bufs[3], &bufs[4], &bufs[5], &bufs[6],
+                        &bufs[7], &bufs[8])) {
+    return NULL;
+  }
+  for (k = 0; k < 9; k++) {
+    if ((size_t)bufs[k].itemsize !=
+        (k % 3 == 2 ? sizeof(unsigned int) : sizeof(unsigned long long))) {
+      PyErr_SetString(PyExc_ValueError, "The buffers must be of format type Q (for identifiers of format type I).");
+      goto fail;
+    }
+    lengths[k] = bufs[k].len / bufs[k].itemsize;
+  }
+  na = lengths[0];
+  nb = lengths[3];
+  if (lengths[1] != na + 1 || lengths[4] != nb + 1) {
+    PyErr_SetString(PyExc_ValueError, "The buffers for offsets must have one more element than the ones for hash values.");
+    goto fail;
+  }
+  if (lengths[6] < na + nb || lengths[7] < na + nb + 1 ||
+      lengths[8] < lengths[2] + lengths[5]) {
+    PyErr_SetString(PyExc_ValueError, "The output buffers are too small.");
+    goto fail;
+  }
+  ah = (const unsigned long long *)bufs[0].buf;
+  ao = (const unsigned long long *)bufs[1].buf;
+  ai = (const unsigned int *)bufs[2].buf;
+  bh = (const unsigned long long *)bufs[3].buf;
+  bo = (const unsigned long long *)bufs[4].buf;
+  bi = (const unsigned int *)bufs[5].buf;
+  oh = (unsigned long long *)bufs[6].buf;
+  oo = (unsigned long long *)bufs[7].buf;
+  oi = (unsigned int *)bufs[8].buf;
+  Py_BEGIN_ALLOW_THREADS
+  oo[0] = 0;
+  while (!invalid && (i < na || j < nb)) {
+    if (j == nb || (i < na && ah[i] < bh[j])) {
+      oh[n] = ah[i];
+      invalid = append_postings(ao, i, ai, lengths[2], oi, &nids);
+      i++;
+    } else if (i == na || bh[j] < ah[i]) {
+      oh[n] = bh[j];
+      invalid = append_postings(bo, j, bi, lengths[5], oi, &nids);
+      j++;
+    } else {
+      oh[n] = ah[i];
+      invalid = (append_postings(ao, i, ai, lengths[2], oi, &nids) ||
+                 append_postings(bo, j, bi, lengths[5], oi, &nids));
+      i++;
+      j++;
+    }
+    n++;
+    oo[n] = nids;
+  }
+  Py_END_ALLOW_THREADS
+  if (invalid) {
+    PyErr_SetString(PyExc_ValueError, "Invalid index (offset out of range).");
+    goto fail;
+  }
+  for (k = 0; k < 9; k++) {
+    PyBuffer_Release(&bufs[k]);
+  }
+  return PyLong_FromSsize_t(n);
+
+ fail:
+  for (k = 0; k < 9; k++) {
+    PyBuffer_Release(&bufs[k]);
+  }
+  return NULL;
+}
+
+/*
+ * Merge two sorted arrays of unique hash values, keeping the k lowest
+ * (sign < 0) or the k highest (sign > 0) distinct values. The values are
+ * written to out in increasing order, and their number is returned.
+ */
+static Py_ssize_t
+bottomk_merge_count(const unsigned long long *a, Py_ssize_t na,
+                    const unsigned long long *b, Py_ssize_t nb,
+                    Py_ssize_t k, int sign, unsigned long long *out)
+{
+  Py_ssize_t i, j, n = 0, l;
+  unsigned long long x, y, tmp;
+
+  if (sign < 0) {
+    i = 0;
+    j = 0;
+    while (n < k && i < na && j < nb) {
+      x = a[i];
+      y = b[j];
+      out[n++] = x <= y ? x : y;
+      i += (x <= y);
+      j += (y <= x);
+    }
+    while (n < k && i < na) {
+      out[n++] = a[i++];
+    }
+    while (n < k && j < nb) {
+      out[n++] = b[j++];
+    }
+    return n;
+  }
+  /* From the highest values, then reversed. */
+  i = na - 1;
+  j = nb - 1;
+  while (n < k && i >= 0 && j >= 0) {
+    x = a[i];
+    y = b[j];
+    out[n++] = x >= y ? x : y;
+    i -= (x >= y);
+    j -= (y >= x);
+  }
+  while (n < k && i >= 0) {
+    out[n++] = a[i--];
+  }
+  while (n < k && j >= 0) {
+    out[n++] = b[j--];
+  }
+  for (l = 0; l < n / 2; l++) {
+    tmp = out[l];
+    out[l] = out[n - 1 - l];
+    out[n - 1 - l] = tmp;
+  }
+  return n;
+}
+
+PyDoc_STRVAR(bottomk_merge_doc,
+             "bottomk_merge(a, b, k, sign, out) -> int\n\n"
+             "Merge the buffers 'a' and 'b' (unique hash values sorted in increasing\n"
+             "order) with one linear pass, keeping the 'k' lowest distinct hash values if\n"
+             "'sign' is -1 or the 'k' highest if 'sign' is 1 (that is the content of a\n"
+             "bottom or top sketch of maximum size 'k' merging two such sketches). The\n"
+             "hash values kept are written to the buffer 'out' in increasing order, and\n"
+             "their number is returned. 'out' must have room for min(k, len(a) + len(b))\n"
+             "hash values. Buffers must be of format type Q.");
+
+static PyObject *
+bottomk_merge(PyObject *self, PyObject *args)
+{
+  Py_buffer abuf;
+  Py_buffer bbuf;
+  Py_buffer outbuf;
+  Py_ssize_t k, na, nb, n;
+  int sign;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "y*y*niw*", &abuf, &bbuf, &k, &sign, &outbuf)) {
+    return NULL;
+  }
+  if (abuf.itemsize != sizeof(unsigned long long) ||
+      bbuf.itemsize != sizeof(unsigned long long) ||
+      outbuf.itemsize != sizeof(unsigned long long)) {
+    PyErr_SetString(PyExc_ValueError, "The buffers must be of format type Q.");
+    goto fail;
+  }
+  if (sign != 1 && sign != -1) {
+    PyErr_SetString(PyExc_ValueError, "The sign must be either 1 or -1.");
+    goto fail;
+  }
+  if (k < 0) {
+    PyErr_SetString(PyExc_ValueError, "k cannot be negative.");
+    goto fail;
+  }
+  na = abuf.len / abuf.itemsize;
+  nb = bbuf.len / bbuf.itemsize;
+  if (outbuf.len / outbuf.itemsize < (k < na + nb ? k : na + nb)) {
+    PyErr_SetString(PyExc_ValueError, "The buffer 'out' is too small.");
+    goto fail;
+  }
+  Py_BEGIN_ALLOW_THREADS
+  n = bottomk_merge_count((const unsigned long long *)abuf.buf, na,
+                          (const unsigned long long *)bbuf.buf, nb,
+                          k, sign, (unsigned long long *)outbuf.buf);
+  Py_END_ALLOW_THREADS
+  PyBuffer_Release(&abuf);
+  PyBuffer_Release(&bbuf);
+  PyBuffer_Release(&outbuf);
+  return PyLong_FromSsize_t(n);
+
+ fail:
+  PyBuffer_Release(&abuf);
+  PyBuffer_Release(&bbuf);
+  PyBuffer_Release(&outbuf);
+  return NULL;
+}
+
+PyDoc_STRVAR(keep_below_doc,
+             "keep_below(hashbuffer, nhashes, threshold) -> int\n\n"
+             "Move the hash values lower than or equal to 'threshold' among the first\n"
+             "'nhashes' hash values in 'hashbuffer' (format type Q) to the beginning of\n"
+             "the buffer, in the same order, and return their number.");
+
+static PyObject *
+keep_below(PyObject *self, PyObject *args)
+{
+  Py_buffer hashbuf;
+  Py_ssize_t nhashes, i, nkept = 0;
+  unsigned long long threshold, h;
+  unsigned long long *hashes;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "w*nK", &hashbuf, &nhashes, &threshold)) {
+    return NULL;
+  }
+  if (hashbuf.itemsize != sizeof(unsigned long long)) {
+    PyBuffer_Release(&hashbuf);
+    PyErr_SetString(PyExc_ValueError, "The buffer must be of format type Q.");
+    return NULL;
+  }
+  if (nhashes < 0 || nhashes > (hashbuf.len / hashbuf.itemsize)) {
+    PyBuffer_Release(&hashbuf);
+    PyErr_SetString(PyExc_ValueError, "The number of hash values cannot be larger than the buffer.");
+    return NULL;
+  }
+  hashes = (unsigned long long *)hashbuf.buf;
+  /* Branchless: the outcome of the comparisons is not predictable. */
+  for (i = 0; i < nhashes; i++) {
+    h = hashes[i];
+    hashes[nkept] = h;
+    nkept += (h <= threshold);
+  }
+  PyBuffer_Release(&hashbuf);
+  return PyLong_FromSsize_t(nkept);
+}
+
+/*
+ * Walk the union of two sorted arrays of unique hash values from the end
+ * kept by the sketches (the lowest values when sign < 0, the highest values
+ * when sign > 0) until k distinct values are seen, and count how many of
+ * these are in both arrays. This is the MinHash estimator for bottom-k (or
+ * top-k) sketches: *shared / *total estimates the Jaccard index between the
+ * sets the sketches were built from.
+ */
+static void
+bottomk_union_count(const unsigned long long *a, Py_ssize_t na,
+                    const unsigned long long *b, Py_ssize_t nb,
+                    Py_ssize_t k, int sign,
+                    Py_ssize_t *shared, Py_ssize_t *total)
+{
+  Py_ssize_t i, j, n = 0, q = 0;
+  unsigned long long x, y;
+
+  if (sign < 0) {
+    i = 0;
+    j = 0;
+    while (n < k && i < na && j < nb) {
+      x = a[i];
+      y = b[j];
+      q += (x == y);
+      i += (x <= y);
+      j += (y <= x);
+      n++;
+    }
+  } else {
+    i = na - 1;
+    j = nb - 1;
+    while (n < k && i >= 0 && j >= 0) {
+      x = a[i];
+      y = b[j];
+      q += (x == y);
+      i -= (x >= y);
+      j -= (y >= x);
+      n++;
+    }
+    /* Number of values left, as when walking forward. */
+    i = na - 1 - i;
+    j = nb - 1 - j;
+  }
+  /* Values left in one of the arrays are not shared. */
+  n += (na - i) + (nb - j);
+  *shared = q;
+  *total = n < k ? n : k;
+}
+
+PyDoc_STRVAR(bottomk_union_doc,
+             "bottomk_union(a, b, k, sign) -> (int, int)\n\n"
+             "Return the pair (shared, total) for the k first distinct hash values in the\n"
+             "union of the buffers 'a' and 'b', starting from the lowest values when sign\n"
+             "is -1 (bottom sketches) or from the highest values when sign is 1 (top\n"
+             "sketches). 'total' is the number of values considered (k, or less when the\n"
+             "union is smaller) and 'shared' the number of these values present in both\n"
+             "buffers. The buffers must be of format type Q, and contain unique hash\n"
+             "values sorted in increasing order.");
+
+static PyObject *
+bottomk_union(PyObject *self, PyObject *args)
+{
+  Py_buffer abuf;
+  Py_buffer bbuf;
+  Py_ssize_t k, shared, total;
+  int sign;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "y*y*ni", &abuf, &bbuf, &k, &sign)) {
+    return NULL;
+  }
+  if (abuf.itemsize != sizeof(unsigned long long) ||
+      bbuf.itemsize != sizeof(unsigned long long)) {
+    PyBuffer_Release(&abuf);
+    PyBuffer_Release(&bbuf);
+    PyErr_SetString(PyExc_ValueError, "The buffers must be of format type Q.");
+    return NULL;
+  }
+  if ((sign != -1 && sign != 1) || k < 0) {
+    PyBuffer_Release(&abuf);
+    PyBuffer_Release(&bbuf);
+    PyErr_SetString(PyExc_ValueError, "'sign' must be -1 or 1, and 'k' must be positive.");
+    return NULL;
+  }
+  bottomk_union_count((const unsigned long long *)abuf.buf,
+                      abuf.len / abuf.itemsize,
+                      (const unsigned long long *)bbuf.buf,
+                      bbuf.len / bbuf.itemsize,
+                      k, sign, &shared, &total);
+  PyBuffer_Release(&abuf);
+  PyBuffer_Release(&bbuf);
+  return Py_BuildValue("nn", shared, total);
+}
+
+enum {
+  METRIC_JACCARD_SIMILARITY = 0,
+  METRIC_JACCARD_CONTAINMENT = 1,
+  METRIC_DICE_SIMILARITY = 2,
+  METRIC_JACCARD_ESTIMATE = 3,
+  METRIC_MASH_DISTANCE = 4
+};
+
+/* Parameters for the MinHash estimators. */
+typedef struct {
+  Py_ssize_t k;
+  int sign;
+  int nsize;
+} estimator_params;
+
+/* Mash distance for a Jaccard index j and k-mers of size nsize. */
+static double
+mash_distance(double j, int nsize)
+{
+  if (j <= 0.0) {
+    return 1.0;
+  }
+  /* not -log(2j / (1 + j)): -0.0 for j == 1 */
+  return log((1.0 + j) / (2.0 * j)) / (double)nsize;
+}
+
+static double
+pair_metric(const unsigned long long *hashes, const unsigned long long *offsets,
+            Py_ssize_t i, Py_ssize_t j, int metric, const estimator_params *params)
+{
+  const Py_ssize_t na = (Py_ssize_t)(offsets[i + 1] - offsets[i]);
+  const Py_ssize_t nb = (Py_ssize_t)(offsets[j + 1] - offsets[j]);
+  Py_ssize_t q, n;
+
+  if (metric == METRIC_JACCARD_ESTIMATE || metric == METRIC_MASH_DISTANCE) {
+    bottomk_union_count(hashes + offsets[i], na, hashes + offsets[j], nb,
+                        params->k, params->sign, &q, &n);
+    if (metric == METRIC_JACCARD_ESTIMATE) {
+      return (double)q / (double)n;
+    }
+    return mash_distance((double)q / (double)n, params->nsize);
+  }
+  q = sorted_intersection_count(hashes + offsets[i], na,
+                                hashes + offsets[j], nb);
+  switch (metric) {
+  case METRIC_JACCARD_SIMILARITY:
+    return (double)q / (double)(na + nb - q);
+  case METRIC_JACCARD_CONTAINMENT:
+    return (double)q / (double)na;
+  case METRIC_DICE_SIMILARITY:
+    return 2.0 * (double)q / (double)(na + nb);
+  default:
+    return 0.0;
+  }
+}
+
+/* Number of rows and columns in a tile. */
+#define PAIRWISE_TILE 64
+
+PyDoc_STRVAR(pairwise_doc,
+             "pairwise(hashes, offsets, metric, out, rowbeg, rowend, colbeg, colend\n"
+             "         [, k, sign, nsize]) -> None\n\n"
+             "Compute a similarity index for all pairs of sketches (i, j) with\n"
+             "rowbeg <= i < rowend and colbeg <= j < colend, and store it in the buffer of\n"
+             "doubles 'out' as a row-major matrix of shape (rowend-rowbeg, colend-colbeg).\n\n"
+             "The sketches are packed in the buffer 'hashes' (format type Q), the hash\n"
+             "values for the sketch i being hashes[offsets[i]:offsets[i+1]] (sorted in\n"
+             "increasing order and unique). The index is 0 for the Jaccard similarity, 1\n"
+             "for the Jaccard containment (of i in j), 2 for the Dice similarity, 3 for the\n"
+             "MinHash estimate of the Jaccard index, and 4 for the Mash distance. The two\n"
+             "latter use the k first values in the union of the sketches, starting from the\n"
+             "lowest values when sign is -1 or from the highest values when sign is 1, and\n"
+             "the Mash distance uses the k-mer size 'nsize'.\n"
+             "Pairs are processed in tiles and, for symmetric indices over a square block\n"
+             "on the diagonal, only once. The GIL is released during the computation.");
+
+static PyObject *
+pairwise(PyObject *self, PyObject *args)
+{
+  Py_buffer hashbuf, offsetbuf, outbuf;
+  PyObject *outobj;
+  Py_ssize_t rowbeg, rowend, colbeg, colend, nsketches, ncols;
+  Py_ssize_t ti, tj, i, j, jbeg, iend, jend;
+  int metric, symmetric;
+  const unsigned long long *hashes, *offsets;
+  double *out;
+  double value;
+  estimator_params params = {PY_SSIZE_T_MAX, -1, 0};
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "y*y*iOnnnn|nii", &hashbuf, &offsetbuf, &metric, &outobj,
+                        &rowbeg, &rowend, &colbeg, &colend,
+                        &params.k, &params.sign, &params.nsize)) {
+    return NULL;
+  }
+  if (PyObject_GetBuffer(outobj, &outbuf, PyBUF_WRITABLE | PyBUF_FORMAT) < 0) {
+    PyBuffer_Release(&hashbuf);
+    PyBuffer_Release(&offsetbuf);
+    return NULL;
+  }
+  if (hashbuf.itemsize != sizeof(unsigned long long) ||
+      offsetbuf.itemsize != sizeof(unsigned long long)) {
+    PyErr_SetString(PyExc_ValueError, "The buffers for hashes and offsets must be of format type Q.");
+    goto fail;
+  }
+  if (outbuf.itemsize != sizeof(double) || outbuf.format == NULL ||
+      !(strcmp(outbuf.format, "d") == 0 || strcmp(outbuf.format, "@d") == 0 ||
+        strcmp(outbuf.format, "=d") == 0)) {
+    PyErr_SetString(PyExc_ValueError, "The buffer 'out' must be of format type d.");
+    goto fail;
+  }
+  if (metric < METRIC_JACCARD_SIMILARITY || metric > METRIC_MASH_DISTANCE) {
+    PyErr_SetString(PyExc_ValueError, "Invalid similarity index.");
+    goto fail;
+  }
+  if ((params.sign != -1 && params.sign != 1) || params.k < 1 ||
+      (metric == METRIC_MASH_DISTANCE && params.nsize < 1)) {
+    PyErr_SetString(PyExc_ValueError, "Invalid parameters for the estimator.");
+    goto fail;
+  }
+  nsketches = offsetbuf.len / offsetbuf.itemsize - 1;
+  if (rowbeg < 0 || colbeg < 0 || rowbeg > rowend || colbeg > colend ||
+      rowend > nsketches || colend > nsketches) {
+    PyErr_SetString(PyExc_ValueError, "Invalid range of rows or columns.");
+    goto fail;
+  }
+  ncols = colend - colbeg;
+  if ((outbuf.len / outbuf.itemsize) < (rowend - rowbeg) * ncols) {
+    PyErr_SetString(PyExc_ValueError, "The buffer 'out' is too small.");
+    goto fail;
+  }
+  hashes = (const unsigned long long *)hashbuf.buf;
+  offsets = (const unsigned long long *)offsetbuf.buf;
+  for (i = 0; i < nsketches; i++) {
+    if (offsets[i] > offsets[i + 1] ||
+        offsets[i + 1] > (unsigned long long)(hashbuf.len / hashbuf.itemsize)) {
+      PyErr_SetString(PyExc_ValueError, "Invalid offsets.");
+      goto fail;
+    }
+  }
+  out = (double *)outbuf.buf;
+  symmetric = (metric != METRIC_JACCARD_CONTAINMENT &&
+               rowbeg == colbeg && rowend == colend);
+
+  Py_BEGIN_ALLOW_THREADS
+  for (ti = rowbeg; ti < rowend; ti += PAIRWISE_TILE) {
+    iend = ti + PAIRWISE_TILE < rowend ? ti + PAIRWISE_TILE : rowend;
+    for (tj = (symmetric ? ti : colbeg); tj < colend; tj += PAIRWISE_TILE) {
+      jend = tj + PAIRWISE_TILE < colend ? tj + PAIRWISE_TILE : colend;
+      for (i = ti; i < iend; i++) {
+        jbeg = (symmetric && tj < i) ? i : tj;
+        for (j = jbeg; j < jend; j++) {
+          value = pair_metric(hashes, offsets, i, j, metric, &params);
+          out[(i - rowbeg) * ncols + (j - colbeg)] = value;
+          if (symmetric) {
+            out[(j - rowbeg) * ncols + (i - colbeg)] = value;
+          }
+        }
+      }
+    }
+  }
+  Py_END_ALLOW_THREADS
+  PyBuffer_Release(&hashbuf);
+  PyBuffer_Release(&offsetbuf);
+  PyBuffer_Release(&outbuf);
+  Py_RETURN_NONE;
+
+ fail:
+  PyBuffer_Release(&hashbuf);
+  PyBuffer_Release(&offsetbuf);
+  PyBuffer_Release(&outbuf);
+  return NULL;
+}
+
+/*
+ * Sketches with one bin per part of the hash space (one-permutation hashing).
+ * The hash space is split into nbins parts of equal size, and a sketch keeps
+ * the lowest hash value seen in each part in a flat array. A hash value `h`
+ * belongs to the bin `floor(h * nbins / 2**64)`. Empty bins hold BINS_EMPTY.
+ */
+
+#define BINS_EMPTY 0xffffffffffffffffULL
+
+/* Number of random bins tried when densifying an empty bin, before moving to
+   the next bins on its right. */
+#define BINS_DENSIFY_ATTEMPTS 64
+
+/* floor(h * n / 2**64) */
+static inline Py_ssize_t
+bins_index(const unsigned long long h, const unsigned long long n)
+{
+#if defined(__SIZEOF_INT128__)
+  __extension__ typedef unsigned __int128 uint128;
+  return (Py_ssize_t)(((uint128)h * n) >> 64);
+#else
+  const uint64_t hlo = h & 0xffffffffULL, hhi = h >> 32;
+  const uint64_t nlo = n & 0xffffffffULL, nhi = n >> 32;
+  const uint64_t lolo = hlo * nlo, hilo = hhi * nlo, lohi = hlo * nhi;
+  const uint64_t mid = (lolo >> 32) + (hilo & 0xffffffffULL) + lohi;
+  return (Py_ssize_t)(hhi * nhi + (hilo >> 32) + (mid >> 32));
+#endif
+}
+
+/* Bijective mixing of 64 bits (finalization step of MurmurHash3). */
+static inline uint64_t
+bins_mix(uint64_t k)
+{
+  k ^= k >> 33;
+  k *= 0xff51afd7ed558ccdULL;
+  k ^= k >> 33;
+  k *= 0xc4ceb9fe1a85ec53ULL;
+  k ^= k >> 33;
+  return k;
+}
+
+PyDoc_STRVAR(bins_add_doc,
+             "bins_add(bins, hashbuffer, nhashes [, mix]) -> None\n\n"
+             "Add the first 'nhashes' hash values in 'hashbuffer' to the bins in the buffer\n"
+             "'bins': the hash space is split into len(bins) parts of equal size, and each\n"
+             "bin keeps the lowest hash value seen in its part (the hash value h belongs\n"
+             "to the bin floor(h * len(bins) / 2**64)). Empty bins hold 2**64-1, which\n"
+             "is therefore ignored as a hash value. Adding the bins of a sketch with the\n"
+             "same number of bins merges the sketches. Buffers must be of format type Q.\n"
+             "If 'mix' is true, the hash values are first mixed with a bijection (the\n"
+             "finalization step of MurmurHash3), for hash values not spread over the hash\n"
+             "space (such as the ones in a bottom sketch).\n"
+             "The GIL is released during the update.");
+
+static PyObject *
+bins_add(PyObject *self, PyObject *args)
+{
+  Py_buffer binbuf;
+  Py_buffer hashbuf;
+  Py_ssize_t nhashes, i, b;
+  unsigned long long nbins, h;
+  unsigned long long *bins;
+  const unsigned long long *hashes;
+  int mix = 0;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "w*y*n|p", &binbuf, &hashbuf, &nhashes, &mix)) {
+    return NULL;
+  }
+  if (binbuf.itemsize != sizeof(unsigned long long) ||
+      hashbuf.itemsize != sizeof(unsigned long long)) {
+    PyErr_SetString(PyExc_ValueError, "The buffers must be of format type Q.");
+    goto fail;
+  }
+  if (nhashes < 0 || nhashes > (hashbuf.len / hashbuf.itemsize)) {
+    PyErr_SetString(PyExc_ValueError, "The number of hash values cannot be larger than the buffer.");
+    goto fail;
+  }
+  nbins = (unsigned long long)(binbuf.len / binbuf.itemsize);
+  bins = (unsigned long long *)binbuf.buf;
+  hashes = (const unsigned long long *)hashbuf.buf;
+  if (nbins > 0) {
+    Py_BEGIN_ALLOW_THREADS
+    for (i = 0; i < nhashes; i++) {
+      h = mix ? bins_mix(hashes[i]) : hashes[i];
+      b = bins_index(h, nbins);
+      bins[b] = h < bins[b] ? h : bins[b];
+    }
+    Py_END_ALLOW_THREADS
+  }
+  PyBuffer_Release(&binbuf);
+  PyBuffer_Release(&hashbuf);
+  Py_RETURN_NONE;
+
+ fail:
+  PyBuffer_Release(&binbuf);
+  PyBuffer_Release(&hashbuf);
+  return NULL;
+}
+
+PyDoc_STRVAR(bins_densify_doc,
+             "bins_densify(bins) -> int\n\n"
+             "Fill the empty bins (holding 2**64-1) in the buffer 'bins' (see bins_add()), in\n"
+             "place, with the value of a non-empty bin. The bins tried for the empty bin i\n"
+             "only depend on i and on the number of bins (random bins first, then the bins\n"
+             "on the right of i): two sketches with the same non-empty bins are densified\n"
+             "the same way, and the probability that a bin is equal in two densified\n"
+             "sketches remains the Jaccard index between the sets they were built from\n"
+             "(\"optimal densification\", Shrivastava A. Optimal densification for fast and\n"
+             "accurate minwise hashing. ICML 2017). Nothing is done if all bins are empty.\n"
+             "The buffer must be of format type Q.\n\n"
+             "Return the number of bins filled.");
+
+static PyObject *
+bins_densify(PyObject *self, PyObject *args)
+{
+  Py_buffer binbuf;
+  Py_ssize_t nbins, i, j, nempty = 0;
+  unsigned long long attempt;
+  unsigned long long *bins;
+  char *empty;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "w*", &binbuf)) {
+    return NULL;
+  }
+  if (binbuf.itemsize != sizeof(unsigned long long)) {
+    PyBuffer_Release(&binbuf);
+    PyErr_SetString(PyExc_ValueError, "The buffer must be of format type Q.");
+    return NULL;
+  }
+  nbins = binbuf.len / binbuf.itemsize;
+  bins = (unsigned long long *)binbuf.buf;
+  for (i = 0; i < nbins; i++) {
+    nempty += (bins[i] == BINS_EMPTY);
+  }
+  if (nempty == 0 || nempty == nbins) {
+    PyBuffer_Release(&binbuf);
+    return PyLong_FromSsize_t(0);
+  }
+  /* Bins tried are the ones that were not empty before densification. */
+  empty = PyMem_Malloc((size_t)nbins);
+  if (empty == NULL) {
+    PyBuffer_Release(&binbuf);
+    return PyErr_NoMemory();
+  }
+  Py_BEGIN_ALLOW_THREADS
+  for (i = 0; i < nbins; i++) {
+    empty[i] = (bins[i] == BINS_EMPTY);
+  }
+  for (i = 0; i < nbins; i++) {
+    if (!empty[i]) {
+      continue;
+    }
+    j = -1;
+    for (attempt = 1; attempt <= BINS_DENSIFY_ATTEMPTS; attempt++) {
+      j = bins_index(bins_mix(((unsigned long long)i << 32) ^ attempt),
+                     (unsigned long long)nbins);
+      if (!empty[j]) {
+        break;
+      }
+      j = -1;
+    }
+    if (j < 0) {
+      for (j = (i + 1) % nbins; empty[j]; j = (j + 1) % nbins) {
+      }
+    }
+    bins[i] = bins[j];
+  }
+  Py_END_ALLOW_THREADS
+  PyMem_Free(empty);
+  PyBuffer_Release(&binbuf);
+  return PyLong_FromSsize_t(nempty);
+}
+
+PyDoc_STRVAR(bins_equal_doc,
+             "bins_equal(a, b) -> int\n\n"
+             "Return the number of positions at which the buffers 'a' and 'b' (of format\n"
+             "type Q and of the same length) hold the same value, empty bins (2**64-1)\n"
+             "excepted.");
+
+static PyObject *
+bins_equal(PyObject *self, PyObject *args)
+{
+  Py_buffer abuf;
+  Py_buffer bbuf;
+  Py_ssize_t n, i, nequal = 0;
+  const unsigned long long *a, *b;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "y*y*", &abuf, &bbuf)) {
+    return NULL;
+  }
+  if (abuf.itemsize != sizeof(unsigned long long) ||
+      bbuf.itemsize != sizeof(unsigned long long)) {
+    PyErr_SetString(PyExc_ValueError, "The buffers must be of format type Q.");
+    goto fail;
+  }
+  if (abuf.len != bbuf.len) {
+    PyErr_SetString(PyExc_ValueError, "The buffers must have the same length.");
+    goto fail;
+  }
+  n = abuf.len / abuf.itemsize;
+  a = (const unsigned long long *)abuf.buf;
+  b = (const unsigned long long *)bbuf.buf;
+  for (i = 0; i < n; i++) {
+    nequal += (a[i] == b[i]) & (a[i] != BINS_EMPTY);
+  }
+  PyBuffer_Release(&abuf);
+  PyBuffer_Release(&bbuf);
+  return PyLong_FromSsize_t(nequal);
+
+ fail:
+  PyBuffer_Release(&abuf);
+  PyBuffer_Release(&bbuf);
+  return NULL;
+}
+
+/*
+ * Tables of counts for hash values: open addressing with linear probing, in
+ * two parallel buffers of format type Q (the hash values, and their counts)
+ * with a power of 2 as the number of slots. A count of 0 is an empty slot.
+ * The tables are kept at most 3/4 full.
+ */
+
+/* Number of slots in a table, or -1 with an exception set if the buffers are
+   not a valid table. */
+static Py_ssize_t
+counttable_check(const Py_buffer *keybuf, const Py_buffer *countbuf)
+{
+  Py_ssize_t capacity;
+
+  if (keybuf->itemsize != sizeof(unsigned long long) ||
+      countbuf->itemsize != sizeof(unsigned long long)) {
+    PyErr_SetString(PyExc_ValueError, "The buffers must be of format type Q.");
+    return -1;
+  }
+  if (keybuf->len != countbuf->len) {
+    PyErr_SetString(PyExc_ValueError, "The buffers for the hash values and the counts must "
+                    "have the same length.");
+    return -1;
+  }
+  capacity = keybuf->len / keybuf->itemsize;
+  if (capacity < 4 || (capacity & (capacity - 1)) != 0) {
+    PyErr_SetString(PyExc_ValueError, "The number of slots must be a power of 2 (at least 4).");
+    return -1;
+  }
+  return capacity;
+}
+
+/* Slot for the hash value `h` (either the slot with `h`, or the empty slot
+   where it would be inserted). */
+static inline Py_ssize_t
+counttable_slot(const unsigned long long *keys, const unsigned long long *counts,
+                Py_ssize_t mask, unsigned long long h)
+{
+  Py_ssize_t i = (Py_ssize_t)(bins_mix(h) & (uint64_t)mask);
+
+  while (counts[i] != 0 && keys[i] != h) {
+    i = (i + 1) & mask;
+  }
+  return i;
+}
+
+PyDoc_STRVAR(counttable_add_doc,
+             "counttable_add(keys, counts, size, hashbuffer, threshold, sign [, weights]) -> (int, int)\n\n"
+             "Count the hash values in 'hashbuffer' that are not above 'threshold' (not\n"
+             "higher than it if 'sign' is -1, not lower than it if 'sign' is 1) in the table\n"
+             "of counts with 'size' entries in the buffers 'keys' and 'counts' (the hash\n"
+             "values and their counts, with a power of 2 as the number of slots and a count\n"
+             "of 0 for empty slots). Each hash value adds 1 to its count, or the value at\n"
+             "the same position in the buffer 'weights'.\n\n"
+             "Return the new number of entries in the table and the number of hash values\n"
+             "processed, lower than the length of 'hashbuffer' when the table is 3/4 full\n"
+             "(it must then be pruned or resized with 'counttable_rebuild', and the\n"
+             "remaining hash values added). Buffers must be of format type Q. The GIL is\n"
+             "released during the update.");
+
+static PyObject *
+counttable_add(PyObject *self, PyObject *args)
+{
+  Py_buffer keybuf;
+  Py_buffer countbuf;
+  Py_buffer hashbuf;
+  Py_buffer weightbuf;
+  Py_ssize_t size, capacity, mask, limit, nhashes, i, j;
+  unsigned long long threshold, h, w;
+  unsigned long long *keys, *counts;
+  const unsigned long long *hashes, *weights = NULL;
+  int sign;
+
+  weightbuf.obj = NULL;
+  (void)self;
+  if (!PyArg_ParseTuple(args, "w*w*ny*Ki|y*", &keybuf, &countbuf, &size, &hashbuf,
+                        &threshold, &sign, &weightbuf)) {
+    return NULL;
+  }
+  capacity = counttable_check(&keybuf, &countbuf);
+  if (capacity < 0) {
+    goto fail;
+  }
+  limit = capacity - capacity / 4;
+  if (size < 0 || size > limit) {
+    PyErr_SetString(PyExc_ValueError, "The number of entries must be between 0 and 3/4 of "
+                    "the number of slots.");
+    goto fail;
+  }
+  if (hashbuf.itemsize != sizeof(unsigned long long)) {
+    PyErr_SetString(PyExc_ValueError, "The buffers must be of format type Q.");
+    goto fail;
+  }
+  nhashes = hashbuf.len / hashbuf.itemsize;
+  if (weightbuf.obj != NULL) {
+    if (weightbuf.itemsize != sizeof(unsigned long long) || weightbuf.len != hashbuf.len) {
+      PyErr_SetString(PyExc_ValueError, "The weights must be of format type Q, one per hash value.");
+      goto fail;
+    }
+    weights = (const unsigned long long *)weightbuf.buf;
+  }
+  if (sign != 1 && sign != -1) {
+    PyErr_SetString(PyExc_ValueError, "The sign must be either 1 or -1.");
+    goto fail;
+  }
+  keys = (unsigned long long *)keybuf.buf;
+  counts = (unsigned long long *)countbuf.buf;
+  hashes = (const unsigned long long *)hashbuf.buf;
+  mask = capacity - 1;
+  Py_BEGIN_ALLOW_THREADS
+  for (i = 0; i < nhashes; i++) {
+    h = hashes[i];
+    w = (weights == NULL) ? 1 : weights[i];
+    if (w == 0 || HASHHEAP_ABOVE(h, threshold, sign)) {
+      continue;
+    }
+    j = counttable_slot(keys, counts, mask, h);
+    if (counts[j] == 0) {
+      if (size >= limit) {
+        break;
+      }
+      keys[j] = h;
+      size++;
+    }
+    counts[j] += w;
+  }
+  Py_END_ALLOW_THREADS
+  PyBuffer_Release(&keybuf);
+  PyBuffer_Release(&countbuf);
+  PyBuffer_Release(&hashbuf);
+  if (weightbuf.obj != NULL) {
+    PyBuffer_Release(&weightbuf);
+  }
+  return Py_BuildValue("nn", size, i);
+
+ fail:
+  PyBuffer_Release(&keybuf);
+  PyBuffer_Release(&countbuf);
+  PyBuffer_Release(&hashbuf);
+  if (weightbuf.obj != NULL) {
+    PyBuffer_Release(&weightbuf);
+  }
+  return NULL;
+}
+
+PyDoc_STRVAR(counttable_rebuild_doc,
+             "counttable_rebuild(keys, counts, newkeys, newcounts, threshold, sign) -> int\n\n"
+             "Copy the entries of the table of counts in the buffers 'keys' and 'counts'\n"
+             "(see 'counttable_add') with a hash value not above 'threshold' into the empty\n"
+             "table in the buffers 'newkeys' and 'newcounts' (all counts 0, with any power\n"
+             "of 2 as the number of slots), and return the number of entries in the new\n"
+             "table. Buffers must be of format type Q.");
+
+static PyObject *
+counttable_rebuild(PyObject *self, PyObject *args)
+{
+  Py_buffer keybuf;
+  Py_buffer countbuf;
+  Py_buffer newkeybuf;
+  Py_buffer newcountbuf;
+  Py_ssize_t capacity, newcapacity, mask, limit, i, j, size = 0;
+  unsigned long long threshold, h;
+  const unsigned long long *keys, *counts;
+  unsigned long long *newkeys, *newcounts;
+  int sign;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "y*y*w*w*Ki", &keybuf, &countbuf, &newkeybuf, &newcountbuf,
+                        &threshold, &sign)) {
+    return NULL;
+  }
+  capacity = counttable_check(&keybuf, &countbuf);
+  if (capacity < 0) {
+    goto fail;
+  }
+  newcapacity = counttable_check(&newkeybuf, &newcountbuf);
+  if (newcapacity < 0) {
+    goto fail;
+  }
+  if (sign != 1 && sign != -1) {
+    PyErr_SetString(PyExc_ValueError, "The sign must be either 1 or -1.");
+    goto fail;
+  }
+  keys = (const unsigned long long *)keybuf.buf;
+  counts = (const unsigned long long *)countbuf.buf;
+  newkeys = (unsigned long long *)newkeybuf.buf;
+  newcounts = (unsigned long long *)newcountbuf.buf;
+  mask = newcapacity - 1;
+  limit = newcapacity - newcapacity / 4;
+  for (i = 0; i < capacity; i++) {
+    h = keys[i];
+    if (counts[i] == 0 || HASHHEAP_ABOVE(h, threshold, sign)) {
+      continue;
+    }
+    if (size >= limit) {
+      PyErr_SetString(PyExc_ValueError, "The new table is too small.");
+      goto fail;
+    }
+    j = counttable_slot(newkeys, newcounts, mask, h);
+    newkeys[j] = h;
+    newcounts[j] = counts[i];
+    size++;
+  }
+  PyBuffer_Release(&keybuf);
+  PyBuffer_Release(&countbuf);
+  PyBuffer_Release(&newkeybuf);
+  PyBuffer_Release(&newcountbuf);
+  return PyLong_FromSsize_t(size);
+
+ fail:
+  PyBuffer_Release(&keybuf);
+  PyBuffer_Release(&countbuf);
+  PyBuffer_Release(&newkeybuf);
+  PyBuffer_Release(&newcountbuf);
+  return NULL;
+}
+
+PyDoc_STRVAR(counttable_get_doc,
+             "counttable_get(keys, counts, hashbuffer, out) -> None\n\n"
+             "Write the count for each hash value in 'hashbuffer' in the table of counts in\n"
+             "the buffers 'keys' and 'counts' (see 'counttable_add') at the same position in\n"
+             "the buffer 'out' (0 for hash values not in the table). Buffers must be of\n"
+             "format type Q.");
+
+static PyObject *
+counttable_get(PyObject *self, PyObject *args)
+{
+  Py_buffer keybuf;
+  Py_buffer countbuf;
+  Py_buffer hashbuf;
+  Py_buffer outbuf;
+  Py_ssize_t capacity, mask, nhashes, i;
+  const unsigned long long *keys, *counts, *hashes;
+  unsigned long long *out;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "y*y*y*w*", &keybuf, &countbuf, &hashbuf, &outbuf)) {
+    return NULL;
+  }
+  capacity = counttable_check(&keybuf, &countbuf);
+  if (capacity < 0) {
+    goto fail;
+  }
+  if (hashbuf.itemsize != sizeof(unsigned long long) ||
+      outbuf.itemsize != sizeof(unsigned long long)) {
+    PyErr_SetString(PyExc_ValueError, "The buffers must be of format type Q.");
+    goto fail;
+  }
+  if (outbuf.len != hashbuf.len) {
+    PyErr_SetString(PyExc_ValueError, "The output buffer must have the length of the "
+                    "buffer of hash values.");
+    goto fail;
+  }
+  keys = (const unsigned long long *)keybuf.buf;
+  counts = (const unsigned long long *)countbuf.buf;
+  hashes = (const unsigned long long *)hashbuf.buf;
+  out = (unsigned long long *)outbuf.buf;
+  nhashes = hashbuf.len / hashbuf.itemsize;
+  mask = capacity - 1;
+  for (i = 0; i < nhashes; i++) {
+    out[i] = counts[counttable_slot(keys, counts, mask, hashes[i])];
+  }
+  PyBuffer_Release(&keybuf);
+  PyBuffer_Release(&countbuf);
+  PyBuffer_Release(&hashbuf);
+  PyBuffer_Release(&outbuf);
+  Py_RETURN_NONE;
+
+ fail:
+  PyBuffer_Release(&keybuf);
+  PyBuffer_Release(&countbuf);
+  PyBuffer_Release(&hashbuf);
+  PyBuffer_Release(&outbuf);
+  return NULL;
+}
+
+PyDoc_STRVAR(countheap_add_doc,
+             "countheap_add(heap, size, keys, counts, tablesize, hashbuffer, sign [, weights]) -> (int, int, int)\n\n"
+             "Add the hash values in 'hashbuffer' to the heap of hash values in the first\n"
+             "'size' slots of the buffer 'heap', and count them in the table of counts with\n"
+             "'tablesize' entries in the buffers 'keys' and 'counts' (see 'counttable_add').\n"
+             "Each hash value adds 1 to its count, or the value at the same position in the\n"
+             "buffer 'weights'.\n\n"
+             "The number of slots in 'heap' is the maximum size of the sketch. The heap\n"
+             "is keeping the lowest hash values if 'sign' is -1 (the largest of them\n"
+             "being at position 0), or the highest hash values if 'sign' is 1 (the\n"
+             "smallest of them being at position 0).\n\n"
+             "Every hash value in the heap must be in the table. The table also tells\n"
+             "whether a hash value is already in the heap: hash values that left the heap\n"
+             "can remain in the table, but are then above the top of the heap.\n\n"
+             "Return the new number of hash values in the heap, the new number of entries\n"
+             "in the table, and the number of hash values processed, lower than the length\n"
+             "of 'hashbuffer' when the table is 3/4 full (see 'counttable_add'). Buffers\n"
+             "must be of format type Q. The GIL is released during the update.");
+
+static PyObject *
+countheap_add(PyObject *self, PyObject *args)
+{
+  Py_buffer heapbuf;
+  Py_buffer keybuf;
+  Py_buffer countbuf;
+  Py_buffer hashbuf;
+  Py_buffer weightbuf;
+  Py_ssize_t size, heapcapacity, tablesize, capacity, mask, limit, nhashes, i, j;
+  unsigned long long h, w;
+  unsigned long long *heap, *keys, *counts;
+  const unsigned long long *hashes, *weights = NULL;
+  int sign;
+
+  weightbuf.obj = NULL;
+  (void)self;
+  if (!PyArg_ParseTuple(args, "w*nw*w*ny*i|y*", &heapbuf, &size, &keybuf, &countbuf,
+                        &tablesize, &hashbuf, &sign, &weightbuf)) {
+    return NULL;
+  }
+  capacity = counttable_check(&keybuf, &countbuf);
+  if (capacity < 0) {
+    goto fail;
+  }
+  limit = capacity - capacity / 4;
+  if (tablesize < 0 || tablesize > limit) {
+    PyErr_SetString(PyExc_ValueError, "The number of entries must be between 0 and 3/4 of "
+                    "the number of slots.");
+    goto fail;
+  }
+  if (heapbuf.itemsize != sizeof(unsigned long long) ||
+      hashbuf.itemsize != sizeof(unsigned long long)) {
+    PyErr_SetString(PyExc_ValueError, "The buffers must be of format type Q.");
+    goto fail;
+  }
+  heapcapacity = heapbuf.len / heapbuf.itemsize;
+  if (size < 0 || size > heapcapacity) {
+    PyErr_SetString(PyExc_ValueError, "The size of the heap cannot be larger than its buffer.");
+    goto fail;
+  }
+  nhashes = hashbuf.len / hashbuf.itemsize;
+  if (weightbuf.obj != NULL) {
+    if (weightbuf.itemsize != sizeof(unsigned long long) || weightbuf.len != hashbuf.len) {
+      PyErr_SetString(PyExc_ValueError, "The weights must be of format type Q, one per hash value.");
+      goto fail;
+    }
+    weights = (const unsigned long long *)weightbuf.buf;
+  }
+  if (sign != 1 && sign != -1) {
+    PyErr_SetString(PyExc_ValueError, "The sign must be either 1 or -1.");
+    goto fail;
+  }
+  heap = (unsigned long long *)heapbuf.buf;
+  keys = (unsigned long long *)keybuf.buf;
+  counts = (unsigned long long *)countbuf.buf;
+  hashes = (const unsigned long long *)hashbuf.buf;
+  mask = capacity - 1;
+  Py_BEGIN_ALLOW_THREADS
+  for (i = 0; i < nhashes; i++) {
+    h = hashes[i];
+    w = (weights == NULL) ? 1 : weights[i];
+    if (w == 0 || heapcapacity == 0 ||
+        (size == heapcapacity && HASHHEAP_ABOVE(h, heap[0], sign))) {
+      continue;
+    }
+    j = counttable_slot(keys, counts, mask, h);
+    if (counts[j] != 0) {
+      /* already in the heap */
+      counts[j] += w;
+      continue;
+    }
+    if (tablesize >= limit) {
+      break;
+    }
+    keys[j] = h;
+    counts[j] = w;
+    tablesize++;
+    if (size < heapcapacity) {
+      heap[size] = h;
+      hashheap_siftdown(heap, size, sign);
+      size++;
+    } else {
+      heap[0] = h;
+      hashheap_siftup(heap, size, 0, sign);
+    }
+  }
+  Py_END_ALLOW_THREADS
+  PyBuffer_Release(&heapbuf);
+  PyBuffer_Release(&keybuf);
+  PyBuffer_Release(&countbuf);
+  PyBuffer_Release(&hashbuf);
+  if (weightbuf.obj != NULL) {
+    PyBuffer_Release(&weightbuf);
+  }
+  return Py_BuildValue("nnn", size, tablesize, i);
+
+ fail:
+  PyBuffer_Release(&heapbuf);
+  PyBuffer_Release(&keybuf);
+  PyBuffer_Release(&countbuf);
+  PyBuffer_Release(&hashbuf);
+  if (weightbuf.obj != NULL) {
+    PyBuffer_Release(&weightbuf);
+  }
+  return NULL;
+}
+
+/*
+ * HyperLogLog registers (Flajolet P, Fusy E, Gandouet O, Meunier F.
+ * HyperLogLog: the analysis of a near-optimal cardinality estimation
+ * algorithm. AofA 2007), one byte each. With 2**p registers, the first p bits
+ * of a hash value select a register, and the register keeps the highest rank
+ * of the first bit set in the remaining bits.
+ */
+
+#define HLL_MINPRECISION 4
+#define HLL_MAXPRECISION 18
+
+/* Precision p for 2**p registers, or -1 if the number of registers is not
+   valid. */
+static int
+hll_precision(const Py_ssize_t nregisters)
+{
+  int p;
+
+  for (p = HLL_MINPRECISION; p <= HLL_MAXPRECISION; p++) {
+    if (nregisters == ((Py_ssize_t)1 << p)) {
+      return p;
+    }
+  }
+  return -1;
+}
+
+/* Number of leading zero bits, for x > 0. */
+static inline int
+hll_clz64(const uint64_t x)
+{
+#if defined(__GNUC__)
+  return __builtin_clzll(x);
+#else
+  int n = 0;
+  uint64_t bit = 1ULL << 63;
+  while ((x & bit) == 0) {
+    n++;
+    bit >>= 1;
+  }
+  return n;
+#endif
+}
+
+/* Check that a buffer holds HyperLogLog registers, and return their
+   precision (-1 with an exception set otherwise). */
+static int
+hll_check(const Py_buffer *regbuf)
+{
+  int p;
+
+  if (regbuf->itemsize != 1) {
+    PyErr_SetString(PyExc_ValueError, "The registers must be of format type B.");
+    return -1;
+  }
+  p = hll_precision(regbuf->len);
+  if (p < 0) {
+    PyErr_Format(PyExc_ValueError, "The number of registers must be 2**p, with p between %i and %i.",
+                 HLL_MINPRECISION, HLL_MAXPRECISION);
+  }
+  return p;
+}
+
+PyDoc_STRVAR(hll_add_doc,
+             "hll_add(registers, hashbuffer, nhashes) -> None\n\n"
+             "Add the first 'nhashes' hash values in 'hashbuffer' (format type Q) to the\n"
+             "HyperLogLog registers in the buffer 'registers' (format type B, with 2**p\n"
+             "registers for a precision p between 4 and 18). The GIL is released during\n"
+             "the update.");
+
+static PyObject *
+hll_add(PyObject *self, PyObject *args)
+{
+  Py_buffer regbuf;
+  Py_buffer hashbuf;
+  Py_ssize_t nhashes, i;
+  int p;
+  unsigned char rank;
+  uint64_t h, w;
+  unsigned char *registers;
+  const unsigned long long *hashes;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "w*y*n", &regbuf, &hashbuf, &nhashes)) {
+    return NULL;
+  }
+  p = hll_check(&regbuf);
+  if (p < 0) {
+    goto fail;
+  }
+  if (hashbuf.itemsize != sizeof(unsigned long long)) {
+    PyErr_SetString(PyExc_ValueError, "The buffer must be of format type Q.");
+    goto fail;
+  }
+  if (nhashes < 0 || nhashes > (hashbuf.len / hashbuf.itemsize)) {
+    PyErr_SetString(PyExc_ValueError, "The number of hash values cannot be larger than the buffer.");
+    goto fail;
+  }
+  registers = (unsigned char *)regbuf.buf;
+  hashes = (const unsigned long long *)hashbuf.buf;
+  Py_BEGIN_ALLOW_THREADS
+  for (i = 0; i < nhashes; i++) {
+    h = hashes[i];
+    w = h << p;
+    rank = (unsigned char)(w == 0 ? 64 - p + 1 : hll_clz64(w) + 1);
+    if (rank > registers[h >> (64 - p)]) {
+      registers[h >> (64 - p)] = rank;
+    }
+  }
+  Py_END_ALLOW_THREADS
+  PyBuffer_Release(&regbuf);
+  PyBuffer_Release(&hashbuf);
+  Py_RETURN_NONE;
+
+ fail:
+  PyBuffer_Release(&regbuf);
+  PyBuffer_Release(&hashbuf);
+  return NULL;
+}
+
+PyDoc_STRVAR(hll_merge_doc,
+             "hll_merge(registers, other) -> None\n\n"
+             "Merge the HyperLogLog registers 'other' into 'registers' (see hll_add()), in\n"
+             "place. Both must have the same number of registers.");
+
+static PyObject *
+hll_merge(PyObject *self, PyObject *args)
+{
+  Py_buffer regbuf;
+  Py_buffer otherbuf;
+  Py_ssize_t i;
+  unsigned char *registers;
+  const unsigned char *other;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "w*y*", &regbuf, &otherbuf)) {
+    return NULL;
+  }
+  if (hll_check(&regbuf) < 0 || hll_check(&otherbuf) < 0) {
+    goto fail;
+  }
+  if (regbuf.len != otherbuf.len) {
+    PyErr_SetString(PyExc_ValueError, "The numbers of registers must be the same.");
+    goto fail;
+  }
+  registers = (unsigned char *)regbuf.buf;
+  other = (const unsigned char *)otherbuf.buf;
+  for (i = 0; i < regbuf.len; i++) {
+    registers[i] = other[i] > registers[i] ? other[i] : registers[i];
+  }
+  PyBuffer_Release(&regbuf);
+  PyBuffer_Release(&otherbuf);
+  Py_RETURN_NONE;
+
+ fail:
+  PyBuffer_Release(&regbuf);
+  PyBuffer_Release(&otherbuf);
+  return NULL;
+}
+
+PyDoc_STRVAR(hll_estimate_doc,
+             "hll_estimate(registers) -> float\n\n"
+             "Estimate the number of distinct hash values added to the HyperLogLog\n"
+             "registers (see hll_add()), with the correction for small cardinalities\n"
+             "(linear counting). The standard error is about 1.04/sqrt(len(registers)).");
+
+static PyObject *
+hll_estimate(PyObject *self, PyObject *args)
+{
+  Py_buffer regbuf;
+  Py_ssize_t i, nzeros = 0;
+  double m, alpha, sum = 0.0, estimate;
+  const unsigned char *registers;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "y*", &regbuf)) {
+    return NULL;
+  }
+  if (hll_check(&regbuf) < 0) {
+    PyBuffer_Release(&regbuf);
+    return NULL;
+  }
+  registers = (const unsigned char *)regbuf.buf;
+  for (i = 0; i < regbuf.len; i++) {
+    sum += ldexp(1.0, -(int)registers[i]);
+    nzeros += (registers[i] == 0);
+  }
+  m = (double)regbuf.len;
+  PyBuffer_Release(&regbuf);
+  if (m == 16) {
+    alpha = 0.673;
+  } else if (m == 32) {
+    alpha = 0.697;
+  } else if (m == 64) {
+    alpha = 0.709;
+  } else {
+    alpha = 0.7213 / (1.0 + 1.079 / m);
+  }
+  estimate = alpha * m * m / sum;
+  if (estimate <= 2.5 * m && nzeros > 0) {
+    estimate = m * log(m / (double)nzeros);
+  }
+  return PyFloat_FromDouble(estimate);
+}
+
+/*
+ * Sequences made of concatenated records, as produced by parse_fastx().
+ */
+
+/* Index of the first record end strictly greater than pos. */
+static Py_ssize_t
+first_end_after(const unsigned long long *ends, Py_ssize_t nends,
+                unsigned long long pos)
+{
+  Py_ssize_t lo = 0, hi = nends, mid;
+
+  while (lo < hi) {
+    mid = lo + (hi - lo) / 2;
+    if (ends[mid] <= pos) {
+      lo = mid + 1;
+    } else {
+      hi = mid;
+    }
+  }
+  return lo;
+}
+
+PyDoc_STRVAR(skip_boundaries_doc,
+             "skip_boundaries(hashbuffer, offsets, nhashes, filtered, nsubs, ends, beg,\n"
+             "                nsize) -> (int, int)\n\n"
+             "Drop the hash values for windows overlapping two records in a sequence made\n"
+             "of concatenated records, the records ending at the (sorted) positions in the\n"
+             "buffer 'ends'. The 'nhashes' hash values in 'hashbuffer' are for windows of\n"
+             "size 'nsize' in the slice of the sequence starting at position 'beg'. If\n"
+             "'filtered' is true the i-th hash value is for the window starting at\n"
+             "position offsets[i] in the slice (as reported by hashing functions\n"
+             "filtering with a threshold), otherwise it is for the window starting at\n"
+             "position i. The hash values kept are moved to the beginning of\n"
+             "'hashbuffer' and their positions are written to 'offsets' (that can be None\n"
+             "when 'filtered' is false). Buffers must be of format type Q.\n\n"
+             "Return the number of hash values kept, and the number of windows within\n"
+             "one record among the 'nsubs' first windows in the slice.");
+
+static PyObject *
+skip_boundaries(PyObject *self, PyObject *args)
+{
+  Py_buffer hashbuf, endbuf, offsetbuf;
+  PyObject *offsetobj;
+  Py_ssize_t nhashes, nsubs, beg, nends, i, k, e, nvalid;
+  int filtered, nsize;
+  unsigned long long *hashes, *offsets = NULL;
+  const unsigned long long *ends;
+  unsigned long long g, pos;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "w*Onpny*ni", &hashbuf, &offsetobj, &nhashes,
+                        &filtered, &nsubs, &endbuf, &beg, &nsize)) {
+    return NULL;
+  }
+  offsetbuf.obj = NULL;
+  if (offsetobj != Py_None) {
+    if (PyObject_GetBuffer(offsetobj, &offsetbuf, PyBUF_WRITABLE) < 0) {
+      PyBuffer_Release(&hashbuf);
+      PyBuffer_Release(&endbuf);
+      return NULL;
+    }
+    if (offsetbuf.itemsize != sizeof(unsigned long long) ||
+        nhashes > offsetbuf.len / offsetbuf.itemsize) {
+      PyErr_SetString(PyExc_ValueError,
+                      "The buffer 'offsets' must be of format type Q, and not shorter than 'nhashes'.");
+      goto fail;
+    }
+    offsets = (unsigned long long *)offsetbuf.buf;
+  } else if (filtered) {
+    PyErr_SetString(PyExc_ValueError, "The buffer 'offsets' is required with 'filtered'.");
+    goto fail;
+  }
+  if (hashbuf.itemsize != sizeof(unsigned long long) ||
+      endbuf.itemsize != sizeof(unsigned long long)) {
+    PyErr_SetString(PyExc_ValueError, "The buffers must be of format type Q.");
+    goto fail;
+  }
+  if (nhashes < 0 || nhashes > hashbuf.len / hashbuf.itemsize ||
+      nsubs < 0 || beg < 0 || nsize < 1) {
+    PyErr_SetString(PyExc_ValueError, "Invalid number of hash values, position, or size.");
+    goto fail;
+  }
+  hashes = (unsigned long long *)hashbuf.buf;
+  ends = (const unsigned long long *)endbuf.buf;
+  nends = endbuf.len / endbuf.itemsize;
+
+  /* Positions are increasing: one pass over the record ends. */
+  e = first_end_after(ends, nends, (unsigned long long)beg);
+  k = 0;
+  for (i = 0; i < nhashes; i++) {
+    pos = filtered ? offsets[i] : (unsigned long long)i;
+    g = (unsigned long long)beg + pos;
+    while (e < nends && ends[e] <= g) {
+      e++;
+    }
+    if (e == nends || ends[e] >= g + (unsigned long long)nsize) {
+      hashes[k] = hashes[i];
+      if (offsets != NULL) {
+        offsets[k] = pos;
+      }
+      k++;
+    }
+  }
+
+  e = first_end_after(ends, nends, (unsigned long long)beg);
+  nvalid = 0;
+  for (i = 0; i < nsubs; i++) {
+    g = (unsigned long long)(beg + i);
+    while (e < nends && ends[e] <= g) {
+      e++;
+    }
+    nvalid += (e == nends || ends[e] >= g + (unsigned long long)nsize);
+  }
+
+  PyBuffer_Release(&hashbuf);
+  PyBuffer_Release(&endbuf);
+  PyBuffer_Release(&offsetbuf);
+  return Py_BuildValue("nn", k, nvalid);
+
+ fail:
+  PyBuffer_Release(&hashbuf);
+  PyBuffer_Release(&endbuf);
+  PyBuffer_Release(&offsetbuf);
+  return NULL;
+}
+
+enum {
+  FASTX_BETWEEN_RECORDS = 0,
+  FASTX_IN_FASTA_SEQUENCE = 1
+};
+
+/* Copy the line data[beg:end] (without a trailing carriage return). */
+static Py_ssize_t
+copy_line(char *out, const char *data, Py_ssize_t beg, Py_ssize_t end)
+{
+  if (end > beg && data[end - 1] == '\r') {
+    end--;
+  }
+  memcpy(out, data + beg, (size_t)(end - beg));
+  return end - beg;
+}
+
+/* End of the line starting at pos, or -1 if there is no line feed. */
+static Py_ssize_t
+line_end(const char *data, Py_ssize_t pos, Py_ssize_t len)
+{
+  const char *eol = memchr(data + pos, '\n', (size_t)(len - pos));
+  return eol == NULL ? -1 : (Py_ssize_t)(eol - data);
+}
+
+PyDoc_STRVAR(parse_fastx_doc,
+             "parse_fastx(data, final, state, seqbuf, seqbeg, ends) -> (int, int, int, int)\n\n"
+             "Extract the sequences of the FASTA or FASTQ records in the buffer 'data'.\n"
+             "The sequences (without line breaks) are written one after the other in the\n"
+             "writable buffer 'seqbuf' starting at position 'seqbeg', and the position in\n"
+             "'seqbuf' where each record ends is written to the buffer 'ends' (format type\n"
+             "Q). 'seqbuf' must have room for at least len(data) bytes after 'seqbeg'.\n\n"
+             "Return (consumed, seqend, nrecords, state), with 'consumed' the number of\n"
+             "bytes processed in 'data', 'seqend' the position in 'seqbuf' after the last\n"
+             "byte written, 'nrecords' the number of records completed, and 'state' 1 if\n"
+             "the last FASTA record can continue after the data processed (the part of\n"
+             "its sequence already read being after the last record end) or 0 otherwise.\n"
+             "The bytes not processed (an incomplete line or FASTQ record, or records\n"
+             "beyond the capacity of 'ends') should be given again in the next call,\n"
+             "together with the 'state' returned. 'final' indicates that 'data' is the\n"
+             "end of the input. The GIL is released during the parsing.");
+
+/* State of the parsing of FASTA/FASTQ data. */
+typedef struct {
+  const char *data;
+  Py_ssize_t len;
+  int final;
+  int state;
+  char *seq;
+  Py_ssize_t seqpos;
+  unsigned long long *ends;
+  Py_ssize_t capacity;
+  Py_ssize_t pos;
+  Py_ssize_t nrecords;
+} fastx_parser;
+
+/*
+ * Parse records until the end of the data (or of the capacity for record
+ * ends). This does not use the Python API (it can run without the GIL).
+ * Return NULL, or an error message.
+ */
+static const char *
+fastx_parse(fastx_parser *parser)
+{
+  const char *data = parser->data;
+  const Py_ssize_t len = parser->len;
+  const int final = parser->final;
+  char *seq = parser->seq;
+  unsigned long long *ends = parser->ends;
+  const Py_ssize_t capacity = parser->capacity;
+  int state = parser->state, l;
+  Py_ssize_t pos = 0, seqpos = parser->seqpos, nrecords = 0, eol, next;
+  Py_ssize_t linebeg[4], lineend[4], seqlen, quallen;
+  const char *error = NULL;
+
+  while (1) {
+    if (state == FASTX_IN_FASTA_SEQUENCE) {
+      /* Sequence lines until the next header or the end of the input. */
+      while (pos < len && data[pos] != '>') {
+        eol = line_end(data, pos, len);
+        if (eol < 0) {
+          if (!final) {
+            goto done;
+          }
+          eol = len;
+        }
+        seqpos += copy_line(seq + seqpos, data, pos, eol);
+        pos = eol + 1 < len ? eol + 1 : len;
+      }
+      if ((pos == len && !final) || nrecords == capacity) {
+        goto done;
+      }
+      ends[nrecords++] = (unsigned long long)seqpos;
+      state = FASTX_BETWEEN_RECORDS;
+    }
+    while (pos < len && (data[pos] == '\n' || data[pos] == '\r')) {
+      pos++;
+    }
+    if (pos == len || nrecords == capacity) {
+      goto done;
+    }
+    if (data[pos] == '>') {
+      eol = line_end(data, pos, len);
+      if (eol < 0) {
+        if (!final) {
+          goto done;
+        }
+        eol = len;
+      }
+      pos = eol + 1 < len ? eol + 1 : len;
+      state = FASTX_IN_FASTA_SEQUENCE;
+    } else if (data[pos] == '@') {
+      /* Header, sequence, '+' line, and quality line. */
+      next = pos;
+      for (l = 0; l < 4; l++) {
+        linebeg[l] = next;
+        eol = next < len ? line_end(data, next, len) : -1;
+        if (eol < 0) {
+          if (!final) {
+            goto done;
+          }
+          if (l < 3) {
+            error = "Truncated FASTQ record.";
+            goto done;
+          }
+          eol = len;
+        }
+        lineend[l] = eol;
+        next = eol + 1 < len ? eol + 1 : len;
+      }
+      if (linebeg[2] == lineend[2] || data[linebeg[2]] != '+') {
+        error = "Invalid FASTQ record (no line starting with '+').";
+        goto done;
+      }
+      seqlen = copy_line(seq + seqpos, data, linebeg[1], lineend[1]);
+      quallen = lineend[3] - linebeg[3];
+      if (quallen > 0 && data[lineend[3] - 1] == '\r') {
+        quallen--;
+      }
+      if (seqlen != quallen) {
+        error = "Invalid FASTQ record (sequence and quality of different lengths).";
+        goto done;
+      }
+      seqpos += seqlen;
+      ends[nrecords++] = (unsigned long long)seqpos;
+      pos = next;
+    } else {
+      error = "Invalid FASTA/FASTQ data (records must start with '>' or '@').";
+      goto done;
+    }
+  }
+
+ done:
+  parser->state = state;
+  parser->seqpos = seqpos;
+  parser->pos = pos;
+  parser->nrecords = nrecords;
+  return error;
+}
+
+static PyObject *
+parse_fastx(PyObject *self, PyObject *args)
+{
+  Py_buffer databuf, seqbuf, endbuf;
+  Py_ssize_t seqbeg;
+  fastx_parser parser;
+  const char *error;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "y*piw*nw*", &databuf, &parser.final, &parser.state,
+                        &seqbuf, &seqbeg, &endbuf)) {
+    return NULL;
+  }
+  if (endbuf.itemsize != sizeof(unsigned long long)) {
+    PyErr_SetString(PyExc_ValueError, "The buffer 'ends' must be of format type Q.");
+    goto fail;
+  }
+  if (seqbeg < 0 || seqbeg > seqbuf.len || seqbuf.len - seqbeg < databuf.len) {
+    PyErr_SetString(PyExc_ValueError, "The buffer 'seqbuf' is too small.");
+    goto fail;
+  }
+  if (parser.state != FASTX_BETWEEN_RECORDS && parser.state != FASTX_IN_FASTA_SEQUENCE) {
+    PyErr_SetString(PyExc_ValueError, "Invalid state.");
+    goto fail;
+  }
+  parser.data = (const char *)databuf.buf;
+  parser.len = databuf.len;
+  parser.seq = (char *)seqbuf.buf;
+  parser.seqpos = seqbeg;
+  parser.ends = (unsigned long long *)endbuf.buf;
+  parser.capacity = endbuf.len / endbuf.itemsize;
+
+  Py_BEGIN_ALLOW_THREADS
+  error = fastx_parse(&parser);
+  Py_END_ALLOW_THREADS
+
+  if (error != NULL) {
+    PyErr_SetString(PyExc_ValueError, error);
+    goto fail;
+  }
+  PyBuffer_Release(&databuf);
+  PyBuffer_Release(&seqbuf);
+  PyBuffer_Release(&endbuf);
+  return Py_BuildValue("nnni", parser.pos, parser.seqpos, parser.nrecords, parser.state);
+
+ fail:
+  PyBuffer_Release(&databuf);
+  PyBuffer_Release(&seqbuf);
+  PyBuffer_Release(&endbuf);
+  return NULL;
+}
+
+static PyMethodDef sketchcoreModuleMethods[] = {
+    {
+      "add_ngrams", (PyCFunction)add_ngrams,
+        METH_VARARGS, add_ngrams_doc,
+    },
+    {
+      "intersection_size", (PyCFunction)intersection_size,
+        METH_VARARGS, intersection_size_doc,
+    },
+    {
+      "sort_unique", (PyCFunction)sort_unique,
+        METH_VARARGS, sort_unique_doc,
+    },
+    {
+      "sorted_union", (PyCFunction)sorted_union,
+        METH_VARARGS, sorted_union_doc,
+    },
+    {
+      "postings_count", (PyCFunction)postings_count,
+        METH_VARARGS, postings_count_doc,
+    },
+    {
+      "postings_index", (PyCFunction)postings_index,
+        METH_VARARGS, postings_index_doc,
+    },
+    {
+      "postings_merge", (PyCFunction)postings_merge,
+        METH_VARARGS, postings_merge_doc,
+    },
+    {
+      "bottomk_merge", (PyCFunction)bottomk_merge,
+        METH_VARARGS, bottomk_merge_doc,
+    },
+    {
+      "keep_below", (PyCFunction)keep_below,
+        METH_VARARGS, keep_below_doc,
+    },
+    {
+      "bottomk_union", (PyCFunction)bottomk_union,
+        METH_VARARGS, bottomk_union_doc,
+    },
+    {
+      "pairwise", (PyCFunction)pairwise,
+        METH_VARARGS, pairwise_doc,
+    },
+    {
+      "bins_add", (PyCFunction)bins_add,
+        METH_VARARGS, bins_add_doc,
+    },
+    {
+      "bins_densify", (PyCFunction)bins_densify,
+        METH_VARARGS, bins_densify_doc,
+    },
+    {
+      "bins_equal", (PyCFunction)bins_equal,
+        METH_VARARGS, bins_equal_doc,
+    },
+    {
+      "counttable_add", (PyCFunction)counttable_add,
+        METH_VARARGS, counttable_add_doc,
+    },
+    {
+      "counttable_rebuild", (PyCFunction)counttable_rebuild,
+        METH_VARARGS, counttable_rebuild_doc,
+    },
+    {
+      "counttable_get", (PyCFunction)counttable_get,
+        METH_VARARGS, counttable_get_doc,
+    },
+    {
+      "countheap_add", (PyCFunction)countheap_add,
+        METH_VARARGS, countheap_add_doc,
+    },
+    {
+      "hll_add", (PyCFunction)hll_add,
+        METH_VARARGS, hll_add_doc,
+    },
+    {
+      "hll_merge", (PyCFunction)hll_merge,
+        METH_VARARGS, hll_merge_doc,
+    },
+    {
+      "hll_estimate", (PyCFunction)hll_estimate,
+        METH_VARARGS, hll_estimate_doc,
+    },
+    {
+      "skip_boundaries", (PyCFunction)skip_boundaries,
+        METH_VARARGS, skip_boundaries_doc,
+    },
+    {
+      "parse_fastx", (PyCFunction)parse_fastx,
+        METH_VARARGS, parse_fastx_doc,
+    },
+    { NULL, NULL, 0, NULL} // sentinel
+};
+
+static struct PyModuleDef moduledef = {
+  PyModuleDef_HEAD_INIT,
+  "_sketchcore",
+  "Compiled building blocks for sketches.",
+  -1,
+  sketchcoreModuleMethods,
+  NULL, NULL, NULL, NULL};
+
+PyMODINIT_FUNC
+PyInit__sketchcore(void)
+{
+    PyObject *m;
+
+    m = PyModule_Create(&moduledef);
+
+    if (m == NULL) {
+        return NULL;
+    }
+
+    PyModule_AddIntConstant(m, "METRIC_JACCARD_SIMILARITY", METRIC_JACCARD_SIMILARITY);
+    PyModule_AddIntConstant(m, "METRIC_JACCARD_CONTAINMENT", METRIC_JACCARD_CONTAINMENT);
+    PyModule_AddIntConstant(m, "METRIC_DICE_SIMILARITY", METRIC_DICE_SIMILARITY);
+    PyModule_AddIntConstant(m, "METRIC_JACCARD_ESTIMATE", METRIC_JACCARD_ESTIMATE);
+    PyModule_AddIntConstant(m, "METRIC_MASH_DISTANCE", METRIC_MASH_DISTANCE);
+    PyModule_AddIntConstant(m, "HLL_MINPRECISION", HLL_MINPRECISION);
+    PyModule_AddIntConstant(m, "HLL_MAXPRECISION", HLL_MAXPRECISION);
+
+    return m;
+}
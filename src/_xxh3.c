@@ -0,0 +1,238 @@
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <stdint.h>
+/* xxh3.h defines NDEBUG, possibly already defined on the command line */
+#undef NDEBUG
+#include <xxh3.h>
+
+#define XXH3_DEFAULT_SEED 0
+
+/* Hash the 'maxi' windows of 'width' bytes in 'input' with XXH3 (64 bits).
+   Without filtering (direction 0) all hash values are written to
+   'hasharray'. Otherwise only the ones greater (direction 1) or lower
+   (direction -1) than or equal to 'threshold' are, with their positions in
+   'offsetarray'. Return the number of hash values written.
+   XXH3 is inlined, and the windows are independent: the processor can
+   overlap the computations for consecutive windows. */
+static Py_ssize_t
+xxh3_windows(const char * input, const Py_ssize_t width,
+             const Py_ssize_t maxi, const uint64_t seed,
+             const unsigned long long threshold, const int direction,
+             unsigned long long * hasharray,
+             unsigned long long * offsetarray)
+{
+  uint64_t out;
+  Py_ssize_t nkept = 0;
+  Py_ssize_t i;
+  if (direction == 0) {
+    for (i = 0; i < maxi; i++) {
+      hasharray[i] = XXH3_64bits_withSeed(input + i, (size_t)width, seed);
+    }
+    return maxi;
+  }
+  for (i = 0; i < maxi; i++) {
+    out = XXH3_64bits_withSeed(input + i, (size_t)width, seed);
+    if (direction > 0 ? out >= threshold : out <= threshold) {
+      hasharray[nkept] = out;
+      offsetarray[nkept] = (unsigned long long)i;
+      nkept++;
+    }
+  }
+  return nkept;
+}
+
+PyDoc_STRVAR(hasharray_doc,
+             "hasharray(input, width, buffer [, seed [, threshold, direction, offsets]]) -> int or (int, int)\n\n"
+             "Compute XXH3 (64 bits) hash values for a sliding array of bytes over a bytes-like object 'input', "
+	     "optionally using a seed (an integer).\n\n"
+	     "When 'threshold' (an integer), 'direction' (1 or -1), and 'offsets' (a buffer of format "
+	     "type Q) are given, only the hash values greater (direction 1) or lower (direction -1) than or "
+	     "equal to the threshold are written, contiguously, to 'buffer' and the positions of the "
+	     "corresponding windows in 'input' to 'offsets'. The return value is then a tuple with the "
+	     "number of windows hashed and the number of hash values written.\n\n"
+	     "The GIL is released while hashing.");
+
+static PyObject *
+hasharray(PyObject * self, PyObject * args)
+{
+  Py_ssize_t width ;
+  Py_buffer inputbuf;
+  Py_buffer arraybuf;
+  unsigned long long seed = XXH3_DEFAULT_SEED;
+  unsigned long long threshold = 0;
+  int direction = 0;
+  Py_buffer offsetbuf;
+  const char * input;
+  Py_ssize_t length, olength, maxi, nkept;
+  unsigned long long * hasharray;
+  unsigned long long * offsetarray = NULL;
+  offsetbuf.obj = NULL;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "s*ny*|KKiw*", &inputbuf, &width, &arraybuf, &seed,
+			&threshold, &direction, &offsetbuf)) {
+    return NULL;
+  }
+
+  if ((direction != 0 || offsetbuf.obj != NULL) &&
+      (offsetbuf.obj == NULL || (direction != 1 && direction != -1))) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
+    PyErr_SetString(PyExc_ValueError, "Filtering requires a threshold, a direction (1 or -1), and a buffer for offsets.");
+    return NULL;
+  }
+
+  input = (const char *)inputbuf.buf;
+  length = inputbuf.len;
+
+  if (width < 1 || width > length) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
+    PyErr_SetString(PyExc_ValueError, "The width of the window must be positive and cannot be longer than the input string.");
+    return NULL;
+  }
+
+  olength = arraybuf.len / arraybuf.itemsize;
+
+  if (arraybuf.itemsize != sizeof(unsigned long long)) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
+    PyErr_SetString(PyExc_ValueError, "The buffer must be of format type Q.");
+    return NULL;
+  }
+
+  hasharray = (unsigned long long *) arraybuf.buf;
+  maxi = olength < (length-width+1) ? olength : (length-width+1);
+
+  if (offsetbuf.obj != NULL &&
+      (offsetbuf.itemsize != sizeof(unsigned long long) ||
+       (offsetbuf.len / offsetbuf.itemsize) < maxi)) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    PyBuffer_Release(&offsetbuf);
+    PyErr_SetString(PyExc_ValueError, "The buffer for offsets must be of format type Q and as long as the buffer.");
+    return NULL;
+  }
+
+  if (offsetbuf.obj != NULL) {
+    offsetarray = (unsigned long long *) offsetbuf.buf;
+  }
+  /* The buffers are held: the hashing loop does not need the GIL. */
+  Py_BEGIN_ALLOW_THREADS
+  nkept = xxh3_windows(input, width, maxi, (uint64_t)seed,
+		       threshold, direction, hasharray, offsetarray);
+  Py_END_ALLOW_THREADS
+  PyBuffer_Release(&inputbuf);
+  PyBuffer_Release(&arraybuf);
+  if (offsetbuf.obj != NULL) {
+    PyBuffer_Release(&offsetbuf);
+  }
+  if (direction == 0) {
+    return PyLong_FromSsize_t(maxi);
+  }
+  return Py_BuildValue("nn", maxi, nkept);
+}
+
+PyDoc_STRVAR(hasharray128_doc,
+             "hasharray128(input, width, buffer [, seed]) -> int\n\n"
+             "Compute XXH3 (128 bits) hash values for a sliding array of bytes over a bytes-like object 'input', "
+	     "optionally using a seed (an integer). The hash value for the window at position i is "
+	     "written to buffer[2*i] (low 64 bits) and buffer[2*i+1] (high 64 bits). The return value is "
+	     "the number of windows hashed.\n\n"
+	     "The GIL is released while hashing.");
+
+static PyObject *
+hasharray128(PyObject * self, PyObject * args)
+{
+  Py_ssize_t width ;
+  Py_buffer inputbuf;
+  Py_buffer arraybuf;
+  unsigned long long seed = XXH3_DEFAULT_SEED;
+  const char * input;
+  Py_ssize_t length, olength, maxi, i;
+  unsigned long long * hasharray;
+  XXH128_hash_t out;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "s*ny*|K", &inputbuf, &width, &arraybuf, &seed)) {
+    return NULL;
+  }
+
+  input = (const char *)inputbuf.buf;
+  length = inputbuf.len;
+
+  if (width < 1 || width > length) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    PyErr_SetString(PyExc_ValueError, "The width of the window must be positive and cannot be longer than the input string.");
+    return NULL;
+  }
+
+  if (arraybuf.itemsize != sizeof(unsigned long long)) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    PyErr_SetString(PyExc_ValueError, "The buffer must be of format type Q.");
+    return NULL;
+  }
+
+  olength = arraybuf.len / arraybuf.itemsize / 2;
+  hasharray = (unsigned long long *) arraybuf.buf;
+  maxi = olength < (length-width+1) ? olength : (length-width+1);
+
+  /* The buffers are held: the hashing loop does not need the GIL. */
+  Py_BEGIN_ALLOW_THREADS
+  for (i = 0; i < maxi; i++) {
+    out = XXH3_128bits_withSeed(input + i, (size_t)width, (uint64_t)seed);
+    hasharray[2 * i] = out.low64;
+    hasharray[2 * i + 1] = out.high64;
+  }
+  Py_END_ALLOW_THREADS
+  PyBuffer_Release(&inputbuf);
+  PyBuffer_Release(&arraybuf);
+  return PyLong_FromSsize_t(maxi);
+}
+
+static PyMethodDef xxh3ModuleMethods[] = {
+    {
+      "hasharray", (PyCFunction)hasharray,
+        METH_VARARGS, hasharray_doc,
+    },
+    {
+      "hasharray128", (PyCFunction)hasharray128,
+        METH_VARARGS, hasharray128_doc,
+    },
+    { NULL, NULL, 0, NULL} // sentinel
+};
+
+static struct PyModuleDef moduledef = {
+  PyModuleDef_HEAD_INIT,
+  "_xxh3",
+  "XXH3 hashing functions.",
+  -1,
+  xxh3ModuleMethods,
+  NULL, NULL, NULL, NULL};
+
+PyMODINIT_FUNC
+PyInit__xxh3(void)
+{
+    PyObject *m;
+
+    m = PyModule_Create(&moduledef);
+
+    if (m == NULL) {
+        return NULL;
+    }
+
+    PyModule_AddIntConstant(m, "DEFAULT_SEED", XXH3_DEFAULT_SEED);
+
+    return m;
+}
@@ -6,9 +6,15 @@ uint32_t XXH_DEFAULT_SEED = 0;
 #include <stdio.h>
 
 PyDoc_STRVAR(hasharray_doc,
-             "hasharray(input, width, buffer [, seed]) -> int\n\n"
+             "hasharray(input, width, buffer [, seed [, threshold, direction, offsets]]) -> int or (int, int)\n\n"
              "Compute a hash values for a sliding array of bytes over a bytes-like object 'input', "
-	     "optionally using a seed (an integer).");
+	     "optionally using a seed (an integer).\n\n"
+	     "When 'threshold' (an integer), 'direction' (1 or -1), and 'offsets' (a buffer of format "
+	     "type Q) are given, only the hash values greater (direction 1) or lower (direction -1) than or "
+	     "equal to the threshold are written, contiguously, to 'buffer' and the positions of the "
+	     "corresponding windows in 'input' to 'offsets'. The return value is then a tuple with the "
+	     "number of windows hashed and the number of hash values written.\n\n"
+	     "The GIL is released while hashing.");
 
 static PyObject *
 hasharray(PyObject * self, PyObject * args)
@@ -16,9 +22,25 @@ hasharray(PyObject * self, PyObject * args)
   Py_ssize_t width ;
   Py_buffer inputbuf;
   Py_buffer arraybuf;
-  const uint32_t seed = XXH_DEFAULT_SEED;
+  unsigned long long seed = XXH_DEFAULT_SEED;
+  unsigned long long threshold = 0;
+  int direction = 0;
+  Py_buffer offsetbuf;
+  offsetbuf.obj = NULL;
 
-  if (!PyArg_ParseTuple(args, "s*ny*|I", &inputbuf, &width, &arraybuf, &seed)) {
+  if (!PyArg_ParseTuple(args, "s*ny*|KKiw*", &inputbuf, &width, &arraybuf, &seed,
+			&threshold, &direction, &offsetbuf)) {
+    return NULL;
+  }
+
+  if ((direction != 0 || offsetbuf.obj != NULL) &&
+      (offsetbuf.obj == NULL || (direction != 1 && direction != -1))) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
+    PyErr_SetString(PyExc_ValueError, "Filtering requires a threshold, a direction (1 or -1), and a buffer for offsets.");
     return NULL;
   }
 
@@ -28,6 +50,9 @@ hasharray(PyObject * self, PyObject * args)
   if (width > length) {
     PyBuffer_Release(&inputbuf);
     PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
     PyErr_SetString(PyExc_ValueError, "The width of the window cannot be longer than the input string.");
     return NULL;
   }
@@ -37,23 +62,170 @@ hasharray(PyObject * self, PyObject * args)
   if (arraybuf.itemsize != sizeof(unsigned long long)) {
     PyBuffer_Release(&inputbuf);
     PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
     PyErr_SetString(PyExc_ValueError, "The buffer must be of format type Q.");
     return NULL;
   }
 
   unsigned long long * hasharray = (unsigned long long *) arraybuf.buf;
   const Py_ssize_t maxi = olength < (length-width+1) ? olength : (length-width+1); 
-  
+
+  if (offsetbuf.obj != NULL &&
+      (offsetbuf.itemsize != sizeof(unsigned long long) ||
+       (offsetbuf.len / offsetbuf.itemsize) < maxi)) {
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    PyBuffer_Release(&offsetbuf);
+    PyErr_SetString(PyExc_ValueError, "The buffer for offsets must be of format type Q and as long as the buffer.");
+    return NULL;
+  }
+
   unsigned long long out;
+  if (direction == 0) {
+    /* The buffers are held: the hashing loop does not need the GIL. */
+    Py_BEGIN_ALLOW_THREADS
+    for (Py_ssize_t i=0; i < maxi; i++) {
+      out = XXH64((void *)(input + i),
+		  (size_t)width,
+		  seed);
+      hasharray[i] = out;
+    }
+    Py_END_ALLOW_THREADS
+    PyBuffer_Release(&inputbuf);
+    PyBuffer_Release(&arraybuf);
+    if (offsetbuf.obj != NULL) {
+      PyBuffer_Release(&offsetbuf);
+    }
+    return PyLong_FromSsize_t(maxi);
+  }
+
+  unsigned long long * offsetarray = (unsigned long long *) offsetbuf.buf;
+  Py_ssize_t nkept = 0;
+  Py_BEGIN_ALLOW_THREADS
   for (Py_ssize_t i=0; i < maxi; i++) {
     out = XXH64((void *)(input + i),
 		(size_t)width,
-		(unsigned long long)seed);
-    hasharray[i] = out;
+		seed);
+    if (direction > 0 ? out >= threshold : out <= threshold) {
+      hasharray[nkept] = out;
+      offsetarray[nkept] = (unsigned long long)i;
+      nkept++;
+    }
   }
+  Py_END_ALLOW_THREADS
   PyBuffer_Release(&inputbuf);
   PyBuffer_Release(&arraybuf);
-  return PyLong_FromSsize_t(maxi);
+  PyBuffer_Release(&offsetbuf);
+  return Py_BuildValue("nn", maxi, nkept);
+}
+
+/* Maximum number of seeds in one call to hasharray_seeds */
+#define XXH_MAXSEEDS 64
+
+/* Number of windows hashed with all seeds at a time in hasharray_seeds */
+#define XXH_SEEDS_BLOCKSIZE 1024
+
+PyDoc_STRVAR(hasharray_seeds_doc,
+             "hasharray_seeds(input, width, buffers, seeds) -> int\n\n"
+             "Compute hash values for a sliding array of bytes over a bytes-like object 'input', "
+	     "with several seeds in one pass over 'input'. 'seeds' is a sequence of integers and "
+	     "'buffers' a sequence of as many buffers (format type Q): the hash values for the seed "
+	     "'seeds[j]' are written to 'buffers[j]'. The return value is the number of windows hashed "
+	     "(limited by the shortest buffer).\n\n"
+	     "The GIL is released while hashing.");
+
+static PyObject *
+hasharray_seeds(PyObject * self, PyObject * args)
+{
+  Py_ssize_t width ;
+  Py_buffer inputbuf;
+  PyObject * buffers_obj;
+  PyObject * seeds_obj;
+  PyObject * buffers = NULL;
+  PyObject * seeds = NULL;
+  Py_buffer arraybufs[XXH_MAXSEEDS];
+  unsigned long long * hasharrays[XXH_MAXSEEDS];
+  unsigned long long seedvalues[XXH_MAXSEEDS];
+  Py_ssize_t nseeds = 0;
+  Py_ssize_t nbufs = 0;
+  Py_ssize_t maxi = -1;
+  Py_ssize_t i, j, blockbeg, blockend;
+  PyObject * res = NULL;
+  const char * input;
+  Py_ssize_t length;
+
+  (void)self;
+  if (!PyArg_ParseTuple(args, "s*nOO", &inputbuf, &width, &buffers_obj, &seeds_obj)) {
+    return NULL;
+  }
+  input = (const char *)inputbuf.buf;
+  length = inputbuf.len;
+
+  if (width > length) {
+    PyErr_SetString(PyExc_ValueError, "The width of the window cannot be longer than the input string.");
+    goto done;
+  }
+  buffers = PySequence_Fast(buffers_obj, "The buffers must be a sequence.");
+  seeds = PySequence_Fast(seeds_obj, "The seeds must be a sequence.");
+  if (buffers == NULL || seeds == NULL) {
+    goto done;
+  }
+  nseeds = PySequence_Fast_GET_SIZE(seeds);
+  if (nseeds != PySequence_Fast_GET_SIZE(buffers) || nseeds > XXH_MAXSEEDS) {
+    PyErr_Format(PyExc_ValueError, "There must be as many buffers as seeds, and at most %i of them.",
+		 XXH_MAXSEEDS);
+    goto done;
+  }
+  for (j = 0; j < nseeds; j++) {
+    seedvalues[j] = PyLong_AsUnsignedLongLong(PySequence_Fast_GET_ITEM(seeds, j));
+    if (PyErr_Occurred()) {
+      goto done;
+    }
+  }
+  maxi = length - width + 1;
+  for (nbufs = 0; nbufs < nseeds; nbufs++) {
+    if (PyObject_GetBuffer(PySequence_Fast_GET_ITEM(buffers, nbufs),
+			   &arraybufs[nbufs], PyBUF_WRITABLE) != 0) {
+      goto done;
+    }
+    if (arraybufs[nbufs].itemsize != sizeof(unsigned long long)) {
+      nbufs++;
+      PyErr_SetString(PyExc_ValueError, "The buffers must be of format type Q.");
+      goto done;
+    }
+    hasharrays[nbufs] = (unsigned long long *) arraybufs[nbufs].buf;
+    if (arraybufs[nbufs].len / arraybufs[nbufs].itemsize < maxi) {
+      maxi = arraybufs[nbufs].len / arraybufs[nbufs].itemsize;
+    }
+  }
+
+  /* The buffers are held: the hashing loop does not need the GIL.
+     The input is read from memory once: the windows are hashed block by
+     block with all seeds, the block staying in cache. */
+  Py_BEGIN_ALLOW_THREADS
+  for (blockbeg=0; blockbeg < maxi; blockbeg += XXH_SEEDS_BLOCKSIZE) {
+    blockend = blockbeg + XXH_SEEDS_BLOCKSIZE < maxi ? blockbeg + XXH_SEEDS_BLOCKSIZE : maxi;
+    for (j=0; j < nseeds; j++) {
+      for (i=blockbeg; i < blockend; i++) {
+	hasharrays[j][i] = XXH64((const void *)(input + i),
+				 (size_t)width,
+				 seedvalues[j]);
+      }
+    }
+  }
+  Py_END_ALLOW_THREADS
+  res = PyLong_FromSsize_t(maxi);
+
+ done:
+  for (j = 0; j < nbufs; j++) {
+    PyBuffer_Release(&arraybufs[j]);
+  }
+  Py_XDECREF(buffers);
+  Py_XDECREF(seeds);
+  PyBuffer_Release(&inputbuf);
+  return res;
 }
 
 static PyMethodDef xxhashModuleMethods[] = {
@@ -61,6 +233,10 @@ static PyMethodDef xxhashModuleMethods[] = {
       "hasharray", (PyCFunction)hasharray,
         METH_VARARGS, hasharray_doc,
     },
+    {
+      "hasharray_seeds", (PyCFunction)hasharray_seeds,
+        METH_VARARGS, hasharray_seeds_doc,
+    },
     { NULL} // sentinel
 };
 
@@ -83,6 +259,7 @@ PyInit__xxhash(void)
     }
 
     PyModule_AddIntConstant(m, "DEFAULT_SEED", XXH_DEFAULT_SEED);
+    PyModule_AddIntConstant(m, "MAXSEEDS", XXH_MAXSEEDS);
     
     return m;
 }
@@ -0,0 +1,262 @@
+"""
+Benchmarks
+
+Run with `python -m mashingpumpkins.benchmark <command>`, with the command
+one of:
+
+- `window`: width of the window over sequences hashed with one call to the
+  hashing function (see
+  :func:`mashingpumpkins.minhashsketch.hashbuffer_size`). For each length
+  of sequence, sequences totalling a fixed number of bases are added one
+  at a time to a sketch, with each maximum width of the window.
+- `hash`: hashing functions, on a random DNA sequence, for several sizes
+  of kmers.
+
+The throughput in megabases per second is reported.
+"""
+
+import argparse
+import array
+import random
+import sys
+import time
+from mashingpumpkins import (_murmurhash3, _murmurhash3_mash, _nthash,
+                             _xxh3, _xxhash)
+from mashingpumpkins.minhashsketch import (DEFAULT_HASHBUFFERSIZE,
+                                           MinCompactSketch,
+                                           MinSketch)
+
+# Lengths of sequences: short reads, long reads, bacterial genome
+DEFAULT_LENGTHS = (150, 10000, 5000000)
+
+# Maximum widths of the window
+DEFAULT_WIDTHS = (64, 250, 1024, 2**12, 2**14, 2**16, 2**18)
+
+# Sizes of kmers
+DEFAULT_NSIZES = (15, 21, 31, 63, 127)
+
+HASHFUNS = {
+    'murmurhash3': _murmurhash3,
+    'xxhash': _xxhash,
+    'xxh3': _xxh3,
+    'nthash': _nthash,
+    'mash': _murmurhash3_mash,
+}
+
+SKETCHES = {
+    'compact': MinCompactSketch,
+    'set': MinSketch,
+}
+
+
+def random_sequences(length: int, total: int, seed: int = 123) -> list:
+    """
+    Random DNA sequences of a given length.
+
+    :param length: length of each sequence
+    :param total: total number of bases (at least one sequence is made)
+    :param seed: seed for the random number generator
+
+    :return: a list of :class:`bytes`
+    """
+    rng = random.Random(seed)
+    return [bytes(rng.choices(b'ACGT', k=length))
+            for i in range(max(1, total // length))]
+
+
+def time_add(sequences, cls, nsize: int, maxsize: int, hashmodule,
+             hashbuffersize: int, repeat: int = 3) -> float:
+    """
+    Time the addition of sequences to an empty sketch.
+
+    :param sequences: a sequence of bytes-like objects
+    :param cls: a sketch class
+    :param nsize: size of the kmers
+    :param maxsize: maximum size of the sketch
+    :param hashmodule: a module with a function `hasharray` and a
+        `DEFAULT_SEED`
+    :param hashbuffersize: maximum width of the window
+    :param repeat: number of repetitions
+
+    :return: the best time (in seconds)
+    """
+    best = float('inf')
+    for i in range(repeat):
+        mhs = cls(nsize, maxsize, hashmodule.hasharray,
+                  hashmodule.DEFAULT_SEED, hashbuffersize=hashbuffersize)
+        t0 = time.perf_counter()
+        for sequence in sequences:
+            mhs.add(sequence)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def run(lengths=DEFAULT_LENGTHS, widths=DEFAULT_WIDTHS,
+        cls=MinCompactSketch, nsize: int = 21, maxsize: int = 1000,
+        hashmodule=_murmurhash3, total: int = 5000000, repeat: int = 3):
+    """
+    Run the benchmark.
+
+    :param lengths: lengths of the sequences
+    :param widths: maximum widths of the window
+    :param total: number of bases for each length of sequence
+    (see :func:`time_add` for the other parameters)
+
+    :return: an iterator of triplets `(length, width, throughput)`, with
+        the throughput in megabases per second
+    """
+    for length in lengths:
+        sequences = random_sequences(length, total)
+        nbases = sum(len(x) for x in sequences)
+        for width in widths:
+            if width < nsize:
+                continue
+            elapsed = time_add(sequences, cls, nsize, maxsize, hashmodule,
+                               width, repeat=repeat)
+            yield (length, width, nbases / elapsed / 1E6)
+
+
+def time_hasharray(sequence, nsize: int, hashmodule,
+                   repeat: int = 3) -> float:
+    """
+    Time the hashing of all kmers in a sequence with one call to the
+    function `hasharray` of a module.
+
+    :param sequence: a bytes-like object
+    :param nsize: size of the kmers
+    :param hashmodule: a module with a function `hasharray` and a
+        `DEFAULT_SEED`
+    :param repeat: number of repetitions
+
+    :return: the best time (in seconds)
+    """
+    hashbuffer = array.array('Q', bytes(8 * (len(sequence) - nsize + 1)))
+    best = float('inf')
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        hashmodule.hasharray(sequence, nsize, hashbuffer,
+                             hashmodule.DEFAULT_SEED)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def run_hashfuns(nsizes=DEFAULT_NSIZES, hashmodules=tuple(HASHFUNS.values()),
+                 length: int = 5000000, repeat: int = 3):
+    """
+    Run the benchmark of hashing functions on a random DNA sequence.
+
+    :param nsizes: sizes of the kmers
+    :param hashmodules: modules with a function `hasharray` and a
+        `DEFAULT_SEED`
+    :param length: length of the sequence
+    :param repeat: number of repetitions
+
+    :return: an iterator of triplets `(nsize, hashmodule, throughput)`,
+        with the throughput in megabases per second
+    """
+    sequence = random_sequences(length, length)[0]
+    for nsize in nsizes:
+        for hashmodule in hashmodules:
+            elapsed = time_hasharray(sequence, nsize, hashmodule,
+                                     repeat=repeat)
+            yield (nsize, hashmodule, len(sequence) / elapsed / 1E6)
+
+
+def _print_table(header, results, ncols: int) -> None:
+    # Print a table from the triplets `(row name, column, value)`.
+    print('\t'.join(header))
+    row = []
+    for name, col, value in results:
+        row.append('%.1f' % value)
+        if len(row) == ncols:
+            print('\t'.join([str(name)] + row))
+            row = []
+
+
+def _cmd_window(args) -> int:
+    widths = [x for x in args.widths if x >= args.nsize]
+    _print_table(['length'] + [str(x) for x in widths],
+                 run(lengths=args.lengths, widths=widths,
+                     cls=SKETCHES[args.sketch], nsize=args.nsize,
+                     maxsize=args.maxsize, hashmodule=HASHFUNS[args.hash],
+                     total=args.total, repeat=args.repeat),
+                 len(widths))
+    return 0
+
+
+def _cmd_hash(args) -> int:
+    _print_table(['nsize'] + args.hashfuns,
+                 run_hashfuns(nsizes=args.nsizes,
+                              hashmodules=[HASHFUNS[x]
+                                           for x in args.hashfuns],
+                              length=args.length, repeat=args.repeat),
+                 len(args.hashfuns))
+    return 0
+
+
+def main(argv=None) -> int:
+    """
+    Run a benchmark from the command line and print a table (throughput
+    in megabases per second).
+
+    :param argv: arguments (if None, `sys.argv[1:]`)
+
+    :return: the exit status
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m mashingpumpkins.benchmark',
+        description='Benchmarks (throughput in megabases per second).')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    window = subparsers.add_parser(
+        'window',
+        help='Maximum widths of the window over sequences, for lengths of '
+        'sequences (default maximum width: %i).' % DEFAULT_HASHBUFFERSIZE)
+    window.add_argument('-l', '--lengths', type=int, nargs='+',
+                        default=DEFAULT_LENGTHS,
+                        help='Lengths of the sequences '
+                        '(default: %(default)s).')
+    window.add_argument('-w', '--widths', type=int, nargs='+',
+                        default=DEFAULT_WIDTHS,
+                        help='Maximum widths of the window '
+                        '(default: %(default)s).')
+    window.add_argument('-k', '--nsize', type=int, default=21,
+                        help='Size of the kmers (default: %(default)s).')
+    window.add_argument('-s', '--maxsize', type=int, default=1000,
+                        help='Maximum size of the sketch '
+                        '(default: %(default)s).')
+    window.add_argument('--hash', choices=tuple(HASHFUNS),
+                        default='murmurhash3',
+                        help='Hashing function (default: %(default)s).')
+    window.add_argument('--sketch', choices=tuple(SKETCHES),
+                        default='compact',
+                        help='Kind of sketch (default: %(default)s).')
+    window.add_argument('--total', type=int, default=5000000,
+                        help='Number of bases for each length '
+                        '(default: %(default)s).')
+    window.set_defaults(func=_cmd_window)
+
+    hashfuns = subparsers.add_parser(
+        'hash',
+        help='Hashing functions, for sizes of kmers.')
+    hashfuns.add_argument('-k', '--nsizes', type=int, nargs='+',
+                          default=DEFAULT_NSIZES,
+                          help='Sizes of the kmers (default: %(default)s).')
+    hashfuns.add_argument('--hashfuns', choices=tuple(HASHFUNS), nargs='+',
+                          default=list(HASHFUNS),
+                          help='Hashing functions (default: all).')
+    hashfuns.add_argument('--length', type=int, default=5000000,
+                          help='Length of the sequence '
+                          '(default: %(default)s).')
+    hashfuns.set_defaults(func=_cmd_hash)
+
+    for subparser in (window, hashfuns):
+        subparser.add_argument('--repeat', type=int, default=3,
+                               help='Number of repetitions '
+                               '(default: %(default)s).')
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""
+Command-line interface
+
+The command `mashingpumpkins` (or `python -m mashingpumpkins.cli`) has
+two subcommands:
+
+- `sketch`: build sketches for FASTA or FASTQ files (plain or
+  gzip-compressed), using several processes (see
+  :class:`mashingpumpkins.parallel.ParallelSketcher`), and write them to
+  disk (see :mod:`mashingpumpkins.sketchfile`).
+- `dist`: compute Mash distances between sketches written by `sketch`.
+"""
+
+import argparse
+import array
+import os
+import sys
+from mashingpumpkins import sketchfile
+from mashingpumpkins.compare import pairwise
+from mashingpumpkins.fastx import DEFAULT_BLOCKSIZE, add_fastx
+from mashingpumpkins.minhashsketch import (FrozenCompactSketch,
+                                           MaxCompactSketch,
+                                           MinCompactSketch,
+                                           _mash_distance)
+from mashingpumpkins.parallel import ParallelSketcher
+
+# Hashing functions, by name, as modules with a function `hasharray`
+# and a `DEFAULT_SEED`.
+HASHFUNS = sketchfile.HASHFUNS
+
+# Kinds of sketches, by name.
+SKETCHES = {
+    'bottom': MinCompactSketch,
+    'top': MaxCompactSketch,
+}
+
+# Suffix for the files with sketches (see :mod:`mashingpumpkins.sketchfile`).
+SKETCH_SUFFIX = '.sketch'
+
+
+def _read_sketch(filename: str) -> (str, str, FrozenCompactSketch):
+    # The name of the sketch is the name of the file without the suffix
+    # (the name of the input file for files written by `sketch`).
+    sketch = sketchfile.load(filename)
+    name = os.path.basename(filename)
+    if name.endswith(SKETCH_SUFFIX):
+        name = name[:-len(SKETCH_SUFFIX)]
+    return (name, sketchfile._hashname(sketch._hashfun), sketch)
+
+
+def _cmd_sketch(args) -> int:
+    hashmodule = HASHFUNS[args.hash]
+    seed = hashmodule.DEFAULT_SEED if args.seed is None else args.seed
+    cls = SKETCHES[args.kind]
+    sketchargs = (args.nsize, args.maxsize, hashmodule.hasharray, seed)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    def write(filename, mhs, stats):
+        print('Processing %s...\n    %s' % (filename, stats),
+              file=sys.stderr)
+        outname = os.path.join(args.output_dir,
+                               os.path.basename(filename) + SKETCH_SUFFIX)
+        sketchfile.save(mhs.freeze(), outname)
+
+    if args.ncpu == 1:
+        for filename in args.filenames:
+            mhs = cls(*sketchargs)
+            stats = add_fastx((mhs, ), filename, blocksize=args.blocksize)
+            write(filename, mhs, stats)
+    else:
+        with ParallelSketcher(*sketchargs, cls=cls, ncpu=args.ncpu,
+                              blocksize=args.blocksize,
+                              threads=args.threads) as sketcher:
+            for i, mhs, stats in sketcher.imap_files(args.filenames):
+                write(args.filenames[i], mhs, stats)
+    return 0
+
+
+def _check_compatible(sketches) -> None:
+    ref_name, ref_hashname, ref = sketches[0]
+    for name, hashname, sketch in sketches[1:]:
+        if ((hashname, sketch._seed, sketch.nsize, sketch._sign) !=
+           (ref_hashname, ref._seed, ref.nsize, ref._sign)):
+            raise ValueError('The sketches for %s and %s were not built '
+                             'with the same parameters.'
+                             % (ref_name, name))
+
+
+def _cmd_dist(args) -> int:
+    sketches = [_read_sketch(x) for x in args.sketches]
+    _check_compatible(sketches)
+    out = sys.stdout if args.output == '-' else open(args.output, 'wt')
+    try:
+        if args.matrix:
+            n = len(sketches)
+            res = array.array('d', bytes(8 * n * n))
+            pairwise([x[2] for x in sketches], metric='mash_distance',
+                     out=res)
+            print('\t'.join([''] + [x[0] for x in sketches]), file=out)
+            for i, (name, hashname, sketch) in enumerate(sketches):
+                print('\t'.join([name] + ['%g' % x
+                                          for x in res[i*n:(i+1)*n]]),
+                      file=out)
+        else:
+            for i, (name_a, hashname, a) in enumerate(sketches):
+                for name_b, hashname, b in sketches[(i+1):]:
+                    shared, total = a._bottomk_union(b)
+                    distance = _mash_distance(shared / total, a.nsize)
+                    print('%s\t%s\t%g\t%g\t%i/%i'
+                          % (name_a, name_b, distance,
+                             a.mash_pvalue(b), shared, total),
+                          file=out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+def _positive_int(value: str) -> int:
+    res = int(value)
+    if res < 1:
+        raise argparse.ArgumentTypeError('%s is not a positive integer.'
+                                         % value)
+    return res
+
+
+def _make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='mashingpumpkins',
+        description='Hash sketches of sequences.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    sketch = subparsers.add_parser(
+        'sketch',
+        help='Sketch FASTA or FASTQ files (plain or gzip-compressed).')
+    sketch.add_argument('filenames', nargs='+', metavar='FILE')
+    sketch.add_argument('-k', '--nsize', type=_positive_int, default=21,
+                        help='Size of the kmers (default: %(default)s).')
+    sketch.add_argument('-s', '--maxsize', type=_positive_int,
+                        default=1000,
+                        help='Maximum size of the sketches '
+                        '(default: %(default)s).')
+    sketch.add_argument('--hash', choices=tuple(HASHFUNS),
+                        default='murmurhash3',
+                        help='Hashing function ("mash" is MurmurHash3 on '
+                        'canonical kmers, as in Mash; default: '
+                        '%(default)s).')
+    sketch.add_argument('--seed', type=int, default=None,
+                        help='Seed for the hashing function (default: the '
+                        'default seed for that function).')
+    sketch.add_argument('--kind', choices=tuple(SKETCHES),
+                        default='bottom',
+                        help='Keep the lowest (bottom) or highest (top) '
+                        'hash values (default: %(default)s).')
+    sketch.add_argument('-p', '--ncpu', type=_positive_int, default=1,
+                        help='Number of processes (default: %(default)s).')
+    sketch.add_argument('--threads', action='store_true',
+                        help='Use threads rather than processes.')
+    sketch.add_argument('--blocksize', type=_positive_int,
+                        default=DEFAULT_BLOCKSIZE,
+                        help='Number of bytes read at a time, and '
+                        'approximate size of the work units '
+                        '(default: %(default)s).')
+    sketch.add_argument('-o', '--output-dir', default='.',
+                        help='Directory in which the sketches are written, '
+                        'as <name of the input file>%s '
+                        '(default: %%(default)s).' % SKETCH_SUFFIX)
+    sketch.set_defaults(func=_cmd_sketch)
+
+    dist = subparsers.add_parser(
+        'dist',
+        help='Compute Mash distances between sketches.')
+    dist.add_argument('sketches', nargs='+', metavar='SKETCH',
+                      help='Files written by the command "sketch" (or '
+                      'with mashingpumpkins.sketchfile.save).')
+    dist.add_argument('--matrix', action='store_true',
+                      help='Write a square matrix of distances rather than '
+                      'one line per pair (with columns name 1, name 2, '
+                      'distance, p-value, shared hash values).')
+    dist.add_argument('-o', '--output', default='-',
+                      help='Output file (default: standard output).')
+    dist.set_defaults(func=_cmd_dist)
+    return parser
+
+
+def main(argv=None) -> int:
+    """
+    Run the command-line interface.
+
+    :param argv: arguments (if None, `sys.argv[1:]`)
+
+    :return: the exit status
+    """
+    parser = _make_parser()
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
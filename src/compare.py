@@ -0,0 +1,152 @@
+"""
+Comparison of collections of sketches
+"""
+
+import array
+from mashingpumpkins import _sketchcore
+from mashingpumpkins.minhashsketch import (FrozenCompactSketch,
+                                           FrozenScaledSketch,
+                                           _sorted_hashes)
+
+
+METRICS = {
+    'jaccard_similarity': _sketchcore.METRIC_JACCARD_SIMILARITY,
+    'jaccard_containment': _sketchcore.METRIC_JACCARD_CONTAINMENT,
+    'dice_similarity': _sketchcore.METRIC_DICE_SIMILARITY,
+    'jaccard_estimate': _sketchcore.METRIC_JACCARD_ESTIMATE,
+    'mash_distance': _sketchcore.METRIC_MASH_DISTANCE,
+}
+
+
+def pack(sketches) -> (array.array, array.array):
+    """
+    Pack the hash values in frozen sketches into one contiguous array.
+
+    :param sketches: a sequence of frozen sketches (see
+        :class:`mashingpumpkins.minhashsketch.FrozenSketch`)
+
+    :return: a pair `(hashes, offsets)` of arrays of type `Q` such as
+        the sorted hash values for sketch `i` are
+        `hashes[offsets[i]:offsets[i+1]]`.
+    """
+    hashes = array.array('Q')
+    offsets = array.array('Q', [0, ])
+    for sketch in sketches:
+        if isinstance(sketch, FrozenCompactSketch):
+            # also a (memory-mapped) memoryview: copied as a buffer
+            hashes.frombytes(memoryview(sketch._sketch).cast('B'))
+        else:
+            hashes.extend(_sorted_hashes(sketch._sketch))
+        offsets.append(len(hashes))
+    return (hashes, offsets)
+
+
+def _metric_id(metric: str) -> int:
+    try:
+        return METRICS[metric]
+    except KeyError:
+        raise ValueError('The metric must be one of: %s'
+                         % ', '.join(METRICS))
+
+
+def _is_packed(sketches) -> bool:
+    return (isinstance(sketches, tuple) and len(sketches) == 2 and
+            isinstance(sketches[0], array.array))
+
+
+def _packed(sketches) -> (array.array, array.array):
+    if _is_packed(sketches):
+        return sketches
+    return pack(sketches)
+
+
+def _estimator_params(sketches, metric_id: int) -> tuple:
+    # parameters for the MinHash estimators (see `_sketchcore.pairwise`)
+    if metric_id not in (_sketchcore.METRIC_JACCARD_ESTIMATE,
+                         _sketchcore.METRIC_MASH_DISTANCE):
+        return ()
+    if _is_packed(sketches):
+        raise ValueError('The MinHash estimators require sketches '
+                         '(not packed hash values).')
+    if len(sketches) == 0:
+        return ()
+    if len(set(x._sign for x in sketches)) > 1:
+        raise ValueError("The sketches must all be bottom sketches "
+                         "or all be top sketches.")
+    if all(isinstance(x, FrozenScaledSketch) for x in sketches):
+        if len(set(x.scale for x in sketches)) > 1:
+            raise ValueError("The scaled sketches must all have the same "
+                             "scale.")
+        # all hash values in the union of two sketches
+        k = sum(len(x) for x in sketches)
+    else:
+        k = min(x.maxsize for x in sketches)
+    return (k, sketches[0]._sign, sketches[0].nsize)
+
+
+def pairwise(sketches, metric: str = 'jaccard_similarity', out=None):
+    """
+    Compute a similarity index for all pairs of sketches.
+
+    :param sketches: a sequence of frozen sketches, or a pair
+        `(hashes, offsets)` as returned by :func:`pack` (except for the
+        MinHash estimators `jaccard_estimate` and `mash_distance`, that
+        need the sketches)
+    :param metric: name of the similarity index (see `METRICS`). The
+        names are the ones of the methods of
+        :class:`mashingpumpkins.minhashsketch.FrozenSketch`. With the
+        MinHash estimators the number of hash values considered is the
+        smallest maximum size across all sketches (or all hash values
+        if the sketches are all scaled sketches).
+    :param out: an optional writable buffer of doubles (format type `d`)
+        of length at least `n * n`. If None, a :mod:`numpy` array
+        is created.
+
+    :return: the matrix `out`, with `out[i, j]` (or `out[i * n + j]`) the
+        index for the sketches `i` and `j` (i.e.,
+        `sketches[i].<metric>(sketches[j])`).
+    """
+    metric_id = _metric_id(metric)
+    params = _estimator_params(sketches, metric_id)
+    hashes, offsets = _packed(sketches)
+    n = len(offsets) - 1
+    if out is None:
+        import numpy
+        out = numpy.empty((n, n), dtype=numpy.float64)
+    _sketchcore.pairwise(hashes, offsets, metric_id, out, 0, n, 0, n,
+                         *params)
+    return out
+
+
+def pairwise_blocks(sketches, metric: str = 'jaccard_similarity',
+                    blocksize: int = 1024, upper: bool = False):
+    """
+    Compute a similarity index for all pairs of sketches, block by block,
+    in order to keep the memory usage bounded for large numbers of
+    sketches.
+
+    :param sketches: a sequence of frozen sketches, or a pair
+        `(hashes, offsets)` as returned by :func:`pack`
+    :param metric: name of the similarity index (see :func:`pairwise`)
+    :param blocksize: maximum number of rows and columns in a block
+    :param upper: only yield the blocks on or above the diagonal
+        (sufficient for symmetric indices)
+
+    :return: an iterator of triplets `(rowbeg, colbeg, block)`, with
+        `block` a 2D :mod:`numpy` array for the rows starting at `rowbeg`
+        and the columns starting at `colbeg`.
+    """
+    import numpy
+    metric_id = _metric_id(metric)
+    params = _estimator_params(sketches, metric_id)
+    hashes, offsets = _packed(sketches)
+    n = len(offsets) - 1
+    for rowbeg in range(0, n, blocksize):
+        rowend = min(rowbeg + blocksize, n)
+        for colbeg in range(rowbeg if upper else 0, n, blocksize):
+            colend = min(colbeg + blocksize, n)
+            block = numpy.empty((rowend - rowbeg, colend - colbeg),
+                                dtype=numpy.float64)
+            _sketchcore.pairwise(hashes, offsets, metric_id, block,
+                                 rowbeg, rowend, colbeg, colend, *params)
+            yield (rowbeg, colbeg, block)
@@ -0,0 +1,318 @@
+"""
+Collections of sketches with an inverted index
+
+A :class:`SketchDatabase` maps each hash value to the identifiers of the
+sketches it is in (inverted index), so that a query only looks at the
+hash values in the query sketch rather than at every sketch in the
+collection.
+"""
+
+import array
+import heapq
+import json
+import mmap
+import struct
+import sys
+from collections import namedtuple
+from mashingpumpkins import _sketchcore
+from mashingpumpkins.minhashsketch import (FrozenCompactSketch,
+                                           _sorted_hashes)
+from mashingpumpkins.sketchfile import HASHFUNS, _hashname
+
+MAGIC = b'MPSKETDB'
+VERSION = 1
+
+# magic, version, flags, nsize, sign, seed, number of sketches, number of
+# distinct hash values, number of identifiers in the postings, name of the
+# hashing function
+HEADER = struct.Struct('<8sHHIiQQQQ16s4x')
+
+# Flags
+FLAG_SEED = 1
+
+# Metrics for :meth:`SketchDatabase.query`
+METRICS = ('containment', 'jaccard')
+
+# Sketch in the database matching a query, with the number of hash
+# values it shares with the query and the score for the metric.
+Match = namedtuple('Match', ('id', 'name', 'score', 'shared'))
+
+
+def _sorted(sketch):
+    if isinstance(sketch, FrozenCompactSketch):
+        return sketch._sketch
+    return _sorted_hashes(sketch._sketch)
+
+
+def _littleendian(values):
+    if sys.byteorder != 'little':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+class SketchDatabase(object):
+    """
+    Collection of frozen sketches (bottom or top sketches) built with the
+    same parameters, with an inverted index from hash values to the
+    sketches they are in.
+
+    The index is made of segments, each a sorted array of distinct hash
+    values with for each one a run of identifiers of sketches (postings).
+    Sketches added are kept as pairs (hash value, identifier) until the
+    next query, when they become a new segment. Segments are merged
+    (linear merges) when a segment is not larger than twice the one
+    after it, so that there are about log2 of the number of sketches
+    segments, and :meth:`consolidate` merges all of them.
+
+    Only the hash values of the sketches are kept, with their number and
+    a name for each sketch.
+    """
+
+    def __init__(self, nsize: int, hashfun, seed: int = None,
+                 sign: int = -1):
+        """
+        Create an empty database.
+
+        :param nsize: size of the ngrams / kmers
+        :param hashfun: hashing function (one of the functions `hasharray`
+            in :data:`mashingpumpkins.sketchfile.HASHFUNS` for the database
+            to be saved)
+        :param seed: seed for the hashing function
+        :param sign: -1 for bottom sketches, 1 for top sketches
+        """
+        self._nsize = nsize
+        self._hashfun = hashfun
+        self._seed = seed
+        self._sign = sign
+        self._names = list()
+        self._sizes = array.array('Q')
+        # segments of the index (hashes, offsets, ids), from the oldest to
+        # the newest (possibly memory-mapped)
+        self._segments = list()
+        # postings for the sketches added since the last query
+        self._pending_hashes = array.array('Q')
+        self._pending_ids = array.array('I')
+
+    @property
+    def nsize(self):
+        """ Size of the ngrams / kmers. """
+        return self._nsize
+
+    @property
+    def names(self) -> tuple:
+        """ Names of the sketches, in the order of their identifiers. """
+        return tuple(self._names)
+
+    def __len__(self):
+        """ Number of sketches. """
+        return len(self._names)
+
+    def _check(self, sketch) -> None:
+        if ((sketch.nsize, sketch._hashfun, sketch._seed, sketch._sign) !=
+           (self._nsize, self._hashfun, self._seed, self._sign)):
+            raise ValueError('The sketch was not built with the parameters '
+                             'of the database (nsize, hashing function, '
+                             'seed, and sign).')
+
+    def add(self, sketch, name: str) -> int:
+        """
+        Add a frozen sketch.
+
+        :param sketch: a frozen sketch (see
+            :class:`mashingpumpkins.minhashsketch.FrozenSketch`)
+        :param name: name for the sketch
+
+        :return: the identifier of the sketch in the database
+        """
+        self._check(sketch)
+        sketchid = len(self._names)
+        if sketchid >= 2**32:
+            raise ValueError('A database cannot have more than 2**32 '
+                             'sketches.')
+        hashes = _sorted(sketch)
+        self._pending_hashes.frombytes(memoryview(hashes).cast('B'))
+        self._pending_ids.extend(array.array('I', (sketchid, )) *
+                                 len(hashes))
+        self._names.append(name)
+        self._sizes.append(len(hashes))
+        return sketchid
+
+    @staticmethod
+    def _merge(a, b):
+        hashes = array.array('Q', bytes(8 * (len(a[0]) + len(b[0]))))
+        offsets = array.array('Q', bytes(8 * (len(hashes) + 1)))
+        ids = array.array('I', bytes(4 * (len(a[2]) + len(b[2]))))
+        n = _sketchcore.postings_merge(a[0], a[1], a[2], b[0], b[1], b[2],
+                                       hashes, offsets, ids)
+        del hashes[n:]
+        del offsets[(n + 1):]
+        return (hashes, offsets, ids)
+
+    def _flush(self) -> None:
+        # index the pending postings as a new segment
+        if len(self._pending_ids) == 0:
+            return
+        hashes = self._pending_hashes
+        ids = self._pending_ids
+        offsets = array.array('Q', bytes(8 * (len(hashes) + 1)))
+        n = _sketchcore.postings_index(hashes, ids, offsets)
+        del hashes[n:]
+        del offsets[(n + 1):]
+        segments = self._segments
+        segments.append((hashes, offsets, ids))
+        while (len(segments) > 1 and
+               len(segments[-2][2]) <= 2 * len(segments[-1][2])):
+            b = segments.pop()
+            segments[-1] = self._merge(segments[-1], b)
+        self._pending_hashes = array.array('Q')
+        self._pending_ids = array.array('I')
+
+    def consolidate(self) -> None:
+        """
+        Merge the index into one segment.
+        """
+        self._flush()
+        segments = self._segments
+        while len(segments) > 1:
+            b = segments.pop()
+            segments[-1] = self._merge(segments[-1], b)
+
+    def query(self, sketch, n: int = 10, metric: str = 'containment'):
+        """
+        Find the sketches sharing the most with a query sketch.
+
+        :param sketch: a frozen sketch built with the parameters of the
+            database
+        :param n: maximum number of matches
+        :param metric: 'containment' (fraction of the hash values in the
+            query also in the sketch, see
+            :meth:`mashingpumpkins.minhashsketch.FrozenSketch.jaccard_containment`)
+            or 'jaccard' (Jaccard index between the sets of hash values)
+
+        :return: a list of at most `n` :class:`Match`, from the best score
+            to the worst, for the sketches sharing at least one hash value
+            with the query
+        """
+        if metric not in METRICS:
+            raise ValueError('The metric must be one of: %s'
+                             % ', '.join(METRICS))
+        self._check(sketch)
+        self._flush()
+        query = _sorted(sketch)
+        counts = array.array('Q', bytes(8 * len(self._names)))
+        for hashes, offsets, ids in self._segments:
+            _sketchcore.postings_count(hashes, offsets, ids, query, counts)
+        nquery = len(query)
+        sizes = self._sizes
+        if metric == 'containment':
+            scores = ((shared / nquery, -i)
+                      for i, shared in enumerate(counts) if shared)
+        else:
+            scores = ((shared / (nquery + sizes[i] - shared), -i)
+                      for i, shared in enumerate(counts) if shared)
+        # ties broken with the lowest identifier
+        return [Match(-i, self._names[-i], score, counts[-i])
+                for score, i in heapq.nlargest(n, scores)]
+
+    def dump(self, fh) -> None:
+        """
+        Write the database to a file (the index is consolidated first).
+
+        :param fh: a file opened in binary mode
+        """
+        self.consolidate()
+        if len(self._segments):
+            hashes, offsets, ids = self._segments[0]
+        else:
+            hashes, offsets, ids = (array.array('Q'), array.array('Q', (0, )),
+                                    array.array('I'))
+        hashname = _hashname(self._hashfun)
+        flags = 0 if self._seed is None else FLAG_SEED
+        fh.write(HEADER.pack(MAGIC, VERSION, flags, self._nsize,
+                             self._sign,
+                             0 if self._seed is None else self._seed,
+                             len(self._names), len(hashes), len(ids),
+                             hashname.encode('ascii')))
+        for values in (hashes, offsets, self._sizes, ids):
+            fh.write(_littleendian(values))
+        fh.write(json.dumps(self._names).encode('utf-8'))
+
+    def save(self, filename: str) -> None:
+        """
+        Write the database to a file (see :meth:`dump`).
+
+        :param filename: name of the file
+        """
+        with open(filename, 'wb') as fh:
+            self.dump(fh)
+
+    @classmethod
+    def loads(cls, buf):
+        """
+        Make a database from the content of a file written by
+        :meth:`dump`. The index uses the buffer (no copy) until it is
+        merged with sketches added later.
+
+        :param buf: a bytes-like object (for example a :class:`mmap.mmap`)
+
+        :return: a :class:`SketchDatabase`
+        """
+        buf = memoryview(buf).cast('B')
+        if len(buf) < HEADER.size:
+            raise ValueError('Truncated database (no header).')
+        (magic, version, flags, nsize, sign, seed, nsketches, nhashes, nids,
+         hashname) = HEADER.unpack_from(buf)
+        if magic != MAGIC:
+            raise ValueError('Not a database of sketches (magic bytes %r).'
+                             % magic)
+        if version != VERSION:
+            raise ValueError('Version %i of the format is not supported '
+                             '(only version %i).' % (version, VERSION))
+        hashname = hashname.rstrip(b'\x00').decode('ascii')
+        if hashname not in HASHFUNS:
+            raise ValueError('Unknown hashing function "%s".' % hashname)
+        res = cls(nsize, HASHFUNS[hashname].hasharray,
+                  seed=seed if flags & FLAG_SEED else None, sign=sign)
+        offset = HEADER.size
+        arrays = list()
+        for length, itemsize, typecode in ((nhashes, 8, 'Q'),
+                                           (nhashes + 1, 8, 'Q'),
+                                           (nsketches, 8, 'Q'),
+                                           (nids, 4, 'I')):
+            end = offset + length * itemsize
+            if len(buf) < end:
+                raise ValueError('Truncated database.')
+            values = buf[offset:end].cast(typecode)
+            if sys.byteorder != 'little':
+                values = _littleendian(array.array(typecode, values))
+            arrays.append(values)
+            offset = end
+        hashes, offsets, sizes, ids = arrays
+        if nhashes:
+            res._segments.append((hashes, offsets, ids))
+        res._sizes = array.array('Q', sizes)
+        res._names = json.loads(bytes(buf[offset:]).decode('utf-8'))
+        if len(res._names) != nsketches:
+            raise ValueError('Invalid database (%i names for %i sketches).'
+                             % (len(res._names), nsketches))
+        return res
+
+    @classmethod
+    def load(cls, filename: str, use_mmap: bool = True):
+        """
+        Read a database from a file written by :meth:`save` (see
+        :meth:`loads`).
+
+        :param filename: name of the file
+        :param use_mmap: map the file in memory (if False, the file is
+            read)
+
+        :return: a :class:`SketchDatabase`
+        """
+        with open(filename, 'rb') as fh:
+            if use_mmap:
+                buf = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buf = fh.read()
+        return cls.loads(buf)
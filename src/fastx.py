@@ -0,0 +1,190 @@
+"""
+Streaming FASTA and FASTQ files into sketches
+"""
+
+import array
+import gzip
+import time
+from collections import namedtuple
+from mashingpumpkins import _sketchcore
+from mashingpumpkins.minhashsketch import CompactSketch
+
+# Number of bytes read from the input at a time
+DEFAULT_BLOCKSIZE = 2**22
+
+# Maximum number of records in a batch
+DEFAULT_MAXRECORDS = 2**16
+
+# Batch of records: the sequences, put one after the other, in a `memoryview`
+# and the positions where each complete record ends (a `memoryview` of
+# format type `Q`). Sequence data after the last end is the beginning of
+# a record continuing in the next batch.
+SequenceBatch = namedtuple('SequenceBatch', ('sequences', 'ends'))
+
+
+def open_fastx(filename: str):
+    """
+    Open a FASTA or FASTQ file, possibly gzip-compressed, for reading
+    in binary mode.
+    """
+    with open(filename, 'rb') as fh:
+        magic = fh.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(filename, 'rb')
+    else:
+        return open(filename, 'rb')
+
+
+def iter_batches(fh, blocksize: int = DEFAULT_BLOCKSIZE, overlap: int = 0,
+                 maxrecords: int = DEFAULT_MAXRECORDS):
+    """
+    Iterate over the sequences in a FASTA or FASTQ stream, in batches of
+    records.
+
+    The sequences are extracted by compiled code and put one after the
+    other in a buffer reused across batches: a batch is only valid until
+    the next one is requested. Long FASTA records (e.g., chromosomes) can
+    span several batches. A batch ending with such an incomplete record
+    is followed by a batch starting with the last `overlap` letters of
+    it, so that sub-sequences of length up to `overlap + 1` across the
+    batches are not missed (and not seen twice).
+
+    :param fh: a binary file-like object (see :func:`open_fastx`)
+    :param blocksize: number of bytes read at a time
+    :param overlap: number of letters repeated for records spanning
+        several batches (`nsize - 1` for sketches)
+    :param maxrecords: maximum number of records in a batch
+
+    :return: an iterator of :class:`SequenceBatch`
+    """
+    ends = array.array('Q', bytes(8 * maxrecords))
+    seqbuf = bytearray()
+    pending = b''
+    carry = b''
+    state = 0
+    final = False
+    while not final:
+        block = fh.read(blocksize)
+        final = len(block) == 0
+        data = pending + block if pending else block
+        pos = 0
+        while True:
+            ncarry = len(carry)
+            if len(seqbuf) < ncarry + len(data) - pos:
+                # new buffer (the previous one can still be in use)
+                seqbuf = bytearray(ncarry + len(data) - pos)
+            seqbuf[:ncarry] = carry
+            consumed, seqend, nrecords, state = _sketchcore.parse_fastx(
+                memoryview(data)[pos:], final, state, seqbuf, ncarry, ends)
+            pos += consumed
+            if nrecords > 0 or seqend > ncarry:
+                yield SequenceBatch(memoryview(seqbuf)[:seqend],
+                                    memoryview(ends)[:nrecords])
+                if state:
+                    start = ends[nrecords-1] if nrecords > 0 else 0
+                    carry = bytes(seqbuf[max(start, seqend-overlap):seqend])
+                else:
+                    carry = b''
+            if consumed == 0 or pos == len(data):
+                break
+        pending = data[pos:]
+
+
+class ReadStats(object):
+    """
+    Statistics about the processing of a FASTA or FASTQ stream.
+    """
+
+    __slots__ = ('nrecords', 'nbytes', 'elapsed')
+
+    def __init__(self, nrecords: int, nbytes: int, elapsed: float):
+        """
+        - nrecords: number of records
+        - nbytes: number of (uncompressed) bytes read
+        - elapsed: time elapsed (in seconds)
+        """
+        self.nrecords = nrecords
+        self.nbytes = nbytes
+        self.elapsed = elapsed
+
+    @property
+    def throughput(self) -> float:
+        """ Number of (uncompressed) megabytes processed per second. """
+        if self.elapsed == 0:
+            return float('inf')
+        return self.nbytes / self.elapsed / 1E6
+
+    def __str__(self):
+        minutes, seconds = divmod(self.elapsed, 60)
+        if minutes:
+            duration = '%im%02is' % (minutes, seconds)
+        else:
+            duration = '%.2fs' % seconds
+        return ('%i records in %s (%.2f MB/s)'
+                % (self.nrecords, duration, self.throughput))
+
+
+class _CountingReader(object):
+    # Wrapper counting the bytes read from a file-like object.
+
+    __slots__ = ('_fh', 'nbytes')
+
+    def __init__(self, fh):
+        self._fh = fh
+        self.nbytes = 0
+
+    def read(self, size):
+        res = self._fh.read(size)
+        self.nbytes += len(res)
+        return res
+
+
+def add_fastx(sketches, source, blocksize: int = DEFAULT_BLOCKSIZE,
+              hashbuffer=None) -> ReadStats:
+    """
+    Add the sequences in a FASTA or FASTQ file to sketches.
+
+    Records are read in large batches (see :func:`iter_batches`) and each
+    batch is added to each sketch with one call to the method `add()`,
+    sub-sequences overlapping two records being skipped.
+
+    :param sketches: a sequence of sketches (all with the same `nsize`)
+    :param source: the name of a (possibly gzip-compressed) FASTA or FASTQ
+        file, or a binary file-like object
+    :param blocksize: number of bytes read at a time
+    :param hashbuffer: an optional buffer array to store hash values (if
+        None, each sketch uses its own buffers, see the method `add()` of
+        the sketches)
+
+    :return: a :class:`ReadStats`
+    """
+    nsizes = set(x.nsize for x in sketches)
+    if len(nsizes) != 1:
+        raise ValueError('The sketches must all have the same nsize.')
+    nsize = nsizes.pop()
+    # sketches keeping the ngrams/kmers must not keep slices
+    # of the (reused) batch buffer
+    keepngrams = any(not isinstance(x, CompactSketch) for x in sketches)
+
+    if isinstance(source, str):
+        fh = open_fastx(source)
+    else:
+        fh = source
+    try:
+        reader = _CountingReader(fh)
+        nrecords = 0
+        t0 = time.time()
+        for sequences, ends in iter_batches(reader, blocksize=blocksize,
+                                            overlap=nsize-1):
+            seqbytes = bytes(sequences) if keepngrams else None
+            for mhs in sketches:
+                if isinstance(mhs, CompactSketch):
+                    mhs.add(sequences, hashbuffer, ends=ends)
+                else:
+                    mhs.add(seqbytes, hashbuffer, ends=ends)
+            nrecords += len(ends)
+        elapsed = time.time() - t0
+    finally:
+        if fh is not source:
+            fh.close()
+    return ReadStats(nrecords, reader.nbytes, elapsed)
@@ -0,0 +1,282 @@
+"""
+Locality-sensitive hashing (LSH) over sketches
+
+An :class:`LSHIndex` finds the sketches likely to be similar to a query
+(candidates) without comparing the query with each sketch: signatures of
+`nbands * nrows` bins are cut into `nbands` bands of `nrows` bins, and
+two sketches are candidates when they have the same values in all the
+bins of at least one band. With a Jaccard index `j` between two sketches,
+this happens with the probability `1 - (1 - j**nrows)**nbands` (see
+:func:`candidate_probability`), an S-shaped curve around
+:func:`threshold`. Candidates are then checked with the similarity
+methods of the frozen sketches.
+"""
+
+import array
+from collections import namedtuple
+from mashingpumpkins import _sketchcore
+from mashingpumpkins.minhashsketch import (EMPTY_BIN,
+                                           FrozenCompactSketch,
+                                           FrozenOnePermutationSketch,
+                                           _sorted_hashes)
+
+# Methods of frozen sketches (similarity indices) that can check
+# candidates.
+METRICS = ('jaccard_estimate', 'jaccard_similarity', 'jaccard_containment',
+           'dice_similarity')
+
+# Sketch in the index similar to a query, with its similarity score.
+Candidate = namedtuple('Candidate', ('id', 'name', 'score'))
+
+
+def candidate_probability(j: float, nbands: int, nrows: int) -> float:
+    """
+    Probability that two sketches with a Jaccard index `j` are candidates.
+
+    :param j: Jaccard index
+    :param nbands: number of bands
+    :param nrows: number of bins (rows) in a band
+
+    :return: `1 - (1 - j**nrows)**nbands`
+    """
+    return 1 - (1 - j ** nrows) ** nbands
+
+
+def threshold(nbands: int, nrows: int) -> float:
+    """
+    Approximate Jaccard index from which sketches are likely to be
+    candidates (where :func:`candidate_probability` rises the fastest).
+
+    :param nbands: number of bands
+    :param nrows: number of bins (rows) in a band
+
+    :return: `(1 / nbands)**(1 / nrows)`
+    """
+    return (1 / nbands) ** (1 / nrows)
+
+
+def bands(nbins: int, jaccard: float) -> (int, int):
+    """
+    Choose the number of bands and of rows per band for signatures of
+    `nbins` bins, such as the :func:`threshold` is the closest to a
+    Jaccard index.
+
+    :param nbins: number of bins in the signatures
+    :param jaccard: Jaccard index from which sketches should be candidates
+
+    :return: a pair `(nbands, nrows)` with `nbands * nrows == nbins`
+    """
+    if nbins < 1:
+        raise ValueError('The number of bins must be positive.')
+    res = min(((abs(threshold(nbins // nrows, nrows) - jaccard), nrows)
+               for nrows in range(1, nbins + 1) if nbins % nrows == 0))
+    nrows = res[1]
+    return (nbins // nrows, nrows)
+
+
+def signature(sketch, nbins: int) -> array.array:
+    """
+    Signature (bins with a fixed layout) for a frozen sketch.
+
+    The signature of a
+    :class:`mashingpumpkins.minhashsketch.FrozenOnePermutationSketch`
+    with `nbins` bins is its (densified) bins. For other frozen sketches
+    (bottom, top, or scaled sketches), the hash values in the sketch are
+    mixed with a bijection and put into `nbins` bins (one-permutation
+    hashing, see :func:`mashingpumpkins._sketchcore.bins_add`), then
+    empty bins are densified: the bins for two sketches are equal with a
+    probability the Jaccard index between the sets of hash values in the
+    sketches.
+
+    :param sketch: a frozen sketch
+    :param nbins: number of bins
+
+    :return: an array of type `Q`
+    """
+    if isinstance(sketch, FrozenOnePermutationSketch):
+        if len(sketch._bins) != nbins:
+            raise ValueError('The sketch has %i bins rather than %i.'
+                             % (len(sketch._bins), nbins))
+        return sketch._bins
+    if isinstance(sketch, FrozenCompactSketch):
+        hashes = sketch._sketch
+    else:
+        hashes = _sorted_hashes(sketch._sketch)
+    bins = array.array('Q', (EMPTY_BIN, )) * nbins
+    _sketchcore.bins_add(bins, hashes, len(hashes), True)
+    _sketchcore.bins_densify(bins)
+    return bins
+
+
+class LSHIndex(object):
+    """
+    Index of frozen sketches built with the same parameters, finding
+    candidates for near-duplicates with locality-sensitive hashing
+    (banding over signatures, see :func:`signature`).
+
+    Each band is a :class:`dict` from the values in the bins of the band
+    to the identifiers of the sketches with these values. The sketches
+    are kept to check candidates.
+    """
+
+    def __init__(self, nsize: int, hashfun, seed: int = None,
+                 nbands: int = 20, nrows: int = 5):
+        """
+        Create an empty index.
+
+        :param nsize: size of the ngrams / kmers
+        :param hashfun: hashing function
+        :param seed: seed for the hashing function
+        :param nbands: number of bands
+        :param nrows: number of bins (rows) in a band (see :func:`bands`
+            to choose `nbands` and `nrows` from a Jaccard index)
+        """
+        if nbands < 1 or nrows < 1:
+            raise ValueError('The number of bands and the number of rows '
+                             'must be positive.')
+        self._nsize = nsize
+        self._hashfun = hashfun
+        self._seed = seed
+        self._nbands = nbands
+        self._nrows = nrows
+        self._bands = tuple(dict() for i in range(nbands))
+        self._sketches = list()
+        self._names = list()
+
+    @property
+    def nbands(self):
+        """ Number of bands. """
+        return self._nbands
+
+    @property
+    def nrows(self):
+        """ Number of bins (rows) in a band. """
+        return self._nrows
+
+    @property
+    def threshold(self) -> float:
+        """ Approximate Jaccard index from which sketches are likely to be
+        candidates (see :func:`threshold`). """
+        return threshold(self._nbands, self._nrows)
+
+    @property
+    def names(self) -> tuple:
+        """ Names of the sketches, in the order of their identifiers. """
+        return tuple(self._names)
+
+    def __len__(self):
+        """ Number of sketches. """
+        return len(self._sketches)
+
+    def _keys(self, sketch):
+        # key for each band
+        if (sketch.nsize, sketch._hashfun, sketch._seed) != (
+                self._nsize, self._hashfun, self._seed):
+            raise ValueError('The sketch was not built with the parameters '
+                             'of the index (nsize, hashing function, and '
+                             'seed).')
+        nrows = self._nrows
+        sig = memoryview(signature(sketch, self._nbands * nrows)).cast('B')
+        step = 8 * nrows
+        return [bytes(sig[i:(i + step)]) for i in range(0, len(sig), step)]
+
+    def add(self, sketch, name: str = None) -> int:
+        """
+        Add a frozen sketch.
+
+        :param sketch: a frozen sketch
+        :param name: optional name for the sketch
+
+        :return: the identifier of the sketch in the index
+        """
+        keys = self._keys(sketch)
+        sketchid = len(self._sketches)
+        for band, key in zip(self._bands, keys):
+            ids = band.get(key)
+            if ids is None:
+                band[key] = [sketchid]
+            else:
+                ids.append(sketchid)
+        self._sketches.append(sketch)
+        self._names.append(name)
+        return sketchid
+
+    def candidates(self, sketch) -> set:
+        """
+        Identifiers of the sketches in the same bucket as a query sketch
+        for at least one band.
+
+        :param sketch: a frozen sketch built with the parameters of the
+            index
+        """
+        res = set()
+        for band, key in zip(self._bands, self._keys(sketch)):
+            res.update(band.get(key, ()))
+        return res
+
+    def _score(self, metric: str):
+        if metric not in METRICS:
+            raise ValueError('The metric must be one of: %s'
+                             % ', '.join(METRICS))
+
+        def score(a, b):
+            try:
+                method = getattr(a, metric)
+            except AttributeError:
+                raise ValueError('The sketches do not have a method "%s".'
+                                 % metric)
+            return method(b)
+        return score
+
+    def query(self, sketch, minscore: float = 0,
+              metric: str = 'jaccard_estimate') -> list:
+        """
+        Find the sketches similar to a query sketch: the candidates (see
+        :meth:`candidates`) are checked with a similarity method of the
+        query.
+
+        :param sketch: a frozen sketch built with the parameters of the
+            index
+        :param minscore: minimum similarity score
+        :param metric: name of the similarity method (see
+            :data:`METRICS`)
+
+        :return: a list of :class:`Candidate`, from the highest score to
+            the lowest
+        """
+        score = self._score(metric)
+        res = list()
+        for i in sorted(self.candidates(sketch)):
+            value = score(sketch, self._sketches[i])
+            if value >= minscore:
+                res.append(Candidate(i, self._names[i], value))
+        res.sort(key=lambda x: -x.score)
+        return res
+
+    def pairs(self, minscore: float = 0,
+              metric: str = 'jaccard_estimate') -> list:
+        """
+        Find the pairs of similar sketches in the index (near-duplicates):
+        the pairs of sketches in the same bucket for at least one band
+        are checked with a similarity method.
+
+        :param minscore: minimum similarity score
+        :param metric: name of the similarity method (see
+            :data:`METRICS`)
+
+        :return: a sorted list of triplets `(i, j, score)` with `i < j`
+            the identifiers of the sketches
+        """
+        score = self._score(metric)
+        candidates = set()
+        for band in self._bands:
+            for ids in band.values():
+                for k, i in enumerate(ids):
+                    candidates.update((i, j) for j in ids[(k + 1):])
+        sketches = self._sketches
+        res = list()
+        for i, j in sorted(candidates):
+            value = score(sketches[i], sketches[j])
+            if value >= minscore:
+                res.append((i, j, value))
+        return res
@@ -1,8 +1,121 @@
+from bisect import bisect_left
 from heapq import heappush, heapreplace
+import math
 import operator
 from collections import Counter
 import array
+import threading
 from mashingpumpkins.sequence import chunkpos_iter
+from mashingpumpkins import (_murmurhash3, _murmurhash3_mash, _nthash,
+                             _sketchcore, _xxh3, _xxhash)
+
+
+# Default maximum width of the window over sequences hashed with one call
+# to the hashing function (see `hashbuffer_size()`). The buffer for the hash
+# values is 8 times that size in bytes.
+DEFAULT_HASHBUFFERSIZE = 2**14
+
+# Buffers for hash values and offsets, private to each thread
+_threadbuffers = threading.local()
+
+
+def hashbuffer_size(lseq: int, nsize: int,
+                    maxsize: int = DEFAULT_HASHBUFFERSIZE) -> int:
+    """
+    Width of the window over a sequence of length `lseq` hashed with
+    one call to the hashing function.
+
+    The window covers the whole sequence if not longer than `maxsize`.
+    Otherwise the sequence is split into the smallest number of windows
+    of width at most `maxsize`, all of about the same width (rather than
+    full windows and a short last one).
+
+    :param lseq: length of the sequence
+    :param nsize: size of the ngrams / kmers
+    :param maxsize: maximum width of the window
+
+    :return: the width of the window (never smaller than `nsize`)
+    """
+    _check_hashbuffersize(maxsize, nsize)
+    if lseq <= maxsize:
+        return max(lseq, nsize)
+    nsubs = lseq - nsize + 1
+    nchunks = -(-nsubs // (maxsize - nsize + 1))
+    return -(-nsubs // nchunks) + nsize - 1
+
+
+def _check_hashbuffersize(w: int, nsize: int) -> None:
+    if w < nsize:
+        raise ValueError('The width of the window over sequences (%i) '
+                         'cannot be smaller than nsize (%i).' % (w, nsize))
+
+
+def _hashbuffers(w: int) -> (array.array, array.array):
+    # Buffers for hash values and for offsets, of length at least `w` and
+    # reused across calls from the same thread.
+    buffers = getattr(_threadbuffers, 'buffers', None)
+    if buffers is None or len(buffers[0]) < w:
+        buffers = (array.array('Q', bytes(8 * w)),
+                   array.array('Q', bytes(8 * w)))
+        _threadbuffers.buffers = buffers
+    return buffers
+
+
+def _hll_registers(hllprecision: int) -> array.array:
+    # HyperLogLog registers (2**hllprecision bytes), or None if
+    # `hllprecision` is None.
+    if hllprecision is None:
+        return None
+    if not (_sketchcore.HLL_MINPRECISION <= hllprecision <=
+            _sketchcore.HLL_MAXPRECISION):
+        raise ValueError('The precision of the HyperLogLog registers must '
+                         'be between %i and %i.'
+                         % (_sketchcore.HLL_MINPRECISION,
+                            _sketchcore.HLL_MAXPRECISION))
+    return array.array('B', bytes(2**hllprecision))
+
+
+def _hll_precision(registers) -> int:
+    if registers is None:
+        return None
+    return len(registers).bit_length() - 1
+
+
+def _hll_cardinality(registers) -> float:
+    if registers is None:
+        raise ValueError('The sketch does not have HyperLogLog registers '
+                         '(see the parameter `hllprecision`).')
+    return _sketchcore.hll_estimate(registers)
+
+
+def _counttable_capacity(n: int) -> int:
+    # Number of slots for a table of counts with `n` entries (a power of 2,
+    # for the table to be at most half full).
+    capacity = 4
+    while capacity < 2 * n:
+        capacity *= 2
+    return capacity
+
+
+def _counttable(n: int) -> (array.array, array.array):
+    """
+    Empty table of counts (see :class:`CountTrait` and
+    :class:`CompactSketch`) with room for `n` entries: the hash values and
+    the counts, two arrays of type `Q`.
+    """
+    capacity = _counttable_capacity(n)
+    return (array.array('Q', bytes(8 * capacity)),
+            array.array('Q', bytes(8 * capacity)))
+
+
+def _counttable_get(table, hashes) -> array.array:
+    """
+    Counts in a table of counts `(keys, counts)` for hash values (0 for
+    hash values not in the table).
+    """
+    res = array.array('Q', bytes(8 * len(hashes)))
+    _sketchcore.counttable_get(table[0], table[1], hashes, res)
+    return res
 
 
 def make_elt(h, substr, j, nsize):
@@ -17,12 +130,14 @@ def _minmaxhash_add_ngrams(
         hashbuffer, heaptop,
         extracthash,
         make_elt, update_elt,
-        replace, anynew, minmax_op) -> int:
+        replace, anynew, minmax_op, offsets=None) -> int:
     """
     Process/add elements to the sketch (See warning below).
 
-    This function is where most of time is spent when building a minhash or
-    a maxhash.
+    This is the reference implementation, in pure Python, of the
+    function :func:`mashingpumpkins._sketchcore.add_ngrams` that is used by
+    :class:`MinSketch` and :class:`MaxSketch`. Both take the same arguments
+    and return the same value.
 
     .. warning::
 
@@ -45,6 +160,9 @@ def _minmaxhash_add_ngrams(
     :param anynew: callback if new entry
     :param minmax_op: a pair that is expected to be either (1, `<`) if
         minhash or (-1, `>`) if maxhash.
+    :param offsets: optional buffer with the position in `subs` of the
+        ngram for each hash value in `hashbuffer` (if None, the i-th hash
+        value is for the ngram at position i).
 
     :return: new hash value for heaptop.
     """
@@ -52,8 +170,9 @@ def _minmaxhash_add_ngrams(
     lheap = len(heap)
     sign, comparator = minmax_op
 
-    for j in range(nsubs):
-        h = hashbuffer[j]
+    for i in range(nsubs):
+        h = hashbuffer[i]
+        j = i if offsets is None else offsets[i]
         if h not in heapmap:
             if lheap < maxsize:
                 elt = make_elt(sign * h, subs, j, nsize)
@@ -82,9 +201,30 @@ def _minmaxhash_add_ngrams(
     return heaptop
 
 
+# Hashing functions accepting the additional optional arguments
+# `(threshold, direction, offsets)` to only report the hash values that
+# can enter a sketch.
+_prefilter_hashfuns = frozenset((_murmurhash3.hasharray, _xxhash.hasharray,
+                                 _xxh3.hasharray, _nthash.hasharray,
+                                 _murmurhash3_mash.hasharray))
+
+
 class SetSketch(object):
 
     _anynew = None
+    # Optional callback `(hashbuffer, nhashes)` after the hash values in
+    # a chunk of sequence were added to the heap (see :class:`CountTrait`).
+    _addcounts = None
+    # Direction for the comparison of hash values with the top of the heap
+    # (+1 for top sketches, -1 for bottom sketches). None if the sketch
+    # does not have such direction.
+    _sign = None
+    # State of the sketch (see `_snapshotstate()`) when the last frozen
+    # sketch was made, and the storage of that frozen sketch.
+    _snapshot = None
+    # Incremented each time the table of counts changes (see
+    # `_clear_counts()`).
+    _countversion = 0
 
     @property
     def maxsize(self):
@@ -107,12 +247,26 @@ class SetSketch(object):
         so far. """
         return self._nvisited
 
+    @property
+    def hashbuffersize(self):
+        """ Maximum width of the window over sequences hashed with one call
+        to `hashfun` (see :func:`hashbuffer_size`). """
+        return self._hashbuffersize
+
+    @property
+    def hllprecision(self):
+        """ Precision `p` of the HyperLogLog registers (`2**p` bytes), or
+        None if the sketch does not have them. """
+        return _hll_precision(self._registers)
+
     def __init__(self, nsize: int,
                  maxsize: int,
                  hashfun,
                  seed: int,
                  heap: list = None,
-                 nvisited: int = 0):
+                 nvisited: int = 0,
+                 hashbuffersize: int = DEFAULT_HASHBUFFERSIZE,
+                 hllprecision: int = None):
         """
         - nsize: size of the ngrams / kmers
         - maxsize: maximum size for the sketch
@@ -121,16 +275,24 @@ class SetSketch(object):
         - heap: heapified list (if unsure about what it is, don't change
             the default)
         - nvisited: number of kmers visited so far
+        - hashbuffersize: maximum width of the window over sequences
+            hashed with one call to `hashfun`
+        - hllprecision: optional precision `p` (between 4 and 18) for
+            HyperLogLog registers (`2**p` bytes) estimating the number of
+            distinct ngrams / kmers added (see `cardinality()`)
         """
+        _check_hashbuffersize(hashbuffersize, nsize)
         self._nsize = nsize
         self._maxsize = maxsize
         self._hashfun = hashfun
         self._seed = seed
+        self._hashbuffersize = hashbuffersize
+        self._registers = _hll_registers(hllprecision)
         if heap is None:
             self._heap = list()
         else:
             self._heap = heap
-        self._heapmap = dict(self._heap)
+        self._heapmap = {self._extracthash(elt): elt for elt in self._heap}
         self._nvisited = nvisited
 
     def __len__(self):
@@ -197,28 +359,101 @@ class SetSketch(object):
                 'Only objects with the same seed can be added.'
             )
 
-        res = type(self)(self.nsize, self.maxsize, self._hashfun, self.seed)
+        res = self._empty()
         res.update(self)
         res.update(obj)
         return res
 
+    def update_many(self, objs):
+        """
+        Update the sketch with the content of all sketches in `objs`, in
+        place (see also :func:`merge`).
+
+        - objs: an iterable of sketches (see the method `update()`)
+        """
+        for obj in objs:
+            self.update(obj)
+
+    def _merge_heaps(self, objs):
+        # Merge the elements in the heaps of the sketches `objs` (same
+        # sign) into the heap of this sketch with linear merges of sorted
+        # hash values, and build the new heap already sorted (a sorted list
+        # is a heap) rather than pushing elements one at a time.
+        heapmap = self._heapmap
+        objmaps = [x._heapmap for x in objs]
+        kept = _bottomk_merge([_sorted_hashes(x)
+                               for x in [heapmap] + objmaps],
+                              self._maxsize, self._sign)
+        new = [h for h in kept if h not in heapmap]
+        if len(heapmap) + len(new) > len(kept):
+            for h in set(heapmap).difference(kept):
+                del heapmap[h]
+        for h in new:
+            for objmap in objmaps:
+                elt = objmap.get(h)
+                if elt is not None:
+                    heapmap[h] = elt
+                    break
+        if self._sign < 0:
+            # lowest hash values: the largest one at the top of the heap
+            kept.reverse()
+        self._heap[:] = [heapmap[h] for h in kept]
+
+    def _empty(self):
+        # Empty sketch with the same parameters.
+        return type(self)(self.nsize, self.maxsize, self._hashfun, self.seed,
+                          hashbuffersize=self._hashbuffersize,
+                          hllprecision=self.hllprecision)
+
     def __iadd__(self, obj):
         self.update(obj)
 
+    def cardinality(self) -> float:
+        """
+        Estimate of the number of distinct ngrams / kmers added with the
+        method `add()` (or merged from other sketches), from the
+        HyperLogLog registers. The standard error is about
+        `1.04 / sqrt(2**hllprecision)`.
+
+        A :class:`ValueError` is raised if the sketch does not have
+        HyperLogLog registers (see the parameter `hllprecision`).
+        """
+        return _hll_cardinality(self._registers)
+
+    def _merge_registers(self, obj):
+        # Merge the HyperLogLog registers of `obj` into the ones of this
+        # sketch (if it has registers).
+        if self._registers is None:
+            return
+        registers = getattr(obj, '_registers', None)
+        if registers is None or len(registers) != len(self._registers):
+            raise ValueError('Mismatching HyperLogLog registers (have '
+                             'precision %s, update has %s).'
+                             % (self.hllprecision,
+                                _hll_precision(registers)))
+        _sketchcore.hll_merge(self._registers, registers)
+
     def __iter__(self):
         """
         Return an iterator over the elements in the sketch.
         """
         return iter(sorted(self._heap))
 
-    def add(self, seq, hashbuffer=array.array('Q', [0, ]*250)):
+    def add(self, seq, hashbuffer=None, ends=None):
         """ Add all sub-sequences of length `self.nsize` found in the sequence
         "seq".
 
         - seq: a bytes-like sequence than can be sliced, and the slices
             be consummed by the function in the property `hashfun` (given to
             the constructor)
-        - hashbuffer: a buffer array to store hash values during batch C calls
+        - hashbuffer: an optional buffer array (type `Q`) to store hash
+            values during batch C calls. If None, a buffer private to the
+            current thread is used, with a window fitted to the length of
+            "seq" (see the property `hashbuffersize`).
+        - ends: optional buffer (type `Q`) with the sorted positions where
+            records end when "seq" is made of several records put one after
+            the other (see :mod:`mashingpumpkins.fastx`). Sub-sequences
+            overlapping two records are skipped.
 
         """
         hashfun = self._hashfun
@@ -227,10 +462,10 @@ class SetSketch(object):
         nsize = self._nsize
         lseq = len(seq)
 
-        w = len(hashbuffer)
-        assert nsize <= w
+        w, hashbuffer, offsetbuffer = self._buffers(lseq, hashbuffer)
 
         anynew = self._anynew
+        addcounts = self._addcounts
         make_elt = self._make_elt
         extracthash = self._extracthash
         lheap = len(heap)
@@ -239,19 +474,132 @@ class SetSketch(object):
         else:
             heaptop = self._initheap
 
+        # Once the sketch is full, hashing functions that can filter
+        # with a threshold only report hash values that can enter it
+        # (HyperLogLog registers need all hash values).
+        sign = self._sign
+        registers = self._registers
+        prefilter = (sign is not None and hashfun in _prefilter_hashfuns and
+                     registers is None)
+        maxsize = self._maxsize
+
         for slice_beg, slice_end in chunkpos_iter(nsize, lseq, w):
             subs = seq[slice_beg:slice_end]  # safe: no out-of-bound in Python
-            nsubs = hashfun(subs, nsize, hashbuffer, seed)
-            heaptop = self._add(subs, nsubs, hashbuffer, heaptop,
-                                extracthash, make_elt, self._replace, anynew)
-            self._nvisited += nsubs
+            filtered = prefilter and len(heap) >= maxsize
+            if filtered:
+                nsubs, nkept = hashfun(subs, nsize, hashbuffer, seed,
+                                       heaptop, sign, offsetbuffer)
+            else:
+                nsubs = hashfun(subs, nsize, hashbuffer, seed)
+                nkept = nsubs
+            if ends is not None:
+                nkept, nvalid = _sketchcore.skip_boundaries(
+                    hashbuffer, offsetbuffer, nkept, filtered, nsubs,
+                    ends, slice_beg, nsize)
+                filtered = True
+            else:
+                nvalid = nsubs
+            if registers is not None:
+                _sketchcore.hll_add(registers, hashbuffer, nkept)
+            heaptop = self._add(subs, nkept, hashbuffer, heaptop,
+                                extracthash, make_elt, self._replace,
+                                anynew,
+                                offsets=offsetbuffer if filtered else None)
+            if addcounts is not None:
+                addcounts(hashbuffer, nkept)
+            self._nvisited += nvalid
+
+    def _buffers(self, lseq: int, hashbuffer) -> (int, array.array,
+                                                  array.array):
+        # Width of the window and buffers for hash values and offsets.
+        if hashbuffer is None:
+            w = hashbuffer_size(lseq, self._nsize, self._hashbuffersize)
+            return (w, ) + _hashbuffers(w)
+        w = len(hashbuffer)
+        _check_hashbuffersize(w, self._nsize)
+        return (w, hashbuffer, _hashbuffers(w)[1])
+
+    def _hashvalues(self) -> array.array:
+        # Hash values in the sketch (in no particular order).
+        return array.array('Q', self._heapmap)
+
+    def _heapstate(self):
+        # Size of the heap and hash value at its top. The content of a
+        # sketch keeping the lowest (or highest) hash values only changes
+        # by growing, or by moving the top of the heap down (or up): a
+        # different content has a different state.
+        heap = self._heap
+        return (len(heap), self._extracthash(heap[0]) if heap else None)
+
+    def _snapshotstate(self):
+        # State telling whether the content of the sketch changed since the
+        # last frozen sketch was made.
+        return self._heapstate()
+
+    def _frozen_storage(self, make):
+        # Storage for a frozen sketch made with `make()`, or the one of the
+        # last frozen sketch if the content has not changed since.
+        state = self._snapshotstate()
+        snapshot = self._snapshot
+        if snapshot is None or snapshot[0] != state:
+            snapshot = (state, make())
+            self._snapshot = snapshot
+        return snapshot[1]
+
+    # Table of hash values and counts with open addressing (see
+    # :class:`CountTrait` and :class:`CompactSketch`).
+    def _clear_counts(self, n: int) -> None:
+        # Empty table of counts, with room for `n` entries.
+        self._countkeys, self._counts = _counttable(n)
+        self._countsize = 0
+        self._countversion += 1
+
+    def _countthreshold(self) -> int:
+        # Threshold for the hash values in the sketch: the top of the heap
+        # if the sketch is full, or any hash value otherwise.
+        size, top = self._heapstate()
+        if size < self._maxsize or top is None:
+            return 2**64 - 1 if self._sign < 0 else 0
+        return top
+
+    def _rebuild_counts(self, threshold: int) -> None:
+        # Drop the counts for hash values no longer in the sketch, and
+        # resize the table to be at most half full (and not smaller than
+        # for `maxsize` entries).
+        maxsize = self._maxsize
+        sign = self._sign
+        keys, counts = _counttable(max(maxsize, self._countsize))
+        size = _sketchcore.counttable_rebuild(self._countkeys, self._counts,
+                                              keys, counts, threshold, sign)
+        if _counttable_capacity(max(maxsize, size)) < len(keys):
+            newkeys, newcounts = _counttable(max(maxsize, size))
+            size = _sketchcore.counttable_rebuild(keys, counts,
+                                                  newkeys, newcounts,
+                                                  threshold, sign)
+            keys, counts = newkeys, newcounts
+        self._countkeys, self._counts = keys, counts
+        self._countsize = size
+
+    def _counts_of(self, hashes) -> array.array:
+        # Counts for hash values (0 for hash values not counted).
+        return _counttable_get((self._countkeys, self._counts), hashes)
 
     def freeze(self):
-        return FrozenSketch(self._heapmap, self.nsize,
+        """
+        Return a read-only copy of the sketch. Frozen sketches made while
+        the content of the sketch does not change share their storage:
+        freezing a sketch again costs little until hash values enter it.
+        """
+        storage = self._frozen_storage(
+            lambda: FrozenSketch._make_sketch(self._heapmap))
+        return FrozenSketch(storage, self.nsize,
                             self._hashfun,
                             seed=self.seed,
                             maxsize=self.maxsize,
-                            nvisited=self.nvisited)
+                            nvisited=self.nvisited,
+                            sign=self._sign,
+                            registers=self._registers,
+                            copy=False)
 
 
 class MaxSketch(SetSketch):
@@ -261,6 +609,7 @@ class MaxSketch(SetSketch):
     """
 
     _initheap = 0
+    _sign = +1
     _make_elt = staticmethod(make_elt)
     _extracthash = staticmethod(operator.itemgetter(0))
 
@@ -303,7 +652,7 @@ class MaxSketch(SetSketch):
                     anynew(elt)
 
     def _add(self, subs, nsubs, hashbuffer, heaptop,
-             extracthash, make_elt, replace, anynew) -> int:
+             extracthash, make_elt, replace, anynew, offsets=None) -> int:
         """
         Process/add elements to the sketch.
 
@@ -318,14 +667,17 @@ class MaxSketch(SetSketch):
         - make_elt:
         - replace:
         - anynew:
+        - offsets: optional buffer with the positions in `subs` for the
+            hash values in `hashbuffer`
         """
 
-        return _minmaxhash_add_ngrams(
+        return _sketchcore.add_ngrams(
             self._heap, self._heapmap, self._maxsize,
             self._nsize,
             subs, nsubs,
             hashbuffer, heaptop,
-            extracthash, make_elt, None, replace, anynew, (+1, operator.ge))
+            extracthash, make_elt, None, replace, anynew, (+1, operator.ge),
+            offsets)
 
     def update(self, obj):
         """
@@ -334,54 +686,41 @@ class MaxSketch(SetSketch):
 
         - obj: An instance of class MaxSketch (or an instance of a child class)
         """
+        self.update_many((obj, ))
 
-        if not isinstance(obj, MaxSketch):
-            raise ValueError('Mismatching sketch type.')
-
-        if hasattr(obj, "nsize") and self.nsize != obj.nsize:
-            raise ValueError("Mismatching 'nsize' (have %i, update has %i)"
-                             % (self.nsize, obj.nsize))
+    def update_many(self, objs):
+        """
+        Update the sketch with elements from all sketches in `objs` in
+        place, with one linear merge of their sorted hash values.
 
-        if hasattr(obj, "_hashfun") and self._hashfun != obj._hashfun:
-            raise ValueError(
-                'Only objects with the same hashfunction can be added.'
-            )
+        - objs: an iterable of MaxSketch objects (or of instances of a child
+            class)
+        """
+        objs = tuple(objs)
+        for obj in objs:
+            if not isinstance(obj, MaxSketch):
+                raise ValueError('Mismatching sketch type.')
 
-        if self.seed != obj.seed:
-            raise ValueError(
-                'Mismatching seed value. This has %i and the update has %i'
-                % (self.seed, obj.seed)
-            )
+            if hasattr(obj, "nsize") and self.nsize != obj.nsize:
+                raise ValueError("Mismatching 'nsize' (have %i, update has %i)"
+                                 % (self.nsize, obj.nsize))
 
-        extracthash = self._extracthash
-        heap = self._heap
-        lheap = len(heap)
-        heapmap = self._heapmap
-        maxsize = self._maxsize
-        if lheap > 0:
-            heaptop = extracthash(heap[0])
-        else:
-            heaptop = self._initheap
+            if hasattr(obj, "_hashfun") and self._hashfun != obj._hashfun:
+                raise ValueError(
+                    'Only objects with the same hashfunction can be added.'
+                )
 
-        for elt in obj:
-            h = extracthash(elt)
-            if lheap < maxsize:
-                if h not in heapmap:
-                    self._add_elt_unsafe(h, elt)
-                    heaptop = extracthash(heap[0])
-                    lheap += 1
-                # no anynew: responsibility of child class
-                # if anynew is not None:
-                #     anynew(h)
-            if h >= heaptop:
-                if h not in heapmap:
-                    self._replace(h, elt)
-                    heaptop = extracthash(heap[0])
-                # no anynew: responsibility of child class
-                # if anynew is not None:
-                #     anynew(h)
+            if self.seed != obj.seed:
+                raise ValueError(
+                    'Mismatching seed value. This has %i and the update has %i'
+                    % (self.seed, obj.seed)
+                )
 
-        self._nvisited += obj.nvisited
+        for obj in objs:
+            self._merge_registers(obj)
+        self._merge_heaps(objs)
+        # no anynew: responsibility of child class
+        self._nvisited += sum(obj.nvisited for obj in objs)
 
 
 class MinSketch(SetSketch):
@@ -391,6 +730,7 @@ class MinSketch(SetSketch):
     """
 
     _initheap = 0
+    _sign = -1
 
     _make_elt = staticmethod(make_elt)
     _extracthash = staticmethod(lambda x: -x[0])
@@ -409,7 +749,7 @@ class MinSketch(SetSketch):
         return out
 
     def _add(self, subs, nsubs, hashbuffer, heaptop,
-             extracthash, make_elt, replace, anynew) -> int:
+             extracthash, make_elt, replace, anynew, offsets=None) -> int:
         """
         Process/add elements to the sketch (See warning below).
 
@@ -421,6 +761,8 @@ class MinSketch(SetSketch):
         - make_elt:
         - replace:
         - anynew:
+        - offsets: optional buffer with the positions in `subs` for the
+            hash values in `hashbuffer`
 
         .. warning::
 
@@ -428,13 +770,13 @@ class MinSketch(SetSketch):
            `nvisited` is under your responsibility.
 
         """
-        return _minmaxhash_add_ngrams(
+        return _sketchcore.add_ngrams(
             self._heap, self._heapmap, self._maxsize,
             self._nsize,
             subs, nsubs,
             hashbuffer, heaptop,
             extracthash, make_elt, None, replace, anynew,
-            (-1, operator.le))
+            (-1, operator.le), offsets)
 
     def add_hashvalues(self, values):
         """
@@ -481,91 +823,163 @@ class MinSketch(SetSketch):
 
         - obj: a MinSketch (or instance of a child class)
         """
+        self.update_many((obj, ))
 
-        if not isinstance(obj, MinSketch):
-            raise ValueError('Mismatching sketch type.')
-
-        if hasattr(obj, "nsize") and (self.nsize != obj.nsize):
-            raise ValueError(
-                'Mismatching `nsize` (have %i, update has %i)'
-                % (self.nsize, obj.nsize)
-            )
+    def update_many(self, objs):
+        """
+        Update the sketch with elements from all sketches in `objs` in
+        place, with one linear merge of their sorted hash values.
 
-        if hasattr(obj, "_hashfun") and (self._hashfun != obj._hashfun):
-            raise ValueError(
-                'Only objects with the same hashfunction can be added.'
-            )
+        - objs: an iterable of MinSketch objects (or of instances of a child
+            class)
+        """
+        objs = tuple(objs)
+        for obj in objs:
+            if not isinstance(obj, MinSketch):
+                raise ValueError('Mismatching sketch type.')
 
-        if self.seed != obj.seed:
-            raise ValueError(
-                'Mismatching seed value. This has %i and the update has %i'
-                % (self.seed, obj.seed)
-            )
+            if hasattr(obj, "nsize") and (self.nsize != obj.nsize):
+                raise ValueError(
+                    'Mismatching `nsize` (have %i, update has %i)'
+                    % (self.nsize, obj.nsize)
+                )
 
-        extracthash = self._extracthash
-        heap = self._heap
-        lheap = len(heap)
-        heapmap = self._heapmap
-        maxsize = self._maxsize
-        if lheap > 0:
-            heaptop = extracthash(heap[0])
-        else:
-            heaptop = self._initheap
+            if hasattr(obj, "_hashfun") and (self._hashfun != obj._hashfun):
+                raise ValueError(
+                    'Only objects with the same hashfunction can be added.'
+                )
 
-        for elt in obj:
-            h = extracthash(elt)
-            if lheap < maxsize:
-                if h not in heapmap:
-                    self._add_elt_unsafe(h, elt)
-                    heaptop = extracthash(heap[0])
-                    lheap += 1
-                # no anynew: responsibility of child class
-                # if anynew is not None:
-                #     anynew(h)
-            if h <= heaptop:
-                if h not in heapmap:
-                    self._replace(h, elt)
-                    heaptop = extracthash(heap[0])
-                # no anynew: responsibility of child class
-                # if anynew is not None:
-                #     anynew(h)
+            if self.seed != obj.seed:
+                raise ValueError(
+                    'Mismatching seed value. This has %i and the update has %i'
+                    % (self.seed, obj.seed)
+                )
 
-        self._nvisited += obj.nvisited
+        for obj in objs:
+            self._merge_registers(obj)
+        self._merge_heaps(objs)
+        # no anynew: responsibility of child class
+        self._nvisited += sum(obj.nvisited for obj in objs)
 
 
 class CountTrait(object):
     """
     Methods for sketches also counting the number of occurences of hash values
     in the input set / sequence.
+
+    The counts are in a table of hash values and counts with open
+    addressing (two arrays of type `Q`, see
+    :func:`mashingpumpkins._sketchcore.counttable_add`), updated once for
+    each chunk of hash values added to the heap. Once a hash value is in a
+    bottom (or top) sketch, all its later occurrences are below (or above)
+    the top of the heap: the hash values in the sketch are the only ones
+    counted, and their counts are exact. Counts for hash values that left
+    the sketch are dropped when the table fills up. The table of a
+    :class:`CompactSketch` already has the counts (see
+    :class:`CompactCountSketch`).
     """
 
-    def _replace(self, h, elt):
-        out = super()._replace(h, elt)
-        del (self._count[self._extracthash(out)])
-        return out
+    def _init_counts(self, count: Counter) -> None:
+        # Counts for the hash values in the heap, 1 for each if `count` is
+        # None.
+        if len(self._heapmap) != len(self):
+            raise ValueError(
+                'Elements in the heap must be unique.'
+            )
+        hashes = self._hashvalues()
+        if count is None:
+            counts = array.array('Q', (1, )) * len(hashes)
+        else:
+            if len(set(hashes) ^ set(count.keys())) > 0:
+                raise ValueError(
+                    'Mismatching keys with the parameter `count`.'
+                )
+            counts = array.array('Q', (count[h] for h in hashes))
+        self._set_counts(hashes, counts)
+
+    def _set_counts(self, hashes, counts) -> None:
+        # Replace the table of counts with counts for hash values.
+        self._clear_counts(max(self._maxsize, len(hashes)))
+        self._addcounts(hashes, len(hashes), weights=counts)
+
+    def _addcounts(self, hashbuffer, nhashes, weights=None) -> None:
+        # Count the first `nhashes` hash values in `hashbuffer` (already
+        # added to the heap) that are in the sketch.
+        threshold = self._countthreshold()
+        sign = self._sign
+        hashes = memoryview(hashbuffer)[:nhashes]
+        if nhashes > 0:
+            self._countversion += 1
+        if weights is not None:
+            weights = memoryview(weights)[:nhashes]
+        while True:
+            self._countsize, n = _sketchcore.counttable_add(
+                self._countkeys, self._counts, self._countsize, hashes,
+                threshold, sign, *(() if weights is None else (weights, )))
+            if n == len(hashes):
+                break
+            # the table is 3/4 full
+            hashes = hashes[n:]
+            if weights is not None:
+                weights = weights[n:]
+            self._rebuild_counts(threshold)
+
+    def _snapshotstate(self):
+        # The counts can change while the state of the heap does not.
+        return (self._heapstate(), self._countversion)
 
-    def _anynew(self, h):
-        self._count[h] += 1
+    @property
+    def _count(self) -> Counter:
+        """ Counts for the hash values in the sketch. """
+        hashes = self._hashvalues()
+        return Counter(dict(zip(hashes, self._counts_of(hashes))))
 
-    def update(self, obj):
+    def add_hashvalues(self, values):
+        """
+        In addition to the parent class' method `add_hashvalues()`, this is
+        counting the hash values.
         """
-        In addition to the parent class' method `update()`, this is ensuring
-        that the counts are properly updated.
+        values = array.array('Q', values)
+        super().add_hashvalues(values)
+        self._addcounts(values, len(values))
+
+    def update_many(self, objs):
+        """
+        In addition to the parent class' method `update_many()`, this is
+        ensuring that the counts are properly updated (summed).
         """
-        super().update(obj)
-        count = self._count
-        for k in self._heapmap:
-            count[k] += obj._count[k]
+        objs = tuple(objs)
+        for obj in objs:
+            if not isinstance(obj, CountTrait):
+                raise ValueError('Mismatching sketch type.')
+        # the merge can replace the tables of counts
+        tables = [(x._countkeys, x._counts) for x in (self, ) + objs]
+        super().update_many(objs)
+        hashes = self._hashvalues()
+        counts = _counttable_get(tables[0], hashes)
+        for table in tables[1:]:
+            counts = array.array('Q', map(operator.add, counts,
+                                          _counttable_get(table, hashes)))
+        self._set_counts(hashes, counts)
 
     def freeze(self):
-        return FrozenCountSketch(self._heapmap, self._count, self._nsize,
+        """
+        Return a read-only copy of the sketch, with its counts (see
+        :meth:`SetSketch.freeze`).
+        """
+        sketch, count = self._frozen_storage(
+            lambda: (FrozenSketch._make_sketch(self._heapmap), self._count))
+        return FrozenCountSketch(sketch, count, self._nsize,
                                  self._hashfun,
                                  seed=self.seed,
                                  maxsize=self.maxsize,
-                                 nvisited=self.nvisited)
+                                 nvisited=self.nvisited,
+                                 sign=self._sign,
+                                 registers=self._registers,
+                                 copy=False)
 
 
-class MaxCountSketch(MaxSketch, CountTrait):
+class MaxCountSketch(CountTrait, MaxSketch):
     """
     Top sketch where the number of times a hash value was found is also stored.
     """
@@ -574,7 +988,9 @@ class MaxCountSketch(MaxSketch, CountTrait):
                  hashfun, seed: int,
                  heap: list = None,
                  count: Counter = None,
-                 nvisited: int = 0):
+                 nvisited: int = 0,
+                 hashbuffersize: int = DEFAULT_HASHBUFFERSIZE,
+                 hllprecision: int = None):
         """
         - nsize: size of the ngrams / kmers
         - maxsize: maximum size for the sketch
@@ -585,40 +1001,31 @@ class MaxCountSketch(MaxSketch, CountTrait):
             the default)
         - count: a collections.Counter
         - nvisited: number of kmers visited so far
+        - hashbuffersize: maximum width of the window over sequences
+            hashed with one call to `hashfun`
+        - hllprecision: optional precision for HyperLogLog registers
+            (see :class:`SetSketch`)
         """
         super().__init__(nsize, maxsize, hashfun, seed,
-                         heap=heap, nvisited=nvisited)
-        if count is None:
-            count = Counter()
-            if heap is not None:
-                for elt in heap:
-                    h = self._extracthash(elt)
-                    if h in count:
-                        raise ValueError(
-                            'Elements in the heap must be unique.'
-                        )
-                    else:
-                        count[h] = 1
-        else:
-            if len(set(self._heapmap) ^ set(count.keys())) > 0:
-                raise ValueError(
-                    'Mismatching keys with the parameter `count`.'
-                )
-        self._count = count
+                         heap=heap, nvisited=nvisited,
+                         hashbuffersize=hashbuffersize,
+                         hllprecision=hllprecision)
+        self._init_counts(count)
 
 
-# TODO: code duplication with MaxCountSketch - may be using __new__()
-# would solve this.
-class MinCountSketch(MinSketch, CountTrait):
+class MinCountSketch(CountTrait, MinSketch):
     """
-    Top sketch where the number of times a hash value was found is also stored.
+    Bottom sketch where the number of times a hash value was found is also
+    stored.
     """
 
     def __init__(self, nsize: int, maxsize: int,
                  hashfun, seed: int,
                  heap: list = None,
                  count: Counter = None,
-                 nvisited: int = 0):
+                 nvisited: int = 0,
+                 hashbuffersize: int = DEFAULT_HASHBUFFERSIZE,
+                 hllprecision: int = None):
         """
         - nsize: size of the ngrams / kmers
         - maxsize: maximum size for the sketch
@@ -629,126 +1036,1096 @@ class MinCountSketch(MinSketch, CountTrait):
             the default)
         - count: a collections.Counter
         - nvisited: number of kmers visited so far
+        - hashbuffersize: maximum width of the window over sequences
+            hashed with one call to `hashfun`
+        - hllprecision: optional precision for HyperLogLog registers
+            (see :class:`SetSketch`)
         """
         super().__init__(nsize, maxsize, hashfun, seed,
-                         heap=heap, nvisited=nvisited)
-        if count is None:
-            count = Counter()
-            if heap is not None:
-                for elt in heap:
-                    h = self._extracthash(elt)
-                    if h in count:
-                        raise ValueError(
-                            'Elements in the heap must be unique.'
-                        )
-                    else:
-                        count[h] = 1
-        else:
-            if len(set(self._heapmap) ^ set(count.keys())) > 0:
-                raise ValueError(
-                    'Mismatching keys with the parameter `count`.')
-        self._count = count
+                         heap=heap, nvisited=nvisited,
+                         hashbuffersize=hashbuffersize,
+                         hllprecision=hllprecision)
+        self._init_counts(count)
 
 
-class FrozenSketch(object):
+class CompactSketch(SetSketch):
     """
-    Read-only sketch.
+    Sketch only storing hash values, in a heap backed by an
+    :class:`array.array` of type `Q`. A table of the hash values and their
+    counts with open addressing (see
+    :func:`mashingpumpkins._sketchcore.countheap_add`) tells the hash
+    values already in the heap in constant time: between 40 and 72 bytes
+    per hash value.
+
+    Ngrams / kmers are not kept. They can be retrieved by scanning
+    a sequence again with the method `ngrams()`.
+
+    This class is not meant to be used directly. See
+    :class:`MinCompactSketch` and :class:`MaxCompactSketch`.
     """
 
-    __slots__ = ('_sketch', '_nsize', '_hashfun', '_seed',
-                 '_maxsize', '_nvisited')
-
-    def __init__(self, sketch: set, nsize: int, hashfun=hash,
-                 seed: int = None,
-                 maxsize: int = None, nvisited: int = None):
+    def __init__(self, nsize: int,
+                 maxsize: int,
+                 hashfun,
+                 seed: int,
+                 hashes=None,
+                 nvisited: int = 0,
+                 hashbuffersize: int = DEFAULT_HASHBUFFERSIZE,
+                 hllprecision: int = None):
         """
-        Create an instance from:
-        - sketch: a set
-        - nsize: a kmer/ngram size
-        - hashfun: a hashing function
-        - seed: an optional seed for hashfun
-        - maxsize: a maximum size for the input set (if missing, this is
-          assumed to be len(setobj)
-        - nvisited: the number of kmers/ngrams visited to create setobj
+        - nsize: size of the ngrams / kmers
+        - maxsize: maximum size for the sketch
+        - hashfun: function used for hashing
+            `hashfun(byteslike) -> hash value`
+        - seed: a seed for hashfun
+        - hashes: an optional iterable of hash values to initialize
+            the sketch with
+        - nvisited: number of kmers visited so far
+        - hashbuffersize: maximum width of the window over sequences
+            hashed with one call to `hashfun`
+        - hllprecision: optional precision for HyperLogLog registers
+            (see :class:`SetSketch`)
         """
-
-        if maxsize is None:
-            maxsize = len(sketch)
-        elif maxsize < len(sketch):
-            raise ValueError("The maximum size cannot be smaller than the "
-                             "number of objects in the set.")
-        if nvisited is None:
-            nvisited = len(sketch)
-        elif nvisited < len(sketch):
-            raise ValueError("'nvisited' cannot be smaller than the number of "
-                             "objects in the set.")
-
-        self._sketch = frozenset(sketch)
+        _check_hashbuffersize(hashbuffersize, nsize)
         self._nsize = nsize
+        self._maxsize = maxsize
         self._hashfun = hashfun
         self._seed = seed
-        self._maxsize = maxsize
+        self._hashbuffersize = hashbuffersize
+        self._registers = _hll_registers(hllprecision)
+        self._heap = array.array('Q', bytes(8 * maxsize))
+        self._lheap = 0
+        self._clear_counts(maxsize)
         self._nvisited = nvisited
+        if hashes is not None:
+            self.add_hashvalues(hashes)
 
-    @property
-    def maxsize(self):
-        """ Maximum size for the sketch. """
-        return self._maxsize
+    def __len__(self):
+        """
+        Return the number of elements in the sketch. See also the property
+        'nvisited'.
+        """
+        return self._lheap
 
-    @property
-    def nsize(self):
-        """ Size of the ngrams / kmers. """
-        return self._nsize
+    def __contains__(self, h):
+        """
+        Return whether a given hash value is in the sketch
 
-    @property
-    def nvisited(self):
-        """ Number of ngrams / kmers visited (considered for inclusion)
-        so far. """
-        return self._nvisited
+        - h: a hash value
+        """
+        if not 0 <= h < 2**64:
+            return False
+        if self._counts_of(array.array('Q', (h, )))[0] == 0:
+            return False
+        # hash values that left the heap can remain in the table, beyond
+        # its top
+        threshold = self._countthreshold()
+        return h <= threshold if self._sign < 0 else h >= threshold
 
-    def jaccard_similarity(self, obj):
-        """ Compute the Jaccard similarity index between this sketch and
-        an other sketch"""
-        return (
-            len(self._sketch.intersection(obj._sketch)) /
-            len(self._sketch.union(obj._sketch))
-        )
+    def __iter__(self):
+        """
+        Return an iterator over the hash values in the sketch.
+        """
+        return iter(sorted(self._heap[:self._lheap]))
 
-    # Alias for `jaccard_similarity`
-    jaccard_correspondance = jaccard_similarity
+    def add(self, seq, hashbuffer=None, ends=None):
+        """ Add all sub-sequences of length `self.nsize` found in the sequence
+        "seq".
 
-    def jaccard_containment(self, obj):
-        """ Compute the Jaccard containment index between this sketch and
-        an other sketch"""
-        return (
-            len(self._sketch.intersection(obj._sketch)) /
-            len(self._sketch)
-        )
+        - seq: a bytes-like sequence than can be sliced, and the slices
+            be consummed by the function in the property `hashfun` (given to
+            the constructor)
+        - hashbuffer: an optional buffer array (type `Q`) to store hash
+            values during batch C calls. If None, a buffer private to the
+            current thread is used, with a window fitted to the length of
+            "seq" (see the property `hashbuffersize`).
+        - ends: optional buffer (type `Q`) with the sorted positions where
+            records end when "seq" is made of several records put one after
+            the other (see :mod:`mashingpumpkins.fastx`). Sub-sequences
+            overlapping two records are skipped.
 
-    def dice_similarity(self, obj):
         """
-        Soerensen-Dice similarity index as:
-        DSC = 2q / (2q + r + s)
+        hashfun = self._hashfun
+        seed = self._seed
+        nsize = self._nsize
+        heap = self._heap
+        maxsize = self._maxsize
+        sign = self._sign
+        lseq = len(seq)
+
+        w, hashbuffer, offsetbuffer = self._buffers(lseq, hashbuffer)
+
+        registers = self._registers
+        prefilter = hashfun in _prefilter_hashfuns and registers is None
+
+        for slice_beg, slice_end in chunkpos_iter(nsize, lseq, w):
+            subs = seq[slice_beg:slice_end]  # safe: no out-of-bound in Python
+            filtered = prefilter and self._lheap >= maxsize and maxsize > 0
+            if filtered:
+                nsubs, nkept = hashfun(subs, nsize, hashbuffer, seed,
+                                       heap[0], sign, offsetbuffer)
+            else:
+                nsubs = hashfun(subs, nsize, hashbuffer, seed)
+                nkept = nsubs
+            if ends is not None:
+                nkept, nvalid = _sketchcore.skip_boundaries(
+                    hashbuffer, offsetbuffer, nkept, filtered, nsubs,
+                    ends, slice_beg, nsize)
+            else:
+                nvalid = nsubs
+            if registers is not None:
+                _sketchcore.hll_add(registers, hashbuffer, nkept)
+            self._heap_add(hashbuffer, nkept)
+            self._nvisited += nvalid
+
+    def add_hashvalues(self, values):
         """
-        q = len(self._sketch.intersection(obj._sketch))
-        r = len(self._sketch.difference(obj._sketch))
-        s = len(obj._sketch.difference(self._sketch))
-        return 2*q / (2*q + r + s)
+        Add hash values while conserving the characteristic of
+        the sketch.
 
-    def __len__(self):
-        """ Return the number of elements in the set. """
-        return len(self._sketch)
+        Note: The attribute `nvisited` is not incremented as this can
+        be used to merge several sketches.
 
+        - values: an iterable of hash values
+        """
+        values = array.array('Q', values)
+        self._heap_add(values, len(values))
+
+    def _heap_add(self, hashbuffer, nhashes, weights=None) -> None:
+        # Add the first `nhashes` hash values in `hashbuffer` to the heap
+        # (and count them), with the table of counts telling the hash values
+        # already in the heap (see
+        # :func:`mashingpumpkins._sketchcore.countheap_add`).
+        sign = self._sign
+        hashes = memoryview(hashbuffer)[:nhashes]
+        if weights is not None:
+            weights = memoryview(weights)[:nhashes]
+        if nhashes > 0:
+            self._countversion += 1
+        while True:
+            self._lheap, self._countsize, n = _sketchcore.countheap_add(
+                self._heap, self._lheap, self._countkeys, self._counts,
+                self._countsize, hashes, sign,
+                *(() if weights is None else (weights, )))
+            if n == len(hashes):
+                break
+            # the table is 3/4 full
+            hashes = hashes[n:]
+            if weights is not None:
+                weights = weights[n:]
+            self._rebuild_counts(self._countthreshold())
 
-class FrozenCountSketch(FrozenSketch):
+    def update(self, obj):
+        """
+        Update the sketch with hash values from `obj` in place
+        (use `__add__` instead to make a copy).
 
-    __slots__ = '_count'
+        - obj: a sketch of the same class
+        """
+        self.update_many((obj, ))
 
-    def __init__(self, sketch: set, count: Counter, nsize: int,
-                 hashfun=hash, seed: int = None,
-                 maxsize: int = None, nvisited: int = None):
+    def update_many(self, objs):
         """
-        Create an instance from:
+        Update the sketch with hash values from all sketches in `objs` in
+        place, with one linear merge of their sorted hash values.
+
+        - objs: an iterable of sketches of the same class
+        """
+        objs = tuple(objs)
+        for obj in objs:
+            if not isinstance(obj, CompactSketch) or self._sign != obj._sign:
+                raise ValueError('Mismatching sketch type.')
+
+            if self.nsize != obj.nsize:
+                raise ValueError(
+                    'Mismatching `nsize` (have %i, update has %i)'
+                    % (self.nsize, obj.nsize)
+                )
+
+            if self._hashfun != obj._hashfun:
+                raise ValueError(
+                    'Only objects with the same hashfunction can be added.'
+                )
+
+            if self.seed != obj.seed:
+                raise ValueError(
+                    'Mismatching seed value. This has %i and the update has %i'
+                    % (self.seed, obj.seed)
+                )
+
+        for obj in objs:
+            self._merge_registers(obj)
+        kept = _bottomk_merge([_sorted_hashes(x._heap[:x._lheap])
+                               for x in (self, ) + objs],
+                              self._maxsize, self._sign)
+        self._set_hashes(kept)
+        self._nvisited += sum(obj.nvisited for obj in objs)
+
+    def _set_hashes(self, hashes: array.array) -> None:
+        # Replace the content of the sketch with sorted unique hash values
+        # (at most `maxsize`, an array of type `Q`). A sorted array is a
+        # heap: no hash value is pushed.
+        n = len(hashes)
+        if self._sign < 0:
+            # lowest hash values: the largest one at the top of the heap
+            hashes = array.array('Q', hashes)
+            hashes.reverse()
+        self._heap[:n] = hashes
+        self._lheap = n
+        self._clear_counts(max(self._maxsize, n))
+        self._countsize, _ = _sketchcore.counttable_add(
+            self._countkeys, self._counts, 0, hashes,
+            2**64 - 1 if self._sign < 0 else 0, self._sign)
+
+    def ngrams(self, seq, hashbuffer=None):
+        """
+        Scan the sequence "seq" and yield pairs `(hash value, ngram)`
+        for all sub-sequences of length `self.nsize` with a hash value
+        in the sketch (a hash value is reported each time its ngram
+        is found in the sequence).
+
+        - seq: a bytes-like sequence (see method `add()`)
+        - hashbuffer: an optional buffer array (type `Q`) to store hash
+            values during batch C calls (if None, one is created)
+        """
+        hashfun = self._hashfun
+        seed = self._seed
+        nsize = self._nsize
+        if hashbuffer is None:
+            # not a per-thread buffer: the caller can add to sketches
+            # between iterations
+            w = hashbuffer_size(len(seq), nsize, self._hashbuffersize)
+            hashbuffer = array.array('Q', bytes(8 * w))
+        else:
+            w = len(hashbuffer)
+            _check_hashbuffersize(w, nsize)
+
+        hashes = frozenset(self._heap[:self._lheap])
+        if len(hashes) == 0:
+            return
+        prefilter = hashfun in _prefilter_hashfuns
+        if prefilter:
+            offsetbuffer = array.array('Q', bytes(8 * w))
+            if self._sign < 0:
+                threshold = max(hashes)
+            else:
+                threshold = min(hashes)
+
+        for slice_beg, slice_end in chunkpos_iter(nsize, len(seq), w):
+            subs = seq[slice_beg:slice_end]
+            if prefilter:
+                nsubs, nkept = hashfun(subs, nsize, hashbuffer, seed,
+                                       threshold, self._sign, offsetbuffer)
+                positions = offsetbuffer
+            else:
+                nkept = hashfun(subs, nsize, hashbuffer, seed)
+                positions = range(nkept)
+            for i in range(nkept):
+                h = hashbuffer[i]
+                if h in hashes:
+                    j = positions[i]
+                    yield (h, subs[j:(j+nsize)])
+
+    def _hashvalues(self) -> array.array:
+        return self._heap[:self._lheap]
+
+    def _heapstate(self):
+        lheap = self._lheap
+        return (lheap, self._heap[0] if lheap else None)
+
+    def freeze(self):
+        """
+        Return a read-only copy of the sketch (see
+        :meth:`SetSketch.freeze`).
+        """
+        storage = self._frozen_storage(
+            lambda: _sorted_hashes(self._heap[:self._lheap]))
+        return FrozenCompactSketch(storage, self.nsize,
+                                   self._hashfun,
+                                   seed=self.seed,
+                                   maxsize=self.maxsize,
+                                   nvisited=self.nvisited,
+                                   sign=self._sign,
+                                   registers=self._registers,
+                                   copy=False)
+
+
+class MaxCompactSketch(CompactSketch):
+    """
+    Top sketch only storing hash values (see :class:`CompactSketch`),
+    with the `maxsize` highest hash values.
+    """
+
+    _sign = +1
+
+
+class MinCompactSketch(CompactSketch):
+    """
+    Bottom sketch only storing hash values (see :class:`CompactSketch`),
+    with the `maxsize` lowest hash values.
+    """
+
+    _sign = -1
+
+
+class CompactCountSketch(CountTrait, CompactSketch):
+    """
+    Sketch only storing hash values (see :class:`CompactSketch`), with
+    the number of times each hash value was found (see
+    :class:`CountTrait`), from the table telling the hash values already
+    in the heap.
+
+    This class is not meant to be used directly. See
+    :class:`MinCompactCountSketch` and :class:`MaxCompactCountSketch`.
+    """
+
+    def __init__(self, nsize: int,
+                 maxsize: int,
+                 hashfun,
+                 seed: int,
+                 hashes=None,
+                 counts=None,
+                 nvisited: int = 0,
+                 hashbuffersize: int = DEFAULT_HASHBUFFERSIZE,
+                 hllprecision: int = None):
+        """
+        - nsize: size of the ngrams / kmers
+        - maxsize: maximum size for the sketch
+        - hashfun: function used for hashing
+            `hashfun(byteslike) -> hash value`
+        - seed: a seed for hashfun
+        - hashes: an optional iterable of hash values to initialize
+            the sketch with (each one found once, unless `counts` is given)
+        - counts: an optional iterable with the count for each hash value
+            in `hashes`
+        - nvisited: number of kmers visited so far
+        - hashbuffersize: maximum width of the window over sequences
+            hashed with one call to `hashfun`
+        - hllprecision: optional precision for HyperLogLog registers
+            (see :class:`SetSketch`)
+        """
+        super().__init__(nsize, maxsize, hashfun, seed,
+                         nvisited=nvisited,
+                         hashbuffersize=hashbuffersize,
+                         hllprecision=hllprecision)
+        if hashes is None:
+            if counts is not None:
+                raise ValueError('Counts cannot be given without hash values.')
+            return
+        hashes = array.array('Q', hashes)
+        if counts is not None:
+            counts = array.array('Q', counts)
+            if len(counts) != len(hashes):
+                raise ValueError('There must be one count for each hash '
+                                 'value.')
+        self._heap_add(hashes, len(hashes), weights=counts)
+
+    # Hash values are counted while they are added to the heap.
+    add_hashvalues = CompactSketch.add_hashvalues
+
+    def freeze(self):
+        """
+        Return a read-only copy of the sketch, with its counts (see
+        :meth:`SetSketch.freeze`).
+        """
+        def make():
+            hashes = _sorted_hashes(self._heap[:self._lheap])
+            return (hashes, self._counts_of(hashes))
+
+        hashes, counts = self._frozen_storage(make)
+        return FrozenCompactCountSketch(hashes, counts, self.nsize,
+                                        self._hashfun,
+                                        seed=self.seed,
+                                        maxsize=self.maxsize,
+                                        nvisited=self.nvisited,
+                                        sign=self._sign,
+                                        registers=self._registers,
+                                        copy=False)
+
+
+class MaxCompactCountSketch(CompactCountSketch):
+    """
+    Top sketch only storing hash values and their counts (see
+    :class:`CompactCountSketch`), with the `maxsize` highest hash values.
+    """
+
+    _sign = +1
+
+
+class MinCompactCountSketch(CompactCountSketch):
+    """
+    Bottom sketch only storing hash values and their counts (see
+    :class:`CompactCountSketch`), with the `maxsize` lowest hash values.
+    """
+
+    _sign = -1
+
+
+# Value of empty bins in :class:`OnePermutationSketch`.
+EMPTY_BIN = 2**64 - 1
+
+
+class OnePermutationSketch(SetSketch):
+    """
+    Sketch with one-permutation hashing: the hash space is split into
+    `maxsize` bins of equal size, and the lowest hash value seen in each
+    bin is kept in an :class:`array.array` of type `Q` (8 bytes per bin).
+
+    Adding a hash value is a constant-time update of its bin (no heap),
+    done in compiled code for all hash values in the buffer. Ngrams /
+    kmers are not kept.
+
+    Frozen sketches (see :class:`FrozenOnePermutationSketch`) have their
+    empty bins filled (densification), and are compared bin by bin.
+    """
+
+    def __init__(self, nsize: int,
+                 maxsize: int,
+                 hashfun,
+                 seed: int,
+                 bins=None,
+                 nvisited: int = 0,
+                 hashbuffersize: int = DEFAULT_HASHBUFFERSIZE,
+                 hllprecision: int = None):
+        """
+        - nsize: size of the ngrams / kmers
+        - maxsize: number of bins
+        - hashfun: function used for hashing
+            `hashfun(byteslike) -> hash value`
+        - seed: a seed for hashfun
+        - bins: an optional iterable of `maxsize` values to initialize
+            the bins with (`EMPTY_BIN` for empty bins)
+        - nvisited: number of kmers visited so far
+        - hashbuffersize: maximum width of the window over sequences
+            hashed with one call to `hashfun`
+        - hllprecision: optional precision for HyperLogLog registers
+            (see :class:`SetSketch`)
+        """
+        _check_hashbuffersize(hashbuffersize, nsize)
+        if maxsize < 1:
+            raise ValueError('The number of bins must be positive.')
+        self._nsize = nsize
+        self._maxsize = maxsize
+        self._hashfun = hashfun
+        self._seed = seed
+        self._hashbuffersize = hashbuffersize
+        if bins is None:
+            self._bins = array.array('Q', [EMPTY_BIN]) * maxsize
+        else:
+            self._bins = array.array('Q', bins)
+            if len(self._bins) != maxsize:
+                raise ValueError('The number of bins must be maxsize.')
+        self._registers = _hll_registers(hllprecision)
+        self._nvisited = nvisited
+
+    def __len__(self):
+        """
+        Return the number of non-empty bins. See also the property
+        'nvisited'.
+        """
+        return self._maxsize - self._bins.count(EMPTY_BIN)
+
+    def __contains__(self, h):
+        """
+        Return whether a given hash value is in the sketch
+
+        - h: a hash value
+        """
+        return (h != EMPTY_BIN and
+                self._bins[(h * self._maxsize) >> 64] == h)
+
+    def __iter__(self):
+        """
+        Return an iterator over the hash values in the sketch.
+        """
+        return iter(sorted(x for x in self._bins if x != EMPTY_BIN))
+
+    def add(self, seq, hashbuffer=None, ends=None):
+        """ Add all sub-sequences of length `self.nsize` found in the sequence
+        "seq".
+
+        - seq: a bytes-like sequence than can be sliced, and the slices
+            be consummed by the function in the property `hashfun` (given to
+            the constructor)
+        - hashbuffer: an optional buffer array (type `Q`) to store hash
+            values during batch C calls. If None, a buffer private to the
+            current thread is used, with a window fitted to the length of
+            "seq" (see the property `hashbuffersize`).
+        - ends: optional buffer (type `Q`) with the sorted positions where
+            records end when "seq" is made of several records put one after
+            the other (see :mod:`mashingpumpkins.fastx`). Sub-sequences
+            overlapping two records are skipped.
+
+        """
+        hashfun = self._hashfun
+        seed = self._seed
+        nsize = self._nsize
+        bins = self._bins
+        registers = self._registers
+        lseq = len(seq)
+
+        w, hashbuffer, offsetbuffer = self._buffers(lseq, hashbuffer)
+
+        for slice_beg, slice_end in chunkpos_iter(nsize, lseq, w):
+            subs = seq[slice_beg:slice_end]  # safe: no out-of-bound in Python
+            nsubs = hashfun(subs, nsize, hashbuffer, seed)
+            if ends is not None:
+                nkept, nvalid = _sketchcore.skip_boundaries(
+                    hashbuffer, offsetbuffer, nsubs, False, nsubs,
+                    ends, slice_beg, nsize)
+            else:
+                nkept = nvalid = nsubs
+            if registers is not None:
+                _sketchcore.hll_add(registers, hashbuffer, nkept)
+            _sketchcore.bins_add(bins, hashbuffer, nkept)
+            self._nvisited += nvalid
+
+    def add_hashvalues(self, values):
+        """
+        Add hash values to their bins.
+
+        Note: The attribute `nvisited` is not incremented as this can
+        be used to merge several sketches.
+
+        - values: an iterable of hash values
+        """
+        values = array.array('Q', values)
+        _sketchcore.bins_add(self._bins, values, len(values))
+
+    def update(self, obj):
+        """
+        Update the sketch with hash values from `obj` in place
+        (use `__add__` instead to make a copy).
+
+        - obj: a sketch of the same class and with the same number of bins
+        """
+
+        if not isinstance(obj, OnePermutationSketch):
+            raise ValueError('Mismatching sketch type.')
+
+        if self.maxsize != obj.maxsize:
+            raise ValueError(
+                'Mismatching number of bins (have %i, update has %i)'
+                % (self.maxsize, obj.maxsize)
+            )
+
+        if self.nsize != obj.nsize:
+            raise ValueError(
+                'Mismatching `nsize` (have %i, update has %i)'
+                % (self.nsize, obj.nsize)
+            )
+
+        if self._hashfun != obj._hashfun:
+            raise ValueError(
+                'Only objects with the same hashfunction can be added.'
+            )
+
+        if self.seed != obj.seed:
+            raise ValueError(
+                'Mismatching seed value. This has %i and the update has %i'
+                % (self.seed, obj.seed)
+            )
+
+        self._merge_registers(obj)
+        _sketchcore.bins_add(self._bins, obj._bins, obj._maxsize)
+        self._nvisited += obj.nvisited
+
+    def freeze(self):
+        return FrozenOnePermutationSketch(self._bins, self.nsize,
+                                          self._hashfun,
+                                          seed=self.seed,
+                                          nvisited=self.nvisited,
+                                          registers=self._registers)
+
+
+class ScaledSketch(SetSketch):
+    """
+    Scaled sketch (FracMinHash): all hash values lower than or equal to
+    `(2**64 - 1) // scale` are kept (about one in `scale`), and the size
+    of the sketch grows with the number of distinct ngrams / kmers.
+
+    Whether a hash value is kept does not depend on the content of the
+    sketch: hashing functions filter hash values with the threshold, and
+    there is no heap and no eviction. Hash values are stored in a sorted
+    :class:`array.array` of type `Q` (8 bytes per hash value), and
+    merging sketches is exact.
+    """
+
+    _sign = -1
+
+    def __init__(self, nsize: int,
+                 scale: int,
+                 hashfun,
+                 seed: int,
+                 hashes=None,
+                 nvisited: int = 0,
+                 hashbuffersize: int = DEFAULT_HASHBUFFERSIZE,
+                 hllprecision: int = None):
+        """
+        - nsize: size of the ngrams / kmers
+        - scale: one hash value in about `scale` is kept
+        - hashfun: function used for hashing
+            `hashfun(byteslike) -> hash value`
+        - seed: a seed for hashfun
+        - hashes: an optional iterable of hash values to initialize
+            the sketch with (the ones above the threshold are ignored)
+        - nvisited: number of kmers visited so far
+        - hashbuffersize: maximum width of the window over sequences
+            hashed with one call to `hashfun`
+        - hllprecision: optional precision for HyperLogLog registers
+            (see :class:`SetSketch`)
+        """
+        _check_hashbuffersize(hashbuffersize, nsize)
+        if scale < 1:
+            raise ValueError('The scale must be positive.')
+        self._nsize = nsize
+        self._maxsize = None
+        self._scale = scale
+        self._threshold = (2**64 - 1) // scale
+        self._hashfun = hashfun
+        self._seed = seed
+        self._hashbuffersize = hashbuffersize
+        self._registers = _hll_registers(hllprecision)
+        # sorted unique hash values, and hash values added since
+        # (unsorted, possibly with duplicates)
+        self._hashes = array.array('Q')
+        self._pending = array.array('Q')
+        self._nvisited = nvisited
+        if hashes is not None:
+            self.add_hashvalues(hashes)
+
+    @property
+    def maxsize(self):
+        """ Maximum size for the sketch (None: no maximum size). """
+        return None
+
+    @property
+    def scale(self):
+        """ One hash value in about `scale` is kept. """
+        return self._scale
+
+    @property
+    def threshold(self):
+        """ Highest hash value that can be kept. """
+        return self._threshold
+
+    def _empty(self):
+        return type(self)(self.nsize, self.scale, self._hashfun, self.seed,
+                          hashbuffersize=self._hashbuffersize,
+                          hllprecision=self.hllprecision)
+
+    def _consolidate(self):
+        # Merge the hash values added since the last call into the sorted
+        # hash values.
+        if len(self._pending) == 0:
+            return
+        self._hashes = _sorted_union(self._hashes,
+                                     _sorted_hashes(self._pending))
+        self._pending = array.array('Q')
+
+    def __len__(self):
+        """
+        Return the number of elements in the sketch. See also the property
+        'nvisited'.
+        """
+        self._consolidate()
+        return len(self._hashes)
+
+    def __contains__(self, h):
+        """
+        Return whether a given hash value is in the sketch
+
+        - h: a hash value
+        """
+        self._consolidate()
+        i = bisect_left(self._hashes, h)
+        return i < len(self._hashes) and self._hashes[i] == h
+
+    def __iter__(self):
+        """
+        Return an iterator over the (sorted) hash values in the sketch.
+        """
+        self._consolidate()
+        return iter(self._hashes[:])
+
+    def add(self, seq, hashbuffer=None, ends=None):
+        """ Add all sub-sequences of length `self.nsize` found in the sequence
+        "seq".
+
+        - seq: a bytes-like sequence than can be sliced, and the slices
+            be consummed by the function in the property `hashfun` (given to
+            the constructor)
+        - hashbuffer: an optional buffer array (type `Q`) to store hash
+            values during batch C calls. If None, a buffer private to the
+            current thread is used, with a window fitted to the length of
+            "seq" (see the property `hashbuffersize`).
+        - ends: optional buffer (type `Q`) with the sorted positions where
+            records end when "seq" is made of several records put one after
+            the other (see :mod:`mashingpumpkins.fastx`). Sub-sequences
+            overlapping two records are skipped.
+
+        """
+        hashfun = self._hashfun
+        seed = self._seed
+        nsize = self._nsize
+        threshold = self._threshold
+        pending = self._pending
+        lseq = len(seq)
+
+        w, hashbuffer, offsetbuffer = self._buffers(lseq, hashbuffer)
+
+        registers = self._registers
+        prefilter = hashfun in _prefilter_hashfuns and registers is None
+
+        for slice_beg, slice_end in chunkpos_iter(nsize, lseq, w):
+            subs = seq[slice_beg:slice_end]  # safe: no out-of-bound in Python
+            if prefilter:
+                nsubs, nkept = hashfun(subs, nsize, hashbuffer, seed,
+                                       threshold, -1, offsetbuffer)
+            else:
+                nsubs = hashfun(subs, nsize, hashbuffer, seed)
+                nkept = nsubs
+            if ends is not None:
+                nkept, nvalid = _sketchcore.skip_boundaries(
+                    hashbuffer, offsetbuffer, nkept, prefilter, nsubs,
+                    ends, slice_beg, nsize)
+            else:
+                nvalid = nsubs
+            if not prefilter:
+                if registers is not None:
+                    _sketchcore.hll_add(registers, hashbuffer, nkept)
+                nkept = _sketchcore.keep_below(hashbuffer, nkept, threshold)
+            pending.extend(hashbuffer[:nkept])
+            self._nvisited += nvalid
+        if len(pending) > max(len(self._hashes), w):
+            self._consolidate()
+
+    def add_hashvalues(self, values):
+        """
+        Add hash values (the ones above the threshold are ignored).
+
+        Note: The attribute `nvisited` is not incremented as this can
+        be used to merge several sketches.
+
+        - values: an iterable of hash values
+        """
+        values = array.array('Q', values)
+        nkept = _sketchcore.keep_below(values, len(values), self._threshold)
+        self._pending.extend(values[:nkept])
+        self._consolidate()
+
+    def update(self, obj):
+        """
+        Update the sketch with hash values from `obj` in place
+        (use `__add__` instead to make a copy).
+
+        - obj: a sketch of the same class and with the same scale
+        """
+
+        if not isinstance(obj, ScaledSketch):
+            raise ValueError('Mismatching sketch type.')
+
+        if self.scale != obj.scale:
+            raise ValueError(
+                'Mismatching scale (have %i, update has %i)'
+                % (self.scale, obj.scale)
+            )
+
+        if self.nsize != obj.nsize:
+            raise ValueError(
+                'Mismatching `nsize` (have %i, update has %i)'
+                % (self.nsize, obj.nsize)
+            )
+
+        if self._hashfun != obj._hashfun:
+            raise ValueError(
+                'Only objects with the same hashfunction can be added.'
+            )
+
+        if self.seed != obj.seed:
+            raise ValueError(
+                'Mismatching seed value. This has %i and the update has %i'
+                % (self.seed, obj.seed)
+            )
+
+        self._merge_registers(obj)
+        self._consolidate()
+        obj._consolidate()
+        self._hashes = _sorted_union(self._hashes, obj._hashes)
+        self._nvisited += obj.nvisited
+
+    def freeze(self):
+        """
+        Return a read-only copy of the sketch. The sorted hash values are
+        shared with the frozen sketch: they are replaced, not changed in
+        place, when hash values are added later.
+        """
+        self._consolidate()
+        return FrozenScaledSketch(self._hashes, self.nsize,
+                                  self._hashfun,
+                                  seed=self.seed,
+                                  scale=self.scale,
+                                  nvisited=self.nvisited,
+                                  registers=self._registers,
+                                  copy=False)
+
+
+def add_seeds(sketches, seq) -> None:
+    """
+    Add all sub-sequences of length `nsize` found in the sequence "seq" to
+    hash-only sketches only differing by the seed for the hashing function
+    :func:`mashingpumpkins._xxhash.hasharray` (e.g., for a family of
+    independent sketches), hashing with all seeds in one pass over "seq".
+
+    - sketches: a sequence of :class:`CompactSketch` objects with the same
+        `nsize` and the hashing function `_xxhash.hasharray`
+    - seq: a bytes-like sequence (see method `add()` of the sketches)
+    """
+    if len(sketches) == 0:
+        return
+    if any(not isinstance(x, CompactSketch) or
+           x._hashfun is not _xxhash.hasharray for x in sketches):
+        raise ValueError('The sketches must be hash-only sketches with '
+                         'the hashing function _xxhash.hasharray.')
+    nsizes = set(x.nsize for x in sketches)
+    if len(nsizes) != 1:
+        raise ValueError('The sketches must all have the same nsize.')
+    nsize = nsizes.pop()
+    w = hashbuffer_size(len(seq), nsize,
+                        min(x.hashbuffersize for x in sketches))
+    for beg in range(0, len(sketches), _xxhash.MAXSEEDS):
+        group = sketches[beg:(beg + _xxhash.MAXSEEDS)]
+        hashbuffers = tuple(array.array('Q', bytes(8 * w)) for x in group)
+        seeds = tuple(x.seed for x in group)
+        for slice_beg, slice_end in chunkpos_iter(nsize, len(seq), w):
+            nsubs = _xxhash.hasharray_seeds(seq[slice_beg:slice_end], nsize,
+                                            hashbuffers, seeds)
+            for mhs, hashbuffer in zip(group, hashbuffers):
+                if mhs._registers is not None:
+                    _sketchcore.hll_add(mhs._registers, hashbuffer, nsubs)
+                mhs._heap_add(hashbuffer, nsubs)
+                mhs._nvisited += nsubs
+
+
+def merge(sketches):
+    """
+    Merge sketches into a new sketch (of the class of the first one).
+
+    Bottom and top sketches are merged with one linear merge of their
+    sorted hash values, rather than by adding the content of each sketch
+    to the result one at a time.
+
+    - sketches: a non-empty sequence of sketches that can be added
+        together (see the method `update_many()` of the sketches)
+    """
+    if len(sketches) == 0:
+        raise ValueError('At least one sketch is needed.')
+    res = sketches[0]._empty()
+    res.update_many(sketches)
+    return res
+
+
+class FrozenSketch(object):
+    """
+    Read-only sketch.
+    """
+
+    __slots__ = ('_sketch', '_nsize', '_hashfun', '_seed',
+                 '_maxsize', '_nvisited', '_sign', '_registers')
+
+    # Storage for the content of the sketch
+    _make_sketch = frozenset
+
+    def __init__(self, sketch: set, nsize: int, hashfun=hash,
+                 seed: int = None,
+                 maxsize: int = None, nvisited: int = None,
+                 sign: int = -1, registers=None, copy: bool = True):
+        """
+        Create an instance from:
+        - sketch: a set
+        - nsize: a kmer/ngram size
+        - hashfun: a hashing function
+        - seed: an optional seed for hashfun
+        - maxsize: a maximum size for the input set (if missing, this is
+          assumed to be len(setobj)
+        - nvisited: the number of kmers/ngrams visited to create setobj
+        - sign: -1 if the sketch kept the lowest hash values (bottom
+          sketch, like :class:`MinSketch`) or 1 if it kept the highest
+          ones (top sketch, like :class:`MaxSketch`)
+        - registers: optional HyperLogLog registers (an array of type
+          `B`, copied) for the set the sketch was built from (see
+          :meth:`SetSketch.cardinality`)
+        - copy: if False, `sketch` is used as the storage as it is and
+          must be what the class would make from it (for
+          :class:`FrozenCompactSketch`, a buffer of format type `Q`
+          with sorted unique hash values, possibly memory-mapped)
+        """
+
+        if copy:
+            sketch = self._make_sketch(sketch)
+        if maxsize is None:
+            maxsize = len(sketch)
+        elif maxsize < len(sketch):
+            raise ValueError("The maximum size cannot be smaller than the "
+                             "number of objects in the set.")
+        if nvisited is None:
+            nvisited = len(sketch)
+        elif nvisited < len(sketch):
+            raise ValueError("'nvisited' cannot be smaller than the number of "
+                             "objects in the set.")
+
+        self._sketch = sketch
+        self._nsize = nsize
+        self._hashfun = hashfun
+        self._seed = seed
+        self._maxsize = maxsize
+        self._nvisited = nvisited
+        self._sign = sign
+        if registers is not None:
+            registers = array.array('B', registers)
+        self._registers = registers
+
+    @property
+    def maxsize(self):
+        """ Maximum size for the sketch. """
+        return self._maxsize
+
+    @property
+    def nsize(self):
+        """ Size of the ngrams / kmers. """
+        return self._nsize
+
+    @property
+    def nvisited(self):
+        """ Number of ngrams / kmers visited (considered for inclusion)
+        so far. """
+        return self._nvisited
+
+    @property
+    def hllprecision(self):
+        """ Precision `p` of the HyperLogLog registers (`2**p` bytes), or
+        None if the sketch does not have them. """
+        return _hll_precision(self._registers)
+
+    def cardinality(self) -> float:
+        """
+        Estimate of the number of distinct ngrams / kmers in the set the
+        sketch was built from (see :meth:`SetSketch.cardinality`).
+        """
+        return _hll_cardinality(self._registers)
+
+    def jaccard_similarity(self, obj):
+        """ Compute the Jaccard similarity index between this sketch and
+        an other sketch"""
+        q = len(self._sketch.intersection(obj._sketch))
+        return q / (len(self._sketch) + len(obj._sketch) - q)
+
+    # Alias for `jaccard_similarity`
+    jaccard_correspondance = jaccard_similarity
+
+    def jaccard_containment(self, obj):
+        """ Compute the Jaccard containment index between this sketch and
+        an other sketch"""
+        return (
+            len(self._sketch.intersection(obj._sketch)) /
+            len(self._sketch)
+        )
+
+    def dice_similarity(self, obj):
+        """
+        Soerensen-Dice similarity index as:
+        DSC = 2q / (2q + r + s)
+        """
+        q = len(self._sketch.intersection(obj._sketch))
+        r = len(self._sketch) - q
+        s = len(obj._sketch) - q
+        return 2*q / (2*q + r + s)
+
+    def _sorted(self) -> array.array:
+        return _sorted_hashes(self._sketch)
+
+    def _bottomk_union(self, obj) -> (int, int):
+        if self._sign != obj._sign:
+            raise ValueError("The sketches must both be bottom sketches "
+                             "or both be top sketches.")
+        return _sketchcore.bottomk_union(self._sorted(), obj._sorted(),
+                                         min(self._maxsize, obj._maxsize),
+                                         self._sign)
+
+    def jaccard_estimate(self, obj):
+        """
+        MinHash estimate of the Jaccard index between the sets this sketch
+        and an other sketch were built from.
+
+        Unlike :meth:`jaccard_similarity`, only the `k` first hash values
+        in the union of the sketches are considered (`k` being the
+        smallest of the two maximum sizes), which is the estimator used
+        by Mash.
+        """
+        shared, total = self._bottomk_union(obj)
+        return shared / total
+
+    def mash_distance(self, obj):
+        """
+        Mash distance between this sketch and an other sketch, computed
+        from the estimate of the Jaccard index `j` (see
+        :meth:`jaccard_estimate`) and the kmer size `k` as:
+        D = -1/k * ln(2j / (1 + j))
+
+        The distance is 1 when the sketches have no hash value in common.
+        """
+        return _mash_distance(self.jaccard_estimate(obj), self._nsize)
+
+    def mash_pvalue(self, obj, alphabet_size: int = 4, lengths=None):
+        """
+        Probability to observe at least as many shared hash values
+        between this sketch and an other sketch by chance, as computed by
+        Mash.
+
+        - obj: an other sketch
+        - alphabet_size: number of letters in the alphabet of the
+          sequences (4 for DNA)
+        - lengths: a pair with the lengths of the sequences the sketches
+          were built from (if missing, the number of kmers/ngrams visited
+          by each sketch is used)
+        """
+        shared, total = self._bottomk_union(obj)
+        if lengths is None:
+            lengths = (self._nvisited, obj._nvisited)
+        kmerspace = float(alphabet_size) ** self._nsize
+        px = 1 / (1 + kmerspace / lengths[0])
+        py = 1 / (1 + kmerspace / lengths[1])
+        r = px * py / (px + py - px * py)
+        return _binomial_sf(shared, total, r)
+
+    def __len__(self):
+        """ Return the number of elements in the set. """
+        return len(self._sketch)
+
+    def compact(self):
+        """
+        Return a :class:`FrozenCompactSketch` with the hash values
+        in this sketch.
+        """
+        return FrozenCompactSketch(self._sketch, self._nsize,
+                                   hashfun=self._hashfun,
+                                   seed=self._seed,
+                                   maxsize=self._maxsize,
+                                   nvisited=self._nvisited,
+                                   sign=self._sign,
+                                   registers=self._registers)
+
+
+class FrozenCountSketch(FrozenSketch):
+
+    __slots__ = '_count'
+
+    def __init__(self, sketch: set, count: Counter, nsize: int,
+                 hashfun=hash, seed: int = None,
+                 maxsize: int = None, nvisited: int = None,
+                 sign: int = -1, registers=None, copy: bool = True):
+        """
+        Create an instance from:
         - sketch: a set
         - count: a counter
         - nsize: a kmer/ngram size
@@ -757,11 +2134,16 @@ class FrozenCountSketch(FrozenSketch):
         - maxsize: a maximum size for the input set (if missing, this is
           assumed to be len(setobj)
         - nvisited: the number of kmers/ngrams visited to create setobj
+        - sign: -1 for a bottom sketch, 1 for a top sketch
+        - registers: optional HyperLogLog registers
+        - copy: if False, `sketch` (a frozenset) and `count` are used as
+          the storage as they are
         """
 
         super().__init__(sketch, nsize, hashfun=hashfun, seed=seed,
-                         maxsize=maxsize, nvisited=nvisited)
-        self._count = count.copy()
+                         maxsize=maxsize, nvisited=nvisited, sign=sign,
+                         registers=registers, copy=copy)
+        self._count = count.copy() if copy else count
 
     def bray_curtis_dissimilarity(self, obj):
         """
@@ -773,3 +2155,340 @@ class FrozenCountSketch(FrozenSketch):
         S_i = sum(self._count)
         S_j = sum(obj._count)
         return 1 - (2 * C_ij) / (S_i + S_j)
+
+
+def _mash_distance(j: float, nsize: int) -> float:
+    if j == 0:
+        return 1.0
+    # not -log(2j / (1 + j)): -0.0 for j == 1
+    return math.log((1 + j) / (2 * j)) / nsize
+
+
+def _binomial_sf(x: int, n: int, p: float) -> float:
+    """
+    Probability P(X >= x) for X following a binomial distribution
+    with `n` trials and a probability of success `p`.
+    """
+    if x <= 0 or p >= 1:
+        return 1.0
+    if x > n or p <= 0:
+        return 0.0
+    # sum of the terms in log space to avoid underflows
+    logp = math.log(p)
+    log1mp = math.log1p(-p)
+    lgn = math.lgamma(n + 1)
+    terms = [lgn - math.lgamma(i + 1) - math.lgamma(n - i + 1) +
+             i * logp + (n - i) * log1mp
+             for i in range(x, n + 1)]
+    m = max(terms)
+    return min(1.0, math.exp(m) * math.fsum(math.exp(t - m) for t in terms))
+
+
+def _sorted_hashes(values) -> array.array:
+    """
+    Sorted array (type `Q`) with the unique hash values in `values`.
+    """
+    res = array.array('Q', values)
+    del res[_sketchcore.sort_unique(res):]
+    return res
+
+
+def _bottomk_merge(arrays, k: int, sign: int) -> array.array:
+    """
+    The `k` lowest (`sign` -1) or highest (`sign` 1) distinct hash values
+    in sorted arrays (type `Q`) of unique hash values, sorted. The arrays
+    are merged pairwise (linear merges).
+    """
+    arrays = list(arrays)
+    if len(arrays) == 0:
+        return array.array('Q')
+    while len(arrays) > 1:
+        merged = list()
+        for a, b in zip(arrays[0::2], arrays[1::2]):
+            res = array.array('Q', bytes(8 * min(k, len(a) + len(b))))
+            del res[_sketchcore.bottomk_merge(a, b, k, sign, res):]
+            merged.append(res)
+        if len(arrays) % 2:
+            merged.append(arrays[-1])
+        arrays = merged
+    if len(arrays[0]) <= k:
+        return array.array('Q', arrays[0])
+    return arrays[0][:k] if sign < 0 else arrays[0][-k:]
+
+
+def _sorted_union(a: array.array, b: array.array) -> array.array:
+    """
+    Union of two sorted arrays (type `Q`) of unique hash values.
+    """
+    res = array.array('Q', bytes(8 * (len(a) + len(b))))
+    del res[_sketchcore.sorted_union(a, b, res):]
+    return res
+
+
+class FrozenCompactSketch(FrozenSketch):
+    """
+    Read-only sketch storing its hash values in a sorted
+    :class:`array.array` of type `Q` (8 bytes per hash value).
+
+    Similarity indices are computed with one linear merge of the
+    sorted arrays (no intermediate sets).
+    """
+
+    __slots__ = ()
+
+    _make_sketch = staticmethod(_sorted_hashes)
+
+    def _intersection_size(self, obj):
+        if isinstance(obj, FrozenCompactSketch):
+            return _sketchcore.intersection_size(self._sketch, obj._sketch)
+        else:
+            return len(obj._sketch.intersection(self._sketch))
+
+    def jaccard_similarity(self, obj):
+        """ Compute the Jaccard similarity index between this sketch and
+        an other sketch"""
+        q = self._intersection_size(obj)
+        return q / (len(self._sketch) + len(obj._sketch) - q)
+
+    # Alias for `jaccard_similarity`
+    jaccard_correspondance = jaccard_similarity
+
+    def jaccard_containment(self, obj):
+        """ Compute the Jaccard containment index between this sketch and
+        an other sketch"""
+        return self._intersection_size(obj) / len(self._sketch)
+
+    def dice_similarity(self, obj):
+        """
+        Soerensen-Dice similarity index as:
+        DSC = 2q / (2q + r + s)
+        """
+        q = self._intersection_size(obj)
+        return 2*q / (len(self._sketch) + len(obj._sketch))
+
+    def _sorted(self) -> array.array:
+        return self._sketch
+
+    def __iter__(self):
+        """ Return an iterator over the (sorted) hash values. """
+        return iter(self._sketch)
+
+    def __contains__(self, h):
+        """ Return whether a given hash value is in the sketch. """
+        i = bisect_left(self._sketch, h)
+        return i < len(self._sketch) and self._sketch[i] == h
+
+
+class FrozenCompactCountSketch(FrozenCompactSketch):
+    """
+    Read-only compact sketch with the number of times each hash value was
+    found (see :class:`CompactCountSketch`): the counts are in an
+    :class:`array.array` of type `Q`, in the order of the sorted hash
+    values.
+    """
+
+    __slots__ = ('_counts', )
+
+    def __init__(self, sketch, counts, nsize: int, hashfun=hash,
+                 seed: int = None,
+                 maxsize: int = None, nvisited: int = None,
+                 sign: int = -1, registers=None, copy: bool = True):
+        """
+        Create an instance from:
+        - sketch: an iterable of unique hash values
+        - counts: an iterable with the count for each hash value in
+          `sketch`, in the same order
+        - nsize: a kmer/ngram size
+        - hashfun: a hashing function
+        - seed: an optional seed for hashfun
+        - maxsize: a maximum size for the input set
+        - nvisited: the number of kmers/ngrams visited to create the sketch
+        - sign: -1 for a bottom sketch, 1 for a top sketch
+        - registers: optional HyperLogLog registers
+        - copy: if False, `sketch` and `counts` are used as the storage
+          as they are (buffers of format type `Q`, with sorted unique
+          hash values and their counts, possibly memory-mapped)
+        """
+        if copy:
+            sketch = tuple(sketch)
+            counts = tuple(counts)
+            count = dict(zip(sketch, counts))
+            if len(count) != len(sketch) or len(count) != len(counts):
+                raise ValueError('There must be one count for each (unique) '
+                                 'hash value.')
+            sketch = _sorted_hashes(count)
+            counts = array.array('Q', (count[h] for h in sketch))
+        elif len(counts) != len(sketch):
+            raise ValueError('There must be one count for each hash value.')
+        super().__init__(sketch, nsize, hashfun=hashfun, seed=seed,
+                         maxsize=maxsize, nvisited=nvisited, sign=sign,
+                         registers=registers, copy=False)
+        self._counts = counts
+
+    def count(self, h) -> int:
+        """ Number of times a hash value was found (0 if not in the
+        sketch). """
+        sketch = self._sketch
+        i = bisect_left(sketch, h)
+        if i < len(sketch) and sketch[i] == h:
+            return self._counts[i]
+        return 0
+
+    def bray_curtis_dissimilarity(self, obj):
+        """
+        Return the Bray-Curtis dissimilarity between this and an other
+        FrozenCompactCountSketch: `1 - 2 * C / (S_i + S_j)`, with `C` the
+        sum of the lowest of the two counts for the hash values in both
+        sketches and `S_i`, `S_j` the sums of the counts in each sketch.
+        """
+        if not isinstance(obj, FrozenCompactCountSketch):
+            raise ValueError('Mismatching sketch type.')
+        other = dict(zip(obj._sketch, obj._counts))
+        C_ij = sum(min(c, other.get(h, 0))
+                   for h, c in zip(self._sketch, self._counts))
+        S_i = sum(self._counts)
+        S_j = sum(obj._counts)
+        return 1 - (2 * C_ij) / (S_i + S_j)
+
+
+class FrozenScaledSketch(FrozenCompactSketch):
+    """
+    Read-only scaled sketch (see :class:`ScaledSketch`).
+
+    MinHash estimators (:meth:`jaccard_estimate`, :meth:`mash_distance`,
+    and :meth:`mash_pvalue`) consider all hash values in two scaled
+    sketches with the same scale. With a sketch of an other kind, they
+    are the ones of :class:`FrozenCompactSketch`.
+    """
+
+    __slots__ = ('_scale', )
+
+    def __init__(self, sketch, nsize: int, hashfun=hash,
+                 seed: int = None, scale: int = 1,
+                 nvisited: int = None, registers=None, copy: bool = True):
+        """
+        Create an instance from:
+        - sketch: an iterable of hash values
+        - nsize: a kmer/ngram size
+        - hashfun: a hashing function
+        - seed: an optional seed for hashfun
+        - scale: the scale of the sketch (see :class:`ScaledSketch`)
+        - nvisited: the number of kmers/ngrams visited to create the sketch
+        - registers: optional HyperLogLog registers
+        - copy: see :class:`FrozenSketch`
+        """
+        super().__init__(sketch, nsize, hashfun=hashfun, seed=seed,
+                         nvisited=nvisited, sign=-1, registers=registers,
+                         copy=copy)
+        self._scale = scale
+
+    @property
+    def scale(self):
+        """ One hash value in about `scale` was kept. """
+        return self._scale
+
+    def _bottomk_union(self, obj) -> (int, int):
+        if not isinstance(obj, FrozenScaledSketch):
+            return super()._bottomk_union(obj)
+        if self._scale != obj._scale:
+            raise ValueError('The scaled sketches must have the same '
+                             'scale (here %i and %i).'
+                             % (self._scale, obj._scale))
+        return _sketchcore.bottomk_union(self._sketch, obj._sketch,
+                                         len(self._sketch) + len(obj._sketch),
+                                         -1)
+
+
+class FrozenOnePermutationSketch(object):
+    """
+    Read-only sketch with one-permutation hashing (see
+    :class:`OnePermutationSketch`).
+
+    Empty bins are filled with the value of an other bin chosen
+    the same way for all sketches with the same number of bins
+    (densification), and the Jaccard index is estimated from the
+    fraction of bins with the same value in two sketches.
+    """
+
+    __slots__ = ('_bins', '_nsize', '_hashfun', '_seed', '_nvisited',
+                 '_nfilled', '_registers')
+
+    def __init__(self, bins, nsize: int, hashfun=hash,
+                 seed: int = None, nvisited: int = 0, registers=None):
+        """
+        Create an instance from:
+        - bins: an iterable with the lowest hash value in each bin
+          (`EMPTY_BIN` for empty bins)
+        - nsize: a kmer/ngram size
+        - hashfun: a hashing function
+        - seed: an optional seed for hashfun
+        - nvisited: the number of kmers/ngrams visited to fill the bins
+        - registers: optional HyperLogLog registers (an array of type
+          `B`, copied)
+        """
+        bins = array.array('Q', bins)
+        if len(bins) == 0:
+            raise ValueError('The number of bins must be positive.')
+        self._nfilled = len(bins) - bins.count(EMPTY_BIN)
+        _sketchcore.bins_densify(bins)
+        self._bins = bins
+        self._nsize = nsize
+        self._hashfun = hashfun
+        self._seed = seed
+        self._nvisited = nvisited
+        if registers is not None:
+            registers = array.array('B', registers)
+        self._registers = registers
+
+    @property
+    def maxsize(self):
+        """ Number of bins. """
+        return len(self._bins)
+
+    @property
+    def nsize(self):
+        """ Size of the ngrams / kmers. """
+        return self._nsize
+
+    @property
+    def nvisited(self):
+        """ Number of ngrams / kmers visited (considered for inclusion)
+        so far. """
+        return self._nvisited
+
+    @property
+    def hllprecision(self):
+        """ Precision `p` of the HyperLogLog registers (`2**p` bytes), or
+        None if the sketch does not have them. """
+        return _hll_precision(self._registers)
+
+    def __len__(self):
+        """ Number of bins that were not empty before densification. """
+        return self._nfilled
+
+    def cardinality(self) -> float:
+        """
+        Estimate of the number of distinct ngrams / kmers in the set the
+        sketch was built from (see :meth:`SetSketch.cardinality`).
+        """
+        return _hll_cardinality(self._registers)
+
+    def jaccard_estimate(self, obj):
+        """
+        Estimate of the Jaccard index between the sets this sketch and
+        an other sketch (with the same number of bins) were built from,
+        as the fraction of bins with the same value.
+        """
+        if self.maxsize != obj.maxsize:
+            raise ValueError('The sketches must have the same number '
+                             'of bins.')
+        return _sketchcore.bins_equal(self._bins, obj._bins) / self.maxsize
+
+    def mash_distance(self, obj):
+        """
+        Mash distance between this sketch and an other sketch, computed
+        from the estimate of the Jaccard index `j` (see
+        :meth:`jaccard_estimate`) and the kmer size `k` as:
+        D = -1/k * ln(2j / (1 + j))
+        """
+        return _mash_distance(self.jaccard_estimate(obj), self._nsize)
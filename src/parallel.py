@@ -2,6 +2,18 @@
 Parallelization utilities
 """
 
+import array
+import collections
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from mashingpumpkins.fastx import (DEFAULT_BLOCKSIZE, ReadStats,
+                                   _CountingReader, iter_batches,
+                                   open_fastx)
+from mashingpumpkins.minhashsketch import (CompactSketch, MinCompactSketch,
+                                           _bottomk_merge, _sorted_hashes)
+from mashingpumpkins.sequence import chunkpos_iter
+
 
 class Sketch(object):
 
@@ -39,6 +51,20 @@ class Sketch(object):
             mhs.add(sequence)
         return mhs
 
+    @staticmethod
+    def map_batch(batch):
+        """
+        - batch: a pair `(sequences, ends)` with a bytes-like object made
+          of records put one after the other and the positions where the
+          records end (see :func:`mashingpumpkins.fastx.iter_batches`)
+
+        return: a sketch
+        """
+        mhs = sketch_constructor()
+        sequences, ends = batch
+        mhs.add(sequences, ends=ends)
+        return mhs
+
     @staticmethod
     def reduce(a, b):
         """
@@ -120,3 +146,289 @@ class SketchList(object):
         for a, b in zip(alist, blist):
             a.update(b)
         return alist
+
+
+def _sketch_batch(params, batch) -> (array.array, int):
+    # Sketch a batch `(sequences, ends)` in a worker process and return
+    # the sorted hash values and the number of kmers visited.
+    cls, args = params
+    mhs = cls(*args)
+    sequences, ends = batch
+    mhs.add(sequences, ends=ends)
+    return (_sorted_hashes(mhs._heap[:mhs._lheap]), mhs.nvisited)
+
+
+def _merge_hashes(params, a, b) -> (array.array, int):
+    # Merge two results of `_sketch_batch` (or of `_merge_hashes`), with
+    # one linear merge of the sorted hash values.
+    cls, args = params
+    return (_bottomk_merge((a[0], b[0]), args[1], cls._sign), a[1] + b[1])
+
+
+class ParallelSketcher(object):
+    """
+    Build hash-only sketches (see
+    :class:`mashingpumpkins.minhashsketch.CompactSketch`) with a pool of
+    processes, or of threads, owned by the instance.
+
+    Input sequences or files are cut into work units of about `blocksize`
+    bytes, each of them sketched by a worker process that returns only
+    the hash values in its sketch (an array of 8-byte integers). These
+    partial results are merged pairwise by the workers as they come
+    back (tree reduction), and at most `2 * ncpu` work units are in
+    flight at any time.
+
+    The hashing functions in this package release the GIL while hashing,
+    which lets a pool of threads (`threads=True`) hash several work units
+    at the same time in one process. Sequences are then shared with the
+    workers rather than copied to other processes.
+
+    .. code-block:: python
+
+       with ParallelSketcher(nsize, maxsize, hashfun, seed,
+                             ncpu=8) as sketcher:
+           mhs = sketcher.sketch_sequences(sequences)
+           mhs_list = sketcher.sketch_files(filenames)
+           mhs_chromosome = sketcher.sketch_sequence(chromosome)
+    """
+
+    def __init__(self, nsize: int, maxsize: int, hashfun, seed: int,
+                 cls=MinCompactSketch, ncpu: int = None,
+                 blocksize: int = DEFAULT_BLOCKSIZE, threads: bool = False):
+        """
+        - nsize: size of the ngrams / kmers
+        - maxsize: maximum size for the sketches
+        - hashfun: function used for hashing (must be picklable when
+            using processes, like the functions `hasharray` in this
+            package)
+        - seed: a seed for hashfun
+        - cls: the class of sketches to build (a child class of
+            :class:`mashingpumpkins.minhashsketch.CompactSketch`)
+        - ncpu: number of worker processes (if None, the number of CPUs)
+        - blocksize: approximate size (in bytes) of the work units (and
+            maximum size of the chunks long sequences are cut into)
+        - threads: use threads rather than processes
+        """
+        if not (isinstance(cls, type) and issubclass(cls, CompactSketch)):
+            raise ValueError('The class of sketches must be a child class '
+                             'of CompactSketch.')
+        if blocksize < nsize:
+            raise ValueError('The block size cannot be smaller than nsize.')
+        if ncpu is None:
+            ncpu = os.cpu_count()
+        self._params = (cls, (nsize, maxsize, hashfun, seed))
+        self._ncpu = ncpu
+        self._blocksize = blocksize
+        self._threads = threads
+        if threads:
+            self._executor = ThreadPoolExecutor(max_workers=ncpu)
+        else:
+            self._executor = ProcessPoolExecutor(max_workers=ncpu)
+        # tasks submitted and not done yet (cancelled on errors)
+        self._futures = set()
+
+    @property
+    def ncpu(self) -> int:
+        """ Number of workers. """
+        return self._ncpu
+
+    @property
+    def threads(self) -> bool:
+        """ Whether the workers are threads (rather than processes). """
+        return self._threads
+
+    def close(self) -> None:
+        """ Terminate the workers. """
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            # `shutdown(cancel_futures=True)` requires Python >= 3.9
+            for future in tuple(self._futures):
+                future.cancel()
+        self._executor.shutdown(wait=True)
+
+    def _submit(self, fn, *args):
+        future = self._executor.submit(fn, *args)
+        self._futures.add(future)
+        future.add_done_callback(self._futures.discard)
+        return future
+
+    def _make_sketch(self, result) -> CompactSketch:
+        cls, args = self._params
+        hashes, nvisited = result
+        mhs = cls(*args, nvisited=nvisited)
+        # sorted unique hash values (from `_bottomk_merge`): a heap as it is
+        mhs._set_hashes(hashes)
+        return mhs
+
+    def _run(self, jobs):
+        """
+        Run work units and reduce their results.
+
+        - jobs: an iterable of pairs `(key, batch)`, with `batch` a
+            pair `(sequences, ends)` to add to the sketch for `key`, or
+            None once all batches for `key` were given.
+
+        This is a generator yielding pairs `(key, (hashes, nvisited))`
+        each time the result for a key is complete.
+        """
+        params = self._params
+        submit = self._submit
+        pending = collections.deque()
+        # key -> [tasks in flight, results to merge, all batches given]
+        states = dict()
+
+        def finished(key):
+            state = states[key]
+            if state[2] and state[0] == 0:
+                del states[key]
+                if state[1]:
+                    return (key, state[1][0])
+                else:
+                    return (key, (array.array('Q'), 0))
+            return None
+
+        def collect():
+            key, task = pending.popleft()
+            result = task.result()
+            state = states[key]
+            state[0] -= 1
+            if state[1]:
+                pending.append((key, submit(_merge_hashes, params,
+                                            state[1].pop(), result)))
+                state[0] += 1
+            else:
+                state[1].append(result)
+            return finished(key)
+
+        for key, batch in jobs:
+            state = states.setdefault(key, [0, [], False])
+            if batch is None:
+                state[2] = True
+                done = finished(key)
+                if done is not None:
+                    yield done
+                continue
+            pending.append((key, submit(_sketch_batch, params, batch)))
+            state[0] += 1
+            while len(pending) > 2 * self._ncpu:
+                done = collect()
+                if done is not None:
+                    yield done
+        while pending:
+            done = collect()
+            if done is not None:
+                yield done
+
+    def _sequence_jobs(self, sequences, key=0):
+        # Put sequences one after the other in batches of about
+        # `blocksize` bytes, and cut sequences longer than that into
+        # overlapping chunks (only copied when sent to processes).
+        blocksize = self._blocksize
+        threads = self._threads
+        nsize = self._params[1][0]
+        parts = list()
+        ends = array.array('Q')
+        size = 0
+        for sequence in sequences:
+            if len(sequence) > blocksize:
+                view = memoryview(sequence)
+                for beg, end in chunkpos_iter(nsize, len(sequence),
+                                              blocksize):
+                    chunk = view[beg:end]
+                    yield (key, (chunk if threads else bytes(chunk), None))
+                continue
+            parts.append(sequence)
+            size += len(sequence)
+            ends.append(size)
+            if size >= blocksize:
+                yield (key, (b''.join(parts), ends))
+                parts = list()
+                ends = array.array('Q')
+                size = 0
+        if parts:
+            yield (key, (b''.join(parts), ends))
+        yield (key, None)
+
+    def sketch_sequences(self, sequences) -> CompactSketch:
+        """
+        Build a sketch for sequences.
+
+        Short sequences are grouped into work units, and sequences longer
+        than `blocksize` are cut into overlapping chunks (see
+        :func:`mashingpumpkins.sequence.chunkpos_iter`) sketched by
+        different workers.
+
+        - sequences: an iterable of bytes-like objects
+
+        return: a sketch
+        """
+        for key, result in self._run(self._sequence_jobs(sequences)):
+            return self._make_sketch(result)
+
+    def sketch_sequence(self, sequence) -> CompactSketch:
+        """
+        Build a sketch for one sequence (e.g., a chromosome), cut into
+        overlapping chunks of `blocksize` bytes sketched by different
+        workers. The result is the same as with a sketch built serially
+        (no ngram / kmer is missed or counted twice at the seams).
+
+        - sequence: a bytes-like object
+
+        return: a sketch
+        """
+        return self.sketch_sequences((sequence, ))
+
+    def imap_files(self, filenames):
+        """
+        Build a sketch for each one of FASTA or FASTQ files (plain or
+        gzip-compressed). Work units from several files can be processed
+        at the same time.
+
+        - filenames: a sequence of file names
+
+        return: an iterator of triplets `(index, sketch, stats)` in the
+          order in which the sketches are complete, with `index` the
+          position of the file in `filenames` and `stats` a
+          :class:`mashingpumpkins.fastx.ReadStats`.
+        """
+        nsize = self._params[1][0]
+        # index -> [nrecords, nbytes, start time]
+        info = dict()
+
+        def jobs():
+            for i, filename in enumerate(filenames):
+                info[i] = [0, 0, time.time()]
+                with open_fastx(filename) as fh:
+                    reader = _CountingReader(fh)
+                    for sequences, ends in iter_batches(
+                            reader, blocksize=self._blocksize,
+                            overlap=nsize - 1):
+                        info[i][0] += len(ends)
+                        yield (i, (bytes(sequences),
+                                   array.array('Q', ends)))
+                info[i][1] = reader.nbytes
+                yield (i, None)
+
+        for i, result in self._run(jobs()):
+            nrecords, nbytes, t0 = info.pop(i)
+            yield (i, self._make_sketch(result),
+                   ReadStats(nrecords, nbytes, time.time() - t0))
+
+    def sketch_files(self, filenames) -> list:
+        """
+        Build a sketch for each one of FASTA or FASTQ files (see
+        :meth:`imap_files`).
+
+        - filenames: a sequence of file names
+
+        return: a list of sketches (in the order of `filenames`)
+        """
+        res = [None, ] * len(filenames)
+        for i, mhs, stats in self.imap_files(filenames):
+            res[i] = mhs
+        return res
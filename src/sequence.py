@@ -36,12 +36,8 @@ def chunkpos_iter(nsize: int, lseq: int, w: int) -> (int, int):
     assert nsize <= w
     ew = w-nsize+1
 
-    nchunks = (lseq // ew)
-
-    leftover = lseq - nchunks*ew
-
-    if leftover >= nsize:
-        nchunks += 1
+    # one chunk for every `ew` ngrams/kmers (rounded up)
+    nchunks = max(0, -(-(lseq - nsize + 1) // ew))
 
     for w_i in range(nchunks):
         slice_beg = (w_i*ew)
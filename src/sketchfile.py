@@ -0,0 +1,204 @@
+"""
+Binary files with sketches
+
+One frozen sketch per file, little-endian:
+
+- a header of :data:`HEADER_SIZE` bytes (see :data:`HEADER`): the magic
+  bytes :data:`MAGIC`, the version of the format, flags, the size of the
+  kmers, the sign (-1 for a bottom sketch, 1 for a top sketch), the
+  maximum size, the number of kmers visited, the seed, the scale (0 if
+  the sketch is not a scaled sketch), the number of hash values, the
+  number of HyperLogLog registers, and the name of the hashing function
+  (see :data:`HASHFUNS`)
+- the sorted hash values (8 bytes each)
+- the counts for the hash values, in the same order (8 bytes each; only
+  for count sketches)
+- the HyperLogLog registers (1 byte each; only if the sketch has them)
+
+:func:`load` maps the file in memory: the hash values (and the counts) are
+used where they are (no copy, and the pages are only read when needed), so
+opening a file does not depend on the size of the sketch.
+"""
+
+import array
+import mmap
+import struct
+import sys
+from mashingpumpkins import (_murmurhash3, _murmurhash3_mash, _nthash,
+                             _xxh3, _xxhash)
+from mashingpumpkins.minhashsketch import (FrozenCompactCountSketch,
+                                           FrozenCompactSketch,
+                                           FrozenCountSketch,
+                                           FrozenScaledSketch,
+                                           FrozenSketch,
+                                           _sorted_hashes)
+
+# Hashing functions, by name, as modules with a function `hasharray`.
+HASHFUNS = {
+    'murmurhash3': _murmurhash3,
+    'xxhash': _xxhash,
+    'xxh3': _xxh3,
+    'nthash': _nthash,
+    'mash': _murmurhash3_mash,
+}
+
+MAGIC = b'MPSKETCH'
+VERSION = 1
+
+# magic, version, flags, nsize, sign, maxsize, nvisited, seed, scale,
+# number of hash values, number of registers, name of the hashing
+# function (padded to 8 bytes so the hash values that follow are aligned)
+HEADER = struct.Struct('<8sHHIiQQQQQQ16s4x')
+HEADER_SIZE = HEADER.size
+
+# Flags
+FLAG_COUNTS = 1
+FLAG_REGISTERS = 2
+FLAG_SEED = 4
+
+
+def _hashname(hashfun) -> str:
+    for name, module in HASHFUNS.items():
+        if hashfun == module.hasharray:
+            return name
+    raise ValueError('The hashing function must be the function `hasharray` '
+                     'of one of: %s' % ', '.join(HASHFUNS))
+
+
+def dump(sketch: FrozenSketch, fh) -> None:
+    """
+    Write a frozen sketch to a file.
+
+    :param sketch: a :class:`mashingpumpkins.minhashsketch.FrozenSketch`
+        (or :class:`FrozenCompactSketch`, :class:`FrozenCountSketch`,
+        :class:`FrozenCompactCountSketch`, :class:`FrozenScaledSketch`)
+        built with one of the hashing functions in :data:`HASHFUNS`
+    :param fh: a file opened in binary mode
+    """
+    if not isinstance(sketch, FrozenSketch):
+        raise ValueError('Sketches of type %s cannot be written to a file '
+                         '(only frozen sketches with hash values).'
+                         % type(sketch).__name__)
+    hashname = _hashname(sketch._hashfun)
+    if isinstance(sketch, FrozenCompactSketch):
+        hashes = sketch._sketch
+    else:
+        hashes = _sorted_hashes(sketch._sketch)
+    flags = 0
+    counts = None
+    if isinstance(sketch, FrozenCompactCountSketch):
+        flags |= FLAG_COUNTS
+        counts = sketch._counts
+    elif isinstance(sketch, FrozenCountSketch):
+        flags |= FLAG_COUNTS
+        counts = array.array('Q', [sketch._count[h] for h in hashes])
+    registers = sketch._registers
+    if registers is not None:
+        flags |= FLAG_REGISTERS
+    seed = sketch._seed
+    if seed is not None:
+        flags |= FLAG_SEED
+    scale = sketch.scale if isinstance(sketch, FrozenScaledSketch) else 0
+    fh.write(HEADER.pack(MAGIC, VERSION, flags, sketch.nsize, sketch._sign,
+                         sketch.maxsize, sketch.nvisited,
+                         0 if seed is None else seed, scale,
+                         len(hashes),
+                         0 if registers is None else len(registers),
+                         hashname.encode('ascii')))
+    for values in (hashes, counts):
+        if values is None:
+            continue
+        values = array.array('Q', values)
+        if sys.byteorder != 'little':
+            values.byteswap()
+        fh.write(values)
+    if registers is not None:
+        fh.write(registers)
+
+
+def save(sketch: FrozenSketch, filename: str) -> None:
+    """
+    Write a frozen sketch to a file (see :func:`dump`).
+
+    :param sketch: a frozen sketch
+    :param filename: name of the file
+    """
+    with open(filename, 'wb') as fh:
+        dump(sketch, fh)
+
+
+def loads(buf) -> FrozenSketch:
+    """
+    Make a frozen sketch from the content of a file written by
+    :func:`dump`, using the buffer for its hash values and counts (no
+    copy).
+
+    :param buf: a bytes-like object (for example a :class:`mmap.mmap`)
+
+    :return: a :class:`FrozenCompactSketch` (or :class:`FrozenScaledSketch`
+        if the sketch is a scaled sketch, or
+        :class:`FrozenCompactCountSketch` if it has counts), with its hash
+        values (and counts) a :class:`memoryview` of format type `Q` on
+        `buf`.
+    """
+    buf = memoryview(buf).cast('B')
+    if len(buf) < HEADER_SIZE:
+        raise ValueError('Truncated sketch (no header).')
+    (magic, version, flags, nsize, sign, maxsize, nvisited, seed, scale,
+     nhashes, nregisters, hashname) = HEADER.unpack_from(buf)
+    if magic != MAGIC:
+        raise ValueError('Not a sketch (magic bytes %r).' % magic)
+    if version != VERSION:
+        raise ValueError('Version %i of the format is not supported '
+                         '(only version %i).' % (version, VERSION))
+    hashname = hashname.rstrip(b'\x00').decode('ascii')
+    if hashname not in HASHFUNS:
+        raise ValueError('Unknown hashing function "%s".' % hashname)
+    ncounts = nhashes if flags & FLAG_COUNTS else 0
+    end = HEADER_SIZE + 8 * (nhashes + ncounts) + nregisters
+    if len(buf) < end:
+        raise ValueError('Truncated sketch (%i bytes rather than %i).'
+                         % (len(buf), end))
+    offset = HEADER_SIZE
+    hashes = buf[offset:(offset + 8 * nhashes)].cast('Q')
+    offset += 8 * nhashes
+    counts = buf[offset:(offset + 8 * ncounts)].cast('Q')
+    offset += 8 * ncounts
+    registers = buf[offset:(offset + nregisters)] if nregisters else None
+    if sys.byteorder != 'little':
+        hashes = array.array('Q', hashes)
+        hashes.byteswap()
+        counts = array.array('Q', counts)
+        counts.byteswap()
+
+    kwargs = dict(hashfun=HASHFUNS[hashname].hasharray,
+                  seed=seed if flags & FLAG_SEED else None,
+                  nvisited=nvisited, registers=registers)
+    if flags & FLAG_COUNTS:
+        return FrozenCompactCountSketch(hashes, counts, nsize,
+                                        maxsize=maxsize, sign=sign,
+                                        copy=False, **kwargs)
+    elif scale:
+        return FrozenScaledSketch(hashes, nsize, scale=scale, copy=False,
+                                  **kwargs)
+    else:
+        return FrozenCompactSketch(hashes, nsize, maxsize=maxsize, sign=sign,
+                                   copy=False, **kwargs)
+
+
+def load(filename: str, use_mmap: bool = True) -> FrozenSketch:
+    """
+    Read a frozen sketch from a file written by :func:`save` or
+    :func:`dump` (see :func:`loads`).
+
+    :param filename: name of the file
+    :param use_mmap: map the file in memory (if False, the file is read)
+
+    :return: a frozen sketch
+    """
+    with open(filename, 'rb') as fh:
+        if use_mmap:
+            buf = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buf = fh.read()
+    return loads(buf)
@@ -0,0 +1,33 @@
+import pytest
+
+import random
+from mashingpumpkins import _murmurhash3
+from mashingpumpkins.minhashsketch import MinSketch
+
+
+@pytest.fixture
+def mutated_sketches():
+    """
+    Function making frozen sketches for sequences sharing more or less
+    with a random base sequence: `make(n, length, nmutations, maxsize,
+    classes)` returns `n` frozen sketches, the i-th one for the base
+    sequence of size `length` with `i * nmutations` random substitutions,
+    built with `classes[i % len(classes)]`.
+    """
+    def make(n, length, nmutations, maxsize, classes=(MinSketch, )):
+        random.seed(123)
+        base = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                        for x in range(length))
+        sketches = list()
+        for i in range(n):
+            mutated = bytearray(base)
+            for x in range(i * nmutations):
+                pos = random.randint(0, len(base)-1)
+                mutated[pos] = ord(random.choice('ATGC'))
+            cls = classes[i % len(classes)]
+            mhs = cls(21, maxsize, _murmurhash3.hasharray,
+                      _murmurhash3.DEFAULT_SEED)
+            mhs.add(bytes(mutated))
+            sketches.append(mhs.freeze())
+        return sketches
+    return make
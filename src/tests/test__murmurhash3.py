@@ -1,3 +1,4 @@
+import pytest
 import array
 from mashingpumpkins import _murmurhash3
 
@@ -12,3 +13,40 @@ def test_hasharray():
     seed = 43
     _murmurhash3.hasharray(b"ACG", nsize, buffer, seed)
     assert buffer[0] != 1731421407650554201
+
+
+def test_hasharray_threshold():
+    nsize = 3
+    sequence = b"ACGTTGCAACGGT"
+    seed = 42
+    nhash = len(sequence) - nsize + 1
+    buffer = array.array('Q', [0, ] * nhash)
+    _murmurhash3.hasharray(sequence, nsize, buffer, seed)
+    allhash = list(buffer)
+    threshold = sorted(allhash)[nhash // 2]
+
+    for direction in (-1, 1):
+        offsets = array.array('Q', [0, ] * nhash)
+        nvisited, nkept = _murmurhash3.hasharray(sequence, nsize, buffer,
+                                                 seed, threshold, direction,
+                                                 offsets)
+        assert nvisited == nhash
+        kept = [(i, h) for i, h in enumerate(allhash)
+                if (h - threshold) * direction >= 0]
+        assert nkept == len(kept)
+        assert list(zip(offsets[:nkept], buffer[:nkept])) == kept
+
+
+def test_hasharray_threshold_invalid():
+    buffer = array.array('Q', [0, ] * 10)
+    offsets = array.array('Q', [0, ] * 10)
+    # missing offsets
+    with pytest.raises(ValueError):
+        _murmurhash3.hasharray(b"ACGTACGT", 3, buffer, 42, 123, 1)
+    # invalid direction
+    with pytest.raises(ValueError):
+        _murmurhash3.hasharray(b"ACGTACGT", 3, buffer, 42, 123, 2, offsets)
+    # offsets shorter than the number of windows
+    with pytest.raises(ValueError):
+        _murmurhash3.hasharray(b"ACGTACGT", 3, buffer, 42, 123, 1,
+                               array.array('Q', [0, ]))
@@ -0,0 +1,121 @@
+import pytest
+import array
+import random
+from mashingpumpkins import _murmurhash3, _murmurhash3_mash
+from mashingpumpkins.minhashsketch import MinSketch, MinCompactSketch
+
+COMPLEMENT = bytes.maketrans(b'ACGTacgt', b'TGCAtgca')
+
+
+def _reverse_complement(sequence):
+    return sequence.translate(COMPLEMENT)[::-1]
+
+
+def _canonical_hashes(sequence, nsize, seed):
+    # hash values for the canonical kmers, computed kmer by kmer
+    res = []
+    buffer = array.array('Q', [0, ])
+    for i in range(len(sequence) - nsize + 1):
+        kmer = sequence[i:(i+nsize)]
+        _murmurhash3.hasharray(min(kmer, _reverse_complement(kmer)),
+                               nsize, buffer, seed)
+        res.append(buffer[0])
+    return res
+
+
+@pytest.mark.parametrize('nsize,length',
+                         ((1, 300), (2, 300), (3, 300), (21, 300),
+                          (31, 300), (100, 300),
+                          # reverse complement computed in several blocks
+                          (21, 9000)))
+def test_hasharray(nsize, length):
+    random.seed(123)
+    sequence = bytes(random.choices(b'ACGTNacgt', k=length))
+    seed = _murmurhash3_mash.DEFAULT_SEED
+    nhash = len(sequence) - nsize + 1
+    buffer = array.array('Q', [0, ] * nhash)
+    assert _murmurhash3_mash.hasharray(sequence, nsize, buffer) == nhash
+    assert list(buffer) == _canonical_hashes(sequence, nsize, seed)
+
+    # both strands give the same hash values
+    buffer_rc = array.array('Q', [0, ] * nhash)
+    _murmurhash3_mash.hasharray(_reverse_complement(sequence), nsize,
+                                buffer_rc)
+    assert list(buffer_rc) == list(reversed(buffer))
+
+    # same hash values as with the reverse complement given
+    _murmurhash3_mash.hasharray_withrc(sequence,
+                                       _reverse_complement(sequence),
+                                       nsize, buffer_rc, seed)
+    assert buffer_rc == buffer
+
+
+def test_hasharray_palindrome():
+    buffer = array.array('Q', [0, ])
+    _murmurhash3_mash.hasharray(b'ACGT', 4, buffer, 1)
+    ref = array.array('Q', [0, ])
+    _murmurhash3.hasharray(b'ACGT', 4, ref, 1)
+    assert buffer == ref
+
+
+def test_hasharray_threshold():
+    nsize = 5
+    sequence = b"ACGTTGCAACGGTTTACGA"
+    seed = 42
+    nhash = len(sequence) - nsize + 1
+    buffer = array.array('Q', [0, ] * nhash)
+    _murmurhash3_mash.hasharray(sequence, nsize, buffer, seed)
+    allhash = list(buffer)
+    threshold = sorted(allhash)[nhash // 2]
+
+    for direction in (-1, 1):
+        offsets = array.array('Q', [0, ] * nhash)
+        nvisited, nkept = _murmurhash3_mash.hasharray(sequence, nsize,
+                                                      buffer, seed,
+                                                      threshold, direction,
+                                                      offsets)
+        assert nvisited == nhash
+        kept = [(i, h) for i, h in enumerate(allhash)
+                if (h - threshold) * direction >= 0]
+        assert nkept == len(kept)
+        assert list(zip(offsets[:nkept], buffer[:nkept])) == kept
+
+
+def test_hasharray_invalid():
+    buffer = array.array('Q', [0, ] * 10)
+    offsets = array.array('Q', [0, ] * 10)
+    with pytest.raises(ValueError):
+        _murmurhash3_mash.hasharray(b"ACGTACGT", 0, buffer)
+    with pytest.raises(ValueError):
+        _murmurhash3_mash.hasharray(b"ACG", 4, buffer)
+    with pytest.raises(ValueError):
+        _murmurhash3_mash.hasharray(b"ACGTACGT", 3, buffer, 42, 123, 1)
+    with pytest.raises(ValueError):
+        _murmurhash3_mash.hasharray(b"ACGTACGT", 3, buffer, 42, 123, 2,
+                                    offsets)
+
+
+def test_hasharray_withrc():
+    # the strands are compared over the window only
+    sequence = b'AAATTT'
+    sequence_rc = _reverse_complement(sequence)
+    buffer = array.array('Q', [0, ] * 4)
+    _murmurhash3_mash.hasharray_withrc(sequence, sequence_rc, 3, buffer, 42)
+    assert list(buffer) == _canonical_hashes(sequence, 3, 42)
+
+
+@pytest.mark.parametrize('cls', (MinSketch, MinCompactSketch))
+def test_sketch(cls):
+    random.seed(123)
+    sequence = bytes(random.choices(b'ACGT', k=2000))
+    nsize = 21
+    maxsize = 20
+    hashfun = _murmurhash3_mash.hasharray
+    seed = _murmurhash3_mash.DEFAULT_SEED
+    mhs = cls(nsize, maxsize, hashfun, seed, hashbuffersize=100)
+    mhs.add(sequence)
+    mhs_rc = cls(nsize, maxsize, hashfun, seed)
+    mhs_rc.add(_reverse_complement(sequence))
+    ref = sorted(set(_canonical_hashes(sequence, nsize, seed)))[:maxsize]
+    assert sorted(mhs.freeze()._sketch) == ref
+    assert sorted(mhs_rc.freeze()._sketch) == ref
@@ -0,0 +1,125 @@
+import pytest
+import array
+import random
+from mashingpumpkins import _nthash, _murmurhash3
+from mashingpumpkins.minhashsketch import MinSketch, MinCompactSketch
+
+MASK = 2**64 - 1
+LETTERS = {ord('A'): 0x3c8bfbb395c60474, ord('C'): 0x3193c18562a02b4c,
+           ord('G'): 0x20323ed082572324, ord('T'): 0x295549f54be24456}
+
+
+def _rol(x, r):
+    r %= 64
+    return ((x << r) | (x >> (64 - r))) & MASK
+
+
+def _fmix64(k):
+    k ^= k >> 33
+    k = (k * 0xff51afd7ed558ccd) & MASK
+    k ^= k >> 33
+    k = (k * 0xc4ceb9fe1a85ec53) & MASK
+    k ^= k >> 33
+    return k
+
+
+def _nthash_ref(kmer, seed):
+    # hash value computed from scratch
+    fh = 0
+    for i, c in enumerate(kmer.upper()):
+        fh ^= _rol(LETTERS.get(c, 0), len(kmer) - 1 - i)
+    return _fmix64(fh ^ seed)
+
+
+def test_hasharray():
+    nsize = 3
+    buffer = array.array('Q', [0, ])
+    seed = 42
+    _nthash.hasharray(b"ACG", nsize, buffer, seed)
+    assert buffer[0] == _nthash_ref(b"ACG", seed)
+
+    _nthash.hasharray(b"ACG", nsize, buffer, 43)
+    assert buffer[0] != _nthash_ref(b"ACG", seed)
+
+    # default seed
+    _nthash.hasharray(b"ACG", nsize, buffer)
+    assert buffer[0] == _nthash_ref(b"ACG", _nthash.DEFAULT_SEED)
+
+    # lowercase
+    _nthash.hasharray(b"acg", nsize, buffer, seed)
+    assert buffer[0] == _nthash_ref(b"ACG", seed)
+
+
+@pytest.mark.parametrize('nsize', (1, 5, 31, 63, 64, 65, 130))
+def test_hasharray_rolling(nsize):
+    random.seed(123)
+    sequence = bytes(random.choices(b'ACGTN', k=300))
+    seed = 2**64 - 3
+    nhash = len(sequence) - nsize + 1
+    buffer = array.array('Q', [0, ] * nhash)
+    assert _nthash.hasharray(sequence, nsize, buffer, seed) == nhash
+    assert list(buffer) == [_nthash_ref(sequence[i:(i+nsize)], seed)
+                            for i in range(nhash)]
+
+    # buffer shorter than the number of windows
+    buffer = array.array('Q', [0, ] * 10)
+    assert _nthash.hasharray(sequence, nsize, buffer, seed) == 10
+    assert list(buffer) == [_nthash_ref(sequence[i:(i+nsize)], seed)
+                            for i in range(10)]
+
+
+def test_hasharray_threshold():
+    nsize = 3
+    sequence = b"ACGTTGCAACGGT"
+    seed = 42
+    nhash = len(sequence) - nsize + 1
+    buffer = array.array('Q', [0, ] * nhash)
+    _nthash.hasharray(sequence, nsize, buffer, seed)
+    allhash = list(buffer)
+    threshold = sorted(allhash)[nhash // 2]
+
+    for direction in (-1, 1):
+        offsets = array.array('Q', [0, ] * nhash)
+        nvisited, nkept = _nthash.hasharray(sequence, nsize, buffer,
+                                            seed, threshold, direction,
+                                            offsets)
+        assert nvisited == nhash
+        kept = [(i, h) for i, h in enumerate(allhash)
+                if (h - threshold) * direction >= 0]
+        assert nkept == len(kept)
+        assert list(zip(offsets[:nkept], buffer[:nkept])) == kept
+
+
+def test_hasharray_invalid():
+    buffer = array.array('Q', [0, ] * 10)
+    offsets = array.array('Q', [0, ] * 10)
+    with pytest.raises(ValueError):
+        _nthash.hasharray(b"ACGTACGT", 0, buffer)
+    with pytest.raises(ValueError):
+        _nthash.hasharray(b"ACG", 4, buffer)
+    with pytest.raises(ValueError):
+        _nthash.hasharray(b"ACGTACGT", 3, array.array('I', [0, ] * 10))
+    with pytest.raises(ValueError):
+        _nthash.hasharray(b"ACGTACGT", 3, buffer, 42, 123, 1)
+    with pytest.raises(ValueError):
+        _nthash.hasharray(b"ACGTACGT", 3, buffer, 42, 123, 2, offsets)
+
+
+@pytest.mark.parametrize('cls', (MinSketch, MinCompactSketch))
+def test_sketch(cls):
+    random.seed(123)
+    sequence = bytes(random.choices(b'ACGT', k=2000))
+    nsize = 31
+    maxsize = 20
+    mhs = cls(nsize, maxsize, _nthash.hasharray, _nthash.DEFAULT_SEED,
+              hashbuffersize=100)
+    mhs.add(sequence)
+    ref = sorted(set(_nthash_ref(sequence[i:(i+nsize)], _nthash.DEFAULT_SEED)
+                     for i in range(len(sequence) - nsize + 1)))[:maxsize]
+    assert sorted(mhs.freeze()._sketch) == ref
+    assert mhs.nvisited == len(sequence) - nsize + 1
+
+    # not the same values as with MurmurHash3
+    mhs_b = cls(nsize, maxsize, _murmurhash3.hasharray, 42)
+    mhs_b.add(sequence)
+    assert mhs.freeze()._sketch != mhs_b.freeze()._sketch
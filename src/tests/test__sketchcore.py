@@ -0,0 +1,504 @@
+import pytest
+
+import array
+import math
+import operator
+import random
+from collections import Counter
+from mashingpumpkins import _murmurhash3, _sketchcore
+from mashingpumpkins.minhashsketch import (_minmaxhash_add_ngrams,
+                                           make_elt)
+
+
+def _make_sequence(n):
+    return b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                    for x in range(n))
+
+
+@pytest.mark.parametrize('minmax_op,extracthash',
+                         (((-1, operator.le), lambda x: -x[0]),
+                          ((+1, operator.ge), operator.itemgetter(0))))
+def test_add_ngrams(minmax_op, extracthash):
+    random.seed(123)
+    sequence = _make_sequence(250)
+    nsize = 5
+    maxsize = 20
+    hashbuffer = array.array('Q', [0, ]*len(sequence))
+    nsubs = _murmurhash3.hasharray(sequence, nsize, hashbuffer,
+                                   _murmurhash3.DEFAULT_SEED)
+
+    new_py = list()
+    heap_py = list()
+    heapmap_py = dict()
+    heaptop_py = _minmaxhash_add_ngrams(
+        heap_py, heapmap_py, maxsize, nsize,
+        sequence, nsubs, hashbuffer, 0,
+        extracthash, make_elt, None, None, new_py.append, minmax_op)
+
+    new_c = list()
+    heap_c = list()
+    heapmap_c = dict()
+    heaptop_c = _sketchcore.add_ngrams(
+        heap_c, heapmap_c, maxsize, nsize,
+        sequence, nsubs, hashbuffer, 0,
+        extracthash, make_elt, None, None, new_c.append, minmax_op)
+
+    assert heaptop_c == heaptop_py
+    assert len(heap_c) == maxsize
+    assert heapmap_c == heapmap_py
+    assert sorted(heap_c) == sorted(heap_py)
+    assert new_c == new_py
+    for h, (signedh, ngram) in heapmap_c.items():
+        assert signedh == minmax_op[0] * h
+        assert len(ngram) == nsize
+
+
+def test_add_ngrams_update_elt():
+    random.seed(123)
+    sequence = _make_sequence(100)
+    nsize = 2
+    maxsize = 5
+    hashbuffer = array.array('Q', [0, ]*len(sequence))
+    nsubs = _murmurhash3.hasharray(sequence, nsize, hashbuffer,
+                                   _murmurhash3.DEFAULT_SEED)
+    updated_py = list()
+    _minmaxhash_add_ngrams(
+        list(), dict(), maxsize, nsize,
+        sequence, nsubs, hashbuffer, 0,
+        operator.itemgetter(0), make_elt, updated_py.append,
+        None, None, (+1, operator.ge))
+    updated_c = list()
+    _sketchcore.add_ngrams(
+        list(), dict(), maxsize, nsize,
+        sequence, nsubs, hashbuffer, 0,
+        operator.itemgetter(0), make_elt, updated_c.append,
+        None, None, (+1, operator.ge))
+    assert len(updated_c) > 0
+    assert updated_c == updated_py
+
+
+def test_add_ngrams_invalid():
+    hashbuffer = array.array('Q', [0, ]*10)
+    # more hash values than in the buffer
+    with pytest.raises(ValueError):
+        _sketchcore.add_ngrams(
+            list(), dict(), 5, 3, b'A'*12, 11, hashbuffer, 0,
+            operator.itemgetter(0), make_elt, None, None, None,
+            (+1, operator.ge))
+    # buffer of the wrong type
+    with pytest.raises(ValueError):
+        _sketchcore.add_ngrams(
+            list(), dict(), 5, 3, b'A'*12, 10, array.array('B', [0, ]*10), 0,
+            operator.itemgetter(0), make_elt, None, None, None,
+            (+1, operator.ge))
+    # invalid sign
+    with pytest.raises(ValueError):
+        _sketchcore.add_ngrams(
+            list(), dict(), 5, 3, b'A'*12, 10, hashbuffer, 0,
+            operator.itemgetter(0), make_elt, None, None, None,
+            (0, operator.ge))
+
+
+def _fmix64(k):
+    # finalization step of MurmurHash3
+    k ^= k >> 33
+    k = (k * 0xff51afd7ed558ccd) % 2**64
+    k ^= k >> 33
+    k = (k * 0xc4ceb9fe1a85ec53) % 2**64
+    return k ^ (k >> 33)
+
+
+def test_bins_add():
+    random.seed(123)
+    values = [random.randint(0, 2**64-2) for x in range(1000)]
+    nbins = 64
+    bins = array.array('Q', [2**64-1]) * nbins
+    hashbuffer = array.array('Q', values)
+    assert _sketchcore.bins_add(bins, hashbuffer, 10) is None
+    _sketchcore.bins_add(bins, hashbuffer[10:], len(values)-10)
+    expected = [2**64-1] * nbins
+    for h in values:
+        b = (h * nbins) >> 64
+        expected[b] = min(expected[b], h)
+    assert list(bins) == expected
+    # merging bins
+    bins_a = array.array('Q', [2**64-1]) * nbins
+    _sketchcore.bins_add(bins_a, hashbuffer, 500)
+    bins_b = array.array('Q', [2**64-1]) * nbins
+    _sketchcore.bins_add(bins_b, hashbuffer[500:], 500)
+    _sketchcore.bins_add(bins_a, bins_b, nbins)
+    assert bins_a == bins
+    # mixed hash values
+    bins_mixed = array.array('Q', [2**64-1]) * nbins
+    _sketchcore.bins_add(bins_mixed, hashbuffer, len(values), True)
+    expected = [2**64-1] * nbins
+    for h in map(_fmix64, values):
+        b = (h * nbins) >> 64
+        expected[b] = min(expected[b], h)
+    assert list(bins_mixed) == expected
+    with pytest.raises(ValueError):
+        _sketchcore.bins_add(bins, hashbuffer, len(values)+1)
+    with pytest.raises(ValueError):
+        _sketchcore.bins_add(array.array('B', [0, ]*10), hashbuffer, 10)
+
+
+def test_bins_densify():
+    empty = 2**64-1
+    nbins = 100
+    bins = array.array('Q', [empty]) * nbins
+    assert _sketchcore.bins_densify(bins) == 0
+    assert bins.count(empty) == nbins
+    for i in (3, 50, 51):
+        bins[i] = ((i * 2**64) // nbins) + 1
+    filled = set(bins) - set((empty, ))
+    bins_copy = array.array('Q', bins)
+    assert _sketchcore.bins_densify(bins) == nbins - 3
+    assert set(bins) == filled
+    for i in (3, 50, 51):
+        assert bins[i] == bins_copy[i]
+    # only depends on the bins that are not empty
+    _sketchcore.bins_densify(bins_copy)
+    assert bins_copy == bins
+    assert _sketchcore.bins_densify(bins) == 0
+    with pytest.raises(ValueError):
+        _sketchcore.bins_densify(array.array('B', [0, ]*10))
+
+
+def test_bins_equal():
+    empty = 2**64-1
+    a = array.array('Q', [1, 2, empty, 4, 5])
+    b = array.array('Q', [1, 3, empty, 4, 6])
+    assert _sketchcore.bins_equal(a, b) == 2
+    assert _sketchcore.bins_equal(a, a) == 4
+    with pytest.raises(ValueError):
+        _sketchcore.bins_equal(a, b[:4])
+    with pytest.raises(ValueError):
+        _sketchcore.bins_equal(a, array.array('B', [0, ]*5))
+
+
+def test_hll():
+    random.seed(123)
+    p = 10
+    for n in (0, 10, 1000, 100000):
+        values = array.array('Q', [random.randint(0, 2**64-1)
+                                   for x in range(n)])
+        registers = array.array('B', bytes(2**p))
+        assert _sketchcore.hll_add(registers, values, n) is None
+        # adding hash values again does not change the registers
+        copy = array.array('B', registers)
+        _sketchcore.hll_add(registers, values, n)
+        assert registers == copy
+        estimate = _sketchcore.hll_estimate(registers)
+        assert abs(estimate - n) <= max(1, 5 * 1.04 / math.sqrt(2**p) * n)
+    # merging registers
+    registers_a = array.array('B', bytes(2**p))
+    _sketchcore.hll_add(registers_a, values, n//2)
+    registers_b = array.array('B', bytes(2**p))
+    _sketchcore.hll_add(registers_b, values[n//2:], n - n//2)
+    assert _sketchcore.hll_merge(registers_a, registers_b) is None
+    assert registers_a == registers
+    # ranks
+    registers = array.array('B', bytes(16))
+    _sketchcore.hll_add(registers, array.array('Q', [(3 << 60) | (1 << 50),
+                                                     5 << 60]), 2)
+    assert registers[3] == 10 and registers[5] == 61
+    assert sum(registers) == 71
+
+
+def test_hll_invalid():
+    values = array.array('Q', bytes(80))
+    for registers in (array.array('B', bytes(8)),
+                      array.array('B', bytes(1000)),
+                      array.array('B', bytes(2**19)),
+                      array.array('Q', bytes(8*16))):
+        with pytest.raises(ValueError):
+            _sketchcore.hll_add(registers, values, 10)
+        with pytest.raises(ValueError):
+            _sketchcore.hll_estimate(registers)
+    registers = array.array('B', bytes(16))
+    with pytest.raises(ValueError):
+        _sketchcore.hll_add(registers, values, 11)
+    with pytest.raises(ValueError):
+        _sketchcore.hll_add(registers, array.array('B', bytes(80)), 10)
+    with pytest.raises(ValueError):
+        _sketchcore.hll_merge(registers, array.array('B', bytes(32)))
+
+
+def test_intersection_size():
+    a = array.array('Q', [1, 3, 5, 7, 2**64-1])
+    b = array.array('Q', [0, 3, 4, 7, 8, 2**64-1])
+    assert _sketchcore.intersection_size(a, b) == 3
+    assert _sketchcore.intersection_size(b, a) == 3
+    assert _sketchcore.intersection_size(a, a) == len(a)
+    assert _sketchcore.intersection_size(a, array.array('Q')) == 0
+    with pytest.raises(ValueError):
+        _sketchcore.intersection_size(a, array.array('B', [1, 3]))
+
+
+def test_sort_unique():
+    random.seed(123)
+    for n in (0, 1, 2, 1000):
+        values = [random.randint(0, 2**64-1) for x in range(n)]
+        # duplicates, and values sharing digits
+        values += values[:(n//2)] + [2**64-1, 0, 255, 256, 2**64-256]
+        hashbuffer = array.array('Q', values)
+        nunique = _sketchcore.sort_unique(hashbuffer)
+        assert hashbuffer[:nunique].tolist() == sorted(set(values))
+    hashbuffer = array.array('Q', [7, ]*10)
+    assert _sketchcore.sort_unique(hashbuffer) == 1
+    with pytest.raises(ValueError):
+        _sketchcore.sort_unique(array.array('B', [0, ]*10))
+
+
+def test_sorted_union():
+    a = array.array('Q', [1, 3, 5, 7, 2**64-1])
+    b = array.array('Q', [0, 3, 4, 7, 8])
+    out = array.array('Q', [0, ]*(len(a)+len(b)))
+    n = _sketchcore.sorted_union(a, b, out)
+    assert tuple(out[:n]) == tuple(sorted(set(a) | set(b)))
+    assert _sketchcore.sorted_union(b, a, out) == n
+    assert _sketchcore.sorted_union(a, array.array('Q'), out) == len(a)
+    assert tuple(out[:len(a)]) == tuple(a)
+    with pytest.raises(ValueError):
+        _sketchcore.sorted_union(a, b, out[:-1])
+    with pytest.raises(ValueError):
+        _sketchcore.sorted_union(a, array.array('B', [1, 3]), out)
+
+
+def test_postings_count():
+    # hash values 2 (sketches 0 and 2), 5 (sketch 1), 9 (sketches 0 and 1)
+    hashes = array.array('Q', [2, 5, 9])
+    offsets = array.array('Q', [0, 2, 3, 5])
+    ids = array.array('I', [0, 2, 1, 0, 1])
+    counts = array.array('Q', [0, ] * 3)
+    query = array.array('Q', [1, 2, 9, 10])
+    assert _sketchcore.postings_count(hashes, offsets, ids, query,
+                                      counts) == 2
+    assert tuple(counts) == (2, 1, 1)
+    assert _sketchcore.postings_count(hashes, offsets, ids,
+                                      array.array('Q'), counts) == 0
+    with pytest.raises(ValueError):
+        # identifier out of range
+        _sketchcore.postings_count(hashes, offsets, ids, query, counts[:2])
+    with pytest.raises(ValueError):
+        _sketchcore.postings_count(hashes, offsets[:-1], ids, query, counts)
+    with pytest.raises(ValueError):
+        _sketchcore.postings_count(hashes, offsets,
+                                   array.array('Q', ids), query, counts)
+
+
+def _postings(pairs):
+    hashes = array.array('Q', (h for h, i in pairs))
+    ids = array.array('I', (i for h, i in pairs))
+    offsets = array.array('Q', [0, ] * (len(pairs) + 1))
+    n = _sketchcore.postings_index(hashes, ids, offsets)
+    return (hashes[:n], offsets[:(n+1)], ids)
+
+
+def _expand(hashes, offsets, ids):
+    return [(h, ids[j]) for i, h in enumerate(hashes)
+            for j in range(offsets[i], offsets[i+1])]
+
+
+def test_postings_index():
+    random.seed(123)
+    pairs = [(random.randint(0, 50) * 2**58 + random.randint(0, 3), i)
+             for i in range(300)]
+    hashes, offsets, ids = _postings(pairs)
+    assert tuple(hashes) == tuple(sorted(set(h for h, i in pairs)))
+    # sorted by hash value, in the same order for a given hash value
+    assert _expand(hashes, offsets, ids) == sorted(pairs)
+    assert tuple(_postings([])[1]) == (0, )
+    with pytest.raises(ValueError):
+        _sketchcore.postings_index(array.array('Q', [1, 2]),
+                                   array.array('I', [0]),
+                                   array.array('Q', [0, 0, 0]))
+
+
+def test_postings_merge():
+    random.seed(123)
+    pairs_a = [(random.randint(0, 100), i) for i in range(200)]
+    pairs_b = [(random.randint(50, 150), i) for i in range(200, 300)]
+    a = _postings(pairs_a)
+    b = _postings(pairs_b)
+    hashes = array.array('Q', [0, ] * (len(a[0]) + len(b[0])))
+    offsets = array.array('Q', [0, ] * (len(hashes) + 1))
+    ids = array.array('I', [0, ] * (len(a[2]) + len(b[2])))
+    n = _sketchcore.postings_merge(*a, *b, hashes, offsets, ids)
+    assert n == len(set(h for h, i in pairs_a + pairs_b))
+    assert (_expand(hashes[:n], offsets[:(n+1)], ids) ==
+            sorted(pairs_a + pairs_b))
+    with pytest.raises(ValueError):
+        _sketchcore.postings_merge(*a, *b, hashes, offsets, ids[:-1])
+    with pytest.raises(ValueError):
+        _sketchcore.postings_merge(a[0], a[1][:-1], a[2], *b, hashes,
+                                   offsets, ids)
+
+
+@pytest.mark.parametrize('sign', (-1, 1))
+def test_bottomk_merge(sign):
+    random.seed(123)
+    values = [random.randint(0, 2**64-1) for x in range(200)]
+    a = array.array('Q', sorted(set(values[:120])))
+    b = array.array('Q', sorted(set(values[80:])))
+    out = array.array('Q', [0, ]*(len(a)+len(b)))
+    for k in (0, 1, 10, 50, 200, 500):
+        expected = sorted(sorted(set(a) | set(b), reverse=(sign > 0))[:k])
+        n = _sketchcore.bottomk_merge(a, b, k, sign, out)
+        assert out[:n].tolist() == expected
+        n = _sketchcore.bottomk_merge(b, a, k, sign, out)
+        assert out[:n].tolist() == expected
+    n = _sketchcore.bottomk_merge(a, array.array('Q'), 10, sign, out)
+    assert out[:n].tolist() == sorted(sorted(a, reverse=(sign > 0))[:10])
+    with pytest.raises(ValueError):
+        _sketchcore.bottomk_merge(a, b, 10, 0, out)
+    with pytest.raises(ValueError):
+        _sketchcore.bottomk_merge(a, b, -1, sign, out)
+    with pytest.raises(ValueError):
+        _sketchcore.bottomk_merge(a, b, 10, sign, out[:9])
+    with pytest.raises(ValueError):
+        _sketchcore.bottomk_merge(a, array.array('B', [1, 3]), 10, sign,
+                                  out)
+
+
+def test_keep_below():
+    random.seed(123)
+    values = [random.randint(0, 2**64-1) for x in range(100)]
+    threshold = 2**62
+    hashbuffer = array.array('Q', values)
+    n = _sketchcore.keep_below(hashbuffer, 90, threshold)
+    expected = [x for x in values[:90] if x <= threshold]
+    assert n == len(expected)
+    assert hashbuffer[:n].tolist() == expected
+    assert _sketchcore.keep_below(hashbuffer, 100, 2**64-1) == 100
+    with pytest.raises(ValueError):
+        _sketchcore.keep_below(hashbuffer, 101, threshold)
+    with pytest.raises(ValueError):
+        _sketchcore.keep_below(array.array('B', [0, ]*10), 10, threshold)
+
+
+@pytest.mark.parametrize('sign', (-1, 1))
+def test_bottomk_union(sign):
+    random.seed(123)
+    values = [random.randint(0, 2**64-1) for x in range(200)]
+    a = array.array('Q', sorted(set(values[:120])))
+    b = array.array('Q', sorted(set(values[80:])))
+    for k in (0, 1, 10, 50, 200, 500):
+        union = sorted(set(a) | set(b), reverse=(sign > 0))[:k]
+        shared = sum(1 for h in union if h in a and h in b)
+        expected = (shared, len(union))
+        assert _sketchcore.bottomk_union(a, b, k, sign) == expected
+        assert _sketchcore.bottomk_union(b, a, k, sign) == expected
+    assert _sketchcore.bottomk_union(a, array.array('Q'), 10, sign) == (0, 10)
+    with pytest.raises(ValueError):
+        _sketchcore.bottomk_union(a, b, 10, 0)
+    with pytest.raises(ValueError):
+        _sketchcore.bottomk_union(a, array.array('B', [1, 3]), 10, sign)
+
+
+def _counttable(capacity):
+    return (array.array('Q', bytes(8 * capacity)),
+            array.array('Q', bytes(8 * capacity)))
+
+
+@pytest.mark.parametrize('sign', (-1, 1))
+def test_counttable(sign):
+    keys, counts = _counttable(8)
+    hashes = array.array('Q', [5, 3, 5, 9, 1, 5, 3])
+    threshold = 5
+    size, n = _sketchcore.counttable_add(keys, counts, 0, hashes,
+                                         threshold, sign)
+    assert n == len(hashes)
+    expected = {h: c for h, c in Counter(hashes).items()
+                if (h <= threshold if sign < 0 else h >= threshold)}
+    assert size == len(expected)
+    out = array.array('Q', bytes(8 * 4))
+    query = array.array('Q', [5, 3, 9, 2])
+    _sketchcore.counttable_get(keys, counts, query, out)
+    assert list(out) == [expected.get(h, 0) for h in query]
+    # weights
+    size, n = _sketchcore.counttable_add(keys, counts, size,
+                                         array.array('Q', [5]),
+                                         threshold, sign,
+                                         array.array('Q', [10]))
+    _sketchcore.counttable_get(keys, counts, query, out)
+    assert out[0] == 13
+    # at most 3/4 full
+    keys, counts = _counttable(4)
+    size, n = _sketchcore.counttable_add(keys, counts, 0, hashes,
+                                         2**64-1, -1)
+    assert (size, n) == (3, 4)
+    assert _sketchcore.counttable_add(keys, counts, size, hashes[:3],
+                                      2**64-1, -1) == (3, 3)
+    # rebuild, keeping the hash values not above 3
+    newkeys, newcounts = _counttable(8)
+    assert _sketchcore.counttable_rebuild(keys, counts, newkeys, newcounts,
+                                          3, -1) == 1
+    out = array.array('Q', bytes(8 * 3))
+    _sketchcore.counttable_get(newkeys, newcounts, hashes[:3], out)
+    assert list(out) == [0, 2, 0]
+    # new table too small
+    keys, counts = _counttable(8)
+    _sketchcore.counttable_add(keys, counts, 0,
+                               array.array('Q', range(1, 6)), 2**64-1, -1)
+    with pytest.raises(ValueError):
+        _sketchcore.counttable_rebuild(keys, counts, *_counttable(4),
+                                       2**64-1, -1)
+
+
+def test_counttable_invalid():
+    keys, counts = _counttable(8)
+    hashes = array.array('Q', [1, 2])
+    # not a power of 2
+    with pytest.raises(ValueError):
+        _sketchcore.counttable_add(keys[:6], counts[:6], 0, hashes, 0, 1)
+    # mismatching lengths
+    with pytest.raises(ValueError):
+        _sketchcore.counttable_add(keys, counts[:4], 0, hashes, 0, 1)
+    # too many entries
+    with pytest.raises(ValueError):
+        _sketchcore.counttable_add(keys, counts, 7, hashes, 0, 1)
+    with pytest.raises(ValueError):
+        _sketchcore.counttable_add(keys, counts, 0, hashes, 0, 0)
+    with pytest.raises(ValueError):
+        _sketchcore.counttable_add(keys, counts, 0, hashes, 0, 1,
+                                   array.array('Q', [1]))
+    with pytest.raises(ValueError):
+        _sketchcore.counttable_get(keys, counts, hashes,
+                                   array.array('Q', [0]))
+
+
+@pytest.mark.parametrize('sign', (-1, 1))
+def test_countheap_add(sign):
+    random.seed(123)
+    hashes = array.array('Q', (random.randint(0, 50) for i in range(200)))
+    maxsize = 10
+    heap = array.array('Q', bytes(8 * maxsize))
+    # room for all the hash values (the ones leaving the heap stay in the
+    # table)
+    keys, counts = _counttable(128)
+    size, tablesize, n = _sketchcore.countheap_add(heap, 0, keys, counts, 0,
+                                                   hashes, sign)
+    assert n == len(hashes)
+    assert size == maxsize
+    expected = sorted(set(hashes), reverse=(sign > 0))[:maxsize]
+    assert sorted(heap) == sorted(expected)
+    assert heap[0] == expected[-1]
+    out = array.array('Q', bytes(8 * maxsize))
+    _sketchcore.counttable_get(keys, counts, heap, out)
+    allcounts = Counter(hashes)
+    assert list(out) == [allcounts[h] for h in heap]
+    # the table filling up stops the update
+    keys, counts = _counttable(8)
+    size, tablesize, n = _sketchcore.countheap_add(heap, 0, keys, counts, 0,
+                                                   hashes, sign)
+    assert tablesize == 6
+    assert n < len(hashes)
+    with pytest.raises(ValueError):
+        _sketchcore.countheap_add(heap, maxsize + 1, keys, counts, 0,
+                                  hashes, sign)
+    with pytest.raises(ValueError):
+        _sketchcore.countheap_add(heap, 0, keys, counts, 0, hashes, 0)
+    with pytest.raises(ValueError):
+        _sketchcore.countheap_add(array.array('B', [0, ]*maxsize), 0,
+                                  keys, counts, 0, hashes, sign)
@@ -0,0 +1,117 @@
+import pytest
+import array
+import random
+from mashingpumpkins import _xxh3
+from mashingpumpkins.minhashsketch import MinSketch, MinCompactSketch
+
+
+def _hashes(sequence, nsize, seed):
+    # hash values computed window by window
+    res = []
+    buffer = array.array('Q', [0, ])
+    for i in range(len(sequence) - nsize + 1):
+        _xxh3.hasharray(sequence[i:(i+nsize)], nsize, buffer, seed)
+        res.append(buffer[0])
+    return res
+
+
+def test_hasharray():
+    nsize = 3
+    buffer = array.array('Q', [0, ])
+    _xxh3.hasharray(b"ACG", nsize, buffer, 42)
+    h = buffer[0]
+    _xxh3.hasharray(b"ACG", nsize, buffer, 43)
+    assert buffer[0] != h
+    _xxh3.hasharray(b"ACG", nsize, buffer, 42)
+    assert buffer[0] == h
+    # 64-bit seeds
+    _xxh3.hasharray(b"ACG", nsize, buffer, 2**64 - 1)
+    assert buffer[0] != h
+
+
+@pytest.mark.parametrize('nsize', (1, 3, 8, 15, 16, 17, 31, 33, 64, 97,
+                                   129, 300))
+def test_hasharray_windows(nsize):
+    random.seed(123)
+    sequence = bytes(random.choices(b'ACGT', k=500))
+    seed = 42
+    nhash = len(sequence) - nsize + 1
+    buffer = array.array('Q', [0, ] * nhash)
+    assert _xxh3.hasharray(sequence, nsize, buffer, seed) == nhash
+    allhash = list(buffer)
+    assert allhash == _hashes(sequence, nsize, seed)
+    assert len(set(allhash)) == len(set(sequence[i:(i+nsize)]
+                                        for i in range(nhash)))
+
+    # buffer shorter than the number of windows
+    buffer = array.array('Q', [0, ] * 7)
+    assert _xxh3.hasharray(sequence, nsize, buffer, seed) == 7
+    assert list(buffer) == allhash[:7]
+
+
+def test_hasharray_threshold():
+    nsize = 3
+    sequence = b"ACGTTGCAACGGT"
+    seed = 42
+    nhash = len(sequence) - nsize + 1
+    buffer = array.array('Q', [0, ] * nhash)
+    _xxh3.hasharray(sequence, nsize, buffer, seed)
+    allhash = list(buffer)
+    threshold = sorted(allhash)[nhash // 2]
+
+    for direction in (-1, 1):
+        offsets = array.array('Q', [0, ] * nhash)
+        nvisited, nkept = _xxh3.hasharray(sequence, nsize, buffer,
+                                          seed, threshold, direction,
+                                          offsets)
+        assert nvisited == nhash
+        kept = [(i, h) for i, h in enumerate(allhash)
+                if (h - threshold) * direction >= 0]
+        assert nkept == len(kept)
+        assert list(zip(offsets[:nkept], buffer[:nkept])) == kept
+
+
+def test_hasharray_invalid():
+    buffer = array.array('Q', [0, ] * 10)
+    offsets = array.array('Q', [0, ] * 10)
+    with pytest.raises(ValueError):
+        _xxh3.hasharray(b"ACGTACGT", 0, buffer)
+    with pytest.raises(ValueError):
+        _xxh3.hasharray(b"ACG", 4, buffer)
+    with pytest.raises(ValueError):
+        _xxh3.hasharray(b"ACGTACGT", 3, array.array('I', [0, ] * 10))
+    with pytest.raises(ValueError):
+        _xxh3.hasharray(b"ACGTACGT", 3, buffer, 42, 123, 1)
+    with pytest.raises(ValueError):
+        _xxh3.hasharray(b"ACGTACGT", 3, buffer, 42, 123, 2, offsets)
+
+
+@pytest.mark.parametrize('nsize', (3, 21, 200))
+def test_hasharray128(nsize):
+    random.seed(123)
+    sequence = bytes(random.choices(b'ACGT', k=300))
+    nhash = len(sequence) - nsize + 1
+    buffer = array.array('Q', [0, ] * (2 * nhash))
+    assert _xxh3.hasharray128(sequence, nsize, buffer, 42) == nhash
+    single = array.array('Q', [0, 0])
+    for i in (0, 1, nhash - 1):
+        _xxh3.hasharray128(sequence[i:(i+nsize)], nsize, single, 42)
+        assert single == buffer[(2*i):(2*i+2)]
+    # buffer with room for fewer windows
+    buffer = array.array('Q', [0, ] * 5)
+    assert _xxh3.hasharray128(sequence, nsize, buffer, 42) == 2
+    with pytest.raises(ValueError):
+        _xxh3.hasharray128(b"ACG", 4, buffer)
+
+
+@pytest.mark.parametrize('cls', (MinSketch, MinCompactSketch))
+def test_sketch(cls):
+    random.seed(123)
+    sequence = bytes(random.choices(b'ACGT', k=2000))
+    nsize = 21
+    maxsize = 20
+    mhs = cls(nsize, maxsize, _xxh3.hasharray, _xxh3.DEFAULT_SEED,
+              hashbuffersize=100)
+    mhs.add(sequence)
+    ref = sorted(set(_hashes(sequence, nsize, _xxh3.DEFAULT_SEED)))[:maxsize]
+    assert sorted(mhs.freeze()._sketch) == ref
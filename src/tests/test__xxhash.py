@@ -0,0 +1,67 @@
+import pytest
+import array
+import random
+from mashingpumpkins import _xxhash
+
+
+def test_hasharray_seed():
+    nsize = 3
+    buffer = array.array('Q', [0, ])
+    # reference values for XXH64
+    _xxhash.hasharray(b"abc", nsize, buffer)
+    assert buffer[0] == 0x44bc2cf5ad770999
+    _xxhash.hasharray(b"abc", nsize, buffer, 0)
+    assert buffer[0] == 0x44bc2cf5ad770999
+    hashes = set()
+    for seed in (1, 2, 2**32, 2**64 - 1):
+        _xxhash.hasharray(b"abc", nsize, buffer, seed)
+        hashes.add(buffer[0])
+        # the seed is used the same way each time
+        buffer_b = array.array('Q', [0, ])
+        _xxhash.hasharray(b"abc", nsize, buffer_b, seed)
+        assert buffer_b == buffer
+    assert len(hashes) == 4
+    assert 0x44bc2cf5ad770999 not in hashes
+
+
+def test_hasharray_seeds():
+    random.seed(123)
+    sequence = bytes(random.choices(b'ACGT', k=200))
+    nsize = 21
+    nhash = len(sequence) - nsize + 1
+    seeds = (0, 1, 42, 2**64 - 1)
+    buffers = tuple(array.array('Q', [0, ] * nhash) for x in seeds)
+    assert _xxhash.hasharray_seeds(sequence, nsize, buffers, seeds) == nhash
+    for seed, buffer in zip(seeds, buffers):
+        ref = array.array('Q', [0, ] * nhash)
+        _xxhash.hasharray(sequence, nsize, ref, seed)
+        assert buffer == ref
+
+    # shortest buffer
+    buffers = (array.array('Q', [0, ] * nhash), array.array('Q', [0, ] * 5))
+    assert _xxhash.hasharray_seeds(sequence, nsize, buffers, (1, 2)) == 5
+
+    # no seed
+    assert _xxhash.hasharray_seeds(sequence, nsize, (), ()) == nhash
+
+
+def test_hasharray_seeds_invalid():
+    buffer = array.array('Q', [0, ] * 10)
+    with pytest.raises(ValueError):
+        _xxhash.hasharray_seeds(b"ACG", 4, (buffer, ), (1, ))
+    with pytest.raises(ValueError):
+        _xxhash.hasharray_seeds(b"ACGTACGT", 3, (buffer, ), (1, 2))
+    with pytest.raises(ValueError):
+        _xxhash.hasharray_seeds(b"ACGTACGT", 3,
+                                (array.array('I', [0, ] * 10), ), (1, ))
+    # read-only buffer
+    with pytest.raises(BufferError):
+        _xxhash.hasharray_seeds(b"ACGTACGT", 3, (b'1234', ), (1, ))
+    with pytest.raises(TypeError):
+        _xxhash.hasharray_seeds(b"ACGTACGT", 3, 123, (1, ))
+    with pytest.raises(OverflowError):
+        _xxhash.hasharray_seeds(b"ACGTACGT", 3, (buffer, ), (-1, ))
+    nseeds = _xxhash.MAXSEEDS + 1
+    with pytest.raises(ValueError):
+        _xxhash.hasharray_seeds(b"ACGTACGT", 3, (buffer, ) * nseeds,
+                                tuple(range(nseeds)))
@@ -0,0 +1,45 @@
+from mashingpumpkins import _murmurhash3, _xxh3, benchmark
+from mashingpumpkins.minhashsketch import MinSketch
+
+
+def test_random_sequences():
+    sequences = benchmark.random_sequences(100, 1050)
+    assert len(sequences) == 10
+    assert all(len(x) == 100 for x in sequences)
+    assert set(b''.join(sequences)) <= set(b'ACGT')
+    assert benchmark.random_sequences(100, 1050) == sequences
+    assert len(benchmark.random_sequences(100, 10)) == 1
+
+
+def test_run():
+    res = tuple(benchmark.run(lengths=(150, 1000), widths=(10, 50, 500),
+                              cls=MinSketch, total=2000, repeat=1))
+    assert tuple((x[0], x[1]) for x in res) == ((150, 50), (150, 500),
+                                                (1000, 50), (1000, 500))
+    assert all(x[2] > 0 for x in res)
+
+
+def test_run_hashfuns():
+    res = tuple(benchmark.run_hashfuns(nsizes=(21, 31),
+                                       hashmodules=(_murmurhash3, _xxh3),
+                                       length=1000, repeat=1))
+    assert tuple((x[0], x[1]) for x in res) == ((21, _murmurhash3),
+                                                (21, _xxh3),
+                                                (31, _murmurhash3),
+                                                (31, _xxh3))
+    assert all(x[2] > 0 for x in res)
+
+
+def test_main(capsys):
+    assert benchmark.main(['window', '-l', '150', '-w', '10', '50',
+                           '--total', '1000', '--repeat', '1']) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == 'length\t50'
+    assert lines[1].startswith('150\t')
+
+    assert benchmark.main(['hash', '-k', '21', '--hashfuns', 'xxhash',
+                           'xxh3', '--length', '1000', '--repeat', '1']) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == 'nsize\txxhash\txxh3'
+    assert lines[1].startswith('21\t')
+    assert len(lines) == 2
@@ -0,0 +1,93 @@
+import pytest
+
+import gzip
+import os
+import random
+from mashingpumpkins import _murmurhash3
+from mashingpumpkins.cli import main, _read_sketch, SKETCH_SUFFIX
+from mashingpumpkins.minhashsketch import MinCompactSketch
+
+
+def _write_fastq(filename, sequence, nreads, readlen=100):
+    random.seed(123)
+    with gzip.open(filename, 'wb') as fh:
+        for i in range(nreads):
+            pos = random.randint(0, len(sequence)-readlen)
+            read = sequence[pos:(pos+readlen)]
+            fh.write(b'@r%i\n%s\n+\n%s\n' % (i, read, b'I'*len(read)))
+
+
+@pytest.fixture
+def fastx_files(tmpdir):
+    random.seed(123)
+    genome = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                      for x in range(5000))
+    fn_a = str(tmpdir.join('a.fastq.gz'))
+    _write_fastq(fn_a, genome, 500)
+    fn_b = str(tmpdir.join('b.fasta'))
+    with open(fn_b, 'wb') as fh:
+        fh.write(b'>b\n' + genome[:2500] + b'\n')
+    return (fn_a, fn_b)
+
+
+@pytest.mark.parametrize('options', (('-p', '1'), ('-p', '2'),
+                                     ('-p', '2', '--threads')))
+def test_sketch(fastx_files, tmpdir, options):
+    outdir = str(tmpdir.join('sketches'))
+    res = main(['sketch', '-k', '21', '-s', '100', '--blocksize', '1000',
+                '-o', outdir] + list(options) + list(fastx_files))
+    assert res == 0
+    with gzip.open(fastx_files[0], 'rb') as fh:
+        reads = fh.read().split(b'\n')[1::4]
+    mhs_ref = MinCompactSketch(21, 100, _murmurhash3.hasharray,
+                               _murmurhash3.DEFAULT_SEED)
+    for read in reads:
+        mhs_ref.add(read)
+    fn = tmpdir.join('sketches', 'a.fastq.gz' + SKETCH_SUFFIX)
+    name, hashname, sketch = _read_sketch(str(fn))
+    assert name == 'a.fastq.gz'
+    assert hashname == 'murmurhash3'
+    assert sketch.nvisited == mhs_ref.nvisited
+    assert tuple(sketch) == tuple(mhs_ref.freeze())
+    assert sketch.nsize == 21
+    assert sketch.maxsize == 100
+    assert sketch._sign == -1
+    assert sketch._seed == _murmurhash3.DEFAULT_SEED
+
+
+def test_dist(fastx_files, tmpdir, capsys):
+    outdir = str(tmpdir.join('sketches'))
+    main(['sketch', '-s', '200', '-o', outdir] + list(fastx_files))
+    capsys.readouterr()
+    sketchfiles = [str(tmpdir.join('sketches', 'a.fastq.gz' + SKETCH_SUFFIX)),
+                   str(tmpdir.join('sketches', 'b.fasta' + SKETCH_SUFFIX))]
+    sketches = [_read_sketch(x)[2] for x in sketchfiles]
+    names = tuple(os.path.basename(x) for x in fastx_files)
+    main(['dist'] + sketchfiles)
+    lines = capsys.readouterr().out.rstrip('\n').split('\n')
+    assert len(lines) == 1
+    name_a, name_b, distance, pvalue, shared = lines[0].split('\t')
+    assert (name_a, name_b) == names
+    assert float(distance) == pytest.approx(
+        sketches[0].mash_distance(sketches[1]), rel=1e-5)
+    assert shared.endswith('/200')
+
+    outfile = str(tmpdir.join('dist.tsv'))
+    main(['dist', '--matrix', '-o', outfile] + sketchfiles)
+    with open(outfile) as fh:
+        rows = [x.rstrip('\n').split('\t') for x in fh]
+    assert rows[0] == [''] + list(names)
+    assert float(rows[1][1]) == 0
+    assert float(rows[1][2]) == pytest.approx(float(distance), rel=1e-5)
+
+
+def test_dist_invalid(fastx_files, tmpdir):
+    outdir = str(tmpdir.join('sketches'))
+    main(['sketch', '-k', '21', '-o', outdir, fastx_files[0]])
+    main(['sketch', '-k', '15', '-o', outdir, fastx_files[1]])
+    with pytest.raises(SystemExit):
+        main(['dist',
+              str(tmpdir.join('sketches', 'a.fastq.gz' + SKETCH_SUFFIX)),
+              str(tmpdir.join('sketches', 'b.fasta' + SKETCH_SUFFIX))])
+    with pytest.raises(SystemExit):
+        main(['sketch', '-k', '0', fastx_files[0]])
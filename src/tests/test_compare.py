@@ -0,0 +1,124 @@
+import pytest
+
+import array
+import math
+import random
+from mashingpumpkins import _murmurhash3
+from mashingpumpkins.compare import pack, pairwise, pairwise_blocks
+from mashingpumpkins.minhashsketch import MaxSketch, ScaledSketch
+
+
+@pytest.fixture
+def make_sketches(mutated_sketches):
+    def make(n):
+        sketches = mutated_sketches(n, 500, 10, 50)
+        # a compact frozen sketch
+        sketches.append(sketches[0].compact())
+        return sketches
+    return make
+
+
+def test_pack(make_sketches):
+    sketches = make_sketches(3)
+    hashes, offsets = pack(sketches)
+    assert len(offsets) == len(sketches) + 1
+    assert len(hashes) == sum(len(x) for x in sketches)
+    for i, sketch in enumerate(sketches):
+        assert (tuple(hashes[offsets[i]:offsets[i+1]]) ==
+                tuple(sorted(sketch._sketch)))
+
+
+@pytest.mark.parametrize('metric',
+                         ('jaccard_similarity', 'jaccard_containment',
+                          'dice_similarity', 'jaccard_estimate',
+                          'mash_distance'))
+def test_pairwise(metric, make_sketches):
+    sketches = make_sketches(5)
+    n = len(sketches)
+    out = array.array('d', [0, ]*(n*n))
+    res = pairwise(sketches, metric=metric, out=out)
+    assert res is out
+    for i in range(n):
+        for j in range(n):
+            expected = getattr(sketches[i], metric)(sketches[j])
+            assert out[i*n+j] == pytest.approx(expected)
+    if metric == 'mash_distance':
+        # no -0.0 on the diagonal
+        assert all(math.copysign(1, out[i*n+i]) == 1 for i in range(n))
+
+    # pre-packed sketches
+    out_b = array.array('d', [0, ]*(n*n))
+    if metric in ('jaccard_estimate', 'mash_distance'):
+        with pytest.raises(ValueError):
+            pairwise(pack(sketches), metric=metric, out=out_b)
+    else:
+        pairwise(pack(sketches), metric=metric, out=out_b)
+        assert out_b == out
+
+
+@pytest.mark.parametrize('metric', ('jaccard_estimate', 'mash_distance'))
+def test_pairwise_scaled(metric):
+    random.seed(123)
+    base = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                    for x in range(5000))
+    sketches = list()
+    for i in range(4):
+        mhs = ScaledSketch(21, 10, _murmurhash3.hasharray,
+                           _murmurhash3.DEFAULT_SEED)
+        mhs.add(base[(i*500):(i*500+3000)])
+        sketches.append(mhs.freeze())
+    n = len(sketches)
+    out = array.array('d', [0, ]*(n*n))
+    pairwise(sketches, metric=metric, out=out)
+    for i in range(n):
+        for j in range(n):
+            expected = getattr(sketches[i], metric)(sketches[j])
+            assert out[i*n+j] == pytest.approx(expected)
+    mhs = ScaledSketch(21, 20, _murmurhash3.hasharray,
+                       _murmurhash3.DEFAULT_SEED)
+    with pytest.raises(ValueError):
+        pairwise(sketches + [mhs.freeze()], metric=metric,
+                 out=array.array('d', [0, ]*((n+1)*(n+1))))
+
+
+def test_pairwise_numpy(make_sketches):
+    numpy = pytest.importorskip('numpy')
+    sketches = make_sketches(150)
+    n = len(sketches)
+    res = pairwise(sketches)
+    assert res.shape == (n, n)
+    assert numpy.allclose(res, res.T)
+    for i, j in ((0, 1), (3, 140), (149, 2), (n-1, 0)):
+        assert res[i, j] == pytest.approx(
+            sketches[i].jaccard_similarity(sketches[j]))
+
+    full = numpy.empty((n, n))
+    for rowbeg, colbeg, block in pairwise_blocks(sketches, blocksize=64):
+        nrows, ncols = block.shape
+        full[rowbeg:(rowbeg+nrows), colbeg:(colbeg+ncols)] = block
+    assert numpy.array_equal(full, res)
+
+    blocks = tuple(pairwise_blocks(sketches, blocksize=64, upper=True))
+    assert len(blocks) == 6
+    for rowbeg, colbeg, block in blocks:
+        assert colbeg >= rowbeg
+
+
+def test_pairwise_invalid(make_sketches):
+    sketches = make_sketches(2)
+    with pytest.raises(ValueError):
+        pairwise(sketches, metric='foo',
+                 out=array.array('d', [0, ]*9))
+    # buffer too small
+    with pytest.raises(ValueError):
+        pairwise(sketches, out=array.array('d', [0, ]*8))
+    # buffer of the wrong type
+    with pytest.raises(ValueError):
+        pairwise(sketches, out=array.array('Q', [0, ]*9))
+    # mixed bottom and top sketches
+    mhs = MaxSketch(21, 50, _murmurhash3.hasharray,
+                    _murmurhash3.DEFAULT_SEED)
+    mhs.add(b'ATGC' * 20)
+    with pytest.raises(ValueError):
+        pairwise(sketches + [mhs.freeze()], metric='mash_distance',
+                 out=array.array('d', [0, ]*9))
@@ -0,0 +1,119 @@
+import pytest
+
+import io
+from mashingpumpkins import _murmurhash3, _xxh3
+from mashingpumpkins.database import Match, SketchDatabase
+from mashingpumpkins.minhashsketch import MinCompactSketch, MinSketch
+
+
+@pytest.fixture
+def make_sketches(mutated_sketches):
+    def make(n):
+        return mutated_sketches(n, 2000, 40, 100,
+                                classes=(MinCompactSketch, MinSketch))
+    return make
+
+
+def _database():
+    return SketchDatabase(21, _murmurhash3.hasharray,
+                          _murmurhash3.DEFAULT_SEED)
+
+
+def _expected(sketches, query, metric):
+    if metric == 'containment':
+        scores = [query.jaccard_containment(x) for x in sketches]
+    else:
+        scores = [query.jaccard_similarity(x) for x in sketches]
+    return sorted(((s, i) for i, s in enumerate(scores) if s > 0),
+                  key=lambda x: (-x[0], x[1]))
+
+
+@pytest.mark.parametrize('metric', ('containment', 'jaccard'))
+def test_SketchDatabase_query(metric, make_sketches):
+    sketches = make_sketches(6)
+    db = _database()
+    assert len(db) == 0
+    assert db.query(sketches[0]) == []
+    for i, sketch in enumerate(sketches):
+        assert db.add(sketch, 'sketch %i' % i) == i
+    assert len(db) == len(sketches)
+    assert db.names == tuple('sketch %i' % i for i in range(len(sketches)))
+    for query in sketches:
+        expected = _expected(sketches, query, metric)
+        res = db.query(query, n=len(sketches), metric=metric)
+        assert [(x.score, x.id) for x in res] == expected
+        assert all(isinstance(x, Match) for x in res)
+        assert all(x.name == 'sketch %i' % x.id for x in res)
+        # one segment
+        db.consolidate()
+        assert db.query(query, n=len(sketches), metric=metric) == res
+        assert db.query(query, n=2, metric=metric) == res[:2]
+    assert db.query(sketches[0], n=1)[0].id == 0
+    assert db.query(sketches[0], n=1)[0].shared == len(sketches[0])
+
+
+def test_SketchDatabase_incremental(make_sketches):
+    sketches = make_sketches(6)
+    db = _database()
+    db_b = _database()
+    for i, sketch in enumerate(sketches):
+        db.add(sketch, str(i))
+        db_b.add(sketch, str(i))
+        # queries (new segments) between additions
+        if i % 2:
+            db.query(sketch)
+    for query in sketches:
+        assert db.query(query) == db_b.query(query)
+    db.consolidate()
+    db_b.consolidate()
+    assert len(db._segments) == len(db_b._segments) == 1
+    for a, b in zip(db._segments[0], db_b._segments[0]):
+        assert tuple(a) == tuple(b)
+
+
+@pytest.mark.parametrize('use_mmap', (True, False))
+def test_SketchDatabase_save_load(tmpdir, use_mmap, make_sketches):
+    sketches = make_sketches(6)
+    db = _database()
+    for i, sketch in enumerate(sketches[:4]):
+        db.add(sketch, 'sketch %i' % i)
+    filename = str(tmpdir.join('db'))
+    db.save(filename)
+    res = SketchDatabase.load(filename, use_mmap=use_mmap)
+    assert res.names == db.names
+    assert res.nsize == db.nsize
+    for query in sketches:
+        assert res.query(query) == db.query(query)
+    # more sketches after loading
+    for i, sketch in enumerate(sketches[4:], 4):
+        db.add(sketch, 'sketch %i' % i)
+        res.add(sketch, 'sketch %i' % i)
+    for query in sketches:
+        assert res.query(query) == db.query(query)
+    res.consolidate()
+    for query in sketches:
+        assert res.query(query) == db.query(query)
+
+
+def test_SketchDatabase_invalid(make_sketches):
+    sketches = make_sketches(2)
+    db = _database()
+    db.add(sketches[0], 'a')
+    with pytest.raises(ValueError):
+        db.query(sketches[0], metric='foo')
+    other = MinSketch(21, 100, _xxh3.hasharray, _xxh3.DEFAULT_SEED)
+    other.add(b'ATGC' * 20)
+    with pytest.raises(ValueError):
+        db.add(other.freeze(), 'b')
+    with pytest.raises(ValueError):
+        db.query(other.freeze())
+    fh = io.BytesIO()
+    db.dump(fh)
+    content = fh.getvalue()
+    assert len(SketchDatabase.loads(content)) == 1
+    with pytest.raises(ValueError):
+        SketchDatabase.loads(b'X' + content[1:])
+    with pytest.raises(ValueError):
+        SketchDatabase.loads(content[:100])
+    with pytest.raises(ValueError):
+        SketchDatabase.loads(content[:10])
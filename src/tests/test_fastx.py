@@ -0,0 +1,170 @@
+import pytest
+
+import array
+import gzip
+import io
+import random
+from mashingpumpkins import _murmurhash3, _sketchcore
+from mashingpumpkins.fastx import (add_fastx, iter_batches, open_fastx,
+                                   ReadStats)
+from mashingpumpkins.minhashsketch import (MaxSketch,
+                                           MinSketch,
+                                           MaxCompactSketch,
+                                           MinCompactSketch)
+
+
+def _make_records(n):
+    random.seed(123)
+    return [b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                     for x in range(random.choice((3, 30, 150, 1000))))
+            for i in range(n)]
+
+
+def _fasta(records, width=60):
+    return b''.join(b'>r%i some description\n' % i +
+                    b''.join(r[j:(j+width)] + b'\n'
+                             for j in range(0, len(r), width))
+                    for i, r in enumerate(records))
+
+
+def _fastq(records):
+    return b''.join(b'@r%i\n%s\n+\n%s\n' % (i, r, b'I'*len(r))
+                    for i, r in enumerate(records))
+
+
+def _parse(data, blocksize, overlap=0):
+    res = list()
+    for sequences, ends in iter_batches(io.BytesIO(data),
+                                        blocksize=blocksize,
+                                        overlap=overlap):
+        res.append((bytes(sequences), tuple(ends)))
+    return res
+
+
+@pytest.mark.parametrize('blocksize', (1, 5, 100))
+def test_iter_batches_fasta(blocksize):
+    data = b'>a\nACGT\nAC\r\n>b\n\nTTTT\n>c\nGG'
+    records = list()
+    seq = b''
+    for sequences, ends in _parse(data, blocksize, overlap=2):
+        beg = 0
+        for end in ends:
+            seq += sequences[beg:end]
+            records.append(seq)
+            seq = b''
+            beg = end
+        # incomplete record continuing in the next batch
+        # (starting with the overlap)
+        if beg < len(sequences):
+            seq += sequences[beg:(len(sequences)-2)]
+        else:
+            seq = b''
+    assert records == [b'ACGTAC', b'TTTT', b'GG']
+
+
+@pytest.mark.parametrize('blocksize', (1, 7, 1000))
+def test_iter_batches_fastq(blocksize):
+    records = _make_records(20)
+    res = _parse(_fastq(records), blocksize)
+    found = list()
+    for sequences, ends in res:
+        beg = 0
+        for end in ends:
+            found.append(sequences[beg:end])
+            beg = end
+        assert beg == len(sequences)
+    assert found == records
+
+
+def test_iter_batches_invalid():
+    with pytest.raises(ValueError):
+        _parse(b'ACGT\n', 100)
+    # no '+' line
+    with pytest.raises(ValueError):
+        _parse(b'@a\nACGT\nIIII\n@b\nA\n+\nI\n', 100)
+    # quality of the wrong length
+    with pytest.raises(ValueError):
+        _parse(b'@a\nACGT\n+\nIII\n', 100)
+    # truncated record
+    with pytest.raises(ValueError):
+        _parse(b'@a\nACGT\n', 100)
+
+
+def test_skip_boundaries():
+    nsize = 3
+    # records: [0, 4), [4, 5), [5, 10)
+    ends = array.array('Q', [4, 5, 10])
+    hashbuffer = array.array('Q', range(100, 108))
+    offsets = array.array('Q', [0, ]*8)
+    nkept, nvalid = _sketchcore.skip_boundaries(hashbuffer, offsets, 8,
+                                                False, 8, ends, 0, nsize)
+    # windows starting at 0, 1, 5, 6, 7
+    assert (nkept, nvalid) == (5, 5)
+    assert tuple(hashbuffer[:nkept]) == (100, 101, 105, 106, 107)
+    assert tuple(offsets[:nkept]) == (0, 1, 5, 6, 7)
+    # filtered hash values, in a slice starting at position 1
+    hashbuffer = array.array('Q', [200, 201, 202, 203])
+    offsets = array.array('Q', [0, 2, 4, 5])
+    nkept, nvalid = _sketchcore.skip_boundaries(hashbuffer, offsets, 4,
+                                                True, 7, ends, 1, nsize)
+    assert (nkept, nvalid) == (3, 4)
+    assert tuple(hashbuffer[:nkept]) == (200, 202, 203)
+    assert tuple(offsets[:nkept]) == (0, 4, 5)
+    with pytest.raises(ValueError):
+        _sketchcore.skip_boundaries(hashbuffer, None, 4, True, 7,
+                                    ends, 1, nsize)
+
+
+@pytest.mark.parametrize('cls',
+                         (MaxSketch, MinSketch,
+                          MaxCompactSketch, MinCompactSketch))
+@pytest.mark.parametrize('fmt', ('fasta', 'fastq', 'fastq.gz'))
+@pytest.mark.parametrize('blocksize', (7, 1000, 2**20))
+def test_add_fastx(cls, fmt, blocksize, tmpdir):
+    records = _make_records(100)
+    nsize = 21
+    maxsize = 50
+    mhs_ref = cls(nsize, maxsize, _murmurhash3.hasharray,
+                  _murmurhash3.DEFAULT_SEED)
+    for record in records:
+        mhs_ref.add(record)
+
+    data = _fastq(records) if fmt.startswith('fastq') else _fasta(records)
+    fn = str(tmpdir.join('test.%s' % fmt))
+    with (gzip.open if fmt.endswith('.gz') else open)(fn, 'wb') as fh:
+        fh.write(data)
+    with open_fastx(fn) as fh:
+        assert fh.read(1) == (b'@' if fmt.startswith('fastq') else b'>')
+
+    mhs = cls(nsize, maxsize, _murmurhash3.hasharray,
+              _murmurhash3.DEFAULT_SEED)
+    mhs_b = cls(nsize, maxsize, _murmurhash3.hasharray,
+                _murmurhash3.DEFAULT_SEED)
+    stats = add_fastx((mhs, mhs_b), fn, blocksize=blocksize,
+                      hashbuffer=array.array('Q', [0, ]*100))
+    assert stats.nrecords == len(records)
+    assert stats.nbytes == len(data)
+    for x in (mhs, mhs_b):
+        assert x.nvisited == mhs_ref.nvisited
+        assert x.freeze()._sketch == mhs_ref.freeze()._sketch
+        if hasattr(x, '_heapmap'):
+            assert x._heapmap == mhs_ref._heapmap
+
+    # file-like object
+    mhs = cls(nsize, maxsize, _murmurhash3.hasharray,
+              _murmurhash3.DEFAULT_SEED)
+    add_fastx((mhs, ), io.BytesIO(_fastq(records)))
+    assert mhs.freeze()._sketch == mhs_ref.freeze()._sketch
+
+
+def test_add_fastx_invalid():
+    sketches = (MinSketch(21, 10, _murmurhash3.hasharray, 42),
+                MinSketch(31, 10, _murmurhash3.hasharray, 42))
+    with pytest.raises(ValueError):
+        add_fastx(sketches, io.BytesIO(b'>a\nACGT\n'))
+
+
+def test_ReadStats():
+    stats = ReadStats(20853697, 754432573, 80)
+    assert stats.throughput == pytest.approx(9.43, abs=0.01)
+    assert str(stats) == '20853697 records in 1m20s (9.43 MB/s)'
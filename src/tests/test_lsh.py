@@ -0,0 +1,122 @@
+import pytest
+
+import random
+from mashingpumpkins import _murmurhash3, _xxh3
+from mashingpumpkins.lsh import (Candidate, LSHIndex, bands,
+                                 candidate_probability, signature, threshold)
+from mashingpumpkins.minhashsketch import (MinCompactSketch, MinSketch,
+                                           OnePermutationSketch)
+
+
+def _sequences(n, length=5000):
+    # groups of 3 near-duplicates (few mutations), unrelated between groups
+    random.seed(123)
+    res = list()
+    for i in range(n):
+        if i % 3 == 0:
+            base = bytes(random.choice(b'ATGC') for x in range(length))
+        mutated = bytearray(base)
+        for x in range(5):
+            mutated[random.randint(0, length-1)] = ord(random.choice('ATGC'))
+        res.append(bytes(mutated))
+    return res
+
+
+def _frozen(cls, sequence, size=200):
+    mhs = cls(21, size, _murmurhash3.hasharray, _murmurhash3.DEFAULT_SEED)
+    mhs.add(sequence)
+    return mhs.freeze()
+
+
+def test_threshold():
+    assert candidate_probability(1, 20, 5) == 1
+    assert candidate_probability(0, 20, 5) == 0
+    t = threshold(20, 5)
+    assert candidate_probability(t - 0.2, 20, 5) < 0.2
+    assert candidate_probability(t + 0.2, 20, 5) > 0.9
+    assert bands(100, threshold(20, 5)) == (20, 5)
+    for nbins in (1, 7, 100, 128):
+        nbands, nrows = bands(nbins, 0.8)
+        assert nbands * nrows == nbins
+    with pytest.raises(ValueError):
+        bands(0, 0.5)
+
+
+@pytest.mark.parametrize('cls', (MinSketch, MinCompactSketch))
+def test_signature(cls):
+    sequences = _sequences(4)
+    a, b, c, d = [_frozen(cls, x) for x in sequences]
+    sig_a = signature(a, 100)
+    assert len(sig_a) == 100
+    assert sig_a == signature(a, 100)
+    # near-duplicates share most bins, unrelated sequences almost none
+    assert sum(x == y for x, y in zip(sig_a, signature(b, 100))) > 70
+    assert sum(x == y for x, y in zip(sig_a, signature(d, 100))) < 10
+    oph = _frozen(OnePermutationSketch, sequences[0], size=100)
+    assert signature(oph, 100) == oph._bins
+    with pytest.raises(ValueError):
+        signature(oph, 50)
+
+
+@pytest.mark.parametrize('cls', (MinSketch, MinCompactSketch,
+                                 OnePermutationSketch))
+def test_LSHIndex(cls):
+    sequences = _sequences(12)
+    sketches = [_frozen(cls, x) for x in sequences]
+    index = LSHIndex(21, _murmurhash3.hasharray, _murmurhash3.DEFAULT_SEED,
+                     nbands=40, nrows=5)
+    assert index.nbands == 40 and index.nrows == 5
+    assert index.threshold == threshold(40, 5)
+    for i, sketch in enumerate(sketches):
+        assert index.add(sketch, 'sketch %i' % i) == i
+    assert len(index) == len(sketches)
+    assert index.names[1] == 'sketch 1'
+    for i, sketch in enumerate(sketches):
+        group = set(range(i - i % 3, i - i % 3 + 3))
+        assert index.candidates(sketch) == group
+        res = index.query(sketch)
+        assert set(x.id for x in res) == group
+        assert all(isinstance(x, Candidate) for x in res)
+        assert res[0] == Candidate(i, 'sketch %i' % i, 1.0)
+        assert [x.score for x in res] == sorted((x.score for x in res),
+                                                reverse=True)
+        assert index.query(sketch, minscore=1.0) == res[:1]
+    pairs = index.pairs()
+    assert ([(i, j) for i, j, score in pairs] ==
+            [(i, j) for i in range(len(sketches))
+             for j in range(i + 1, len(sketches)) if i // 3 == j // 3])
+    for i, j, score in pairs:
+        assert score == sketches[i].jaccard_estimate(sketches[j])
+    assert index.pairs(minscore=1.1) == []
+
+
+def test_LSHIndex_metrics():
+    sketches = [_frozen(MinSketch, x) for x in _sequences(3)]
+    index = LSHIndex(21, _murmurhash3.hasharray, _murmurhash3.DEFAULT_SEED)
+    for sketch in sketches:
+        index.add(sketch)
+    res = index.query(sketches[0], metric='jaccard_similarity')
+    assert res[1].score == sketches[0].jaccard_similarity(
+        sketches[res[1].id])
+    assert res[1].name is None
+    with pytest.raises(ValueError):
+        index.query(sketches[0], metric='mash_distance')
+    oph = _frozen(OnePermutationSketch, _sequences(1)[0], size=100)
+    index_oph = LSHIndex(21, _murmurhash3.hasharray,
+                         _murmurhash3.DEFAULT_SEED)
+    index_oph.add(oph)
+    with pytest.raises(ValueError):
+        # no method jaccard_similarity
+        index_oph.query(oph, metric='jaccard_similarity')
+
+
+def test_LSHIndex_invalid():
+    with pytest.raises(ValueError):
+        LSHIndex(21, _murmurhash3.hasharray, nbands=0)
+    index = LSHIndex(21, _murmurhash3.hasharray, _murmurhash3.DEFAULT_SEED)
+    other = MinSketch(21, 100, _xxh3.hasharray, _xxh3.DEFAULT_SEED)
+    other.add(b'ATGC' * 20)
+    with pytest.raises(ValueError):
+        index.add(other.freeze())
+    with pytest.raises(ValueError):
+        index.candidates(other.freeze())
@@ -1,15 +1,33 @@
 import pytest
 
+import math
 import random
+import threading
 import array
 from collections import Counter
 from mashingpumpkins import _murmurhash3, _xxhash
-from mashingpumpkins.minhashsketch import (MaxSketch,
+from mashingpumpkins.minhashsketch import (_binomial_sf,
+                                           add_seeds,
+                                           merge,
+                                           hashbuffer_size,
+                                           MaxSketch,
                                            MaxCountSketch,
+                                           MaxCompactSketch,
+                                           MaxCompactCountSketch,
+                                           CompactCountSketch,
                                            FrozenSketch,
                                            FrozenCountSketch,
+                                           FrozenCompactCountSketch,
+                                           FrozenCompactSketch,
+                                           FrozenOnePermutationSketch,
+                                           FrozenScaledSketch,
                                            MinSketch,
-                                           MinCountSketch)
+                                           MinCountSketch,
+                                           MinCompactSketch,
+                                           MinCompactCountSketch,
+                                           OnePermutationSketch,
+                                           ScaledSketch,
+                                           EMPTY_BIN)
 
 
 def _allngramshashed(sequence, nsize, hashfun, seed, hashreverse):
@@ -128,6 +146,29 @@ def test_MinMaxSketch_shorter_than_buffer(cls):
         _test_MinMaxSketch_add(sequence, nsize, maxsize, hashfun, seed, cls)
 
 
+@pytest.mark.parametrize('cls', (MinSketch, MaxSketch))
+def test_MinMaxSketch_prefilter(cls):
+    # sequence spanning several hash buffers, for which the sketch is full
+    # (hashing functions then filter with the top of the heap)
+    random.seed(123)
+    sequence = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                        for x in range(2000))
+    for hashfun, seed in ((_murmurhash3.hasharray,
+                           _murmurhash3.DEFAULT_SEED),
+                          (_xxhash.hasharray,
+                           _xxhash.DEFAULT_SEED)):
+        nsize = 21
+        maxsize = 10
+        _test_MinMaxSketch_add(sequence, nsize, maxsize, hashfun, seed, cls)
+        # check that the ngrams are matching the hash values
+        mhs = cls(nsize, maxsize, hashfun, seed)
+        mhs.add(sequence)
+        hbuffer = array.array('Q', [0, ])
+        for h, (signedh, ngram) in mhs._heapmap.items():
+            hashfun(ngram, nsize, hbuffer, seed)
+            assert hbuffer[0] == h
+
+
 def _test_MinMaxSketch_update(sequence, maxsize, methodname, cls):
     # set the hashing function, size of ngrams, max size for the minhash sketch
     hashfun = _murmurhash3.hasharray
@@ -417,6 +458,793 @@ def test_CountSketch_update(cls, reverse):
         assert allcounthash[h] == value
 
 
+@pytest.mark.parametrize('cls,srccls',
+                         ((MinCountSketch, MinSketch),
+                          (MaxCountSketch, MaxSketch),
+                          (MinCompactCountSketch, MinCompactSketch),
+                          (MaxCompactCountSketch, MaxCompactSketch)))
+def test_CountSketch_heap(cls, srccls):
+    random.seed(123)
+    sequence = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                        for x in range(300))
+    hashfun = _murmurhash3.hasharray
+    seed = _murmurhash3.DEFAULT_SEED
+    nsize = 5
+    maxsize = 10
+    src = srccls(nsize, maxsize, hashfun, seed)
+    src.add(sequence[:200])
+    # the content of the heap of the source sketch
+    if issubclass(cls, CompactCountSketch):
+        mhs = cls(nsize, maxsize, hashfun, seed,
+                  hashes=src._heap[:src._lheap], nvisited=src.nvisited)
+    else:
+        mhs = cls(nsize, maxsize, hashfun, seed, heap=list(src._heap),
+                  nvisited=src.nvisited)
+    assert len(mhs) == maxsize
+    assert set(mhs.freeze()._sketch) == set(src.freeze()._sketch)
+    assert mhs._count == Counter(src.freeze()._sketch)
+    for h in src.freeze()._sketch:
+        assert h in mhs
+    # adding to it and merging
+    mhs.add(sequence[200:])
+    src.add(sequence[200:])
+    assert set(mhs.freeze()._sketch) == set(src.freeze()._sketch)
+    other = cls(nsize, maxsize, hashfun, seed)
+    other.add(sequence[::-1])
+    mhs.update(other)
+    src.update(other)
+    assert set(mhs.freeze()._sketch) == set(src.freeze()._sketch)
+    assert len(mhs) == maxsize
+
+
+@pytest.mark.parametrize('cls', (MinCountSketch, MaxCountSketch,
+                                 MinCompactCountSketch,
+                                 MaxCompactCountSketch))
+def test_CountSketch_add_hashvalues(cls):
+    hashfun = _murmurhash3.hasharray
+    seed = _murmurhash3.DEFAULT_SEED
+    mhs = cls(2, 3, hashfun, seed)
+    mhs.add_hashvalues((5, 1, 5, 9, 3, 1, 5))
+    if cls._sign < 0:
+        assert mhs._count == Counter({1: 2, 3: 1, 5: 3})
+    else:
+        assert mhs._count == Counter({3: 1, 5: 3, 9: 1})
+    assert mhs.nvisited == 0
+
+
+@pytest.mark.parametrize('cls,reverse', ((MinCompactCountSketch, False),
+                                         (MaxCompactCountSketch, True)))
+@pytest.mark.parametrize('hashfun,seed',
+                         ((_murmurhash3.hasharray, _murmurhash3.DEFAULT_SEED),
+                          (_xxhash.hasharray, _xxhash.DEFAULT_SEED)))
+@pytest.mark.parametrize('maxsize', (10, 500))
+def test_CompactCountSketch_add(cls, reverse, hashfun, seed, maxsize):
+    random.seed(123)
+    # sequence with repeated kmers
+    sequence = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                        for x in range(2000))
+    sequence = sequence + sequence[:500] * 3
+    nsize = 7
+
+    allcounthash = Counter(h for h, ngram in
+                           _allngramshashed(sequence, nsize, hashfun, seed,
+                                            reverse))
+    kept = sorted(allcounthash, reverse=reverse)[:maxsize]
+
+    mhs = cls(nsize, maxsize, hashfun, seed)
+    # small hash buffer: many chunks, and the table of counts is rebuilt
+    mhs.add(sequence, hashbuffer=array.array('Q', bytes(8 * 64)))
+    assert mhs.nvisited == len(sequence) - nsize + 1
+    assert sorted(mhs) == sorted(kept)
+    assert mhs._count == Counter({h: allcounthash[h] for h in kept})
+
+    fmhs = mhs.freeze()
+    assert isinstance(fmhs, FrozenCompactCountSketch)
+    assert tuple(fmhs) == tuple(sorted(kept))
+    assert tuple(fmhs._counts) == tuple(allcounthash[h] for h in fmhs)
+    # the frozen sketch is not changed by later counts
+    mhs.add(sequence[:500])
+    assert tuple(fmhs._counts) == tuple(allcounthash[h] for h in fmhs)
+
+    # same sketch from the hash values and their counts
+    mhs_b = cls(nsize, maxsize, hashfun, seed,
+                hashes=allcounthash.keys(), counts=allcounthash.values())
+    assert mhs_b._count == Counter({h: allcounthash[h] for h in kept})
+
+    # update
+    i = len(sequence) // 2
+    mhs_a = cls(nsize, maxsize, hashfun, seed)
+    mhs_a.add(sequence[:i])
+    mhs_b = cls(nsize, maxsize, hashfun, seed)
+    mhs_b.add(sequence[(i-nsize+1):])
+    mhs_a.update(mhs_b)
+    assert mhs_a._count == Counter({h: allcounthash[h] for h in kept})
+    mhs_c = mhs_b + mhs_b
+    assert mhs_c._count == Counter({h: 2 * v
+                                    for h, v in mhs_b._count.items()})
+
+
+def test_CompactCountSketch_invalid():
+    hashfun = _murmurhash3.hasharray
+    seed = _murmurhash3.DEFAULT_SEED
+    with pytest.raises(ValueError):
+        MinCompactCountSketch(2, 10, hashfun, seed, hashes=(1, 2),
+                              counts=(1, ))
+    with pytest.raises(ValueError):
+        MinCompactCountSketch(2, 10, hashfun, seed, counts=(1, ))
+    mhs = MinCompactCountSketch(2, 10, hashfun, seed)
+    # no counts in the other sketch
+    with pytest.raises(ValueError):
+        mhs.update(MinCompactSketch(2, 10, hashfun, seed))
+    with pytest.raises(ValueError):
+        mhs.update(MaxCompactCountSketch(2, 10, hashfun, seed))
+
+
+@pytest.mark.parametrize('cls,refcls',
+                         ((MinCompactSketch, MinSketch),
+                          (MaxCompactSketch, MaxSketch)))
+def test_CompactSketch_add(cls, refcls):
+    random.seed(123)
+    sequence = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                        for x in range(1000))
+    nsize = 21
+    for hashfun, seed in ((_murmurhash3.hasharray,
+                           _murmurhash3.DEFAULT_SEED),
+                          (_xxhash.hasharray,
+                           _xxhash.DEFAULT_SEED)):
+        for maxsize in (10, 2000):
+            mhs = cls(nsize, maxsize, hashfun, seed)
+            assert len(mhs) == 0
+            mhs.add(sequence)
+            ref = refcls(nsize, maxsize, hashfun, seed)
+            ref.add(sequence)
+            assert mhs.nvisited == ref.nvisited
+            assert len(mhs) == len(ref)
+            assert tuple(mhs) == tuple(sorted(ref._heapmap))
+            for h in ref._heapmap:
+                assert h in mhs
+            assert 123 not in mhs
+
+            fmhs = mhs.freeze()
+            assert tuple(fmhs) == tuple(sorted(ref._heapmap))
+            assert fmhs.nvisited == ref.nvisited
+
+
+@pytest.mark.parametrize('cls', (MinCompactSketch, MaxCompactSketch))
+def test_CompactSketch_update(cls):
+    random.seed(123)
+    sequence = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                        for x in range(500))
+    hashfun = _murmurhash3.hasharray
+    seed = _murmurhash3.DEFAULT_SEED
+    nsize = 21
+    maxsize = 10
+    mhs = cls(nsize, maxsize, hashfun, seed)
+    mhs.add(sequence)
+
+    i = len(sequence)//2
+    mhs_a = cls(nsize, maxsize, hashfun, seed)
+    mhs_a.add(sequence[:i])
+    mhs_b = cls(nsize, maxsize, hashfun, seed)
+    mhs_b.add(sequence[(i-nsize+1):])
+
+    mhs_ab = mhs_a + mhs_b
+    assert mhs_ab.nvisited == mhs.nvisited
+    assert tuple(mhs_ab) == tuple(mhs)
+
+    mhs_a.update(mhs_b)
+    assert mhs_a.nvisited == mhs.nvisited
+    assert tuple(mhs_a) == tuple(mhs)
+
+    # mismatching objects
+    with pytest.raises(ValueError):
+        mhs_a.update(cls(nsize+1, maxsize, hashfun, seed))
+    with pytest.raises(ValueError):
+        mhs_a.update(cls(nsize, maxsize, hashfun, seed+1))
+    with pytest.raises(ValueError):
+        mhs_a.update(MinSketch(nsize, maxsize, hashfun, seed))
+    other = MaxCompactSketch if cls is MinCompactSketch else MinCompactSketch
+    with pytest.raises(ValueError):
+        mhs_a.update(other(nsize, maxsize, hashfun, seed))
+
+    # initialization with hash values
+    mhs_c = cls(nsize, maxsize, hashfun, seed, hashes=tuple(mhs))
+    assert tuple(mhs_c) == tuple(mhs)
+    # hash values merged are found in the sketch (table rebuilt)
+    mhs_c = cls(nsize, maxsize, hashfun, seed)
+    mhs_c.update(mhs)
+    mhs_c.add_hashvalues(tuple(mhs))
+    assert tuple(mhs_c) == tuple(mhs)
+
+
+@pytest.mark.parametrize('cls', (MinCompactSketch, MaxCompactSketch))
+def test_CompactSketch_contains(cls):
+    hashfun = _murmurhash3.hasharray
+    seed = _murmurhash3.DEFAULT_SEED
+    random.seed(123)
+    values = [random.randint(0, 2**64-1) for i in range(1000)]
+    mhs = cls(21, 10, hashfun, seed)
+    for i in range(0, len(values), 100):
+        mhs.add_hashvalues(values[i:(i+100)] * 2)
+    kept = sorted(values, reverse=(cls is MaxCompactSketch))[:10]
+    assert tuple(mhs) == tuple(sorted(kept))
+    # hash values that left the heap (possibly still in the table of
+    # counts) are not in the sketch
+    for h in values:
+        assert (h in mhs) == (h in kept)
+    assert -1 not in mhs
+    assert 2**64 not in mhs
+
+
+@pytest.mark.parametrize('cls,refcls',
+                         ((MinCompactSketch, MinSketch),
+                          (MaxCompactSketch, MaxSketch)))
+def test_CompactSketch_ngrams(cls, refcls):
+    random.seed(123)
+    sequence = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                        for x in range(1000))
+    nsize = 21
+    maxsize = 10
+    for hashfun in (_murmurhash3.hasharray,
+                    lambda *args: _murmurhash3.hasharray(*args[:4])):
+        seed = _murmurhash3.DEFAULT_SEED
+        mhs = cls(nsize, maxsize, hashfun, seed)
+        mhs.add(sequence)
+        ref = refcls(nsize, maxsize, hashfun, seed)
+        ref.add(sequence)
+        ngrams = dict(mhs.ngrams(sequence))
+        assert ngrams == dict((h, ngram)
+                              for h, (x, ngram) in ref._heapmap.items())
+
+    mhs = cls(nsize, maxsize, hashfun, seed)
+    assert tuple(mhs.ngrams(sequence)) == ()
+
+
+def test_hashbuffer_size():
+    assert hashbuffer_size(150, 21, 1000) == 150
+    assert hashbuffer_size(10, 21, 1000) == 21
+    # 2000 - 21 + 1 kmers in 3 windows
+    assert hashbuffer_size(2000, 21, 1000) == 660 + 20
+    assert hashbuffer_size(1000, 21, 1000) == 1000
+    assert hashbuffer_size(1001, 21, 1000) == 491 + 20
+    with pytest.raises(ValueError):
+        hashbuffer_size(1000, 21, 20)
+
+
+@pytest.mark.parametrize('cls',
+                         (MinSketch, MaxSketch, MinCountSketch,
+                          MinCompactSketch, MaxCompactSketch))
+def test_Sketch_hashbuffersize(cls):
+    random.seed(123)
+    sequence = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                        for x in range(2000))
+    nsize = 21
+    maxsize = 10
+    hashfun = _murmurhash3.hasharray
+    seed = _murmurhash3.DEFAULT_SEED
+    ref = cls(nsize, maxsize, hashfun, seed)
+    ref.add(sequence)
+    for hashbuffersize in (21, 22, 41, 100, 1999, 2000, 5000):
+        mhs = cls(nsize, maxsize, hashfun, seed,
+                  hashbuffersize=hashbuffersize)
+        assert mhs.hashbuffersize == hashbuffersize
+        mhs.add(sequence)
+        assert mhs.nvisited == ref.nvisited
+        assert mhs.freeze()._sketch == ref.freeze()._sketch
+        # the configuration is kept when adding sketches
+        assert (mhs + ref).hashbuffersize == hashbuffersize
+    # explicit buffer
+    mhs = cls(nsize, maxsize, hashfun, seed)
+    mhs.add(sequence, array.array('Q', [0, ]*100))
+    assert mhs.freeze()._sketch == ref.freeze()._sketch
+
+    with pytest.raises(ValueError):
+        cls(nsize, maxsize, hashfun, seed, hashbuffersize=20)
+    with pytest.raises(ValueError):
+        mhs.add(sequence, array.array('Q', [0, ]*20))
+
+
+@pytest.mark.parametrize('cls', (MinSketch, MinCompactSketch))
+def test_Sketch_add_threads(cls):
+    random.seed(123)
+    sequences = [b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                          for x in range(5000 + i))
+                 for i in range(4)]
+    nsize = 21
+    maxsize = 50
+    hashfun = _murmurhash3.hasharray
+    seed = _murmurhash3.DEFAULT_SEED
+    refs = []
+    for sequence in sequences:
+        ref = cls(nsize, maxsize, hashfun, seed, hashbuffersize=100)
+        ref.add(sequence)
+        refs.append(ref)
+    # each thread uses its own buffers
+    sketches = [cls(nsize, maxsize, hashfun, seed, hashbuffersize=100)
+                for x in sequences]
+
+    def add(mhs, sequence):
+        for i in range(20):
+            mhs.add(sequence)
+
+    threads = [threading.Thread(target=add, args=x)
+               for x in zip(sketches, sequences)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for mhs, ref in zip(sketches, refs):
+        assert mhs.freeze()._sketch == ref.freeze()._sketch
+
+
+@pytest.mark.parametrize('cls', (MinSketch, MaxSketch,
+                                 MinCompactSketch, MaxCompactSketch,
+                                 ScaledSketch, OnePermutationSketch))
+def test_merge(cls):
+    random.seed(123)
+    sequence = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                        for x in range(2000))
+    hashfun = _murmurhash3.hasharray
+    seed = _murmurhash3.DEFAULT_SEED
+    nsize = 21
+    maxsize = 20
+    mhs = cls(nsize, maxsize, hashfun, seed)
+    mhs.add(sequence)
+
+    # overlapping parts, and an empty sketch
+    parts = list()
+    for beg in range(0, len(sequence), 300):
+        part = cls(nsize, maxsize, hashfun, seed)
+        part.add(sequence[beg:(beg+300+nsize-1)])
+        parts.append(part)
+    parts.append(cls(nsize, maxsize, hashfun, seed))
+    nvisited = sum(x.nvisited for x in parts)
+
+    res = merge(parts)
+    assert type(res) is cls
+    assert res.nvisited == nvisited
+    assert tuple(res) == tuple(mhs)
+    assert len(res) == len(mhs)
+
+    res = cls(nsize, maxsize, hashfun, seed)
+    res.update_many(parts[:3])
+    res.update_many(iter(parts[3:]))
+    assert res.nvisited == nvisited
+    assert tuple(res) == tuple(mhs)
+
+    # the merged sketch can be added to
+    res.add(sequence[:100])
+    assert tuple(res) == tuple(mhs)
+
+    with pytest.raises(ValueError):
+        merge([])
+    with pytest.raises(ValueError):
+        res.update_many([parts[0], cls(nsize+1, maxsize, hashfun, seed)])
+
+
+def test_OnePermutationSketch():
+    random.seed(123)
+    sequence = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                        for x in range(1000))
+    nsize = 21
+    hashfun = _murmurhash3.hasharray
+    seed = _murmurhash3.DEFAULT_SEED
+    allhash = _allngramshashed(sequence, nsize, hashfun, seed, False)
+    for nbins in (1, 10, 2000):
+        mhs = OnePermutationSketch(nsize, nbins, hashfun, seed)
+        assert len(mhs) == 0
+        mhs.add(sequence, hashbuffer=array.array('Q', [0, ]*100))
+        assert mhs.nvisited == len(allhash)
+        expected = dict()
+        for h, ngram in allhash:
+            b = (h * nbins) >> 64
+            expected[b] = min(expected.get(b, h), h)
+        assert len(mhs) == len(expected)
+        assert tuple(mhs) == tuple(sorted(expected.values()))
+        for h in expected.values():
+            assert h in mhs
+        assert 123 not in mhs
+        assert EMPTY_BIN not in mhs
+
+    # records one after the other
+    mhs = OnePermutationSketch(nsize, 100, hashfun, seed)
+    mhs.add(sequence[:500])
+    mhs.add(sequence[500:])
+    mhs_ends = OnePermutationSketch(nsize, 100, hashfun, seed)
+    mhs_ends.add(sequence, ends=array.array('Q', [500, 1000]))
+    assert mhs_ends.nvisited == mhs.nvisited
+    assert tuple(mhs_ends) == tuple(mhs)
+
+    with pytest.raises(ValueError):
+        OnePermutationSketch(nsize, 0, hashfun, seed)
+    with pytest.raises(ValueError):
+        OnePermutationSketch(nsize, 10, hashfun, seed, bins=(1, 2))
+
+
+def test_OnePermutationSketch_update():
+    random.seed(123)
+    sequence = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                        for x in range(500))
+    hashfun = _murmurhash3.hasharray
+    seed = _murmurhash3.DEFAULT_SEED
+    nsize = 21
+    nbins = 50
+    mhs = OnePermutationSketch(nsize, nbins, hashfun, seed)
+    mhs.add(sequence)
+
+    i = len(sequence)//2
+    mhs_a = OnePermutationSketch(nsize, nbins, hashfun, seed)
+    mhs_a.add(sequence[:i])
+    mhs_b = OnePermutationSketch(nsize, nbins, hashfun, seed)
+    mhs_b.add(sequence[(i-nsize+1):])
+
+    mhs_ab = mhs_a + mhs_b
+    assert mhs_ab.nvisited == mhs.nvisited
+    assert tuple(mhs_ab) == tuple(mhs)
+
+    mhs_a.update(mhs_b)
+    assert mhs_a.nvisited == mhs.nvisited
+    assert tuple(mhs_a) == tuple(mhs)
+
+    mhs_c = OnePermutationSketch(nsize, nbins, hashfun, seed)
+    mhs_c.add_hashvalues(mhs)
+    assert tuple(mhs_c) == tuple(mhs)
+    mhs_d = OnePermutationSketch(nsize, nbins, hashfun, seed,
+                                 bins=mhs._bins)
+    assert tuple(mhs_d) == tuple(mhs)
+
+    # mismatching objects
+    for other in (OnePermutationSketch(nsize, nbins+1, hashfun, seed),
+                  OnePermutationSketch(nsize+1, nbins, hashfun, seed),
+                  OnePermutationSketch(nsize, nbins, hashfun, seed+1),
+                  MinCompactSketch(nsize, nbins, hashfun, seed)):
+        with pytest.raises(ValueError):
+            mhs_a.update(other)
+
+
+def test_FrozenOnePermutationSketch():
+    random.seed(123)
+    sequence = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                        for x in range(20000))
+    hashfun = _murmurhash3.hasharray
+    seed = _murmurhash3.DEFAULT_SEED
+    nsize = 21
+    nbins = 1000
+    mhs_a = OnePermutationSketch(nsize, nbins, hashfun, seed)
+    mhs_a.add(sequence[:12000])
+    mhs_b = OnePermutationSketch(nsize, nbins, hashfun, seed)
+    mhs_b.add(sequence[8000:])
+    # sparse sketch, filled by densification
+    mhs_c = OnePermutationSketch(nsize, nbins, hashfun, seed)
+    mhs_c.add(sequence[:300])
+
+    fmhs_a = mhs_a.freeze()
+    fmhs_b = mhs_b.freeze()
+    fmhs_c = mhs_c.freeze()
+    assert fmhs_a.maxsize == nbins
+    assert fmhs_a.nsize == nsize
+    assert fmhs_a.nvisited == mhs_a.nvisited
+    assert len(fmhs_a) == len(mhs_a)
+    assert len(fmhs_c) == len(mhs_c) < nbins
+    assert EMPTY_BIN not in fmhs_c._bins
+    assert fmhs_a.jaccard_estimate(fmhs_a) == 1
+    assert fmhs_c.jaccard_estimate(fmhs_c) == 1
+    assert fmhs_a.mash_distance(fmhs_a) == 0
+    assert math.copysign(1, fmhs_a.mash_distance(fmhs_a)) == 1
+
+    def jaccard(x, y):
+        return len(set(x) & set(y)) / len(set(x) | set(y))
+    kmers = [sequence[i:(i+nsize)] for i in range(len(sequence)-nsize+1)]
+    for fx, fy, expected in ((fmhs_a, fmhs_b,
+                              jaccard(kmers[:12000-nsize+1], kmers[8000:])),
+                             (fmhs_a, fmhs_c,
+                              jaccard(kmers[:12000-nsize+1],
+                                      kmers[:300-nsize+1]))):
+        j = fx.jaccard_estimate(fy)
+        assert j == fy.jaccard_estimate(fx)
+        assert abs(j - expected) < 0.05
+        assert fx.mash_distance(fy) == pytest.approx(
+            -math.log(2 * j / (1 + j)) / nsize)
+
+    # empty sketch
+    fmhs_e = OnePermutationSketch(nsize, nbins, hashfun, seed).freeze()
+    assert len(fmhs_e) == 0
+    assert fmhs_e.jaccard_estimate(fmhs_a) == 0
+    assert fmhs_e.mash_distance(fmhs_a) == 1
+
+    with pytest.raises(ValueError):
+        fmhs_a.jaccard_estimate(
+            OnePermutationSketch(nsize, nbins+1, hashfun, seed).freeze())
+    with pytest.raises(ValueError):
+        FrozenOnePermutationSketch((), nsize)
+
+
+def _hasharray_nofilter(input, width, buffer, seed):
+    # hashing function without the optional filtering arguments
+    return _murmurhash3.hasharray(input, width, buffer, seed)
+
+
+@pytest.mark.parametrize('hashfun,seed',
+                         ((_murmurhash3.hasharray, _murmurhash3.DEFAULT_SEED),
+                          (_hasharray_nofilter, 0)))
+def test_ScaledSketch(hashfun, seed):
+    random.seed(123)
+    sequence = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                        for x in range(2000))
+    nsize = 21
+    allhash = _allngramshashed(sequence, nsize, hashfun, seed, False)
+    for scale in (1, 10):
+        threshold = (2**64 - 1) // scale
+        expected = sorted(set(h for h, ngram in allhash if h <= threshold))
+        mhs = ScaledSketch(nsize, scale, hashfun, seed)
+        assert mhs.scale == scale
+        assert mhs.threshold == threshold
+        assert mhs.maxsize is None
+        assert len(mhs) == 0
+        mhs.add(sequence[:1000], hashbuffer=array.array('Q', [0, ]*100))
+        mhs.add(sequence[(1000-nsize+1):])
+        assert mhs.nvisited == len(allhash)
+        assert len(mhs) == len(expected)
+        assert tuple(mhs) == tuple(expected)
+        for h in expected:
+            assert h in mhs
+        assert (threshold + 1) not in mhs
+        # records one after the other
+        mhs_ends = ScaledSketch(nsize, scale, hashfun, seed)
+        mhs_ends.add(sequence[:1000] + sequence[(1000-nsize+1):],
+                     ends=array.array('Q', [1000, 2000+nsize-1]))
+        assert tuple(mhs_ends) == tuple(mhs)
+        assert mhs_ends.nvisited == mhs.nvisited
+        # initialization with hash values
+        mhs_c = ScaledSketch(nsize, scale, hashfun, seed,
+                             hashes=[h for h, ngram in allhash] + [2**64-1])
+        assert tuple(mhs_c) == tuple(mhs) if scale > 1 else (
+            tuple(mhs_c) == tuple(expected) + (2**64-1, ))
+
+    with pytest.raises(ValueError):
+        ScaledSketch(nsize, 0, hashfun, seed)
+
+
+def test_ScaledSketch_update():
+    random.seed(123)
+    sequence = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                        for x in range(2000))
+    hashfun = _murmurhash3.hasharray
+    seed = _murmurhash3.DEFAULT_SEED
+    nsize = 21
+    scale = 5
+    mhs = ScaledSketch(nsize, scale, hashfun, seed)
+    mhs.add(sequence)
+
+    i = len(sequence)//2
+    mhs_a = ScaledSketch(nsize, scale, hashfun, seed)
+    mhs_a.add(sequence[:i])
+    mhs_b = ScaledSketch(nsize, scale, hashfun, seed)
+    mhs_b.add(sequence[(i-nsize+1):])
+
+    mhs_ab = mhs_a + mhs_b
+    assert mhs_ab.scale == scale
+    assert mhs_ab.nvisited == mhs.nvisited
+    assert tuple(mhs_ab) == tuple(mhs)
+
+    mhs_a.update(mhs_b)
+    assert mhs_a.nvisited == mhs.nvisited
+    assert tuple(mhs_a) == tuple(mhs)
+
+    for other in (ScaledSketch(nsize, scale+1, hashfun, seed),
+                  ScaledSketch(nsize+1, scale, hashfun, seed),
+                  ScaledSketch(nsize, scale, hashfun, seed+1),
+                  MinCompactSketch(nsize, scale, hashfun, seed)):
+        with pytest.raises(ValueError):
+            mhs_a.update(other)
+
+
+def test_FrozenScaledSketch():
+    random.seed(123)
+    sequence = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                        for x in range(20000))
+    hashfun = _murmurhash3.hasharray
+    seed = _murmurhash3.DEFAULT_SEED
+    nsize = 21
+    scale = 10
+    mhs_a = ScaledSketch(nsize, scale, hashfun, seed)
+    mhs_a.add(sequence[:12000])
+    mhs_b = ScaledSketch(nsize, scale, hashfun, seed)
+    mhs_b.add(sequence[8000:])
+    fmhs_a = mhs_a.freeze()
+    fmhs_b = mhs_b.freeze()
+    assert isinstance(fmhs_a, FrozenScaledSketch)
+    assert fmhs_a.scale == scale
+    assert tuple(fmhs_a) == tuple(mhs_a)
+    assert fmhs_a.nvisited == mhs_a.nvisited
+
+    # all hash values are considered
+    assert fmhs_a.jaccard_estimate(fmhs_b) == fmhs_a.jaccard_similarity(
+        fmhs_b)
+    shared = len(set(fmhs_a) & set(fmhs_b))
+    assert fmhs_a._bottomk_union(fmhs_b) == (
+        shared, len(set(fmhs_a) | set(fmhs_b)))
+    assert abs(fmhs_a.jaccard_estimate(fmhs_b) - 4000 / 20000) < 0.05
+    assert fmhs_a.mash_distance(fmhs_a) == 0
+    assert math.copysign(1, fmhs_a.mash_distance(fmhs_a)) == 1
+    assert fmhs_a.mash_pvalue(fmhs_b) < 1e-10
+
+    # with a bottom sketch, the smallest maximum size is considered
+    mhs_c = MinCompactSketch(nsize, 100, hashfun, seed)
+    mhs_c.add(sequence[8000:])
+    fmhs_c = mhs_c.freeze()
+    assert fmhs_a._bottomk_union(fmhs_c)[1] == 100
+
+    mhs_d = ScaledSketch(nsize, scale+1, hashfun, seed)
+    mhs_d.add(sequence[8000:])
+    with pytest.raises(ValueError):
+        fmhs_a.jaccard_estimate(mhs_d.freeze())
+
+
+@pytest.mark.parametrize('cls', (MinSketch, MaxSketch, MinCountSketch,
+                                 MinCompactSketch, MaxCompactSketch,
+                                 MinCompactCountSketch,
+                                 OnePermutationSketch, ScaledSketch))
+def test_Sketch_cardinality(cls):
+    random.seed(123)
+    # sequence with repeated kmers
+    sequence = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                        for x in range(5000)) * 3
+    nsize = 21
+    maxsize = 10
+    hashfun = _murmurhash3.hasharray
+    seed = _murmurhash3.DEFAULT_SEED
+    ndistinct = len(set(sequence[i:(i+nsize)]
+                        for i in range(len(sequence)-nsize+1)))
+    mhs = cls(nsize, maxsize, hashfun, seed)
+    assert mhs.hllprecision is None
+    with pytest.raises(ValueError):
+        mhs.cardinality()
+    with pytest.raises(ValueError):
+        mhs.freeze().cardinality()
+
+    mhs = cls(nsize, maxsize, hashfun, seed, hllprecision=12)
+    assert mhs.hllprecision == 12
+    assert mhs.cardinality() == 0
+    mhs.add(sequence)
+    assert mhs.nvisited == len(sequence) - nsize + 1
+    assert abs(mhs.cardinality() - ndistinct) / ndistinct < 0.05
+    # the sketch is the same as without registers
+    ref = cls(nsize, maxsize, hashfun, seed)
+    ref.add(sequence)
+    assert tuple(mhs) == tuple(ref)
+    fmhs = mhs.freeze()
+    assert fmhs.hllprecision == 12
+    assert fmhs.cardinality() == mhs.cardinality()
+
+    # merging
+    i = len(sequence)//2
+    mhs_a = cls(nsize, maxsize, hashfun, seed, hllprecision=12)
+    mhs_a.add(sequence[:i])
+    mhs_b = cls(nsize, maxsize, hashfun, seed, hllprecision=12)
+    mhs_b.add(sequence[(i-nsize+1):])
+    mhs_ab = mhs_a + mhs_b
+    assert mhs_ab.hllprecision == 12
+    assert mhs_ab.cardinality() == mhs.cardinality()
+    mhs_a.update(mhs_b)
+    assert mhs_a.cardinality() == mhs.cardinality()
+    # a sketch without registers can be updated from one with registers
+    ref.update(mhs_b)
+    for other in (cls(nsize, maxsize, hashfun, seed),
+                  cls(nsize, maxsize, hashfun, seed, hllprecision=10)):
+        with pytest.raises(ValueError):
+            mhs_a.update(other)
+
+    with pytest.raises(ValueError):
+        cls(nsize, maxsize, hashfun, seed, hllprecision=3)
+    with pytest.raises(ValueError):
+        cls(nsize, maxsize, hashfun, seed, hllprecision=19)
+
+
+def test_add_seeds():
+    random.seed(123)
+    sequence = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                        for x in range(1000))
+    nsize = 21
+    maxsize = 10
+    hashfun = _xxhash.hasharray
+    seeds = tuple(range(_xxhash.MAXSEEDS + 3))
+    sketches = [(MinCompactSketch if i % 2 else MaxCompactSketch)(
+        nsize, maxsize, hashfun, seed, hashbuffersize=100,
+        hllprecision=8 if i % 3 else None)
+                for i, seed in enumerate(seeds)]
+    add_seeds(sketches, sequence)
+    for mhs in sketches:
+        ref = type(mhs)(nsize, maxsize, hashfun, mhs.seed,
+                        hllprecision=mhs.hllprecision)
+        ref.add(sequence)
+        assert mhs.nvisited == ref.nvisited
+        assert mhs.freeze()._sketch == ref.freeze()._sketch
+        assert mhs._registers == ref._registers
+    assert len(set(tuple(x) for x in sketches)) == len(seeds)
+
+    add_seeds([], sequence)
+    with pytest.raises(ValueError):
+        add_seeds([MinSketch(nsize, maxsize, hashfun, 1)], sequence)
+    with pytest.raises(ValueError):
+        add_seeds([MinCompactSketch(nsize, maxsize, _murmurhash3.hasharray,
+                                    1)], sequence)
+    with pytest.raises(ValueError):
+        add_seeds([MinCompactSketch(nsize, maxsize, hashfun, 1),
+                   MinCompactSketch(nsize + 1, maxsize, hashfun, 2)],
+                  sequence)
+
+
+@pytest.mark.parametrize('cls', (MinSketch, MaxSketch, MinCompactSketch,
+                                 MaxCompactSketch))
+def test_freeze_snapshot(cls):
+    random.seed(123)
+    sequence = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                        for x in range(5000))
+    mhs = cls(21, 50, _murmurhash3.hasharray, _murmurhash3.DEFAULT_SEED)
+    mhs.add(sequence[:1000])
+    frozen_a = mhs.freeze()
+    # no new content: the storage is shared
+    mhs.add(sequence[:500])
+    frozen_b = mhs.freeze()
+    assert frozen_b._sketch is frozen_a._sketch
+    assert frozen_b.nvisited == mhs.nvisited > frozen_a.nvisited
+    # new content: new storage, and the earlier frozen sketches unchanged
+    content_a = tuple(sorted(frozen_a._sketch))
+    mhs.add(sequence[1000:])
+    frozen_c = mhs.freeze()
+    assert frozen_c._sketch is not frozen_a._sketch
+    assert tuple(sorted(frozen_a._sketch)) == content_a
+    expected = cls(21, 50, _murmurhash3.hasharray, _murmurhash3.DEFAULT_SEED)
+    expected.add(sequence[:1000])
+    expected.add(sequence[1000:])
+    assert (tuple(sorted(frozen_c._sketch)) ==
+            tuple(sorted(expected.freeze()._sketch)))
+    # merging other sketches
+    other = cls(21, 50, _murmurhash3.hasharray, _murmurhash3.DEFAULT_SEED)
+    other.add(sequence[::-1])
+    mhs.update(other)
+    frozen_d = mhs.freeze()
+    expected.update(other)
+    assert (tuple(sorted(frozen_d._sketch)) ==
+            tuple(sorted(expected.freeze()._sketch)))
+
+
+@pytest.mark.parametrize('cls', (MinCountSketch, MaxCountSketch,
+                                 MinCompactCountSketch,
+                                 MaxCompactCountSketch))
+def test_freeze_snapshot_counts(cls):
+    random.seed(123)
+    sequence = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                        for x in range(5000))
+    mhs = cls(21, 50, _murmurhash3.hasharray, _murmurhash3.DEFAULT_SEED)
+    mhs.add(sequence)
+    frozen_a = mhs.freeze()
+    hashes = sorted(frozen_a._sketch)
+
+    def counts(frozen):
+        if isinstance(frozen, FrozenCountSketch):
+            return [frozen._count[h] for h in hashes]
+        return [frozen.count(h) for h in hashes]
+
+    # nothing added: the storage is shared
+    frozen_b = mhs.freeze()
+    assert frozen_b._sketch is frozen_a._sketch
+    counts_a = counts(frozen_a)
+    # the same content with new counts: new storage, and the earlier
+    # frozen sketches unchanged
+    mhs.add(sequence)
+    frozen_c = mhs.freeze()
+    assert sorted(frozen_c._sketch) == hashes
+    assert frozen_c._sketch is not frozen_a._sketch
+    assert counts(frozen_a) == counts_a
+    assert counts(frozen_c) == [2 * x for x in counts_a]
+    mhs.add_hashvalues((hashes[0], ))
+    frozen_d = mhs.freeze()
+    assert sum(counts(frozen_d)) == 2 * sum(counts_a) + 1
+    assert counts(frozen_c) == [2 * x for x in counts_a]
+
+
 def test_FrozenSketch():
 
     nsize = 2
@@ -527,3 +1355,156 @@ def test_FrozenCountSketch():
     # invalid nvisited
     with pytest.raises(ValueError):
         mhs = FrozenCountSketch(sketch, count, nsize, nvisited=len(sketch)-1)
+
+
+def test_FrozenCompactCountSketch():
+    nsize = 2
+    sketch = (5, 3, 1, 2, 4)
+    counts = (10, 6, 2, 4, 8)
+    mhs = FrozenCompactCountSketch(sketch, counts, nsize, maxsize=10,
+                                   nvisited=30)
+    assert tuple(mhs._sketch) == (1, 2, 3, 4, 5)
+    assert tuple(mhs._counts) == (2, 4, 6, 8, 10)
+    assert mhs.maxsize == 10
+    assert mhs.nvisited == 30
+    assert mhs.count(3) == 6
+    assert mhs.count(7) == 0
+    assert mhs.jaccard_similarity(mhs) == 1
+
+    # bray_curtis_dissimilarity
+    assert mhs.bray_curtis_dissimilarity(mhs) == 0
+    mhs_b = FrozenCompactCountSketch((1, 2, 6), (1, 10, 5), nsize)
+    # common: min(2, 1) + min(4, 10)
+    assert mhs.bray_curtis_dissimilarity(mhs_b) == 1 - 2 * 5 / (30 + 16)
+    assert (mhs.bray_curtis_dissimilarity(mhs_b) ==
+            mhs_b.bray_curtis_dissimilarity(mhs))
+    with pytest.raises(ValueError):
+        mhs.bray_curtis_dissimilarity(FrozenCompactSketch(sketch, nsize))
+
+    # storage used as it is
+    hashes = array.array('Q', (1, 2, 3))
+    mhs = FrozenCompactCountSketch(hashes, array.array('Q', (3, 2, 1)),
+                                   nsize, copy=False)
+    assert mhs._sketch is hashes
+    assert mhs.count(1) == 3
+
+    # invalid counts
+    with pytest.raises(ValueError):
+        FrozenCompactCountSketch(sketch, counts[:-1], nsize)
+    with pytest.raises(ValueError):
+        FrozenCompactCountSketch((1, 1), (1, 2), nsize)
+    with pytest.raises(ValueError):
+        FrozenCompactCountSketch(hashes, array.array('Q', (1, )), nsize,
+                                 copy=False)
+
+
+def test_FrozenCompactSketch():
+
+    nsize = 2
+    maxsize = 5
+    sketch = (5, 3, 1, 2, 4, 3)
+    nvisited = len(sketch)
+
+    mhs = FrozenCompactSketch(sketch, nsize, maxsize=maxsize,
+                              nvisited=nvisited)
+    assert mhs.maxsize == maxsize
+    assert mhs.nsize == nsize
+    assert mhs.nvisited == nvisited
+    assert len(mhs) == maxsize
+    assert tuple(mhs) == (1, 2, 3, 4, 5)
+    assert mhs._sketch.itemsize == 8
+    assert 3 in mhs
+    assert 6 not in mhs
+
+    sketch = set((1, 2, 3, 6, 7))
+    mhs_b = FrozenCompactSketch(sketch, nsize, maxsize=maxsize,
+                                nvisited=len(sketch))
+    mhs_ref = FrozenSketch((1, 2, 3, 4, 5), nsize)
+    mhs_ref_b = FrozenSketch(sketch, nsize)
+    for methodname in ('jaccard_similarity', 'jaccard_correspondance',
+                       'jaccard_containment', 'dice_similarity'):
+        assert getattr(mhs, methodname)(mhs) == 1
+        assert (getattr(mhs, methodname)(mhs_b) ==
+                getattr(mhs_ref, methodname)(mhs_ref_b))
+    assert mhs.jaccard_similarity(mhs_b) == 3/7
+    assert mhs.jaccard_containment(mhs_b) == 3/5
+    assert mhs.dice_similarity(mhs_b) == 3/5
+
+    mhs_c = mhs_ref_b.compact()
+    assert isinstance(mhs_c, FrozenCompactSketch)
+    assert tuple(mhs_c) == tuple(sorted(sketch))
+    assert mhs_c.nvisited == mhs_ref_b.nvisited
+
+    # invalid maxsize
+    with pytest.raises(ValueError):
+        mhs = FrozenCompactSketch(sketch, nsize, maxsize=len(sketch)-1)
+
+    # invalid nvisited
+    with pytest.raises(ValueError):
+        mhs = FrozenCompactSketch(sketch, nsize, nvisited=len(sketch)-1)
+
+
+def _jaccard_estimate(a, b, k, reverse):
+    # reference: the k first hash values in the union
+    union = sorted(set(a) | set(b), reverse=reverse)[:k]
+    return sum(1 for h in union if h in a and h in b) / len(union)
+
+
+@pytest.mark.parametrize('cls,reverse',
+                         ((MinSketch, False), (MaxSketch, True),
+                          (MinCompactSketch, False), (MaxCompactSketch, True)))
+def test_FrozenSketch_jaccard_estimate(cls, reverse):
+    random.seed(123)
+    nsize = 21
+    maxsize = 100
+    sequence = b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                        for x in range(2000))
+    sketches = list()
+    for beg, end in ((0, 2000), (500, 2000), (0, 1000), (1500, 2000)):
+        mhs = cls(nsize, maxsize, _murmurhash3.hasharray,
+                  _murmurhash3.DEFAULT_SEED)
+        mhs.add(sequence[beg:end])
+        sketches.append(mhs.freeze())
+    for mhs_a in sketches:
+        for mhs_b in sketches:
+            hashes_a = set(mhs_a._sketch)
+            hashes_b = set(mhs_b._sketch)
+            expected = _jaccard_estimate(hashes_a, hashes_b, maxsize, reverse)
+            assert mhs_a.jaccard_estimate(mhs_b) == pytest.approx(expected)
+            # same result with compact and non-compact frozen sketches
+            assert (mhs_a.compact().jaccard_estimate(mhs_b) ==
+                    mhs_a.jaccard_estimate(mhs_b))
+    assert sketches[0].jaccard_estimate(sketches[0]) == 1
+    assert sketches[0].mash_distance(sketches[0]) == 0
+    # the sequences (0, 1000) and (1500, 2000) have nothing in common
+    assert sketches[2].jaccard_estimate(sketches[3]) == 0
+    assert sketches[2].mash_distance(sketches[3]) == 1
+    assert sketches[2].mash_pvalue(sketches[3]) == 1
+    # the Jaccard index between (0, 2000) and (500, 2000) is about 0.75
+    j = sketches[0].jaccard_estimate(sketches[1])
+    assert 0.6 < j < 0.9
+    assert (sketches[0].mash_distance(sketches[1]) ==
+            pytest.approx(-math.log(2*j/(1+j))/nsize))
+    assert sketches[0].mash_pvalue(sketches[1]) < 1e-100
+
+
+def test_FrozenSketch_mash_invalid():
+    mhs_min = FrozenSketch((1, 2, 3), 2, sign=-1)
+    mhs_max = FrozenSketch((1, 2, 3), 2, sign=1)
+    with pytest.raises(ValueError):
+        mhs_min.jaccard_estimate(mhs_max)
+    with pytest.raises(ValueError):
+        mhs_min.mash_distance(mhs_max)
+
+
+def test_binomial_sf():
+    n = 20
+    p = 0.3
+    for x in range(n + 2):
+        expected = sum(math.comb(n, i) * p**i * (1-p)**(n-i)
+                       for i in range(x, n + 1))
+        assert _binomial_sf(x, n, p) == pytest.approx(expected)
+    assert _binomial_sf(0, n, 0) == 1
+    assert _binomial_sf(1, n, 0) == 0
+    # small probabilities
+    assert 0 < _binomial_sf(50, 100, 0.01) < 1e-50
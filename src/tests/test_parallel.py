@@ -228,3 +228,113 @@ def test_sketchlist_reduce_sketches():
         assert mhs.maxsize == mhs_ab.maxsize
         assert mhs.nvisited == mhs_ab.nvisited
         assert len(set(mhs._heapmap) ^ set(mhs_ab._heapmap)) == 0
+
+
+@pytest.mark.parametrize('threads', (False, True))
+@pytest.mark.parametrize('cls', (minhashsketch.MinCompactSketch,
+                                 minhashsketch.MaxCompactSketch))
+def test_parallelsketcher_sequences(cls, threads):
+    nsize = 21
+    maxsize = 50
+    random.seed(123)
+    sequences = [_make_sequence() for x in range(40)]
+    mhs_ref = cls(nsize, maxsize, hasharray, DEFAULT_SEED)
+    for sequence in sequences:
+        mhs_ref.add(sequence)
+    with mashingpumpkins.parallel.ParallelSketcher(
+            nsize, maxsize, hasharray, DEFAULT_SEED, cls=cls,
+            ncpu=2, blocksize=1000, threads=threads) as sketcher:
+        assert sketcher.ncpu == 2
+        assert sketcher.threads is threads
+        mhs = sketcher.sketch_sequences(iter(sequences))
+        mhs_empty = sketcher.sketch_sequences(())
+    assert type(mhs) is cls
+    assert mhs.nvisited == mhs_ref.nvisited
+    assert tuple(mhs.freeze()) == tuple(mhs_ref.freeze())
+    assert len(mhs_empty) == 0
+    assert mhs_empty.nvisited == 0
+
+
+@pytest.mark.parametrize('threads', (False, True))
+def test_parallelsketcher_files(tmpdir, threads):
+    nsize = 21
+    maxsize = 50
+    random.seed(123)
+    filenames = list()
+    refs = list()
+    for i in range(5):
+        sequences = [_make_sequence() for x in range(i * 10)]
+        fn = str(tmpdir.join('%i.fasta' % i))
+        with open(fn, 'wb') as fh:
+            for j, sequence in enumerate(sequences):
+                fh.write(b'>%i\n%s\n' % (j, sequence))
+        filenames.append(fn)
+        mhs_ref = minhashsketch.MinCompactSketch(nsize, maxsize,
+                                                 hasharray, DEFAULT_SEED)
+        for sequence in sequences:
+            mhs_ref.add(sequence)
+        refs.append(mhs_ref)
+    with mashingpumpkins.parallel.ParallelSketcher(
+            nsize, maxsize, hasharray, DEFAULT_SEED,
+            ncpu=2, blocksize=2000, threads=threads) as sketcher:
+        res = sketcher.sketch_files(filenames)
+        seen = set()
+        for i, mhs, stats in sketcher.imap_files(filenames):
+            seen.add(i)
+            assert stats.nrecords == i * 10
+            assert tuple(mhs.freeze()) == tuple(refs[i].freeze())
+    assert seen == set(range(len(filenames)))
+    for mhs, mhs_ref in zip(res, refs):
+        assert mhs.nvisited == mhs_ref.nvisited
+        assert tuple(mhs.freeze()) == tuple(mhs_ref.freeze())
+
+
+def test_parallelsketcher_invalid():
+    with pytest.raises(ValueError):
+        mashingpumpkins.parallel.ParallelSketcher(
+            21, 10, hasharray, DEFAULT_SEED, cls=minhashsketch.MinSketch)
+
+
+@pytest.mark.parametrize('threads', (False, True))
+@pytest.mark.parametrize('blocksize', (100, 999, 5000))
+def test_parallelsketcher_sequence(blocksize, threads):
+    nsize = 21
+    maxsize = 50
+    random.seed(123)
+    sequence = b''.join(_make_sequence() for x in range(20))
+    mhs_ref = minhashsketch.MinCompactSketch(nsize, maxsize, hasharray,
+                                             DEFAULT_SEED)
+    mhs_ref.add(sequence)
+    with mashingpumpkins.parallel.ParallelSketcher(
+            nsize, maxsize, hasharray, DEFAULT_SEED,
+            ncpu=2, blocksize=blocksize, threads=threads) as sketcher:
+        mhs = sketcher.sketch_sequence(sequence)
+        mhs_view = sketcher.sketch_sequence(memoryview(sequence))
+        # long and short sequences mixed
+        mhs_mixed = sketcher.sketch_sequences((sequence[:10], sequence,
+                                               sequence[:30]))
+    for x in (mhs, mhs_view, mhs_mixed):
+        assert tuple(x.freeze()) == tuple(mhs_ref.freeze())
+    assert mhs.nvisited == len(sequence) - nsize + 1
+    assert mhs_view.nvisited == mhs.nvisited
+    assert mhs_mixed.nvisited == mhs.nvisited + 30 - nsize + 1
+
+
+@pytest.mark.parametrize('threads', (False, True))
+def test_parallelsketcher_exit_error(threads):
+    random.seed(123)
+    sequence = b''.join(_make_sequence() for x in range(20))
+
+    def jobs():
+        # fails with tasks in flight
+        yield from sketcher._sequence_jobs((sequence, ))
+        raise KeyError()
+
+    with pytest.raises(KeyError):
+        with mashingpumpkins.parallel.ParallelSketcher(
+                21, 50, hasharray, DEFAULT_SEED,
+                ncpu=2, blocksize=100, threads=threads) as sketcher:
+            for res in sketcher._run(jobs()):
+                pass
+    # pending tasks cancelled or completed
+    assert len(sketcher._futures) == 0
@@ -28,3 +28,17 @@ def test_chunkpos_iter():
     for slice, check in zip(chunkpos_iter(nsize, len(seq), w),
                             ((0, len(seq)), )):
         assert slice == check
+
+    # window as long as the sequence
+    assert tuple(chunkpos_iter(nsize, len(seq), len(seq))) == ((0, len(seq)), )
+    assert tuple(chunkpos_iter(21, 30, 30)) == ((0, 30), )
+
+    # sequence shorter than the ngrams
+    assert tuple(chunkpos_iter(nsize, 2, w)) == ()
+
+    # all ngrams/kmers covered once
+    for lseq in range(nsize, 40):
+        for w in range(nsize, 45):
+            starts = [i for beg, end in chunkpos_iter(nsize, lseq, w)
+                      for i in range(beg, end - nsize + 1)]
+            assert starts == list(range(lseq - nsize + 1))
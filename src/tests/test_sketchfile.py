@@ -0,0 +1,144 @@
+import pytest
+
+import io
+import random
+from collections import Counter
+from mashingpumpkins import _murmurhash3, _xxh3, sketchfile
+from mashingpumpkins.compare import pairwise
+from mashingpumpkins.minhashsketch import (FrozenCompactCountSketch,
+                                           FrozenCompactSketch,
+                                           FrozenCountSketch,
+                                           FrozenScaledSketch,
+                                           FrozenSketch,
+                                           MaxSketch,
+                                           MinCompactCountSketch,
+                                           MinCompactSketch,
+                                           MinSketch,
+                                           OnePermutationSketch,
+                                           ScaledSketch)
+
+
+def _sequence(length=2000, seed=123):
+    random.seed(seed)
+    return b''.join(random.choice((b'A', b'T', b'G', b'C'))
+                    for x in range(length))
+
+
+def _check_same(a, b):
+    assert type(b) in (FrozenCompactSketch, FrozenScaledSketch,
+                       FrozenCompactCountSketch)
+    assert tuple(sorted(a._sketch)) == tuple(sorted(b._sketch))
+    assert a.nsize == b.nsize
+    assert a.maxsize == b.maxsize
+    assert a.nvisited == b.nvisited
+    assert a._seed == b._seed
+    assert a._sign == b._sign
+    assert a._hashfun == b._hashfun
+
+
+@pytest.mark.parametrize('cls', (MinSketch, MaxSketch, MinCompactSketch))
+@pytest.mark.parametrize('use_mmap', (True, False))
+def test_save_load(tmpdir, cls, use_mmap):
+    mhs = cls(21, 100, _murmurhash3.hasharray, _murmurhash3.DEFAULT_SEED)
+    mhs.add(_sequence())
+    frozen = mhs.freeze()
+    filename = str(tmpdir.join('a.sketch'))
+    sketchfile.save(frozen, filename)
+    res = sketchfile.load(filename, use_mmap=use_mmap)
+    assert isinstance(res, FrozenCompactSketch)
+    # the hash values are not copied
+    assert isinstance(res._sketch, memoryview)
+    _check_same(frozen, res)
+    assert res.hllprecision is None
+    assert res.jaccard_similarity(frozen) == 1
+    assert res.mash_distance(frozen) == 0
+    assert pairwise([res, frozen]).tolist() == [[1.0, 1.0], [1.0, 1.0]]
+
+
+def test_save_load_count(tmpdir):
+    frozen = FrozenCountSketch(range(10, 60), Counter(range(10, 60)), 21,
+                               hashfun=_murmurhash3.hasharray, seed=1,
+                               maxsize=100, nvisited=200)
+    frozen._count[20] += 5
+    filename = str(tmpdir.join('a.sketch'))
+    sketchfile.save(frozen, filename)
+    res = sketchfile.load(filename)
+    assert isinstance(res, FrozenCompactCountSketch)
+    _check_same(frozen, res)
+    assert dict(zip(res._sketch, res._counts)) == frozen._count
+
+
+@pytest.mark.parametrize('use_mmap', (True, False))
+def test_save_load_compactcount(tmpdir, use_mmap):
+    mhs = MinCompactCountSketch(5, 100, _xxh3.hasharray, _xxh3.DEFAULT_SEED)
+    mhs.add(_sequence() * 3)
+    frozen = mhs.freeze()
+    filename = str(tmpdir.join('a.sketch'))
+    sketchfile.save(frozen, filename)
+    res = sketchfile.load(filename, use_mmap=use_mmap)
+    assert isinstance(res, FrozenCompactCountSketch)
+    # neither the hash values nor the counts are copied
+    assert isinstance(res._sketch, memoryview)
+    assert isinstance(res._counts, memoryview)
+    _check_same(frozen, res)
+    assert tuple(res._counts) == tuple(frozen._counts)
+    assert res.bray_curtis_dissimilarity(frozen) == 0
+
+
+def test_save_load_scaled(tmpdir):
+    mhs = ScaledSketch(21, 10, _xxh3.hasharray, _xxh3.DEFAULT_SEED,
+                       hllprecision=10)
+    mhs.add(_sequence())
+    frozen = mhs.freeze()
+    filename = str(tmpdir.join('a.sketch'))
+    sketchfile.save(frozen, filename)
+    res = sketchfile.load(filename)
+    assert isinstance(res, FrozenScaledSketch)
+    _check_same(frozen, res)
+    assert res.scale == 10
+    assert res.hllprecision == 10
+    assert res.cardinality() == frozen.cardinality()
+    assert res.jaccard_estimate(frozen) == 1
+
+
+def test_dump_loads_empty():
+    frozen = FrozenCompactSketch((), 21, hashfun=_murmurhash3.hasharray,
+                                 maxsize=100)
+    fh = io.BytesIO()
+    sketchfile.dump(frozen, fh)
+    assert len(fh.getvalue()) == sketchfile.HEADER_SIZE
+    res = sketchfile.loads(fh.getvalue())
+    assert len(res) == 0
+    assert res._seed is None
+
+
+def test_dump_invalid():
+    frozen = FrozenSketch((1, 2), 21, hashfun=hash)
+    with pytest.raises(ValueError):
+        sketchfile.dump(frozen, io.BytesIO())
+    # no hash values to write
+    mhs = OnePermutationSketch(21, 16, _murmurhash3.hasharray,
+                               _murmurhash3.DEFAULT_SEED)
+    mhs.add(_sequence())
+    with pytest.raises(ValueError, match='FrozenOnePermutationSketch'):
+        sketchfile.dump(mhs.freeze(), io.BytesIO())
+
+
+def test_loads_invalid():
+    mhs = MinCompactSketch(21, 100, _murmurhash3.hasharray,
+                           _murmurhash3.DEFAULT_SEED)
+    mhs.add(_sequence())
+    fh = io.BytesIO()
+    sketchfile.dump(mhs.freeze(), fh)
+    content = fh.getvalue()
+    # truncated
+    with pytest.raises(ValueError):
+        sketchfile.loads(content[:-1])
+    with pytest.raises(ValueError):
+        sketchfile.loads(content[:10])
+    # not a sketch
+    with pytest.raises(ValueError):
+        sketchfile.loads(b'X' + content[1:])
+    # unknown version
+    with pytest.raises(ValueError):
+        sketchfile.loads(content[:8] + b'\xff' + content[9:])